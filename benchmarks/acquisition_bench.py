@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+Created on 19 Oct 2026
+
+Copyright © 2026 Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms
+of the GNU General Public License version 2 as published by the Free Software
+Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+Odemis. If not, see http://www.gnu.org/licenses/.
+"""
+# Measures the overhead of the acquisition code compared to the time the hardware
+# is expected to take:
+#  * SEMCCDMDStream: time per pixel spent on top of the exposure time
+#  * SEMTemporalMDStream: time per pixel spent on top of the time-correlator dwell time
+#  * TiledAcquisitionTask: time per tile spent on top of the stream acquisition
+
+import logging
+import time
+
+from benchutil import SimMicroscope
+from odemis.acq import stream
+from odemis.acq.stitching import REGISTER_IDENTITY, WEAVER_COLLAGE, acquireTiledArea
+from odemis.acq.stitching._tiledacq import TiledAcquisitionTask
+
+SPARC_CONFIG = "sparc2-sim.odm.yaml"
+SECOM_CONFIG = "secom-sim.odm.yaml"
+TC_CONFIG = "sparc2-time-correlator-sim.odm.yaml"
+
+SEMCCD_REPETITIONS = ((4, 4), (16, 16))
+SEMCCD_EXPOSURE_TIME = 0.01  # s
+TC_REPETITIONS = ((4, 4), (8, 8))
+TC_DWELL_TIME = 5e-3  # s
+TILED_GRID = (3, 3)  # Number of tiles in X, Y (approximately)
+TILED_OVERLAP = 0.2
+
+
+def bench_semccd(results, mic):
+    """
+    Measures the overhead per pixel of the SEMCCDMDStream (via a spectrum acquisition)
+    """
+    ebeam = mic.getComponent("e-beam")
+    sed = mic.getComponent("se-detector")
+    spec = mic.getComponent("spectrometer")
+
+    sems = stream.SEMStream("bench sem", sed, sed.data, ebeam)
+    specs = stream.SpectrumSettingsStream("bench spec", spec, spec.data, ebeam,
+                                          detvas={"exposureTime"})
+    sps = stream.SEMSpectrumMDStream("bench sem-spec", [sems, specs])
+    specs.detExposureTime.value = SEMCCD_EXPOSURE_TIME
+
+    for rep in SEMCCD_REPETITIONS:
+        specs.repetition.value = rep
+        rep = specs.repetition.value  # Could have been adjusted
+        npx = rep[0] * rep[1]
+        estimated = sps.estimateAcquisitionTime()
+
+        start = time.perf_counter()
+        f = sps.acquire()
+        data, exp = f.result(10 + 3 * estimated)
+        dur = time.perf_counter() - start
+        if exp:
+            raise exp
+
+        overhead = (dur - npx * specs.detExposureTime.value) / npx
+        name = "acq.semccd.%dx%d" % rep
+        results.add(name + ".overhead_per_pixel", overhead * 1e3, "ms", higher_is_better=False,
+                    exposure_time=specs.detExposureTime.value)
+        results.add(name + ".estimate_ratio", dur / estimated, "", higher_is_better=False)
+
+
+def bench_semtemporal(results, mic):
+    """
+    Measures the overhead per pixel of the SEMTemporalMDStream
+    """
+    ebeam = mic.getComponent("e-beam")
+    sed = mic.getComponent("se-detector")
+    tc = mic.getComponent("time-correlator")
+
+    tcs = stream.ScannedTemporalSettingsStream("bench tc", tc, tc.data, ebeam,
+                                               detvas={"dwellTime"})
+    sems = stream.SpotSEMStream("bench spot", sed, sed.data, ebeam)
+    stcs = stream.SEMTemporalMDStream("bench sem-tc", [sems, tcs])
+    tcs.detDwellTime.value = TC_DWELL_TIME
+
+    for rep in TC_REPETITIONS:
+        tcs.repetition.value = rep
+        rep = tcs.repetition.value  # Could have been adjusted
+        npx = rep[0] * rep[1]
+        estimated = stcs.estimateAcquisitionTime()
+
+        start = time.perf_counter()
+        f = stcs.acquire()
+        data, exp = f.result(10 + 3 * estimated)
+        dur = time.perf_counter() - start
+        if exp:
+            raise exp
+
+        overhead = (dur - npx * tcs.detDwellTime.value) / npx
+        name = "acq.semtemporal.%dx%d" % rep
+        results.add(name + ".overhead_per_pixel", overhead * 1e3, "ms", higher_is_better=False,
+                    dwell_time=tcs.detDwellTime.value)
+        results.add(name + ".estimate_ratio", dur / estimated, "", higher_is_better=False)
+
+
+def bench_tiled(results, mic):
+    """
+    Measures the overhead per tile of the TiledAcquisitionTask
+    """
+    ccd = mic.getComponent("ccd")
+    light = mic.getComponent("light")
+    light_filter = mic.getComponent("filter")
+    stage = mic.getComponent("stage")
+
+    fs = stream.FluoStream("bench fluo", ccd, ccd.data, light, light_filter)
+    ccd.exposureTime.value = ccd.exposureTime.clip(0.01)
+
+    fov = fs.guessFoV()
+    pos = stage.position.value
+    # Step between tiles is (1 - overlap) * FoV, so this area needs just TILED_GRID tiles
+    width = fov[0] * (1 + (TILED_GRID[0] - 1) * (1 - TILED_OVERLAP)) * 0.99
+    height = fov[1] * (1 + (TILED_GRID[1] - 1) * (1 - TILED_OVERLAP)) * 0.99
+    area = (pos["x"] - width / 2, pos["y"] - height / 2,
+            pos["x"] + width / 2, pos["y"] + height / 2)
+
+    task = TiledAcquisitionTask([fs], stage, area, TILED_OVERLAP)
+    ntiles = task._number_of_tiles
+    tile_time = fs.estimateAcquisitionTime()
+
+    start = time.perf_counter()
+    f = acquireTiledArea([fs], stage, area, overlap=TILED_OVERLAP,
+                         registrar=REGISTER_IDENTITY, weaver=WEAVER_COLLAGE)
+    f.result(60 + 10 * ntiles * tile_time)
+    dur = time.perf_counter() - start
+
+    overhead = (dur - ntiles * tile_time) / ntiles
+    results.add("acq.tiled.overhead_per_tile", overhead, "s", higher_is_better=False,
+                tiles=ntiles, tile_acq_time=tile_time)
+    results.add("acq.tiled.throughput", ntiles / dur, "tiles/s", tiles=ntiles)
+
+
+def run(results):
+    """
+    results (BenchmarkResults): where to store the measurements
+    """
+    with SimMicroscope(SPARC_CONFIG) as mic:
+        bench_semccd(results, mic)
+
+    with SimMicroscope(TC_CONFIG) as mic:
+        bench_semtemporal(results, mic)
+
+    with SimMicroscope(SECOM_CONFIG) as mic:
+        bench_tiled(results, mic)
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+Created on 19 Oct 2026
+
+Copyright © 2026 Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms
+of the GNU General Public License version 2 as published by the Free Software
+Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+Odemis. If not, see http://www.gnu.org/licenses/.
+"""
+# Helper functions and classes shared by all the benchmarks: recording of the
+# results, in-process instantiation of a simulated microscope, and storage/comparison
+# of the results as JSON files.
+
+import json
+import logging
+import os
+import platform
+import threading
+import time
+
+import odemis
+from odemis import model
+from odemis.odemisd import modelgen
+from odemis.util import testing
+
+CONFIG_PATH = os.path.join(os.path.dirname(odemis.__file__), "../../install/linux/usr/share/odemis/sim/")
+
+# Relative change above which a result is considered a regression
+DEFAULT_TOLERANCE = 0.1
+
+
+class BenchmarkResults(object):
+    """
+    Collects the measurements of all the benchmarks run
+    """
+
+    def __init__(self):
+        self.results = {}  # str -> dict: name -> value, unit, higher_is_better, info
+
+    def add(self, name, value, unit, higher_is_better=True, **info):
+        """
+        Record a measurement
+        name (str): unique name of the measurement (eg, "dataflow.local.ccd.fps")
+        value (float): the measured value
+        unit (str): unit of the value (eg, "fps", "s", "MB/s")
+        higher_is_better (bool): True if a larger value means faster code
+        info: any extra (JSON-serializable) information about the conditions
+        """
+        logging.info("%s: %g %s %s", name, value, unit, info or "")
+        self.results[name] = {"value": float(value),
+                              "unit": unit,
+                              "higher_is_better": higher_is_better,
+                              "info": info,
+                              }
+
+    def save(self, filename):
+        """
+        Store all the results (and some info about the environment) as JSON
+        """
+        content = {"version": odemis.__version__,
+                   "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+                   "host": platform.node(),
+                   "python": platform.python_version(),
+                   "cpu_count": os.cpu_count(),
+                   "results": self.results,
+                   }
+        with open(filename, "w") as f:
+            json.dump(content, f, indent=2, sort_keys=True)
+
+
+def load_results(filename):
+    """
+    Read a JSON file previously written by BenchmarkResults.save()
+    return (dict str -> dict): name -> result
+    """
+    with open(filename) as f:
+        content = json.load(f)
+    return content["results"]
+
+
+def compare_results(ref, new, tolerance=DEFAULT_TOLERANCE):
+    """
+    Compare two sets of results
+    ref (dict str -> dict): the reference results (eg, from the previous release)
+    new (dict str -> dict): the current results
+    tolerance (0 <= float): relative change considered as "same performance"
+    return (list of (str, float, float, float, str)): for each measurement found in
+      both sets: name, reference value, new value, relative change and status,
+      which is either "ok", "better" or "REGRESSION".
+    """
+    report = []
+    for name in sorted(set(ref) & set(new)):
+        vref = ref[name]["value"]
+        vnew = new[name]["value"]
+        if vref == 0:
+            change = 0 if vnew == 0 else float("inf")
+        else:
+            change = (vnew - vref) / abs(vref)
+
+        # Express the change as "improvement" so that positive is always better
+        gain = change if new[name]["higher_is_better"] else -change
+        if gain < -tolerance:
+            status = "REGRESSION"
+        elif gain > tolerance:
+            status = "better"
+        else:
+            status = "ok"
+        report.append((name, vref, vnew, change, status))
+
+    return report
+
+
+def measure_time(fun, *args, repeat=3, **kwargs):
+    """
+    Run a function several times, and report the best duration
+    fun (callable): the function to measure
+    repeat (int > 0): number of times the function is run
+    args, kwargs: passed to the function
+    return (float, value): shortest duration in s, and the value returned by the
+      last call of the function.
+    """
+    best = float("inf")
+    ret = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        ret = fun(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best, ret
+
+
+class SimMicroscope(object):
+    """
+    Instantiates all the components of a (simulated) microscope file in the
+    current process, without running a back-end. All the components are shared
+    via a container running in a thread, so that they can be accessed either
+    directly or via a proxy (to measure the overhead of Pyro and 0MQ).
+    Use as a context manager, or call terminate() when done.
+    """
+
+    def __init__(self, config):
+        """
+        config (str): path to the microscope file. If not an absolute path, it's
+          looked for in the simulator microscope files.
+        """
+        if not os.path.isabs(config) and not os.path.exists(config):
+            config = os.path.join(CONFIG_PATH, config)
+        self.config = config
+        # Don't interfere with a running backend, nor require access to /var/run/odemisd
+        testing.use_fake_backend_directory()
+
+        self._cont_name = "bench-%d" % (os.getpid(),)
+        self._container = model.Container(self._cont_name)
+        self._cont_thread = threading.Thread(target=self._container.run,
+                                             name="Container " + self._cont_name)
+        self._cont_thread.daemon = True
+        self._cont_thread.start()
+
+        try:
+            with open(config) as f:
+                self._instantiator = modelgen.Instantiator(f, container=self._container)
+            mic = self._instantiator.instantiate_microscope()
+            self._container.setRoot(mic)
+
+            # Instantiate everything which can be instantiated, in dependency order
+            while True:
+                nexts = self._instantiator.get_instantiables()
+                if not nexts:
+                    break
+                for n in nexts:
+                    self._instantiator.instantiate_component(n)
+            self.components = self._instantiator.components
+            logging.info("Instantiated %d components from %s", len(self.components), config)
+        except Exception:
+            self.terminate()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.terminate()
+
+    def getComponent(self, role):
+        """
+        role (str): the role of the component
+        return (HwComponent): the actual component (not a proxy)
+        raise LookupError: if no component with the given role exists
+        """
+        for c in self.components:
+            if c.role == role:
+                return c
+        raise LookupError("No component with role %s" % (role,))
+
+    def getProxy(self, comp):
+        """
+        comp (HwComponent): one of the components of the microscope
+        return (Proxy): a proxy to the component, as a client in another process
+          would get.
+        """
+        return model.getObject(self._cont_name, comp.name)
+
+    def terminate(self):
+        inst = getattr(self, "_instantiator", None)
+        for c in (inst.components if inst else ()):
+            try:
+                c.terminate()
+            except Exception:
+                logging.warning("Failed to terminate component %s", c.name, exc_info=True)
+        self._container.terminate()
+        self._cont_thread.join(10)
+        self._container.close()
@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+"""
+Created on 19 Oct 2026
+
+Copyright © 2026 Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms
+of the GNU General Public License version 2 as published by the Free Software
+Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+Odemis. If not, see http://www.gnu.org/licenses/.
+"""
+# Measures the frame rate of live DataFlows, both when directly subscribing to
+# the component, and via a proxy (ie, over Pyro + 0MQ, as the GUI does).
+# Also measures the size and time of the metadata encoding over 0MQ, and the
+# rate of small DataArrays which can be sent over 0MQ.
+
+import logging
+import pickle
+import threading
+import time
+
+import numpy
+import zmq
+
+from benchutil import SimMicroscope, measure_time
+from odemis import model
+from odemis.model import _dataflow
+
+CONFIG = "sparc2-sim.odm.yaml"
+DURATION = 5  # s, for each measurement
+DETECTORS = ("ccd", "se-detector")
+MD_FRAMES = 100000  # number of frames for the metadata encoding
+SMALL_ARRAYS = 100000  # number of 1-element arrays sent
+SMALL_BATCH = 100  # number of arrays per message, when batching
+
+
+class FrameCounter(object):
+    """
+    Listener of a DataFlow which counts the frames and bytes received
+    """
+
+    def __init__(self):
+        self.frames = 0
+        self.bytes = 0
+        self._first = threading.Event()
+
+    def on_data(self, df, data):
+        self.frames += 1
+        self.bytes += data.nbytes
+        self._first.set()
+
+    def wait_first(self, timeout):
+        return self._first.wait(timeout)
+
+
+def measure_dataflow(df, duration=DURATION):
+    """
+    Subscribes to a dataflow, and counts the frames received for a given time.
+    The first frame is skipped, as it includes the start-up time.
+    df (DataFlow): dataflow to subscribe to
+    duration (float): time to listen in s
+    return (float, float): frames per second, MB per second
+    """
+    counter = FrameCounter()
+    df.subscribe(counter.on_data)
+    try:
+        if not counter.wait_first(30):
+            raise IOError("No data received from %s" % (df,))
+        start = time.perf_counter()
+        f0, b0 = counter.frames, counter.bytes
+        time.sleep(duration)
+        dur = time.perf_counter() - start
+        frames, nbytes = counter.frames - f0, counter.bytes - b0
+    finally:
+        df.unsubscribe(counter.on_data)
+
+    return frames / dur, nbytes / dur / 1e6
+
+
+def _typical_metadata():
+    """
+    return (dict): metadata similar to the one of a spectrum CCD
+    """
+    return {model.MD_HW_NAME: "Andor iXon Ultra",
+            model.MD_HW_VERSION: "Andor v2.10, driver 2.102.30000.0",
+            model.MD_SW_VERSION: "3.0.2",
+            model.MD_DESCRIPTION: "Spectrum",
+            model.MD_PIXEL_SIZE: (16e-6, 16e-6),
+            model.MD_SENSOR_PIXEL_SIZE: (16e-6, 16e-6),
+            model.MD_BINNING: (1, 1),
+            model.MD_EXP_TIME: 0.01,
+            model.MD_GAIN: 1.0,
+            model.MD_READOUT_TIME: 1e-6,
+            model.MD_EBEAM_VOLTAGE: 5000.0,
+            model.MD_SENSOR_TEMP: -60.0,
+            model.MD_WL_LIST: list(numpy.linspace(400e-9, 700e-9, 512)),
+            model.MD_POS: (0.0, 0.0),
+            model.MD_ACQ_DATE: time.time(),
+            }
+
+
+def _send_full(mds):
+    """
+    Serialize the complete metadata of each frame (as before the delta encoding)
+    return (int): the total number of bytes
+    """
+    nbytes = 0
+    for md in mds:
+        nbytes += len(pickle.dumps({"metadata": md}, pickle.DEFAULT_PROTOCOL))
+    return nbytes
+
+
+def _send_delta(mds):
+    """
+    Serialize and decode the metadata of each frame, with the delta encoding
+    return (int): the total number of bytes
+    """
+    encoder = _dataflow._MetadataEncoder()
+    decoder = _dataflow._MetadataDecoder()
+    nbytes = 0
+    for md in mds:
+        msg = pickle.dumps(encoder.encode(md), pickle.DEFAULT_PROTOCOL)
+        nbytes += len(msg)
+        decoder.decode(pickle.loads(msg))
+    return nbytes
+
+
+def measure_metadata_encoding(results, nframes=MD_FRAMES):
+    """
+    Compare the size and time to transmit the metadata of a scan, where only
+    the date and position change for every frame.
+    """
+    md0 = _typical_metadata()
+    mds = []
+    for i in range(nframes):
+        md = md0.copy()
+        md[model.MD_ACQ_DATE] = md0[model.MD_ACQ_DATE] + i * 0.01
+        md[model.MD_POS] = ((i % 300) * 1e-7, (i // 300) * 1e-7)
+        mds.append(md)
+
+    dur, nbytes = measure_time(_send_full, mds, repeat=1)
+    results.add("dataflow.metadata.full.size", nbytes / nframes, "B/frame", higher_is_better=False)
+    results.add("dataflow.metadata.full.time", dur / nframes, "s/frame", higher_is_better=False)
+    dur, nbytes = measure_time(_send_delta, mds, repeat=1)
+    results.add("dataflow.metadata.delta.size", nbytes / nframes, "B/frame", higher_is_better=False)
+    results.add("dataflow.metadata.delta.time", dur / nframes, "s/frame", higher_is_better=False)
+
+
+def _send_small_pickle(pub, das):
+    """
+    Send each DataArray with a pickled header (as before the binary header)
+    """
+    encoder = _dataflow._MetadataEncoder()
+    for d in das:
+        dformat = encoder.encode(d.metadata)
+        dformat["dtype"] = str(d.dtype)
+        dformat["shape"] = d.shape
+        pub.send_pyobj(dformat, zmq.SNDMORE)
+        pub.send(memoryview(d), copy=False)
+
+
+def _recv_small_pickle(sub, n):
+    decoder = _dataflow._MetadataDecoder()
+    for i in range(n):
+        dformat = sub.recv_pyobj()
+        buf = sub.recv(copy=False)
+        md = decoder.decode(dformat)
+        model.DataArray(numpy.frombuffer(buf, dtype=dformat["dtype"]).reshape(dformat["shape"]), md)
+
+
+def _send_small_binary(pub, das, batch=1):
+    """
+    Send the DataArrays with the binary header, by messages of batch arrays
+    """
+    encoder = _dataflow._HeaderEncoder()
+    for i, d in enumerate(das):
+        pub.send(encoder.encode(d), zmq.SNDMORE)
+        last = (i + 1) % batch == 0 or i == len(das) - 1
+        pub.send(memoryview(d), 0 if last else zmq.SNDMORE, copy=False)
+
+
+def _recv_small_binary(sub, n):
+    decoder = _dataflow._HeaderDecoder()
+    for i in range(n):
+        dtype, shape, md = decoder.decode(sub.recv())
+        buf = sub.recv(copy=False)
+        model.DataArray(numpy.frombuffer(buf, dtype=dtype).reshape(shape), md)
+
+
+def _transmit_small(sender, receiver, das):
+    """
+    Send DataArrays over 0MQ, from the current thread to a receiving thread.
+    return (float): duration in s, until all the data is received
+    """
+    ctx = zmq.Context(1)
+    pub = ctx.socket(zmq.PUB)
+    pub.sndhwm = 0  # Never drop messages
+    pub.bind("ipc://odemis-bench-dataflow")
+    sub = ctx.socket(zmq.SUB)
+    sub.rcvhwm = 0
+    sub.connect("ipc://odemis-bench-dataflow")
+    sub.setsockopt(zmq.SUBSCRIBE, b"")
+    time.sleep(0.2)  # let the subscription propagate
+    try:
+        t = threading.Thread(target=receiver, args=(sub, len(das)))
+        start = time.perf_counter()
+        t.start()
+        sender(pub, das)
+        t.join()
+        return time.perf_counter() - start
+    finally:
+        pub.close(linger=0)
+        sub.close(linger=0)
+        ctx.term()
+
+
+def measure_small_arrays(results, n=SMALL_ARRAYS):
+    """
+    Measure the number of 1-element arrays (as sent by a counting detector)
+    which can be transmitted per second.
+    """
+    md0 = {model.MD_HW_NAME: "Fake counter",
+           model.MD_DWELL_TIME: 1e-3,
+           model.MD_DESCRIPTION: "Counts",
+           model.MD_POS: (0.0, 0.0),
+           model.MD_ACQ_DATE: time.time()}
+    das = []
+    for i in range(n):
+        md = md0.copy()
+        md[model.MD_ACQ_DATE] += i * 1e-3
+        das.append(model.DataArray(numpy.array([i], dtype=numpy.uint32), md))
+
+    dur = _transmit_small(_send_small_pickle, _recv_small_pickle, das)
+    results.add("dataflow.small.pickle.rate", n / dur, "arrays/s")
+    dur = _transmit_small(_send_small_binary, _recv_small_binary, das)
+    results.add("dataflow.small.binary.rate", n / dur, "arrays/s")
+    dur = _transmit_small(lambda pub, das: _send_small_binary(pub, das, SMALL_BATCH),
+                          _recv_small_binary, das)
+    results.add("dataflow.small.batch.rate", n / dur, "arrays/s", batch=SMALL_BATCH)
+
+
+def _fastest_settings(det, emitter):
+    """
+    Set the detector (or its emitter) to produce frames as fast as possible
+    """
+    if hasattr(det, "exposureTime"):
+        det.exposureTime.value = det.exposureTime.range[0]
+    elif emitter is not None and hasattr(emitter, "dwellTime"):
+        emitter.dwellTime.value = emitter.dwellTime.range[0]
+    if hasattr(det, "resolution"):
+        return det.resolution.value
+    elif emitter is not None and hasattr(emitter, "resolution"):
+        return emitter.resolution.value
+    return None
+
+
+def run(results, config=CONFIG):
+    """
+    results (BenchmarkResults): where to store the measurements
+    config (str): microscope file to use
+    """
+    measure_metadata_encoding(results)
+    measure_small_arrays(results)
+
+    with SimMicroscope(config) as mic:
+        try:
+            ebeam = mic.getComponent("e-beam")
+        except LookupError:
+            ebeam = None
+
+        for role in DETECTORS:
+            try:
+                det = mic.getComponent(role)
+            except LookupError:
+                logging.info("No %s in %s, skipping it", role, config)
+                continue
+
+            res = _fastest_settings(det, ebeam)
+            fps, mbps = measure_dataflow(det.data)
+            results.add("dataflow.local.%s.fps" % role, fps, "fps", res=res)
+            results.add("dataflow.local.%s.throughput" % role, mbps, "MB/s", res=res)
+
+            # Same thing, but over 0MQ
+            pdet = mic.getProxy(det)
+            fps, mbps = measure_dataflow(pdet.data)
+            results.add("dataflow.proxy.%s.fps" % role, fps, "fps", res=res)
+            results.add("dataflow.proxy.%s.throughput" % role, mbps, "MB/s", res=res)
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Created on 19 Oct 2026
+
+Copyright © 2026 Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms
+of the GNU General Public License version 2 as published by the Free Software
+Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+Odemis. If not, see http://www.gnu.org/licenses/.
+"""
+# Measures the rate at which the semnidaq driver can downsample the analog input
+# data into the frame, chunk by chunk as during an acquisition, either in the
+# acquisition thread or in a pool of threads (one per channel), in parallel with
+# the "reading" of the next chunk (which is simulated by a copy).
+# It needs the nidaqmx module to be installed (but no hardware).
+
+from concurrent.futures import ThreadPoolExecutor
+import types
+
+import numpy
+
+from benchutil import measure_time
+from odemis import util
+
+RES = (1024, 1024)  # X, Y
+MARGIN = 16  # px
+CHUNK_SAMPLES = 2 ** 20  # Samples per channel read at once
+# channels, oversampling ratio
+SETTINGS = ((1, 10), (2, 10), (4, 10), (4, 40))
+
+
+def _create_samples(n_channels, osr):
+    """
+    returns (ndarray of shape C, N, int16): the raw samples of a whole frame
+    """
+    rng = numpy.random.default_rng(0)
+    samples_n = RES[1] * (RES[0] + MARGIN) * osr
+    return rng.integers(-2000, 2000, (n_channels, samples_n), dtype=numpy.int16)
+
+
+def _downsample_sequential(Acquirer, samples, osr):
+    """
+    Downsample each chunk of all the channels in the current thread
+    """
+    n_channels, samples_n = samples.shape
+    data = numpy.empty((n_channels,) + RES[::-1], dtype=samples.dtype)
+    acc_dtype = util.get_best_dtype_for_acc(samples.dtype, osr)
+    buffer = numpy.empty((n_channels, CHUNK_SAMPLES), dtype=samples.dtype)
+    prev_samples_n = [0] * n_channels
+    prev_samples_sum = [0] * n_channels
+    for acquired_n in range(0, samples_n, CHUNK_SAMPLES):
+        n = min(CHUNK_SAMPLES, samples_n - acquired_n)
+        buffer[:, :n] = samples[:, acquired_n:acquired_n + n]  # "read"
+        for c in range(n_channels):
+            prev_samples_n[c], prev_samples_sum[c] = Acquirer._downsample_data(
+                data[c], RES, MARGIN, acquired_n, osr, buffer[c, :n],
+                prev_samples_n[c], prev_samples_sum[c], acc_dtype)
+    return data
+
+
+def _downsample_parallel(AIDownsampler, executor, samples, osr):
+    """
+    Downsample each chunk with the AIDownsampler, while the next chunk is "read"
+    """
+    n_channels, samples_n = samples.shape
+    data = numpy.empty((n_channels,) + RES[::-1], dtype=samples.dtype)
+    acc_dtype = util.get_best_dtype_for_acc(samples.dtype, osr)
+    acq_settings = types.SimpleNamespace(res=RES, margin=MARGIN, ai_osr=osr)
+    downsampler = AIDownsampler(acq_settings, data, acc_dtype, executor)
+    buffers = [numpy.empty((n_channels, CHUNK_SAMPLES), dtype=samples.dtype) for _ in range(2)]
+    for i, acquired_n in enumerate(range(0, samples_n, CHUNK_SAMPLES)):
+        n = min(CHUNK_SAMPLES, samples_n - acquired_n)
+        buffers[i % 2][:, :n] = samples[:, acquired_n:acquired_n + n]  # "read"
+        downsampler.submit(buffers[i % 2], acquired_n, n)
+    downsampler.wait()
+    return data
+
+
+def run(results):
+    """
+    results (BenchmarkResults): where to store the measurements
+    """
+    from odemis.driver.semnidaq import Acquirer, AIDownsampler, MAX_DOWNSAMPLE_WORKERS
+
+    executor = ThreadPoolExecutor(max_workers=MAX_DOWNSAMPLE_WORKERS)
+    try:
+        for n_channels, osr in SETTINGS:
+            samples = _create_samples(n_channels, osr)
+            name = "downsample.%dch.osr%d" % (n_channels, osr)
+
+            dur_seq, exp_data = measure_time(_downsample_sequential, Acquirer, samples, osr)
+            results.add(name + ".sequential", samples.size / dur_seq, "samples/s")
+
+            dur, data = measure_time(_downsample_parallel, AIDownsampler, executor, samples, osr)
+            results.add(name + ".parallel", samples.size / dur, "samples/s",
+                        workers=min(n_channels, MAX_DOWNSAMPLE_WORKERS))
+            results.add(name + ".speedup", dur_seq / dur, "x")
+
+            if not numpy.array_equal(data, exp_data):
+                raise ValueError("Parallel downsampling of %d channels with osr %d differs from the "
+                                 "sequential one" % (n_channels, osr))
+    finally:
+        executor.shutdown()
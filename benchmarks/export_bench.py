@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+Created on 19 Oct 2026
+
+Copyright © 2026 Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms
+of the GNU General Public License version 2 as published by the Free Software
+Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+Odemis. If not, see http://www.gnu.org/licenses/.
+"""
+# Measures the throughput of the exporters (TIFF & HDF5), on typical data.
+
+import os
+import shutil
+import tempfile
+import time
+
+import numpy
+
+from benchutil import measure_time
+from odemis import model
+from odemis.dataio import hdf5, tiff
+
+
+def _create_data():
+    """
+    return (dict str -> list of DataArray): name of the data -> data to export
+    """
+    md = {model.MD_PIXEL_SIZE: (1e-7, 1e-7),
+          model.MD_POS: (1e-3, -2e-3),
+          model.MD_ACQ_DATE: time.time(),
+          model.MD_EXP_TIME: 0.1,
+          model.MD_BPP: 12,
+          }
+
+    rng = numpy.random.default_rng(0)
+    img = model.DataArray(rng.integers(0, 4095, (2048, 2048), dtype=numpy.uint16), md.copy())
+
+    spec_md = md.copy()
+    spec_md[model.MD_WL_LIST] = list(400e-9 + numpy.arange(256) * 1e-9)
+    spec = model.DataArray(rng.integers(0, 4095, (256, 1, 1, 256, 256), dtype=numpy.uint16), spec_md)
+
+    return {"image2k": [img],
+            "spectrum256": [img[:256, :256].copy(), spec],
+            }
+
+
+def run(results):
+    """
+    results (BenchmarkResults): where to store the measurements
+    """
+    all_data = _create_data()
+    exporters = {"tiff": lambda fn, d: tiff.export(fn, d),
+                 "tiff-uncompressed": lambda fn, d: tiff.export(fn, d, compressed=False),
+                 "tiff-pyramid": lambda fn, d: tiff.export(fn, d, pyramid=True),
+                 "hdf5": lambda fn, d: hdf5.export(fn, d),
+                 }
+    exts = {"hdf5": ".h5"}
+
+    tmpdir = tempfile.mkdtemp(prefix="odemis-bench-")
+    try:
+        for dname, data in all_data.items():
+            nbytes = sum(d.nbytes for d in data)
+            for ename, export in exporters.items():
+                fn = os.path.join(tmpdir, "%s-%s%s" % (dname, ename, exts.get(ename, ".ome.tiff")))
+                dur, _ = measure_time(export, fn, data)
+                results.add("export.%s.%s" % (ename, dname), nbytes / dur / 1e6, "MB/s",
+                            size=nbytes, file_size=os.path.getsize(fn))
+                os.remove(fn)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Created on 19 Oct 2026
+
+Copyright © 2026 Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms
+of the GNU General Public License version 2 as published by the Free Software
+Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+Odemis. If not, see http://www.gnu.org/licenses/.
+"""
+# Measures the latency of the conversion of raw data to RGB images, as used
+# every time the GUI displays a new image.
+
+import time
+
+import numpy
+
+from benchutil import measure_time
+from odemis import model
+from odemis.acq import stream
+from odemis.acq.stream import RGBSpatialProjection
+from odemis.util import img
+
+SIZES = ((512, 512), (2048, 2048), (4096, 4096))
+
+
+def bench_rgb(results):
+    rng = numpy.random.default_rng(0)
+    for shape in SIZES:
+        data = model.DataArray(rng.integers(0, 4095, shape, dtype=numpy.uint16))
+        dur, _ = measure_time(img.DataArray2RGB, data, (100, 3000), (0, 255, 0))
+        results.add("projection.rgb.%dx%d" % shape, dur * 1e3, "ms", higher_is_better=False)
+
+        dur, _ = measure_time(img.histogram, data)
+        results.add("projection.histogram.%dx%d" % shape, dur * 1e3, "ms", higher_is_better=False)
+
+
+def bench_spatial(results):
+    """
+    Full projection of a 2D static stream, as done when displaying an image
+    """
+    rng = numpy.random.default_rng(0)
+    md = {model.MD_PIXEL_SIZE: (1e-7, 1e-7),
+          model.MD_POS: (0, 0),
+          model.MD_IN_WL: (500e-9, 520e-9),
+          model.MD_OUT_WL: (600e-9, 630e-9),
+          }
+    for shape in SIZES:
+        data = model.DataArray(rng.integers(0, 4095, shape, dtype=numpy.uint16), md.copy())
+        fls = stream.StaticFluoStream("bench fluo", data)
+        proj = RGBSpatialProjection(fls)
+        dur, _ = measure_time(proj._updateImage)
+        results.add("projection.spatial.%dx%d" % shape, dur * 1e3, "ms", higher_is_better=False)
+
+
+def bench_spectrum(results):
+    """
+    Projection of a spectrum cube (for each bandwidth change)
+    """
+    rng = numpy.random.default_rng(0)
+    shape = (1024, 1, 1, 256, 256)
+    md = {model.MD_PIXEL_SIZE: (1e-7, 1e-7),
+          model.MD_POS: (0, 0),
+          model.MD_ACQ_DATE: time.time(),
+          model.MD_WL_LIST: list(400e-9 + numpy.arange(shape[0]) * 0.5e-9),
+          }
+    data = model.DataArray(rng.integers(0, 4095, shape, dtype=numpy.uint16), md)
+    specs = stream.StaticSpectrumStream("bench spec", data)
+    proj = RGBSpatialProjection(specs)
+
+    wl_rng = specs.spectrumBandwidth.range
+    specs.spectrumBandwidth.value = (wl_rng[0][0], wl_rng[1][1])  # Full range
+    dur, _ = measure_time(proj._updateImage)
+    results.add("projection.spectrum.1024x256x256", dur * 1e3, "ms", higher_is_better=False)
+
+    # Typical of the user dragging the bandwidth: a different range each time
+    specs.tint.value = model.TINT_FIT_TO_RGB
+    bandwidths = [(wl_rng[0][0] + i * 10e-9, wl_rng[0][0] + i * 10e-9 + 100e-9) for i in range(10)]
+    start = time.perf_counter()
+    for bw in bandwidths:
+        specs.spectrumBandwidth.value = bw
+        proj._updateImage()
+    dur = (time.perf_counter() - start) / len(bandwidths)
+    results.add("projection.spectrum.bandwidth_change", dur * 1e3, "ms", higher_is_better=False)
+
+    # Change of calibration, until the new image is displayed
+    coef = model.DataArray(numpy.linspace(0.5, 2, 64).reshape(64, 1, 1, 1, 1),
+                           {model.MD_WL_LIST: list(numpy.linspace(350e-9, 950e-9, 64))})
+
+    def set_calibration():
+        specs.efficiencyCompensation.value = coef
+        proj._updateImage()
+
+    dur, _ = measure_time(set_calibration, repeat=1)  # Same calibration is not recomputed
+    results.add("projection.spectrum.calibration_change", dur * 1e3, "ms", higher_is_better=False)
+
+
+def run(results):
+    """
+    results (BenchmarkResults): where to store the measurements
+    """
+    bench_rgb(results)
+    bench_spatial(results)
+    bench_spectrum(results)
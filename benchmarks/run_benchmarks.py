@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on 19 Oct 2026
+
+Copyright © 2026 Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms
+of the GNU General Public License version 2 as published by the Free Software
+Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+Odemis. If not, see http://www.gnu.org/licenses/.
+"""
+# Runs the performance benchmarks, and stores the results as a JSON file, which
+# can be compared to the results of a previous run (eg, of the previous release).
+# It doesn't need a running back-end: the simulated microscopes are instantiated
+# within this process. It must not be run while a back-end is running, as the
+# simulators might compete for CPU.
+# Example:
+# ./benchmarks/run_benchmarks.py --output bench-3.7.json
+# ./benchmarks/run_benchmarks.py --only export projection --compare bench-3.6.json
+
+import argparse
+import logging
+import sys
+
+import acquisition_bench
+import dataflow_bench
+import downsample_bench
+import export_bench
+import projection_bench
+import shift_bench
+import spike_bench
+import waveform_bench
+import xt_image_bench
+from benchutil import BenchmarkResults, compare_results, load_results, DEFAULT_TOLERANCE
+
+# name -> function to run (taking a BenchmarkResults as argument)
+BENCHMARKS = {
+    "dataflow": dataflow_bench.run,
+    "downsample": downsample_bench.run,
+    "acquisition": acquisition_bench.run,
+    "export": export_bench.run,
+    "projection": projection_bench.run,
+    "shift": shift_bench.run,
+    "spike": spike_bench.run,
+    "waveform": waveform_bench.run,
+    "xt_image": xt_image_bench.run,
+}
+
+
+def main(args):
+    """
+    Handles the command line arguments
+    args is the list of arguments passed
+    return (int): value to return to the OS as program exit code
+    """
+    parser = argparse.ArgumentParser(description="Run the Odemis performance benchmarks")
+    parser.add_argument("--log-level", dest="loglev", metavar="<level>", type=int, choices=[0, 1, 2],
+                        default=0, help="set verbosity level (0-2, default = 0)")
+    parser.add_argument("--only", dest="only", nargs="+", choices=sorted(BENCHMARKS.keys()),
+                        help="only run the given benchmarks (default: all)")
+    parser.add_argument("--output", "-o", dest="output",
+                        help="JSON file where to store the results")
+    parser.add_argument("--compare", "-c", dest="compare",
+                        help="JSON file of previous results to compare to")
+    parser.add_argument("--tolerance", dest="tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="relative change considered as a regression (default: %(default)s)")
+    options = parser.parse_args(args[1:])
+
+    loglev_names = [logging.WARNING, logging.INFO, logging.DEBUG]
+    logging.getLogger().setLevel(loglev_names[options.loglev])
+
+    results = BenchmarkResults()
+    failed = []
+    for name in (options.only or BENCHMARKS.keys()):
+        logging.warning("Running benchmark %s...", name)
+        try:
+            BENCHMARKS[name](results)
+        except Exception:
+            logging.exception("Benchmark %s failed", name)
+            failed.append(name)
+
+    for n, r in sorted(results.results.items()):
+        print("%-50s %12.4g %s" % (n, r["value"], r["unit"]))
+
+    if options.output:
+        results.save(options.output)
+
+    ret = 0
+    if options.compare:
+        ref = load_results(options.compare)
+        print("\nComparison with %s:" % (options.compare,))
+        for n, vref, vnew, change, status in compare_results(ref, results.results, options.tolerance):
+            print("%-50s %12.4g -> %12.4g (%+.1f%%) %s" % (n, vref, vnew, change * 100, status))
+            if status == "REGRESSION":
+                ret = 1
+
+    if failed:
+        logging.error("Benchmarks failed: %s", ", ".join(failed))
+        ret = 127
+    return ret
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format="%(asctime)s (%(module)s) %(levelname)s: %(message)s")
+    ret = main(sys.argv)
+    exit(ret)
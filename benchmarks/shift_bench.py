@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+Created on 19 Oct 2026
+
+Copyright © 2026 Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms
+of the GNU General Public License version 2 as published by the Free Software
+Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+Odemis. If not, see http://www.gnu.org/licenses/.
+"""
+# Measures the time to compute the shift between two images, as done by the
+# drift correction (with sub-pixel precision) and the tile registration.
+
+import numpy
+
+from benchutil import measure_time
+from odemis.acq.align.shift import MeasureShift, ShiftMeasurer
+
+SIZES = ((128, 128), (512, 512), (1024, 1024))
+PRECISIONS = (1, 10)
+N_IMAGES = 16  # Number of images compared to the reference
+
+
+def _create_images(shape, n):
+    """
+    returns (ndarray, list of ndarray): reference image, and n shifted images
+    """
+    rng = numpy.random.default_rng(0)
+    ref = rng.random(shape)
+    imgs = [numpy.roll(ref, (i, -i), axis=(0, 1)) + 0.1 * rng.random(shape) for i in range(n)]
+    return ref, imgs
+
+
+def run(results):
+    """
+    results (BenchmarkResults): where to store the measurements
+    """
+    for shape in SIZES:
+        ref, imgs = _create_images(shape, N_IMAGES)
+        for prec in PRECISIONS:
+            name = "shift.%dx%d.prec%d" % (shape + (prec,))
+            dur, _ = measure_time(lambda: [MeasureShift(ref, im, prec) for im in imgs])
+            results.add(name + ".measureshift", dur / N_IMAGES * 1e3, "ms", higher_is_better=False)
+
+            measurer = ShiftMeasurer(shape, prec)
+            measurer.set_reference(ref)
+            dur, _ = measure_time(lambda: [measurer.measure(ref, im) for im in imgs])
+            results.add(name + ".measurer", dur / N_IMAGES * 1e3, "ms", higher_is_better=False)
+
+            dur, _ = measure_time(measurer.measure_batch, ref, imgs)
+            results.add(name + ".batch", dur / N_IMAGES * 1e3, "ms", higher_is_better=False)
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+Created on 19 Oct 2026
+
+Copyright © 2026 Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms
+of the GNU General Public License version 2 as published by the Free Software
+Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+Odemis. If not, see http://www.gnu.org/licenses/.
+"""
+# Measures the time to remove the cosmic ray spikes from a spectrum cube, with
+# the vectorised implementation, compared to the original per-pixel loop of the
+# spike removal plugin (which must give the same output).
+
+import numpy
+
+from benchutil import measure_time
+from odemis.util import spectrum
+
+SIZES = ((256, 32, 32), (1024, 64, 64), (1024, 128, 128))  # C, Y, X
+THRESHOLD = 8
+
+
+def _create_spectra(shape):
+    """
+    returns (ndarray of shape C11YX, uint16): smooth spectra with some spikes
+    """
+    rng = numpy.random.default_rng(0)
+    c, h, w = shape
+    wl = numpy.linspace(-1, 1, c)[:, None, None]
+    data = 1000 + 500 * numpy.exp(-wl ** 2 / 0.1) * rng.random((1, h, w)) + rng.normal(0, 10, shape)
+    # About one spike every 10 spectra, of 1 to 3 wavelengths
+    nspikes = h * w // 10
+    for ci, yi, xi, l in zip(rng.integers(0, c - 3, nspikes), rng.integers(0, h, nspikes),
+                             rng.integers(0, w, nspikes), rng.integers(1, 4, nspikes)):
+        data[ci:ci + l, yi, xi] += rng.uniform(5000, 20000)
+    return data.astype(numpy.uint16).reshape(c, 1, 1, h, w)
+
+
+def _remove_spikes_loop(raw_spec_dat, spikestep):
+    """
+    Reference implementation, as originally in the spike removal plugin
+    """
+    s = raw_spec_dat.shape
+    specdat = numpy.reshape(raw_spec_dat.copy(), (s[-5], s[-2], s[-1]))
+    diffspec = numpy.diff(numpy.float32(specdat), axis=0) ** 2
+    size = numpy.shape(diffspec)
+    ms_step = (diffspec / numpy.prod(size)).sum()
+    threshold = ms_step * spikestep ** 2
+    spike_margin = 1
+    spike_spacing = 3
+    npixels = 0
+    nspikes = 0
+    for ii in range(size[1]):
+        for jj in range(size[2]):
+            specdiff = diffspec[:, ii, jj]
+            spec = specdat[:, ii, jj]
+            spike_indices = numpy.argwhere(specdiff > threshold)
+            num_spike_indices = numpy.size(spike_indices)
+            if num_spike_indices > 1:
+                npixels += 1
+                spike_indices = numpy.squeeze(spike_indices)
+                dif_spike = numpy.diff(spike_indices)
+                spike_edges = numpy.argwhere(dif_spike > spike_spacing)
+                spike_edges = numpy.append(spike_edges, num_spike_indices - 1)
+                for pp, se in enumerate(spike_edges):
+                    nspikes += 1
+                    if pp == 0:
+                        spike_indices1 = spike_indices[0:(se + 1)]
+                    else:
+                        spike_indices1 = spike_indices[(spike_edges[pp - 1] + 1):(se + 1)]
+                    min_edge = spike_indices1.min() - spike_margin
+                    max_edge = spike_indices1.max() + spike_margin
+                    if min_edge > 0 and max_edge < size[0]:
+                        line = numpy.linspace(spec[min_edge], spec[max_edge], (max_edge - min_edge) + 1)
+                        spec[min_edge:max_edge + 1] = line
+                    elif min_edge <= 0:
+                        line = numpy.linspace(spec[0], spec[max_edge], max_edge + 1)
+                        spec[0:max_edge + 1] = line
+                    elif max_edge >= size[0]:
+                        line = numpy.linspace(spec[min_edge], spec[size[0]], size[0] - min_edge + 1)
+                        spec[min_edge:size[0] + 1] = line
+                specdat[:, ii, jj] = spec
+
+    specdat.shape = raw_spec_dat.shape
+    return specdat, npixels, nspikes
+
+
+def run(results):
+    """
+    results (BenchmarkResults): where to store the measurements
+    """
+    for shape in SIZES:
+        data = _create_spectra(shape)
+        name = "spike.%dx%dx%d" % shape
+
+        dur_loop, (exp_data, exp_npixels, exp_nspikes) = measure_time(_remove_spikes_loop, data, THRESHOLD, repeat=1)
+        results.add(name + ".loop", dur_loop * 1e3, "ms", higher_is_better=False)
+
+        dur, (cor_data, npixels, nspikes) = measure_time(spectrum.remove_spikes, data, THRESHOLD)
+        results.add(name + ".vectorised", dur * 1e3, "ms", higher_is_better=False)
+        results.add(name + ".speedup", dur_loop / dur, "x")
+
+        if (npixels, nspikes) != (exp_npixels, exp_nspikes) or not numpy.array_equal(cor_data, exp_data):
+            raise ValueError("Spike removal of %s differs from the reference: %d/%d spectra, %d/%d spikes, "
+                             "%d values different" % (shape, npixels, exp_npixels, nspikes, exp_nspikes,
+                                                      numpy.count_nonzero(cor_data != exp_data)))
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+Created on 19 Oct 2026
+
+Copyright © 2026 Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms
+of the GNU General Public License version 2 as published by the Free Software
+Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+Odemis. If not, see http://www.gnu.org/licenses/.
+"""
+# Measures the time to generate the scan waveforms (analog and TTL) of the semnidaq
+# driver, by computing a single line and copying it over the frame, compared to
+# the original implementation which fills the whole frame for each signal (and
+# must give the same output).
+# It needs the nidaqmx module to be installed (but no hardware).
+
+import types
+
+import numpy
+
+from benchutil import measure_time
+
+# X, Y, margin, dup
+SETTINGS = ((1024, 1024, 10, 1), (4096, 4096, 40, 1), (1024, 1024, 10, 4))
+LIMITS = ((-20000, 20000), (18000, -18000))
+# Fake scanner, with all the TTLs: pixel on DO 0 & 3 (inverted), line on 1, frame on 2
+SCANNER_TTL = types.SimpleNamespace(_fast_do_names=["pixel", "line", "frame"],
+                                    _pixel_ttl=[0, 3], _line_ttl=[1], _frame_ttl=[2],
+                                    _ttl_inverted={0: False, 3: True, 1: False, 2: False})
+
+
+def _generate_scan_array_frame(res, limits, margin, dup):
+    """
+    Reference implementation, filling the whole frame for each dimension
+    """
+    full_shape = (2, res[1], res[0] + margin, dup)
+    scan = numpy.empty(full_shape, dtype=numpy.int16, order='C')
+    scan_dup = numpy.moveaxis(scan, 3, 0)
+    scany = scan_dup[:, 1, :, :].swapaxes(1, 2)
+    scany[:, :, :] = numpy.linspace(limits[1][0], limits[1][1], res[1])
+    scan_dup[:, 0, :, margin:] = numpy.linspace(limits[0][0], limits[0][1], res[0])
+    if margin:
+        scan_dup[:, 0, :, :margin] = limits[0][0]
+    return scan
+
+
+def _generate_signal_array_bits_frame(self, res, margin, dup):
+    """
+    Reference implementation, filling the whole frame for each TTL
+    """
+    dtype = numpy.uint32
+    full_shape = (res[1], 2 * (res[0] + margin), dup)
+    ttl_signal = numpy.empty(full_shape, dtype=dtype, order='C')
+    inactive_bitmap = sum(1 << port for port, inv in self._ttl_inverted.items() if inv)
+    ttl_signal[...] = inactive_bitmap
+
+    for c in self._pixel_ttl:
+        ttl_signal[:, margin * 2::2, 0] ^= dtype(1 << c)
+
+    ttl_signal_dup = numpy.moveaxis(ttl_signal, 2, 0)
+    for c in self._line_ttl:
+        line_bit = dtype(1 << c)
+        ttl_signal_dup[:, :, margin * 2:] ^= line_bit
+        if not margin:
+            ttl_signal_dup[-1, :, -1] ^= line_bit
+
+    for c in self._frame_ttl:
+        frame_bit = dtype(1 << c)
+        frame_signal = ttl_signal_dup.reshape(dup, res[1] * 2 * (res[0] + margin))
+        frame_signal[:, margin * 2:] ^= frame_bit
+        if not margin:
+            frame_signal[-1, -1] ^= frame_bit
+
+    return ttl_signal
+
+
+def run(results):
+    """
+    results (BenchmarkResults): where to store the measurements
+    """
+    from odemis.driver.semnidaq import Scanner
+
+    for x, y, margin, dup in SETTINGS:
+        res = (x, y)
+        name = "waveform.%dx%d.dup%d" % (x, y, dup)
+
+        dur_frame, exp_scan = measure_time(_generate_scan_array_frame, res, LIMITS, margin, dup)
+        results.add(name + ".analog.frame", dur_frame * 1e3, "ms", higher_is_better=False)
+        dur, scan = measure_time(Scanner._generate_scan_array, res, LIMITS, margin, dup)
+        results.add(name + ".analog.line", dur * 1e3, "ms", higher_is_better=False)
+        results.add(name + ".analog.speedup", dur_frame / dur, "x")
+
+        dur_frame, exp_ttl = measure_time(_generate_signal_array_bits_frame, SCANNER_TTL, res, margin, dup)
+        results.add(name + ".ttl.frame", dur_frame * 1e3, "ms", higher_is_better=False)
+        dur, ttl = measure_time(Scanner._generate_signal_array_bits, SCANNER_TTL, res, margin, dup)
+        results.add(name + ".ttl.line", dur * 1e3, "ms", higher_is_better=False)
+        results.add(name + ".ttl.speedup", dur_frame / dur, "x")
+
+        if not numpy.array_equal(scan, exp_scan) or not numpy.array_equal(ttl, exp_ttl):
+            raise ValueError("Waveforms of %s differ from the reference" % (name,))
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+Created on 19 Oct 2026
+
+Copyright © 2026 Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms
+of the GNU General Public License version 2 as published by the Free Software
+Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+Odemis. If not, see http://www.gnu.org/licenses/.
+"""
+# Measures the time spent by the acquisition thread of the xt_client driver to
+# retrieve an image from the server, and the time to decode it (which is done in
+# a separate thread, while the next image is scanned). It compares the standard
+# transfer (get_latest_image(), decoded within the call), with the same transfer
+# decoded later, and with the transfer as a raw or compressed buffer.
+# It runs a fake xtadapter server locally, so the network is much faster than
+# with a real microscope. It needs the Pyro5 and msgpack_numpy modules.
+
+import numpy
+
+from benchutil import measure_time
+
+SHAPES = ((1024, 1536), (3072, 4096))  # Y, X
+
+
+def _create_image(shape):
+    """
+    returns (ndarray of shape, uint16): an image with a gradient and noise, which is
+      roughly as compressible as a SEM image
+    """
+    rng = numpy.random.default_rng(0)
+    gradient = numpy.linspace(10000, 30000, shape[1], dtype=numpy.uint16)
+    return gradient + rng.integers(0, 2000, shape, dtype=numpy.uint16)
+
+
+def run(results):
+    """
+    results (BenchmarkResults): where to store the measurements
+    """
+    from odemis.driver import xt_client
+    from odemis.driver.test import xt_fake_server
+
+    server = xt_fake_server.FakeXTServer()
+    uri, daemon = xt_fake_server.start_server(server)
+    legacy_server = xt_fake_server.LegacyXTServer()
+    legacy_uri, legacy_daemon = xt_fake_server.start_server(legacy_server)
+    try:
+        client = xt_fake_server.create_client(uri)
+        legacy_client = xt_fake_server.create_client(legacy_uri)
+        channel = "electron1"
+        for shape in SHAPES:
+            image = _create_image(shape)
+            server.image = image
+            legacy_server.image = image
+            name = "xt_image.%dx%d" % (shape[1], shape[0])
+
+            dur, _ = measure_time(xt_client.SEM.get_latest_image, legacy_client, channel)
+            results.add(name + ".standard.call", dur * 1e3, "ms", higher_is_better=False)
+
+            for cname, c, compression in (("fallback", legacy_client, None),
+                                          ("raw", client, None),
+                                          ("zlib", client, "zlib")):
+                dur, buf = measure_time(xt_client.SEM.get_latest_image_buffer, c, channel, compression)
+                results.add("%s.%s.call" % (name, cname), dur * 1e3, "ms", higher_is_better=False)
+                dur, decoded = measure_time(xt_client.decode_image_buffer, buf)
+                results.add("%s.%s.decode" % (name, cname), dur * 1e3, "ms", higher_is_better=False)
+                if not numpy.array_equal(decoded, image):
+                    raise ValueError("Image transferred via %s differs from the original" % (cname,))
+    finally:
+        daemon.shutdown()
+        legacy_daemon.shutdown()
@@ -40,6 +40,7 @@ from odemis import dataio, model
 from odemis.acq.stream import SpectrumStream
 from odemis.gui.plugin import Plugin, AcquisitionDialog
 from odemis.gui.util import call_in_wx_main
+from odemis.util import spectrum
 from odemis.util.dataio import open_acquisition
 from odemis.gui.win.acquisition import ShowAcquisitionFileDialog
 from odemis.acq.stream import DataProjection
@@ -50,7 +51,7 @@ import os.path
 
 class SpikeRemovalPlugin(Plugin):
     name = "Spike removal"
-    __version__ = "1.1"
+    __version__ = "1.2"
     __author__ = "Toon Coenen and Eric Piel"
     __license__ = "Public domain"
 
@@ -215,92 +216,12 @@ class SpikeRemovalPlugin(Plugin):
            spikes corrected (int)
         """
         # The spike detection is performed by comparing the signal differential
-        # with the average differential in the scan. If the differential for a
-        # given pixel exceeds a given threshold (spikestep), it will be marked
-        # as a spike. Subsequently, the identified pixels will be corrected
-        # using the values in neighboring pixels in the spectrum.
-
-        spikestep = self.threshold.value
-
-        assert raw_spec_dat.ndim == 5
-        s = raw_spec_dat.shape
-        specdat = numpy.reshape(raw_spec_dat, (s[-5], s[-2], s[-1]))
-
-        assert specdat.ndim == 3
-        # this diff calculation requires higher numerical precision than 16 bits because it is squared.
-        # 32 uint should be good enough as the max diff < 2**16. However for the summation of ms_step it is more convenient to use float32.
-        # Maybe there is a trick to stick with uint32?
-        diffspec = numpy.diff(numpy.float32(specdat), axis=0) ** 2
-        size = numpy.shape(diffspec)
-        ms_step = (diffspec / numpy.prod(size)).sum()
-
-        # We are now calculating the threshold based on the global average.
-        # Using a more local average could help identifying spikes
-        # more precisely although but it is more involved and possibly overkill
-        threshold = ms_step * spikestep**2
-        # this sets sensitivity to spikes. Used in combination with this number
-        # is rather large now, we could be a bit more clever if a spike covers more pixels
-        spike_margin = 1  # number of pixels left and right of spike that are also corrected
-        spike_spacing = 3  # when spikes are considered to be two separate spikes
-        npixels = 0  # number of corrected pixels (aka single spectrum)
-        nspikes = 0  # spike counter
-
-        # Look at each spectrum independently (as they were acquired independently)
-        for ii in range(size[1]):
-            for jj in range(size[2]):
-                specdiff = diffspec[:, ii, jj]
-                spec = specdat[:, ii, jj]
-                # These are the indices of the spike starts and ends.
-                spike_indices = numpy.argwhere(specdiff > threshold)
-                num_spike_indices = numpy.size(spike_indices)
-
-                if num_spike_indices > 1: # only one step that deviates is no spike.
-                    npixels += 1
-                    spike_indices = numpy.squeeze(spike_indices)
-                    dif_spike = numpy.diff(spike_indices)
-
-                    # check whether there is more than one spike in the spectrum.
-                    # The first spike always starts at the first element of
-                    # spike_indices whereas the last spike always ends on the spike_indices
-                    spike_edges = numpy.argwhere(dif_spike > spike_spacing)
-                    # subtract 1 from the num_spike_indices to make it work for the last pixel
-                    spike_edges = numpy.append(spike_edges, num_spike_indices - 1)
-
-                    # distinguish spikes within spectrum
-                    for pp, se in enumerate(spike_edges):
-                        nspikes += 1
-
-                        if pp == 0:
-                            spike_indices1 = spike_indices[0:(se + 1)]
-                        else:
-                            spike_indices1 = spike_indices[(spike_edges[pp - 1] + 1):(se + 1)]
-
-                        min_edge = spike_indices1.min() - spike_margin
-                        max_edge = spike_indices1.max() + spike_margin
-
-                        if min_edge > 0 and max_edge < size[0]:
-                            # correction with appropriate slope
-                            line = numpy.linspace(spec[min_edge], spec[max_edge], (max_edge - min_edge) + 1)
-                            spec[min_edge:max_edge + 1] = line
-
-                        # fix for when cosmic ray occurs within first few CCD pixels such that it is impossible to take the average in earlier pixels
-                        elif min_edge <= 0:
-                            line = numpy.linspace(spec[0], spec[max_edge], max_edge + 1)
-                            spec[0:max_edge + 1] = line
-
-                        # fix for when cosmic ray occurs within last few CCD pixels such that it is impossible to take the average in earlier pixel
-                        elif max_edge >= size[0]:
-                            line = numpy.linspace(spec[min_edge], spec[size[0]], size[0] - min_edge + 1)
-                            spec[min_edge:size[0] + 1] = line
-
-                    # include corrected spectrum in dataset
-                    specdat[:, ii, jj] = spec
-
+        # with the average differential in the scan. See spectrum.remove_spikes()
+        # for the details.
+        corrected, npixels, nspikes = spectrum.remove_spikes(raw_spec_dat, self.threshold.value)
         logging.debug("Number of corrected scan pixels %s", npixels)
         logging.debug("Number of corrected spikes %s", nspikes)
-
-        specdat.shape = raw_spec_dat.shape  # add back the TZ dimensions
-        return specdat, npixels, nspikes
+        return corrected, npixels, nspikes
 
     def _force_update_spec(self, st):
         """
@@ -44,7 +44,6 @@ from odemis.gui.plugin import Plugin, AcquisitionDialog
 from odemis.gui.util import formats_to_wildcards
 from odemis.util.dataio import splitext
 import os
-import queue
 import threading
 import time
 import wx
@@ -52,7 +51,7 @@ import wx
 
 class TimelapsePlugin(Plugin):
     name = "Timelapse"
-    __version__ = "2.2"
+    __version__ = "2.3"
     __author__ = "Éric Piel"
     __license__ = "Public domain"
 
@@ -103,8 +102,7 @@ class TimelapsePlugin(Plugin):
         self._dlg = None
         self.addMenu("Acquisition/Timelapse...\tCtrl+T", self.start)
 
-        self._to_store = queue.Queue()  # queue of tuples (str, [DataArray]) for saving data
-        self._sthreads = []  # the saving threads
+        self._save_futures = []  # futures of the data being saved
         self._exporter = None  # dataio exporter to use
 
     def _get_new_filename(self):
@@ -280,54 +278,25 @@ class TimelapsePlugin(Plugin):
 
     # Functions to handle the storage of the data in parallel threads
 
-    def _saving_thread(self, i):
-        try:
-            while True:
-                fn, das = self._to_store.get()
-                if fn is None:
-                    self._to_store.task_done()
-                    return
-                logging.info("Saving data %s in thread %d", fn, i)
-                self._exporter.export(fn, das)
-                self._to_store.task_done()
-        except Exception:
-            logging.exception("Failure in the saving thread")
-        finally:
-            logging.debug("Saving thread %d done", i)
-
-    def _start_saving_threads(self, n=4):
-        """
-        n (int >= 1): number of threads
-        """
-        if self._sthreads:
-            logging.warning("The previous saving threads were not stopped, stopping now")
-            self._stop_saving_threads()
-
-        for i in range(n):
-            t = threading.Thread(target=self._saving_thread, args=(i,))
-            t.start()
-            self._sthreads.append(t)
-
-    def _stop_saving_threads(self):
+    def _wait_saving(self):
         """
         Blocks until all the data has been stored
         Can be called multiple times in a row
         """
-        # Indicate to all the threads that they should stop
-        for _ in self._sthreads:
-            self._to_store.put((None, None))  # Special "quit" message for each thread
-
-        # Wait for all the threads to complete
-        self._to_store.join()
-        for t in self._sthreads:
-            t.join()
-        self._sthreads = []
+        for f in self._save_futures:
+            try:
+                f.result()
+            except Exception:
+                logging.exception("Failed to save data")
+        self._save_futures = []
 
     def _save_data(self, fn, das):
         """
         Queue the requested DataArrays to be stored in the given file
         """
-        self._to_store.put((fn, das))
+        logging.info("Saving data %s", fn)
+        f = dataio.export_async(fn, das, exporter=self._exporter)
+        self._save_futures.append(f)
 
     def acquire(self, dlg):
         main_data = self.main_app.main_data
@@ -335,8 +304,6 @@ class TimelapsePlugin(Plugin):
         stream_paused = str_ctrl.pauseStreams()
         dlg.pauseSettings()
 
-        self._start_saving_threads(4)
-
         ss, last_ss = self._get_acq_streams()
         sacqt = acqmng.estimateTime(ss)
         p = self.period.value
@@ -354,8 +321,8 @@ class TimelapsePlugin(Plugin):
             else:
                 self._acquire_multi(dlg, ss, last_ss)
         finally:
-            # Make sure the threads are stopped even in case of error
-            self._stop_saving_threads()
+            # Make sure all the data is saved even in case of error
+            self._wait_saving()
 
         # self.showAcquisition(self.filename.value)
 
@@ -415,7 +382,7 @@ class TimelapsePlugin(Plugin):
             das, e = acqmng.acquire(ss, self.main_app.main_data.settings_obs).result()
             self._save_data(fn_pat % (nb,), das)
 
-        self._stop_saving_threads()  # Wait for all the data to be stored
+        self._wait_saving()  # Wait for all the data to be stored
         f.set_result(None)  # Indicate it's over
 
     def _cancel_fast_acquire(self, f):
@@ -508,5 +475,5 @@ class TimelapsePlugin(Plugin):
                 else:
                     logging.info("Immediately starting next acquisition, %g s late", -sleept)
 
-        self._stop_saving_threads()  # Wait for all the data to be stored
+        self._wait_saving()  # Wait for all the data to be stored
         f.set_result(None)  # Indicate it's over
@@ -42,7 +42,7 @@ import copy
 from odemis.model import prepare_to_listen_to_more_vas
 from concurrent.futures._base import CANCELLED, FINISHED, RUNNING
 from odemis.util.driver import guessActuatorMoveDuration
-from odemis.util.img import assembleZCube
+from odemis.util.img import ZCubeAssembler
 
 # This is the "manager" of an acquisition. The basic idea is that you give it
 # a list of streams to acquire, and it will acquire them in the best way in the
@@ -168,7 +168,6 @@ class ZStackAcquisitionTask(object):
         acquired_data = []
         # iterate through streams
         for stream in self._streams:
-            zstack = []
             if stream not in self._zlevels:
                 try:
                     # acquire this single stream, and get the data
@@ -201,9 +200,12 @@ class ZStackAcquisitionTask(object):
 
             else:
                 # for each stream, iterate through zlevels
-                for i, z in enumerate(self._zlevels[stream]):
-                    # move the focuser
-                    self._actuator_f = stream.focuser.moveAbs({"z": z})
+                zlevels = self._zlevels[stream]
+                # Each image is directly copied into the cube, so that they don't have to be all kept
+                zcube_assembler = ZCubeAssembler(zlevels)
+                self._actuator_f = stream.focuser.moveAbs({"z": zlevels[0]})
+                for i, z in enumerate(zlevels):
+                    # wait for the focuser to reach the zlevel
                     self._actuator_f.result()
 
                     # check if cancellation happened while the actuator future is working
@@ -211,7 +213,7 @@ class ZStackAcquisitionTask(object):
                         raise CancelledError()
 
                     # subtract one zstep time
-                    if i != len(self._zlevels[stream]) - 1:
+                    if i != len(zlevels) - 1:
                         remaining_t -= self._zstep_duration[stream]
                         self._main_future.set_end_time(time.time() + remaining_t)
 
@@ -225,6 +227,11 @@ class ZStackAcquisitionTask(object):
                         if self._future_state == CANCELLED:
                             raise CancelledError()
 
+                        # The acquisition is over, so the focuser can already move to the next
+                        # zlevel, while the data is being stored.
+                        if i != len(zlevels) - 1:
+                            self._actuator_f = stream.focuser.moveAbs({"z": zlevels[i + 1]})
+
                         # check on the acquired data
                         if not data:
                             logging.warning("The acquired data array for stream %s is empty", stream)
@@ -241,12 +248,12 @@ class ZStackAcquisitionTask(object):
 
                     # only if there is data acquired
                     if data:
-                        zstack.append(data[0])
+                        zcube_assembler.append(data[0])
                     # update the remaining time
                     remaining_t -= stream.estimateAcquisitionTime()
                     self._main_future.set_end_time(time.time() + remaining_t)
 
-                zcube = assembleZCube(zstack, self._zlevels[stream])
+                zcube = zcube_assembler.get_cube()
                 acquired_data.append(zcube)
 
         # state that the future has finished
@@ -21,10 +21,11 @@ Odemis. If not, see http://www.gnu.org/licenses/.
 """
 
 import logging
+import math
 import threading
 import time
 from collections.abc import Iterable
-from concurrent.futures import TimeoutError, CancelledError
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, CancelledError
 from concurrent.futures._base import CANCELLED, FINISHED, RUNNING
 from typing import Any, Dict, List, Optional, Tuple, Union, Callable
 
@@ -35,14 +36,20 @@ from odemis.acq.align import light
 from odemis.model import InstantaneousFuture
 from odemis.util import executeAsyncTask, almost_equal
 from odemis.util.driver import guessActuatorMoveDuration
-from odemis.util.focus import MeasureSEMFocus, Measure1d, MeasureSpotsFocus, AssessFocus
+from odemis.util.focus import MeasureSEMFocus, Measure1d, MeasureSpotsFocus, AssessFocus, FitFocusCurve
 from odemis.util.img import Subtract
 
 MTD_BINARY = 0
 MTD_EXHAUSTIVE = 1
+# Exhaustive scan, with the focus measurement done in parallel of the next move,
+# stopped as soon as the peak is passed, and a peak model fitted on the focus curve
+MTD_EXHAUSTIVE_FIT = 2
 
 MAX_STEPS_NUMBER = 100  # Max steps to perform autofocus
 MAX_BS_NUMBER = 1  # Maximum number of applying binary search with a smaller max_step
+# For MTD_EXHAUSTIVE_FIT, number of measurements after the best focus level which
+# have to be below half of the peak before considering the peak is passed
+FIT_STOP_STEPS = 3
 
 
 def getNextImage(det: model.Detector, timeout: Optional[float] = None) -> model.DataArray:
@@ -115,6 +122,62 @@ def _discard_data(df: Any, data: Any) -> None:
     pass
 
 
+def _getDepthOfField(detector: model.Detector, emt: Optional[model.Emitter]) -> float:
+    """
+    Find the depth of field, based on the .depthOfField on the detector or emitter
+    detector: Detector on which to improve the focus quality
+    emt: In case of a SED this is the scanner used
+    return: the depth of field (m)
+    """
+    avail_depths = (detector, emt)
+    if model.hasVA(emt, "dwellTime"):
+        # Hack in case of using the e-beam with a DigitalCamera detector.
+        # All the digital cameras have a depthOfField, which is updated based
+        # on the optical lens properties... but the depthOfField in this
+        # case depends on the e-beam lens.
+        # TODO: or better rely on which component the focuser affects? If it
+        # affects (also) the emitter, use this one first? (but in the
+        # current models the focusers affects nothing)
+        avail_depths = (emt, detector)
+    for c in avail_depths:
+        if model.hasVA(c, "depthOfField"):
+            return c.depthOfField.value
+
+    logging.debug("No depth of field info found")
+    return 1e-6  # m, not too bad value
+
+
+def _getMeasureFunction(detector: model.Detector, measure_func: Optional[Callable] = None) -> Callable:
+    """
+    Pick the function to measure the focus level
+    detector: Detector on which to improve the focus quality
+    measure_func: function to measure the focus level on the image. If None,
+      the function is selected based on the detector.
+    return: function which takes an image and returns the focus level
+    """
+    # Pick measurement method based on the heuristics that SEM detectors
+    # are typically just a point (ie, shape == data depth).
+    # TODO: is this working as expected? Alternatively, we could check
+    # MD_DET_TYPE.
+    if measure_func is None:
+        if len(detector.shape) > 1:
+            if detector.role == 'diagnostic-ccd':
+                logging.debug("Using Spot method to estimate focus")
+                return MeasureSpotsFocus
+            elif detector.resolution.value[1] == 1:
+                logging.debug("Using 1d method to estimate focus")
+                return Measure1d
+            else:
+                logging.debug("Using Spot method to estimate focus")
+                return MeasureSpotsFocus
+        else:
+            logging.debug("Using SEM method to estimate focus")
+            return MeasureSEMFocus
+    else:
+        logging.debug(f"Using measure function {measure_func.__name__} to estimate focus")
+        return measure_func
+
+
 def _DoBinaryFocus(
         future: model.ProgressiveFuture,
         detector: model.Detector,
@@ -173,23 +236,7 @@ def _DoBinaryFocus(
         timeout = 3 + 2 * estimateAcquisitionTime(detector, emt)
 
         # use the .depthOfField on detector or emitter as maximum stepsize
-        avail_depths = (detector, emt)
-        if model.hasVA(emt, "dwellTime"):
-            # Hack in case of using the e-beam with a DigitalCamera detector.
-            # All the digital cameras have a depthOfField, which is updated based
-            # on the optical lens properties... but the depthOfField in this
-            # case depends on the e-beam lens.
-            # TODO: or better rely on which component the focuser affects? If it
-            # affects (also) the emitter, use this one first? (but in the
-            # current models the focusers affects nothing)
-            avail_depths = (emt, detector)
-        for c in avail_depths:
-            if model.hasVA(c, "depthOfField"):
-                dof = c.depthOfField.value
-                break
-        else:
-            logging.debug("No depth of field info found")
-            dof = 1e-6  # m, not too bad value
+        dof = _getDepthOfField(detector, emt)
         min_step = dof / 2
 
         # adjust to rng_focus if provided
@@ -213,27 +260,7 @@ def _DoBinaryFocus(
         best_fm = 0
         last_pos = None
 
-        # Pick measurement method based on the heuristics that SEM detectors
-        # are typically just a point (ie, shape == data depth).
-        # TODO: is this working as expected? Alternatively, we could check
-        # MD_DET_TYPE.
-        if measure_func is None:
-            if len(detector.shape) > 1:
-                if detector.role == 'diagnostic-ccd':
-                    logging.debug("Using Spot method to estimate focus")
-                    Measure = MeasureSpotsFocus
-                elif detector.resolution.value[1] == 1:
-                    logging.debug("Using 1d method to estimate focus")
-                    Measure = Measure1d
-                else:
-                    logging.debug("Using Spot method to estimate focus")
-                    Measure = MeasureSpotsFocus
-            else:
-                logging.debug("Using SEM method to estimate focus")
-                Measure = MeasureSEMFocus
-        else:
-            logging.debug(f"Using measure function {measure_func.__name__} to estimate focus")
-            Measure = measure_func
+        Measure = _getMeasureFunction(detector, measure_func)
 
         step_factor = 2 ** 7
         if good_focus is not None:
@@ -430,43 +457,10 @@ def _DoExhaustiveFocus(
         timeout = 3 + 2 * estimateAcquisitionTime(detector, emt)
 
         # use the .depthOfField on detector or emitter as maximum stepsize
-        avail_depths = (detector, emt)
-        if model.hasVA(emt, "dwellTime"):
-            # Hack in case of using the e-beam with a DigitalCamera detector.
-            # All the digital cameras have a depthOfField, which is updated based
-            # on the optical lens properties... but the depthOfField in this
-            # case depends on the e-beam lens.
-            avail_depths = (emt, detector)
-        for c in avail_depths:
-            if model.hasVA(c, "depthOfField"):
-                dof = c.depthOfField.value
-                break
-        else:
-            logging.debug("No depth of field info found")
-            dof = 1e-6  # m, not too bad value
+        dof = _getDepthOfField(detector, emt)
         logging.debug("Depth of field is %.7g", dof)
 
-        # Pick measurement method based on the heuristics that SEM detectors
-        # are typically just a point (ie, shape == data depth).
-        # TODO: is this working as expected? Alternatively, we could check
-        # MD_DET_TYPE.
-        if measure_func is None:
-            if len(detector.shape) > 1:
-                if detector.role == 'diagnostic-ccd':
-                    logging.debug("Using Spot method to estimate focus")
-                    Measure = MeasureSpotsFocus
-                elif detector.resolution.value[1] == 1:
-                    logging.debug("Using 1d method to estimate focus")
-                    Measure = Measure1d
-                else:
-                    logging.debug("Using Spot method to estimate focus")
-                    Measure = MeasureSpotsFocus
-            else:
-                logging.debug("Using SEM method to estimate focus")
-                Measure = MeasureSEMFocus
-        else:
-            logging.debug(f"Using measure function {measure_func.__name__} to estimate focus")
-            Measure = measure_func
+        Measure = _getMeasureFunction(detector, measure_func)
 
         # adjust to rng_focus if provided
         rng = focus.axes["z"].range
@@ -552,6 +546,152 @@ def _DoExhaustiveFocus(
             future._autofocus_state = FINISHED
 
 
+def _IsFocusPeakPassed(levels: List[float], n_after: int = FIT_STOP_STEPS) -> bool:
+    """
+    Checks whether a focus curve, measured in a monotonic order, has passed a peak
+    levels: the focus levels, in the order of the positions scanned
+    n_after: number of levels after the maximum which must all be low
+    return: True if the maximum is followed (and preceded) by at least n_after
+      levels below the half-maximum.
+    """
+    if len(levels) < 2 * n_after + 1:
+        return False
+    imax = int(numpy.argmax(levels))
+    if imax < n_after or imax + n_after >= len(levels):
+        return False
+
+    half_max = (max(levels) + min(levels)) / 2
+    after = levels[imax + 1:]
+    before = levels[:imax]
+    return (all(l < half_max for l in after[-n_after:]) and
+            sum(l < half_max for l in before) >= n_after)
+
+
+def _DoExhaustiveFitFocus(
+        future: model.ProgressiveFuture,
+        detector: model.Detector,
+        emt: Optional[model.Emitter],
+        focus: model.Actuator,
+        dfbkg: Optional[model.DataFlow],
+        good_focus: Optional[float],
+        rng_focus: Optional[Tuple[float, float]],
+        measure_func: Optional[Callable] = None
+) -> Tuple[float, float, float]:
+    """
+    Scans the focus through the given range, from the end closest to the current
+    position. The focus level of each image is computed in a separate thread,
+    while the focus is already moving to the next position. As soon as the focus
+    curve has clearly passed a peak, the scan stops. A peak model (Gaussian)
+    is then fitted on the focus curve, and the focus is moved to its center,
+    which can be in-between the measured positions.
+    Parameters and return values are the same as _DoExhaustiveFocus().
+    """
+    logging.debug("Starting exhaustive fitted autofocus on detector %s...", detector.name)
+    executor = ThreadPoolExecutor(max_workers=1)
+    best_pos = focus.position.value['z']
+    try:
+        # Big timeout, most important being that it's shorter than eternity
+        timeout = 3 + 2 * estimateAcquisitionTime(detector, emt)
+        dof = _getDepthOfField(detector, emt)
+        logging.debug("Depth of field is %.7g", dof)
+        Measure = _getMeasureFunction(detector, measure_func)
+
+        # adjust to rng_focus if provided
+        rng = focus.axes["z"].range
+        if rng_focus:
+            rng = (max(rng[0], rng_focus[0]), min(rng[1], rng_focus[1]))
+        lower_bound, upper_bound = rng
+        if upper_bound <= lower_bound:
+            raise ValueError("Unexpected focus range %s" % (rng,))
+
+        # Same step as the standard exhaustive method, but as it's interpolated
+        # afterwards, no need to go smaller than 10 steps over the whole range.
+        # On a large range, the steps are made bigger to not go over MAX_STEPS_NUMBER.
+        step = min(8 * dof, (upper_bound - lower_bound) / 10)
+        nsteps = min(MAX_STEPS_NUMBER, int(round((upper_bound - lower_bound) / step)) + 1)
+        step = (upper_bound - lower_bound) / (nsteps - 1)
+        positions = numpy.linspace(lower_bound, upper_bound, nsteps)
+        # Start from the closest end, to reduce the first move
+        start_pos = good_focus if good_focus is not None else best_pos
+        if abs(start_pos - upper_bound) < abs(start_pos - lower_bound):
+            positions = positions[::-1]
+
+        scanned_pos = []  # focus positions of the images acquired
+        meas_fs = []  # futures of the focus level measurement of each image
+        levels = []  # focus levels measured so far (in the order of the positions)
+        move_f = focus.moveAbs({"z": positions[0]})
+        for i, pos in enumerate(positions):
+            if future._autofocus_state == CANCELLED:
+                raise CancelledError()
+            move_f.result()
+            image = AcquireNoBackground(detector, dfbkg, timeout)
+            scanned_pos.append(pos)
+            # Move to next position while the focus level is being computed
+            if i + 1 < len(positions):
+                move_f = focus.moveAbs({"z": positions[i + 1]})
+            meas_fs.append(executor.submit(Measure, image))
+
+            # Gather the levels computed (in order)
+            while len(levels) < len(meas_fs) and meas_fs[len(levels)].done():
+                levels.append(meas_fs[len(levels)].result())
+                logging.debug("Focus level at %.7g is %.7g", scanned_pos[len(levels) - 1], levels[-1])
+
+            if _IsFocusPeakPassed(levels):
+                logging.debug("Focus peak passed after %d steps, stopping the scan", len(levels))
+                break
+
+        # Wait for the last measurements (and the last move)
+        for f in meas_fs[len(levels):]:
+            levels.append(f.result())
+        scanned_pos = scanned_pos[:len(levels)]
+        move_f.result()
+
+        if future._autofocus_state == CANCELLED:
+            raise CancelledError()
+
+        ibest = int(numpy.argmax(levels))
+        best_pos, best_fm = scanned_pos[ibest], levels[ibest]
+        worst_fm = min(levels)
+        try:
+            fit_pos, fit_width, fit_amp, fit_off = FitFocusCurve(scanned_pos, levels)
+            # Only trust the fit if it's close to the measured peak
+            if abs(fit_pos - best_pos) <= step and fit_width > 0:
+                logging.debug("Focus curve fitted with peak at %.7g (width = %g, best measured at %.7g)",
+                              fit_pos, fit_width, best_pos)
+                best_pos = fit_pos
+                best_fm = max(best_fm, fit_amp + fit_off)
+            else:
+                logging.debug("Fitted focus peak at %.7g is too far from best measured position %.7g, ignoring it",
+                              fit_pos, best_pos)
+        except ValueError as ex:
+            logging.debug("Failed to fit focus curve, will use best measurement: %s", ex)
+
+        best_pos = max(lower_bound, min(best_pos, upper_bound))
+        focus.moveAbsSync({"z": best_pos})
+
+        # Same confidence heuristic as the binary focus
+        if (best_fm - worst_fm) < best_fm * 0.5:
+            logging.info("Auto focus indecisive but picking level %g @ %g m (lowest = %g)",
+                         best_fm, best_pos, worst_fm)
+            confidence = 0.2
+        else:
+            logging.info("Auto focus found best level %g @ %g m after %d steps",
+                         best_fm, best_pos, len(levels))
+            confidence = 0.8
+
+        return best_pos, best_fm, confidence
+
+    except CancelledError:
+        # Go to the best position known so far
+        focus.moveAbsSync({"z": best_pos})
+    finally:
+        executor.shutdown(wait=False)
+        with future._autofocus_lock:
+            if future._autofocus_state == CANCELLED:
+                raise CancelledError()
+            future._autofocus_state = FINISHED
+
+
 def _CancelAutoFocus(future: model.ProgressiveFuture) -> bool:
     """
     Canceller of AutoFocus task.
@@ -614,6 +754,13 @@ def estimateAutoFocusTime(
     # optimistic guess
     move_time = guessActuatorMoveDuration(focus, "z", distance) + 2 * guessActuatorMoveDuration(focus, "z",
                                                                                                 distance / 2)
+    if method == MTD_EXHAUSTIVE_FIT:
+        # Goes once through the whole range (at worse)
+        move_time = guessActuatorMoveDuration(focus, "z", distance)
+        step = min(8 * _getDepthOfField(detector, emt), distance / 10)
+        nsteps = min(MAX_STEPS_NUMBER, int(math.ceil(distance / step)) + 1)
+        return move_time + nsteps * estimateAcquisitionTime(detector, emt)
+
     # pessimistic guess
     acquisition_time = MAX_STEPS_NUMBER * estimateAcquisitionTime(detector, emt)
     return move_time + acquisition_time
@@ -1070,7 +1217,9 @@ def AutoFocus(
     rng_focus: if provided, the search of the best focus position is limited
       within this range
     method (MTD_*): focusing method, if BINARY we follow a dichotomic method while in
-      case of EXHAUSTIVE we iterate through the whole provided range
+      case of EXHAUSTIVE we iterate through the whole provided range. EXHAUSTIVE_FIT
+      iterates through the range until the peak is passed, and locates the
+      best focus by fitting a peak model.
     measure_func: function to measure the focus level on the image,
       for instance MeasureSEMFocus. If None the focus metric used is based
       on the detector.
@@ -1082,7 +1231,7 @@ def AutoFocus(
     est_start = time.time() + 0.1
     f = model.ProgressiveFuture(start=est_start,
                                 end=est_start + estimateAutoFocusTime(detector, emt, focus, dfbkg, good_focus,
-                                                                      rng_focus))
+                                                                      rng_focus, method))
     f._autofocus_state = RUNNING
     f._autofocus_lock = threading.Lock()
     f.task_canceller = _CancelAutoFocus
@@ -1090,6 +1239,8 @@ def AutoFocus(
     # Run in separate thread
     if method == MTD_EXHAUSTIVE:
         autofocus_fn = _DoExhaustiveFocus
+    elif method == MTD_EXHAUSTIVE_FIT:
+        autofocus_fn = _DoExhaustiveFitFocus
     elif method == MTD_BINARY:
         autofocus_fn = _DoBinaryFocus
     else:
@@ -21,17 +21,122 @@ Odemis. If not, see http://www.gnu.org/licenses/.
 """
 
 import logging
+import math
 import statistics
 import threading
 import time
 from concurrent.futures._base import CANCELLED, FINISHED, RUNNING, CancelledError
-from typing import Iterable, Dict, List, Optional
+from typing import Iterable, Dict, List, Optional, Tuple
+
+import numpy
 
 from odemis import model
 from odemis.acq import align
 from odemis.acq.align.autofocus import estimateAutoFocusTime
 from odemis.util import executeAsyncTask
 
+# Number of focus positions needed before the focus of the next positions is predicted
+MIN_POINTS_PREDICTION = 4
+# Maximum uncertainty (m) of the prediction for it to be used. Above, the whole focus range is searched.
+MAX_PREDICTION_UNCERTAINTY = 10e-6  # m
+# Extra margin (m) added on each side of the predicted focus, on top of the uncertainty
+PREDICTION_MARGIN = 5e-6  # m
+# If the focus is found that close to the border of the restricted range (as ratio of the range),
+# the real focus is probably outside of it, so the whole range is searched.
+PREDICTION_BORDER_RATIO = 0.1
+
+
+class FocusSurfaceModel:
+    """
+    Model of the focus position over the sample, built incrementally from the
+    focus positions found. The focus surface is approximated by a plane, fitted
+    by least-squares, and the uncertainty of the predictions is estimated from
+    the residuals of the fit.
+    """
+
+    def __init__(self, min_points: int = MIN_POINTS_PREDICTION):
+        """
+        :param min_points: minimum number of focus positions needed to predict the focus.
+          Must be at least 4, so that the residuals can be estimated.
+        """
+        if min_points < 4:
+            raise ValueError(f"min_points must be at least 4, but got {min_points}")
+        self._min_points = min_points
+        self._points = []  # list of (x, y, z)
+        self._fit = None  # (centre, coefficients, inverse of normal matrix, std of residuals)
+
+    def add_point(self, x: float, y: float, z: float) -> None:
+        """
+        Add a known focus position
+        :param x, y: the stage position (m)
+        :param z: the focus position (m)
+        """
+        self._points.append((x, y, z))
+        self._fit = None
+
+    def _update_fit(self) -> None:
+        pts = numpy.array(self._points)
+        # Centre the coordinates for numerical stability
+        centre = pts[:, :2].mean(axis=0)
+        a = numpy.ones((len(pts), 3))
+        a[:, :2] = pts[:, :2] - centre
+        # z = αx + βy + γ
+        coefs, *_ = numpy.linalg.lstsq(a, pts[:, 2], rcond=None)
+        residuals = pts[:, 2] - a @ coefs
+        std = math.sqrt(numpy.sum(residuals ** 2) / (len(pts) - 3))
+        self._fit = centre, coefs, numpy.linalg.pinv(a.T @ a), std
+
+    def predict(self, x: float, y: float) -> Optional[Tuple[float, float]]:
+        """
+        Predict the focus position at a given stage position.
+        :param x, y: the stage position (m)
+        :return: the predicted focus position (m) and its uncertainty (m, standard deviation),
+          or None if there are not enough known focus positions.
+        """
+        if len(self._points) < self._min_points:
+            return None
+        if self._fit is None:
+            self._update_fit()
+        centre, coefs, inv_normal, std = self._fit
+
+        v = numpy.array([x - centre[0], y - centre[1], 1])
+        z = float(v @ coefs)
+        # Standard deviation of the prediction: larger when extrapolating away from the known points
+        uncertainty = std * math.sqrt(1 + v @ inv_normal @ v)
+        return z, uncertainty
+
+
+def get_focus_search_range(
+        surface: FocusSurfaceModel,
+        x: float,
+        y: float,
+        focus_range: Tuple[float, float]
+) -> Tuple[Tuple[float, float], Optional[float]]:
+    """
+    Compute the focus range to search at a given position, based on the predicted focus.
+    :param surface: model of the focus positions found so far
+    :param x, y: the stage position (m)
+    :param focus_range: the whole focus range (zmin, zmax) in m
+    :return: the focus range (zmin, zmax) to search, and the predicted focus
+      position (or None if the prediction is not reliable enough, in which case
+      the whole focus range is returned)
+    """
+    prediction = surface.predict(x, y)
+    if prediction is None:
+        return focus_range, None
+
+    z, uncertainty = prediction
+    if uncertainty > MAX_PREDICTION_UNCERTAINTY:
+        logging.debug("Focus prediction at %s too uncertain (%g m), using the whole range", (x, y), uncertainty)
+        return focus_range, None
+
+    margin = 3 * uncertainty + PREDICTION_MARGIN
+    rng = (max(focus_range[0], z - margin), min(focus_range[1], z + margin))
+    if rng[0] >= rng[1]:  # Prediction outside of the range
+        return focus_range, None
+
+    return rng, z
+
 
 def do_autofocus_in_roi(
         f: model.ProgressiveFuture,
@@ -45,6 +150,8 @@ def do_autofocus_in_roi(
 ) -> list:
     """
     Run autofocus in a given roi. The roi is divided in nx * ny positions and autofocus is run at each position.
+    Once enough focus positions are found, the focus at the next positions is predicted,
+    and the autofocus only searches around the prediction.
 
     :param f: future of autofocus in roi
     :param bbox: bounding box of the roi, tuple of (xmin, ymin, xmax, ymax) in meters
@@ -59,6 +166,9 @@ def do_autofocus_in_roi(
     """
     focus_positions = []
     average_focus_time = None
+    # To predict the focus of the next positions, from the ones found
+    surface = FocusSurfaceModel()
+    n_predicted = 0  # number of positions where the focus was found within the predicted range
     try:
         init_pos = stage.position.value
         time_per_action = {"focus": [], "move": []}
@@ -80,16 +190,37 @@ def do_autofocus_in_roi(
                 move_to_pos_start = time.time()
                 stage.moveAbsSync({"x": x, "y": y})
                 time_per_action["move"].append(time.time() - move_to_pos_start)
-                # run autofocus
+                # run autofocus, within a small range if the focus can be predicted
                 focus_start = time.time()
-                f._running_subf = align.AutoFocus(ccd, None, focus, rng_focus=focus_range)
+                search_range, pred_z = get_focus_search_range(surface, x, y, focus_range)
+                if pred_z is not None:
+                    logging.debug(f"Predicted focus at {pred_z}, searching within {search_range}")
+                f._running_subf = align.AutoFocus(ccd, None, focus, good_focus=pred_z, rng_focus=search_range)
 
             foc_pos, foc_lev, conf = f._running_subf.result(timeout=900)
+
+            if pred_z is not None:
+                # If the prediction was wrong, the focus is likely not found, or at the border of the range
+                border = (search_range[1] - search_range[0]) * PREDICTION_BORDER_RATIO
+                if (conf < conf_level or
+                    not search_range[0] + border <= foc_pos <= search_range[1] - border
+                   ):
+                    logging.debug(f"Focus found at {foc_pos} with confidence {conf} does not match prediction "
+                                  f"{pred_z}, searching the whole range")
+                    with f._autofocus_roi_lock:
+                        if f._autofocus_roi_state == CANCELLED:
+                            raise CancelledError()
+                        f._running_subf = align.AutoFocus(ccd, None, focus, rng_focus=focus_range)
+                    foc_pos, foc_lev, conf = f._running_subf.result(timeout=900)
+                else:
+                    n_predicted += 1
+
             time_per_action["focus"].append(time.time() - focus_start)
             if conf >= conf_level:
                 focus_positions.append([stage.position.value["x"],
                                         stage.position.value["y"],
                                         focus.position.value["z"]])
+                surface.add_point(*focus_positions[-1])
                 logging.debug(f"Added focus with confidence of {conf} at position: {focus_positions[-1]}")
             else:
                 logging.debug(f"Focus level is not added due to low confidence of {conf} at position: {x, y}.")
@@ -106,6 +237,7 @@ def do_autofocus_in_roi(
     finally:
         avg_per_action = {key: statistics.mean(val) for key, val in time_per_action.items() if len(val) > 0}
         logging.debug(f"The actual time taken per focus position for each action is {time_per_action}")
+        logging.debug(f"Focus found within the predicted range at {n_predicted} positions")
         logging.debug(f"The average time taken per focus position for each action is {avg_per_action}")
         logging.debug(f"The average time taken per focus position is {average_focus_time}")
         logging.debug(f"Moving back to initial stage position {init_pos}")
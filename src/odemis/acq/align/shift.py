@@ -19,9 +19,15 @@ PARTICULAR  PURPOSE. See the GNU General Public License for more details.
 You should have received a copy of the GNU General Public License along with
 Odemis. If not, see http://www.gnu.org/licenses/.
 """
+import functools
+import threading
+
 import numpy
-from numpy import fft
 from numpy.fft import fftfreq
+import scipy.fft
+
+# Maximum number of FFTs kept by a ShiftMeasurer, for reuse in the next measurements
+FFT_CACHE_SIZE = 4
 
 
 def _upsampled_dft(data, upsampled_region_size,
@@ -109,52 +115,216 @@ def MeasureShift(previous_img, current_img, precision=1):
     precision (1<=int): Calculate drift within 1/precision of a pixel
     returns (tuple of floats): Drift in pixels (horizontal, vertical).
     """
-    if precision < 1:
-        raise ValueError("Precision cannot be less than 1, got %s." % (precision,))
     assert previous_img.shape == current_img.shape, "Prev shape %s != new shape %s" % (
         previous_img.shape, current_img.shape)
+    measurer = ShiftMeasurer(previous_img.shape, precision)
+    return measurer.measure(previous_img, current_img)
+
+
+@functools.lru_cache(maxsize=32)
+def _get_dft_kernel(n_items, ups_size, upsample_factor):
+    """
+    Computes the part of the upsampled DFT kernel which is independent of the
+    offset, for one axis. The complete kernel is obtained by multiplying each
+    column by exp(2i.pi * offset * freq).
+    n_items (int): number of elements in the axis
+    ups_size (int): size of the upsampled region
+    upsample_factor (int): upsampling factor
+    returns:
+       kernel (ndarray of complex, shape ups_size x n_items): base kernel (read-only)
+       freqs (ndarray of float, shape n_items): frequencies of the axis (read-only)
+    """
+    freqs = fftfreq(n_items, upsample_factor)
+    kernel = numpy.exp(-2j * numpy.pi * numpy.arange(ups_size)[:, None] * freqs)
+    kernel.flags.writeable = False
+    freqs.flags.writeable = False
+    return kernel, freqs
+
+
+class ShiftMeasurer(object):
+    """
+    Measures the shift between pairs of images of a given shape, as MeasureShift()
+    does, but optimized for repeated measurements:
+     * The FFTs of the last images are kept, so that an image used in several
+       measurements (typically, the reference/anchor image) is only transformed once.
+     * Real-input FFTs are used, with multiple threads.
+     * The buffers and the DFT kernels for the sub-pixel upsampling are only
+       allocated once.
+     * Several pairs can be measured at once with measure_batch().
+    The measurement is thread-safe, but there is no advantage in sharing a
+    ShiftMeasurer between threads, as only one measurement runs at a time.
+    """
+
+    def __init__(self, shape, precision=1, workers=-1):
+        """
+        shape (tuple of 2 ints): shape of all the images which will be compared
+        precision (1<=int): Calculate drift within 1/precision of a pixel
+        workers (int): number of threads used for computing the FFTs. -1 means
+          as many as CPUs.
+        """
+        if precision < 1:
+            raise ValueError("Precision cannot be less than 1, got %s." % (precision,))
+        if len(shape) != 2:
+            raise ValueError("Shape must be 2D, got %s" % (shape,))
+        self.shape = tuple(shape)
+        self.precision = precision
+        self.workers = workers
+
+        # FFT of a real image is Hermitian, so only half of it (+1) is needed
+        self._fft_shape = (shape[0], shape[1] // 2 + 1)
+        self._product = numpy.empty(self._fft_shape, dtype=complex)
+        self._magnitude = numpy.empty(self._fft_shape, dtype=float)
+        self._midpoints = numpy.array([numpy.fix(s / 2) for s in shape])
+        self._eps = numpy.finfo(float).eps
+
+        if precision > 1:
+            self._ups_size = int(numpy.ceil(precision * 1.5))
+            self._dftshift = numpy.fix(self._ups_size / 2.0)
+            self._kernels = [_get_dft_kernel(n, self._ups_size, precision) for n in shape]
+            self._full_product = numpy.empty(shape, dtype=complex)
+            # To reconstruct the complete FFT from the half FFT: the missing
+            # columns are the conjugate of the mirrored ones.
+            self._mirror_rows = (-numpy.arange(shape[0])) % shape[0]
+            self._mirror_cols = shape[1] - numpy.arange(self._fft_shape[1], shape[1])
 
-    previous_fft = fft.fft2(previous_img)
-    current_fft = fft.fft2(current_img)
-    shape = previous_fft.shape
-    m, n = previous_fft.shape
-    image_product = previous_fft * current_fft.conj()
-
-    # Cross-correlation computation
-    eps = numpy.finfo(image_product.real.dtype).eps
-    # pixel magnitude below 100*eps is magnified whereas values above it are normalized to one
-    # this helps in finding low magnitude pixels which are related to small shifts
-    image_product /= numpy.maximum(numpy.abs(image_product), 100 * eps)
-    float_dtype = image_product.real.dtype
-    cross_correlation = fft.ifft2(image_product)
-    # Locate maximum
-    maxima = numpy.unravel_index(numpy.argmax(numpy.abs(cross_correlation)),
-                                 cross_correlation.shape)
-    midpoints = numpy.array([numpy.fix(axis_size / 2) for axis_size in shape])
-
-    float_dtype = image_product.real.dtype
-
-    shifts = numpy.stack(maxima).astype(float_dtype, copy=False)
-    shifts[shifts > midpoints] -= numpy.array(shape)[shifts > midpoints]
-
-    if precision > 1:
-        shifts = numpy.round(shifts * precision) / precision
-        upsampled_region_size = numpy.ceil(precision * 1.5)
-        # Center of output array at dftshift + 1
-        dftshift = numpy.fix(upsampled_region_size / 2.0)
-        # Matrix multiply DFT around the current shift estimate
-        sample_region_offset = dftshift - shifts * precision
-        cross_correlation = _upsampled_dft(image_product.conj(),
-                                           upsampled_region_size,
-                                           precision,
-                                           sample_region_offset).conj()
-        # Locate maximum and map back to original pixel grid
+        self._fft_cache = []  # list of (image, FFT), most recent last
+        self._lock = threading.Lock()
+
+    def transform(self, img):
+        """
+        Computes (or reuse) the FFT of an image. The last FFTs computed are kept,
+        associated to the image object. So the image should not be modified after
+        being passed.
+        img (numpy.array): 2d array of the measurer's shape
+        returns (numpy.array of complex): half of the FFT of the image (read-only)
+        """
+        if img.shape != self.shape:
+            raise ValueError("Image shape %s != expected shape %s" % (img.shape, self.shape))
+
+        for i, (cimg, cfft) in enumerate(self._fft_cache):
+            if cimg is img:
+                # Move to the end, to indicate it's been recently used
+                self._fft_cache.append(self._fft_cache.pop(i))
+                return cfft
+
+        imfft = scipy.fft.rfft2(img, workers=self.workers)
+        imfft.flags.writeable = False
+        self._fft_cache.append((img, imfft))
+        if len(self._fft_cache) > FFT_CACHE_SIZE:
+            del self._fft_cache[0]
+        return imfft
+
+    def set_reference(self, img):
+        """
+        Precompute the FFT of an image which will be used in several measurements.
+        It's not required, but ensures that the FFT of this image is kept even if
+        many other images are measured.
+        img (numpy.array): 2d array of the measurer's shape
+        """
+        with self._lock:
+            self._fft_cache = [(img, self.transform(img))]
+
+    def measure(self, previous_img, current_img):
+        """
+        Computes the shift between two images. Same as MeasureShift().
+        previous_img (numpy.array): 2d array with the previous frame
+        current_img (numpy.array): 2d array with the last frame
+        returns (tuple of floats): Drift in pixels (horizontal, vertical).
+        """
+        with self._lock:
+            prev_fft = self.transform(previous_img)
+            cur_fft = self.transform(current_img)
+            return self._measure_fft(prev_fft, cur_fft)
+
+    def measure_batch(self, previous_imgs, current_imgs):
+        """
+        Computes the shift between many pairs of images. The FFTs of all the
+        images are computed in a single call, which is faster than measuring
+        each pair separately.
+        previous_imgs (list of numpy.array, or numpy.array of shape N x shape):
+          the previous frames. If only one image is passed, it's used as previous
+          frame for all the current frames.
+        current_imgs (list of numpy.array, or numpy.array of shape N x shape):
+          the last frames
+        returns (list of tuple of floats): Drift in pixels (horizontal, vertical)
+          for each pair.
+        """
+        current_imgs = numpy.asarray(current_imgs)
+        if current_imgs.shape[1:] != self.shape:
+            raise ValueError("Images shape %s != expected shape %s" %
+                             (current_imgs.shape[1:], self.shape))
+        with self._lock:
+            cur_ffts = scipy.fft.rfft2(current_imgs, workers=self.workers)
+            if isinstance(previous_imgs, numpy.ndarray) and previous_imgs.shape == self.shape:
+                prev_ffts = [self.transform(previous_imgs)] * len(cur_ffts)
+            else:
+                previous_imgs = numpy.asarray(previous_imgs)
+                if previous_imgs.shape != current_imgs.shape:
+                    raise ValueError("Previous images shape %s != current images shape %s" %
+                                     (previous_imgs.shape, current_imgs.shape))
+                prev_ffts = scipy.fft.rfft2(previous_imgs, workers=self.workers)
+
+            return [self._measure_fft(p, c) for p, c in zip(prev_ffts, cur_ffts)]
+
+    def _measure_fft(self, prev_fft, cur_fft):
+        """
+        Computes the shift between two images, based on their (half) FFT.
+        Must be called with the lock taken.
+        returns (tuple of floats): Drift in pixels (horizontal, vertical).
+        """
+        image_product = self._product
+        numpy.conjugate(cur_fft, out=image_product)
+        image_product *= prev_fft
+
+        # Cross-correlation computation
+        # pixel magnitude below 100*eps is magnified whereas values above it are normalized to one
+        # this helps in finding low magnitude pixels which are related to small shifts
+        numpy.abs(image_product, out=self._magnitude)
+        numpy.maximum(self._magnitude, 100 * self._eps, out=self._magnitude)
+        image_product /= self._magnitude
+        # As the product is Hermitian, the cross-correlation is real
+        cross_correlation = scipy.fft.irfft2(image_product, s=self.shape, workers=self.workers)
+        # Locate maximum
         maxima = numpy.unravel_index(numpy.argmax(numpy.abs(cross_correlation)),
                                      cross_correlation.shape)
 
-        maxima = numpy.stack(maxima).astype(float_dtype, copy=False)
-        maxima -= dftshift
+        shifts = numpy.stack(maxima).astype(float, copy=False)
+        shifts[shifts > self._midpoints] -= numpy.array(self.shape)[shifts > self._midpoints]
+
+        precision = self.precision
+        if precision > 1:
+            shifts = numpy.round(shifts * precision) / precision
+            # Matrix multiply DFT around the current shift estimate
+            sample_region_offset = self._dftshift - shifts * precision
+            cross_correlation = self._upsampled_dft(sample_region_offset).conj()
+            # Locate maximum and map back to original pixel grid
+            maxima = numpy.unravel_index(numpy.argmax(numpy.abs(cross_correlation)),
+                                         cross_correlation.shape)
+
+            maxima = numpy.stack(maxima).astype(float, copy=False)
+            maxima -= self._dftshift
+
+            shifts += maxima / precision
+
+        return shifts[1], shifts[0]
 
-        shifts += maxima / precision
+    def _upsampled_dft(self, axis_offsets):
+        """
+        Same as _upsampled_dft(conj(product), ups_size, precision, axis_offsets),
+        on the current product, but using the precomputed kernels.
+        axis_offsets (array of 2 floats): The offsets of the region to be sampled.
+        returns (numpy.ndarray): The upsampled DFT of the specified region.
+        """
+        # Reconstruct the complete (conjugated) product from the half one
+        data = self._full_product
+        nh = self._fft_shape[1]
+        numpy.conjugate(self._product, out=data[:, :nh])
+        data[:, nh:] = self._product[self._mirror_rows][:, self._mirror_cols]
 
-    return shifts[1], shifts[0]
+        im2pi = 1j * 2 * numpy.pi
+        for (kernel, freqs), ax_offset in list(zip(self._kernels, axis_offsets))[::-1]:
+            # kernel[i, k] = exp(-2i.pi * (i - offset) * freq[k])
+            #              = base_kernel[i, k] * exp(2i.pi * offset * freq[k])
+            phase = numpy.exp(im2pi * ax_offset * freqs)
+            data = numpy.tensordot(kernel, data * phase, axes=(1, -1))
+        return data
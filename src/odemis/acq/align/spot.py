@@ -36,7 +36,7 @@ from odemis.acq.align import coordinates, autofocus
 from odemis.acq.align.autofocus import AcquireNoBackground, MTD_EXHAUSTIVE
 from odemis.dataio import tiff
 from odemis.util import executeAsyncTask
-from odemis.util.spot import FindCenterCoordinates, GridPoints, MaximaFind, EstimateLatticeConstant
+from odemis.util.spot import GridPoints, MaximaFind, EstimateLatticeConstant, find_center_coordinates_batch
 from odemis.util.transform import AffineTransform, SimilarityTransform, alt_transformation_matrix_to_implicit
 
 ROUGH_MOVE = 1  # Number of max steps to reach the center in rough move
@@ -325,7 +325,7 @@ def FindSpot(image, sensitivity_limit=100):
     if not subimages:
         raise LookupError("No spot detected")
 
-    spot_coordinates = [FindCenterCoordinates(i) for i in subimages]
+    spot_coordinates = find_center_coordinates_batch(subimages)
     optical_coordinates = coordinates.ReconstructCoordinates(subimage_coordinates, spot_coordinates)
 
     # Too many spots detected
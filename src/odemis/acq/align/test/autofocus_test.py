@@ -29,7 +29,8 @@ from odemis.dataio import tiff
 from odemis import model, acq
 import odemis
 from odemis.acq import align, stream
-from odemis.acq.align.autofocus import Sparc2AutoFocus, MTD_BINARY
+from odemis.acq.align.autofocus import Sparc2AutoFocus, MTD_BINARY, MTD_EXHAUSTIVE_FIT, \
+    _IsFocusPeakPassed
 from odemis.dataio import hdf5
 from odemis.util import testing, timeout, img
 import os
@@ -131,6 +132,35 @@ class TestAutofocus(unittest.TestCase):
         self.assertAlmostEqual(foc_pos, self._sem_good_focus, 3)
         self.assertGreater(foc_lev, 0)
 
+    @timeout(1000)
+    def test_autofocus_opt_fit(self):
+        """
+        Test AutoFocus on CCD with the exhaustive fitted method
+        """
+        focus = self.focus
+        ccd = self.ccd
+        focus.moveAbs({"z": self._opt_good_focus - 100e-6}).result()
+        ccd.exposureTime.value = ccd.exposureTime.range[0]
+        rng = (self._opt_good_focus - 200e-6, self._opt_good_focus + 200e-6)
+        future_focus = align.AutoFocus(ccd, None, focus, rng_focus=rng, method=MTD_EXHAUSTIVE_FIT)
+        foc_pos, foc_lev, conf = future_focus.result(timeout=900)
+        self.assertAlmostEqual(foc_pos, self._opt_good_focus, 4)
+        self.assertGreater(foc_lev, 0)
+        self.assertAlmostEqual(focus.position.value["z"], foc_pos, 5)
+
+    def test_autofocus_fit_cancel(self):
+        """
+        Test cancelling AutoFocus with the exhaustive fitted method
+        """
+        self.efocus.moveAbs({"z": self._sem_good_focus - 100e-06}).result()
+        self.ebeam.dwellTime.value = self.ebeam.dwellTime.range[0]
+        future_focus = align.AutoFocus(self.sed, self.ebeam, self.efocus, method=MTD_EXHAUSTIVE_FIT)
+        time.sleep(0.5)
+        future_focus.cancel()
+        self.assertTrue(future_focus.cancelled())
+        with self.assertRaises(CancelledError):
+            future_focus.result(timeout=900)
+
 
 class TestSparc2AutoFocus(unittest.TestCase):
     """
@@ -620,5 +650,31 @@ class TestAutofocus1d(unittest.TestCase):
         numpy.testing.assert_allclose(foc_pos, self._good_focus, atol=2.5e-5)
 
 
+class TestIsFocusPeakPassed(unittest.TestCase):
+    """
+    Test the stop criterion of the exhaustive fitted autofocus
+    """
+
+    def test_peak_passed(self):
+        levels = [1, 2, 3, 8, 10, 7, 3, 2, 1]
+        self.assertTrue(_IsFocusPeakPassed(levels, n_after=3))
+
+    def test_peak_not_passed(self):
+        # Not enough low levels after the peak
+        levels = [1, 2, 3, 8, 10, 7, 3, 2]
+        self.assertFalse(_IsFocusPeakPassed(levels, n_after=3))
+        # Still going up
+        levels = [1, 2, 3, 4, 5, 6, 7]
+        self.assertFalse(_IsFocusPeakPassed(levels, n_after=3))
+
+    def test_peak_not_preceded(self):
+        # Only one low level before the peak: the scan started next to it, so
+        # it might just be the tail of a larger peak
+        levels = [1, 9, 9, 10, 3, 2, 1]
+        self.assertFalse(_IsFocusPeakPassed(levels, n_after=3))
+        levels = [1, 2, 3, 9, 10, 3, 2, 1]
+        self.assertTrue(_IsFocusPeakPassed(levels, n_after=3))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -17,10 +17,13 @@ import time
 import unittest
 from concurrent import futures
 
+import numpy
+
 import odemis
 from odemis import model
 from odemis.acq.align.autofocus import estimateAutoFocusTime
-from odemis.acq.align.roi_autofocus import autofocus_in_roi, estimate_autofocus_in_roi_time
+from odemis.acq.align.roi_autofocus import autofocus_in_roi, estimate_autofocus_in_roi_time, \
+    FocusSurfaceModel, get_focus_search_range
 from odemis.acq.move import FM_IMAGING, MicroscopePostureManager
 from odemis.util import testing
 from odemis.util.linalg import generate_triangulation_points
@@ -147,5 +150,58 @@ class RoiAutofocusTestCase(unittest.TestCase):
         self.assertGreaterEqual(estimated_time, min_time)
 
 
+class FocusSurfaceModelTestCase(unittest.TestCase):
+    """
+    Unit test for the prediction of the focus positions
+    """
+
+    def test_not_enough_points(self):
+        surface = FocusSurfaceModel()
+        focus_range = (-50e-6, 50e-6)
+        for x, y in ((0, 0), (100e-6, 0), (0, 100e-6)):
+            self.assertIsNone(surface.predict(x, y))
+            self.assertEqual(get_focus_search_range(surface, x, y, focus_range), (focus_range, None))
+            surface.add_point(x, y, 1e-6)
+
+    def test_plane(self):
+        """
+        On a tilted, flat, sample, the focus is predicted exactly
+        """
+        surface = FocusSurfaceModel()
+        for x, y in ((0, 0), (100e-6, 0), (0, 100e-6), (100e-6, 100e-6)):
+            surface.add_point(x, y, 0.01 * x - 0.02 * y + 3e-6)
+
+        z, uncertainty = surface.predict(50e-6, 200e-6)
+        self.assertAlmostEqual(z, 0.01 * 50e-6 - 0.02 * 200e-6 + 3e-6, delta=1e-12)
+        self.assertAlmostEqual(uncertainty, 0, delta=1e-12)
+
+        focus_range = (-50e-6, 50e-6)
+        rng, pred_z = get_focus_search_range(surface, 50e-6, 200e-6, focus_range)
+        self.assertAlmostEqual(pred_z, z, delta=1e-12)
+        self.assertLess(rng[1] - rng[0], focus_range[1] - focus_range[0])
+        self.assertTrue(rng[0] < z < rng[1])
+
+    def test_noisy_surface(self):
+        """
+        With a noisy sample, the uncertainty is larger when extrapolating
+        """
+        rng = numpy.random.default_rng(0)
+        surface = FocusSurfaceModel()
+        for x in numpy.linspace(0, 200e-6, 5):
+            for y in numpy.linspace(0, 200e-6, 5):
+                surface.add_point(x, y, 0.01 * x + rng.normal(0, 1e-6))
+
+        z_in, unc_in = surface.predict(100e-6, 100e-6)
+        z_out, unc_out = surface.predict(2e-3, 2e-3)
+        self.assertAlmostEqual(z_in, 1e-6, delta=2e-6)
+        self.assertGreater(unc_in, 0)
+        self.assertGreater(unc_out, unc_in)
+
+        # Too uncertain => the whole range is searched
+        surface.add_point(100e-6, 100e-6, 100e-6)
+        focus_range = (-50e-6, 50e-6)
+        self.assertEqual(get_focus_search_range(surface, 100e-6, 100e-6, focus_range), (focus_range, None))
+
+
 if __name__ == '__main__':
     unittest.main()
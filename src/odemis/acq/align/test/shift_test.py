@@ -22,7 +22,7 @@ Odemis. If not, see http://www.gnu.org/licenses/.
 import math
 from numpy import fft
 import numpy
-from odemis.acq.align.shift import MeasureShift
+from odemis.acq.align.shift import MeasureShift, ShiftMeasurer
 from odemis.dataio import hdf5
 import os
 import unittest
@@ -206,5 +206,71 @@ class TestMeasureShift(unittest.TestCase):
         drift = MeasureShift(self.small_data, self.small_data_random_drifted_noisy, 10)
         numpy.testing.assert_almost_equal(drift, (self.small_deltac, self.small_deltar), 0)
 
+
+class TestShiftMeasurer(unittest.TestCase):
+    """
+    Test ShiftMeasurer
+    """
+
+    def setUp(self):
+        # Same data as for MeasureShift
+        TestMeasureShift.setUp(self)
+
+    def test_same_as_measureshift(self):
+        """
+        The results should be the same as MeasureShift, for all precisions
+        """
+        shape = self.data[0].shape
+        for precision in (1, 10, 100):
+            measurer = ShiftMeasurer(shape, precision)
+            for img in (self.data_drifted[0], self.data_random_drifted, self.data_random_drifted_noisy):
+                drift = measurer.measure(self.data[0], img)
+                exp_drift = MeasureShift(self.data[0], img, precision)
+                numpy.testing.assert_almost_equal(drift, exp_drift)
+
+    def test_odd_shape(self):
+        """
+        Real FFTs must handle shapes with odd number of columns
+        """
+        img = self.small_data[:, :-1]
+        img_drifted = self.small_data_random_drifted[:, :-1]
+        measurer = ShiftMeasurer(img.shape, 10)
+        drift = measurer.measure(img, img_drifted)
+        numpy.testing.assert_almost_equal(drift, MeasureShift(img, img_drifted, 10))
+
+    def test_reference(self):
+        """
+        Measuring against a reference image several times
+        """
+        measurer = ShiftMeasurer(self.data[0].shape, 10)
+        measurer.set_reference(self.data[0])
+        for i in range(3):
+            drift = measurer.measure(self.data[0], self.data_random_drifted)
+            numpy.testing.assert_almost_equal(drift, (self.deltac, self.deltar), 1)
+            drift = measurer.measure(self.data[0], self.data[0])
+            numpy.testing.assert_almost_equal(drift, (0, 0))
+
+    def test_batch(self):
+        """
+        Batch measurement, with a single previous image, and with a list of them
+        """
+        measurer = ShiftMeasurer(self.data[0].shape, 10)
+        imgs = [self.data[0], self.data_random_drifted, self.data_random_drifted_noisy]
+        exp_drifts = [MeasureShift(self.data[0], img, 10) for img in imgs]
+
+        drifts = measurer.measure_batch(self.data[0], imgs)
+        numpy.testing.assert_almost_equal(drifts, exp_drifts)
+
+        drifts = measurer.measure_batch([self.data[0]] * len(imgs), imgs)
+        numpy.testing.assert_almost_equal(drifts, exp_drifts)
+
+    def test_wrong_shape(self):
+        measurer = ShiftMeasurer(self.small_data.shape, 1)
+        with self.assertRaises(ValueError):
+            measurer.measure(self.data[0], self.data[0])
+        with self.assertRaises(ValueError):
+            ShiftMeasurer(self.small_data.shape, 0)
+
+
 if __name__ == '__main__':
     unittest.main()
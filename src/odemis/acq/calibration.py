@@ -20,6 +20,8 @@ You should have received a copy of the GNU General Public License along with Ode
 import csv
 import logging
 import math
+import threading
+from collections import OrderedDict
 
 import numpy
 
@@ -277,7 +279,31 @@ def apply_spectrum_corrections(data, bckg=None, coef=None):
       the A dimension (theta angles) is shorten by removing the indices where the
       theta is NaN. The MD_THETA_LIST is updated to only contain the part with numbers.
     """
+    _check_spectrum_corrections(data, bckg, coef)
 
+    if bckg is not None:
+        data = img.Subtract(data, bckg)
+
+    if model.MD_THETA_LIST in data.metadata:
+        try:
+            data = project_angular_spectrum_to_grid_5d(data)
+        except (ValueError, KeyError) as ex:
+            logging.warning("Failed to correct chromatic aberration on angular spectrum data: %s", ex)
+
+    if coef is not None:
+        # Compensate the data
+        data = data * _fit_spectrum_efficiency(data, coef)  # will keep metadata from data
+
+    return data
+
+
+def _check_spectrum_corrections(data, bckg=None, coef=None):
+    """
+    Check that the background correction and the spectrum efficiency compensation
+    can be applied to the given data. See apply_spectrum_corrections() for the
+    parameters.
+    :raises ValueError: If the data and calibration data are not compatible.
+    """
     # handle time correlator data (chronograph) data
     # -> no spectrum efficiency compensation and bg correction supported
     if data.shape[-5] <= 1 and data.shape[-4] > 1:
@@ -314,7 +340,6 @@ def apply_spectrum_corrections(data, bckg=None, coef=None):
             if model.MD_WL_LIST in bckg.metadata:
                 raise ValueError("Found MD_WL_LIST metadata in background image, but "
                                  "data does not provide any wavelength information")
-            data = img.Subtract(data, bckg)
 
         else:
             # temporal spectrum with wl info (with/without time info)
@@ -336,14 +361,6 @@ def apply_spectrum_corrections(data, bckg=None, coef=None):
                                 wl_bckg[0] * 1e9, wl_bckg[-1] * 1e9,
                                 wl_data[0] * 1e9, wl_data[-1] * 1e9)
 
-            data = img.Subtract(data, bckg)
-
-    if model.MD_THETA_LIST in data.metadata:
-        try:
-            data = project_angular_spectrum_to_grid_5d(data)
-        except (ValueError, KeyError) as ex:
-            logging.warning("Failed to correct chromatic aberration on angular spectrum data: %s", ex)
-
     if coef is not None:
         # Check if we have any wavelength information in data.
         if model.MD_WL_LIST not in data.metadata:
@@ -352,24 +369,172 @@ def apply_spectrum_corrections(data, bckg=None, coef=None):
         if coef.shape[1:] != (1, 1, 1, 1):
             raise ValueError("Spectrum efficiency compensation should have shape C1111.")
 
-        # Need to get the calibration data for each wavelength of the data
-        wl_data = spectrum.get_wavelength_per_pixel(data)
-        wl_coef = spectrum.get_wavelength_per_pixel(coef)
 
-        # Warn if the calibration is not enough for the data
-        if wl_coef[0] > wl_data[0] or wl_coef[-1] < wl_data[-1]:
-            logging.warning("Spectrum efficiency compensation is only between "
-                            "%g->%g nm, while the spectrum is between %g->%g nm.",
-                            wl_coef[0] * 1e9, wl_coef[-1] * 1e9,
-                            wl_data[0] * 1e9, wl_data[-1] * 1e9)
+def _fit_spectrum_efficiency(data, coef):
+    """
+    Compute the spectrum efficiency compensation factor for each wavelength of the data.
+    :param data: (DataArray of at least 5 dims) The data, with MD_WL_LIST.
+    :param coef: (DataArray of at least 5 dims) The coefficient data, with CTZYX = C1111.
+    :returns: (numpy.ndarray of shape C1111) The factor to multiply the data with.
+    """
+    # Need to get the calibration data for each wavelength of the data
+    wl_data = spectrum.get_wavelength_per_pixel(data)
+    wl_coef = spectrum.get_wavelength_per_pixel(coef)
 
-        # Interpolate the calibration data for each wl_data
-        calib_fitted = numpy.interp(wl_data, wl_coef, coef[:, 0, 0, 0, 0])
-        calib_fitted.shape += (1, 1, 1, 1)  # put TZYX dims
-        # Compensate the data
-        data = data * calib_fitted  # will keep metadata from data
+    # Warn if the calibration is not enough for the data
+    if wl_coef[0] > wl_data[0] or wl_coef[-1] < wl_data[-1]:
+        logging.warning("Spectrum efficiency compensation is only between "
+                        "%g->%g nm, while the spectrum is between %g->%g nm.",
+                        wl_coef[0] * 1e9, wl_coef[-1] * 1e9,
+                        wl_data[0] * 1e9, wl_data[-1] * 1e9)
 
-    return data
+    # Interpolate the calibration data for each wl_data
+    calib_fitted = numpy.interp(wl_data, wl_coef, coef[:, 0, 0, 0, 0])
+    calib_fitted.shape += (1, 1, 1, 1)  # put TZYX dims
+
+    return calib_fitted
+
+
+# Maximum number of parts of the data kept by a SpectrumCorrectedData
+CORRECTED_CACHE_SIZE = 16
+# Maximum memory used by the cache of a SpectrumCorrectedData
+CORRECTED_CACHE_MAX_BYTES = 256 * 2 ** 20  # B
+
+
+class SpectrumCorrectedData(object):
+    """
+    Lazy version of apply_spectrum_corrections(): it behaves like the corrected
+    DataArray (shape, dtype, metadata, and indexing), but the corrections are
+    only computed on the part of the data which is accessed. This avoids having
+    a full (float) copy of the data in memory, when only a few pixels or
+    wavelengths are needed. The last parts accessed are cached.
+    Use getData() to get the whole corrected data as a DataArray.
+    Note: angular spectrum data is not supported, as it has to be projected to
+    a regular grid, which needs the whole data. Use apply_spectrum_corrections()
+    in such case.
+    """
+
+    def __init__(self, data, bckg=None, coef=None):
+        """
+        :param data: (DataArray of 5 dims) The original data.
+        :param bckg: (None or DataArray of 5 dims) The background data.
+        :param coef: (None or DataArray of 5 dims) The coefficient data.
+          See apply_spectrum_corrections() for the details on the parameters.
+        :raises ValueError: If the data and calibration data are not compatible,
+          or the data is angular spectrum data.
+        """
+        if model.MD_THETA_LIST in data.metadata:
+            raise ValueError("Angular spectrum data cannot be corrected lazily")
+        _check_spectrum_corrections(data, bckg, coef)
+
+        self._data = data
+        self._bckg = bckg
+        self._coef = None if coef is None else _fit_spectrum_efficiency(data, coef)
+
+        self.shape = data.shape
+        self.ndim = data.ndim
+        self.size = data.size
+        # The corrections keep the metadata of the data
+        self.metadata = data.metadata
+        # The simplest way to know the dtype is to correct a tiny part of the data
+        self.dtype = self._correct((slice(0, 1),) * data.ndim).dtype
+
+        self._cache = OrderedDict()  # hashable index -> DataArray
+        self._cache_nbytes = 0
+        self._cache_lock = threading.Lock()
+
+    @property
+    def nbytes(self):
+        return self.size * self.dtype.itemsize
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __repr__(self):
+        return "<%s of shape %s and dtype %s>" % (self.__class__.__name__, self.shape, self.dtype)
+
+    def __getitem__(self, key):
+        """
+        Compute the corrected data for the given index (as for a numpy array).
+        The result is cached, and therefore read-only.
+        """
+        ckey = self._hashable_key(key)
+        if ckey is not None:
+            with self._cache_lock:
+                try:
+                    self._cache.move_to_end(ckey)
+                    return self._cache[ckey]
+                except KeyError:
+                    pass
+
+        d = self._correct(key)
+
+        if ckey is not None and isinstance(d, numpy.ndarray) and d.nbytes <= CORRECTED_CACHE_MAX_BYTES:
+            d.flags.writeable = False
+            with self._cache_lock:
+                self._cache[ckey] = d
+                self._cache_nbytes += d.nbytes
+                while (len(self._cache) > CORRECTED_CACHE_SIZE or
+                       self._cache_nbytes > CORRECTED_CACHE_MAX_BYTES):
+                    _, old = self._cache.popitem(last=False)
+                    self._cache_nbytes -= old.nbytes
+        return d
+
+    def __array__(self, dtype=None):
+        d = self.getData()
+        if dtype is not None:
+            d = d.astype(dtype, copy=False)
+        return d
+
+    def getData(self):
+        """
+        Compute the whole corrected data (not cached).
+        :returns: (DataArray) Same as apply_spectrum_corrections() would return.
+        """
+        return self._correct(Ellipsis)
+
+    def minmax(self):
+        """
+        Compute the minimum and maximum value of the corrected data, without
+        having the whole corrected data in memory at once.
+        :returns: (number, number) minimum and maximum value.
+        """
+        mn, mx = None, None
+        for c in range(self.shape[0]):
+            d = self._correct(c).view(numpy.ndarray)
+            dmn, dmx = d.min(), d.max()
+            mn = dmn if mn is None else numpy.minimum(mn, dmn)
+            mx = dmx if mx is None else numpy.maximum(mx, dmx)
+        return mn, mx
+
+    def _correct(self, key):
+        """
+        Compute the corrected data for the given index, without caching.
+        """
+        d = self._data[key]
+        if self._bckg is not None:
+            d = img.Subtract(d, numpy.broadcast_to(self._bckg, self.shape)[key])
+        if self._coef is not None:
+            d = d * numpy.broadcast_to(self._coef, self.shape)[key]
+        return d
+
+    @staticmethod
+    def _hashable_key(key):
+        """
+        Convert an index into a hashable value, to be used as key for the cache.
+        :returns: (tuple or None) None if the index cannot be cached (eg, it contains an array).
+        """
+        if not isinstance(key, tuple):
+            key = (key,)
+        hkey = []
+        for k in key:
+            if isinstance(k, slice):
+                hkey.append((k.start, k.stop, k.step))
+            elif k is Ellipsis or k is None or isinstance(k, (int, numpy.integer)):
+                hkey.append(k)
+            else:
+                return None
+        return tuple(hkey)
 
 
 def project_angular_spectrum_to_grid_5d(data: model.DataArray) -> model.DataArray:
@@ -29,7 +29,7 @@ import numpy
 import cv2
 
 from odemis import model
-from odemis.acq.align.shift import MeasureShift
+from odemis.acq.align.shift import MeasureShift, ShiftMeasurer
 
 MIN_RESOLUTION = (20, 20)  # sometimes 8x8 works, but it's not reliable enough
 MAX_PIXELS = 128 ** 2  # px
@@ -72,6 +72,9 @@ class AnchoredEstimator(object):
         self.max_drift = (0, 0)  # in sem px
 
         self.raw = []  # first 2 and last 2 anchor areas acquired (in order)
+        # To measure the shift between anchor areas, reusing the FFT of the
+        # images which are compared multiple times. Created on the first estimate.
+        self._shift_measurer = None
         self._acq_sem_complete = threading.Event()
 
         # Calculate initial translation for anchor region acquisition
@@ -175,11 +178,11 @@ class AnchoredEstimator(object):
             # include also the drift of the previous image.
             # Also, MeasureShift return the shift in image pixels, which is
             # different (usually bigger) from the SEM px.
-            prev_drift = MeasureShift(self.raw[-2], self.raw[-1], 10)
+            prev_drift = self._measure_shift(self.raw[-2], self.raw[-1])
             prev_drift = (prev_drift[0] * self._scale[0] + self.drift[0],
                           prev_drift[1] * self._scale[1] + self.drift[1])
 
-            orig_drift = MeasureShift(self.raw[0], self.raw[-1], 10)
+            orig_drift = self._measure_shift(self.raw[0], self.raw[-1])
             self.drift = (orig_drift[0] * self._scale[0],
                           orig_drift[1] * self._scale[1])
             logging.debug("Current drift: %s", self.drift)
@@ -201,6 +204,22 @@ class AnchoredEstimator(object):
 
         return self.drift
 
+    def _measure_shift(self, previous_img, current_img):
+        """
+        Measure the shift between two anchor areas, with a precision of 1/10th px
+        returns (tuple of floats): shift in pixels (horizontal, vertical)
+        """
+        if previous_img.shape != current_img.shape:
+            # Should never happen, but just in case
+            return MeasureShift(previous_img, current_img, 10)
+
+        if self._shift_measurer is None or self._shift_measurer.shape != current_img.shape:
+            self._shift_measurer = ShiftMeasurer(current_img.shape, 10)
+            # The first image is used for every estimation
+            if self.raw[0].shape == current_img.shape:
+                self._shift_measurer.set_reference(self.raw[0])
+        return self._shift_measurer.measure(previous_img, current_img)
+
     def estimateAcquisitionTime(self):
         """
         return (float): estimated time to acquire 1 anchor area
@@ -11,6 +11,8 @@ from concurrent.futures._base import CANCELLED, FINISHED, RUNNING, CancelledErro
 from enum import Enum
 from typing import Dict, List, Tuple, Optional
 
+import numpy
+
 from odemis import model
 from odemis.acq.acqmng import (
     SettingsObserver,
@@ -19,7 +21,7 @@ from odemis.acq.acqmng import (
     estimateTime,
     estimateZStackAcquisitionTime,
 )
-from odemis.acq.align.autofocus import AutoFocus, estimateAutoFocusTime
+from odemis.acq.align.autofocus import AutoFocus, estimateAutoFocusTime, MTD_EXHAUSTIVE_FIT
 from odemis.acq.milling.tasks import MillingTaskSettings, load_milling_tasks
 from odemis.acq.milling import DEFAULT_MILLING_TASKS_PATH
 from odemis.acq.move import (
@@ -31,12 +33,13 @@ from odemis.acq.move import (
 )
 from odemis.acq.stitching._tiledacq import SAFE_REL_RANGE_DEFAULT
 from odemis.acq.stream import Stream, StaticFluoStream
-from odemis.dataio import find_fittest_converter
+from odemis.dataio import export_async, find_fittest_converter
 from odemis.util import dataio, executeAsyncTask
 from odemis.util.comp import generate_zlevels
 from odemis.util.dataio import data_to_static_streams, open_acquisition, splitext
 from odemis.util.driver import estimate_stage_movement_time
 from odemis.util.filename import create_filename
+from odemis.util.graph import shortest_open_path
 
 # The current state of the feature
 FEATURE_ACTIVE, FEATURE_READY_TO_MILL, FEATURE_ROUGH_MILLED, FEATURE_POLISHED, FEATURE_DEACTIVE = (
@@ -456,6 +459,7 @@ class CryoFeatureAcquisitionTask(object):
 
         # Find the fittest converter for the given filename
         self.exporter = find_fittest_converter(filename)
+        self._export_futures = []  # futures of the data being saved
 
         # Get the microscope and the posture manager
         microscope = model.getMicroscope()
@@ -558,7 +562,8 @@ class CryoFeatureAcquisitionTask(object):
             self._future._running_subf = AutoFocus(detector=self.streams[0].detector,
                                                         emt=None,
                                                         focus=self.focus,
-                                                        rng_focus=focus_rng)
+                                                        rng_focus=focus_rng,
+                                                        method=MTD_EXHAUSTIVE_FIT)
 
             # note: the auto focus moves the objective to the best position
             foc_pos, foc_lev, conf = self._future._running_subf.result(timeout=900)
@@ -583,13 +588,13 @@ class CryoFeatureAcquisitionTask(object):
     def _move_to_site(self, site: CryoFeature):
         """
         Move the stage to the given site and move the objective lens to position.
+        If the objective moves away from the sample, it's moved at the same time as the stage.
         :param site: The site to move to.
         :raises MoveError: if the stage failed to move to the given site.
         """
         stage_position = get_feature_position_at_posture(pm=self.pm, feature=site, posture=FM_IMAGING) # stage-bare
         fm_focus_position = site.fm_focus_position.value
         logging.debug(f"For feature {site.name.value} moving the stage to {stage_position}")
-        self._future.running_subf = self.stage.moveAbs(stage_position)
 
         # estimate the time to move the stage
         t = estimate_stage_movement_time(
@@ -600,23 +605,57 @@ class CryoFeatureAcquisitionTask(object):
             independent_axes=True,
         )
         t = t * 5 + 3 # adding extra margin
+
+        self._future.running_subf = self.stage.moveAbs(stage_position)
+        focus_f = None
+        if self._is_focus_retracting(fm_focus_position):
+            # Safe to do it during the stage move, as it cannot get closer to the sample
+            logging.debug(
+                "For feature %s moving the objective to %s m, during the stage move", site.name.value, fm_focus_position
+            )
+            focus_f = self.focus.moveAbs(fm_focus_position)
+
         try:
             self._future.running_subf.result(t)
         except TimeoutError:
             self._future.running_subf.cancel()
+            if focus_f:
+                focus_f.cancel()
             raise MoveError(
                 f"Failed to move the stage for feature {site.name.value} within {t} s"
             )
 
-        logging.debug(
-            "For feature %s moving the objective to %s m", site.name.value, fm_focus_position
-        )
-        self._move_focus(site, fm_focus_position)
+        if focus_f:
+            self._future.running_subf = focus_f
+            self._wait_focus(site)
+        else:
+            logging.debug(
+                "For feature %s moving the objective to %s m", site.name.value, fm_focus_position
+            )
+            self._move_focus(site, fm_focus_position)
+
+    def _is_focus_retracting(self, fm_focus_position: Dict[str, float]) -> bool:
+        """
+        Check whether moving the objective to the given position brings it further
+        from the sample (ie, closer to its deactive position).
+        :param fm_focus_position: The target position of the focus.
+        :return: True if the move goes towards the deactive position. False if it
+          gets closer to the sample, or it cannot be determined.
+        """
+        try:
+            deactive = self.focus.getMetadata()[model.MD_FAV_POS_DEACTIVE]["z"]
+            current = self.focus.position.value["z"]
+            return abs(fm_focus_position["z"] - deactive) <= abs(current - deactive)
+        except (KeyError, TypeError):
+            return False
 
     def _move_focus(self, site: CryoFeature, fm_focus_position: Dict[str, float]) -> None:
         """Move the focus to the given position."""
         self._future.running_subf = self.focus.moveAbs(fm_focus_position)
+        self._wait_focus(site)
 
+    def _wait_focus(self, site: CryoFeature) -> None:
+        """Wait for the focus move (as .running_subf) to finish."""
         # objective move shouldn't take longer than 2 seconds
         t = OBJECTIVE_WAIT_TIME * 2 # adding extra margin
         try:
@@ -645,7 +684,8 @@ class CryoFeatureAcquisitionTask(object):
             autofocus_time = estimateAutoFocusTime(detector=self.streams[0].detector,
                                                         emt=None,
                                                         focus=self.focus,
-                                                        rng_focus=focus_rng)
+                                                        rng_focus=focus_rng,
+                                                        method=MTD_EXHAUSTIVE_FIT)
 
         if self.zparams:
             zlevels = self._generate_zlevels(zmin=self.zparams["zmin"],
@@ -657,31 +697,51 @@ class CryoFeatureAcquisitionTask(object):
         logging.debug(f"Estimated total acquisition time {acq_time}s, autofocus time {autofocus_time}s")
         return acq_time + autofocus_time
 
-    def estimate_movement_time(self) -> float:
-        """Estimate the movement time for the acquisition task."""
-
-        # calculate the time to move between each position
-        positions = []
-        for f in self.features:
-            if f.status.value == FEATURE_DEACTIVE:
-                continue
+    def _plan_feature_order(self) -> Tuple[List[CryoFeature], float, float]:
+        """
+        Find a short order to visit the active features, starting from the
+        current stage position, based on the estimated stage movement times.
+        :return: the active features in the order to visit them, the estimated
+          stage movement time (s) in that order, and the estimated stage movement
+          time (s) in the original order.
+        """
+        features = [f for f in self.features if f.status.value != FEATURE_DEACTIVE]
+        positions = [self.stage.position.value]
+        for f in features:
             positions.append(get_feature_position_at_posture(pm=self.pm,
                                                              feature=f,
                                                              posture=FM_IMAGING))
 
-        stage_movement_time = 0
-        for start, end in zip(positions[0:-1], positions[1:]):
-            stage_movement_time += estimate_stage_movement_time(
-                                    stage=self.stage,
-                                    start_pos=start, end_pos=end,
-                                    axes=["x", "y", "z"], independent_axes=True)
+        # time to move between each position
+        n = len(positions)
+        costs = numpy.zeros((n, n))
+        for i, j in itertools.combinations(range(n), 2):
+            costs[i, j] = costs[j, i] = estimate_stage_movement_time(
+                                            stage=self.stage,
+                                            start_pos=positions[i], end_pos=positions[j],
+                                            axes=["x", "y", "z"], independent_axes=True)
+
+        path = shortest_open_path(costs, start=0)
+        ordered_features = [features[i - 1] for i in path[1:]]
+        opt_time = sum(costs[i, j] for i, j in zip(path[:-1], path[1:]))
+        orig_time = sum(costs[i, i + 1] for i in range(n - 1))
+        return ordered_features, opt_time, orig_time
+
+    def estimate_movement_time(self) -> float:
+        """Estimate the movement time for the acquisition task."""
+
+        # calculate the time to move between each position, in the optimised order
+        features, stage_movement_time, orig_stage_movement_time = self._plan_feature_order()
+        logging.debug("Optimised feature order: %s, saving %g s of stage movement (compared to %g s)",
+                      [f.name.value for f in features],
+                      orig_stage_movement_time - stage_movement_time, orig_stage_movement_time)
 
         # add the time to wait for the stage to settle
-        expected_stage_time = stage_movement_time + STAGE_WAIT_TIME * len(positions)
+        expected_stage_time = stage_movement_time + STAGE_WAIT_TIME * len(features)
         logging.debug(f"Estimated total stage movement time {stage_movement_time}s")
 
         # estimate the time to move the objective
-        expected_objective_time = 1 * len(positions) # 1 second for objective movement (estimated)
+        expected_objective_time = 1 * len(features) # 1 second for objective movement (estimated)
         logging.debug(f"Estimated total objective movement time {expected_objective_time}s")
 
         # total movement time
@@ -721,12 +781,16 @@ class CryoFeatureAcquisitionTask(object):
                     self._future.running_subf = self.pm.cryoSwitchSamplePosition(FM_IMAGING)
                     self._future.running_subf.result()
 
-            for feature in self.features:
-                logging.debug(f"starting acquisition task for {feature.name.value}")
+            # Visit the features in the order which minimizes the stage movements
+            features, opt_time, orig_time = self._plan_feature_order()
+            skipped = [f.name.value for f in self.features if f not in features]
+            if skipped:
+                logging.info(f"Skipping features {skipped} because they are deactivated")
+            logging.info("Acquiring features in order %s, expected to save %g s of stage movement",
+                         [f.name.value for f in features], orig_time - opt_time)
 
-                if feature.status.value == FEATURE_DEACTIVE:
-                    logging.info(f"Skipping feature {feature.name.value} because it is deactivated")
-                    continue
+            for feature in features:
+                logging.debug(f"starting acquisition task for {feature.name.value}")
 
                 # move to feature position
                 self._move_to_site(feature)
@@ -741,13 +805,17 @@ class CryoFeatureAcquisitionTask(object):
             logging.exception(f"The acquisition failed: {exp}")
             raise
         finally:
+            # Even if cancelled, make sure the data acquired is saved
+            self._wait_export()
             self._future._task_state = FINISHED
 
         return [], exp
 
     def _export_data(self, feature: CryoFeature, data: List[model.DataArray]) -> None:
         """
-        Called to export the acquired data.
+        Called to export the acquired data. The data is written in the
+        background, so that the acquisition of the next feature can start
+        immediately. Use _wait_export() to wait until it's written.
         data: the returned data/images from the future
         """
 
@@ -759,8 +827,18 @@ class CryoFeatureAcquisitionTask(object):
             status = feature.status.value
             d.metadata[model.MD_DESCRIPTION] = f"{name}-{status}-{d.metadata[model.MD_DESCRIPTION]}"
 
-        self.exporter.export(filename, data)
-        logging.info("Acquisition saved as file '%s'.", filename)
+        f = export_async(filename, data, exporter=self.exporter)
+        self._export_futures.append(f)
+
+    def _wait_export(self) -> None:
+        """Wait until all the acquired data is written on disk."""
+        for f in self._export_futures:
+            try:
+                filename = f.result()
+                logging.info("Acquisition saved as file '%s'.", filename)
+            except Exception:
+                logging.exception("Failed to save the acquisition")
+        self._export_futures = []
 
 
 def acquire_at_features(
@@ -17,14 +17,13 @@ PURPOSE. See the GNU General Public License for more details.
 You should have received a copy of the GNU General Public License along with
 Odemis. If not, see http://www.gnu.org/licenses/.
 """
-import copy
 import logging
 import math
 import os
 import statistics
 import threading
 import time
-from concurrent.futures import CancelledError, TimeoutError
+from concurrent.futures import CancelledError, ThreadPoolExecutor, TimeoutError
 from concurrent.futures._base import CANCELLED, FINISHED, RUNNING
 from enum import Enum
 from itertools import groupby
@@ -38,7 +37,7 @@ from shapely.geometry import Polygon, box
 
 from odemis import dataio, model
 from odemis.acq import acqmng
-from odemis.acq.align.autofocus import MTD_EXHAUSTIVE, AutoFocus
+from odemis.acq.align.autofocus import MTD_EXHAUSTIVE_FIT, AutoFocus
 from odemis.acq.align.roi_autofocus import (
     autofocus_in_roi,
     estimate_autofocus_in_roi_time,
@@ -60,11 +59,10 @@ from odemis.acq.stream import (
     executeAsyncTask,
     util,
 )
-from odemis.model import DataArray
 from odemis.util import dataio as udataio
 from odemis.util import img, linalg, rect_intersect
 from odemis.util.focus import MeasureOpticalFocus
-from odemis.util.img import assembleZCube
+from odemis.util.img import ZCubeAssembler
 from odemis.util.linalg import generate_triangulation_points
 from odemis.util.raster import get_polygon_grid_cells, point_in_polygon
 
@@ -89,6 +87,13 @@ MAX_DISTANCE_FOCUS_POINTS = 450e-06  # in m
 DEFAULT_FOV = (100e-6, 100e-6) # m
 STITCH_SPEED = 1e8  # px/s
 
+# Number of threads used to post-process the tiles (z-stack projection, saving...),
+# while the next tiles are acquired
+TILE_PROCESSING_WORKERS = 2
+# Maximum number of tiles acquired but not yet post-processed. When reached, the
+# acquisition waits, to limit the memory usage.
+MAX_PENDING_TILES = 4
+
 class FocusingMethod(Enum):
     NONE = 0  # Never auto-focus
     ALWAYS = 1  # Before every tile
@@ -240,6 +245,7 @@ class TiledAcquisitionTask(object):
             self._exporter = dataio.find_fittest_converter(filename)
             self._fn_bs, self._fn_ext = udataio.splitext(filename)
             self._log_dir = os.path.dirname(self._log_path)
+        self._save_futures = []  # futures of the tiles being saved
 
         self._registrar = registrar
         self._weaver = weaver
@@ -460,14 +466,13 @@ class TiledAcquisitionTask(object):
             self._future.running_subf.cancel()
             # Continue acquiring anyway... maybe it has moved somewhere near
 
-    def _sortDAs(self, das, ss):
+    def _addAcqTypeMetadata(self, das, ss):
         """
-        Sorts das based on priority for stitching, i.e. largest SEM da first, then
-        other SEM das, and finally das from other streams.
+        Add the ACQ_TYPE metadata to the das which don't have it yet, based on
+        the stream they come from. Must be called while the das are still the
+        .raw of the streams.
         das: list of DataArrays
         ss: streams from which the das were extracted
-
-        returns: list of DataArrays, reordered input
         """
         # Add the ACQ_TYPE metadata (in case it's not there)
         # In practice, we check the stream the DA came from, and based on the stream
@@ -502,6 +507,17 @@ class TiledAcquisitionTask(object):
             else:
                 logging.warning("Couldn't find the stream for DA of shape %s", da.shape)
 
+    def _sortDAs(self, das, ss):
+        """
+        Sorts das based on priority for stitching, i.e. largest SEM da first, then
+        other SEM das, and finally das from other streams.
+        das: list of DataArrays
+        ss: streams from which the das were extracted
+
+        returns: list of DataArrays, reordered input
+        """
+        self._addAcqTypeMetadata(das, ss)
+
         # # Remove the DAs we don't want to (cannot) stitch
         das = [da for da in das if da.metadata[model.MD_ACQ_TYPE] \
                not in (model.MD_AT_AR, model.MD_AT_SPECTRUM)]
@@ -641,60 +657,90 @@ class TiledAcquisitionTask(object):
 
     def _save_tiles(self, ix, iy, das, stream_cube_id=None):
         """
-        Save the acquired data array to disk (for debugging)
+        Save the acquired data array to disk (for debugging).
+        The data is written in the background, by the export service. Use
+        _waitSaveTiles() to wait until it's written.
         """
+        if stream_cube_id is not None:
+            # Indicate it's a stream cube in the file name
+            fn_tile = "%s-cube%d-%.5dx%.5d%s" % (self._fn_bs, stream_cube_id, ix, iy, self._fn_ext)
+        else:
+            fn_tile = "%s-%.5dx%.5d%s" % (self._fn_bs, ix, iy, self._fn_ext)
+        logging.debug("Will save data of tile %dx%d to %s", ix, iy, fn_tile)
+        f = dataio.export_async(os.path.join(self._log_dir, fn_tile), das, exporter=self._exporter)
+        self._save_futures.append(f)
 
-        def save_tile(ix, iy, das, stream_cube_id=None):
-            if stream_cube_id is not None:
-                # Indicate it's a stream cube in the file name
-                fn_tile = "%s-cube%d-%.5dx%.5d%s" % (self._fn_bs, stream_cube_id, ix, iy, self._fn_ext)
-            else:
-                fn_tile = "%s-%.5dx%.5d%s" % (self._fn_bs, ix, iy, self._fn_ext)
-            logging.debug("Will save data of tile %dx%d to %s", ix, iy, fn_tile)
-            self._exporter.export(os.path.join(self._log_dir, fn_tile), das)
-
-        # Run in a separate thread
-        threading.Thread(target=save_tile, args=(ix, iy, das, stream_cube_id), ).start()
+    def _waitSaveTiles(self):
+        """
+        Wait until all the tiles passed to _save_tiles() are written on disk.
+        Failures are only logged, as the tiles are just saved for debugging.
+        """
+        for f in self._save_futures:
+            try:
+                f.result()
+            except Exception:
+                logging.exception("Failed to save tile")
+        self._save_futures = []
 
-    def _acquireStreamCompressedZStack(self, i, ix, iy, stream):
+    def _acquireStreamZStack(self, i, ix, iy, stream):
         """
-        Acquire a compressed zstack image for the given stream.
-        The method does the following:
-            - Move focus over the list of zlevels
-            - For each focus level acquire image of the stream
-            - Construct xyz cube for the acquired zstack
-            - Compress the cube into a single image using 'maximum intensity projection'
-        :return DataArray: Acquired da for the current tile stream
+        Acquire a zstack for the given stream, by moving the focus over the
+        list of zlevels, and acquiring an image of the stream at each level.
+        The compression into a single image is done later, by _compressZStack().
+        :return list of DataArray: Acquired da for each zlevel
         """
         zstack = []
-        for z in self._zlevels:
-            logging.debug(f"Moving focus for tile {ix}x{iy} to {z}.")
-            stream.focuser.moveAbsSync({'z': z})
+        zlevels = self._zlevels
+        logging.debug(f"Moving focus for tile {ix}x{iy} to {zlevels[0]}.")
+        f = stream.focuser.moveAbs({'z': zlevels[0]})
+        for j, z in enumerate(zlevels):
+            f.result()
             da = self._acquireStreamTile(i, ix, iy, stream)
+            # Move to the next zlevel while the data is being handled
+            if j < len(zlevels) - 1:
+                logging.debug(f"Moving focus for tile {ix}x{iy} to {zlevels[j + 1]}.")
+                f = stream.focuser.moveAbs({'z': zlevels[j + 1]})
             zstack.append(da)
 
         if self._future._task_state == CANCELLED:
             raise CancelledError()
+        return zstack
+
+    def _compressZStack(self, ix, iy, stream, zstack, zlevels):
+        """
+        Compress a zstack into a single image.
+        The method does the following:
+            - Construct xyz cube for the acquired zstack (if needed)
+            - Compress the zstack into a single image using 'maximum intensity projection'
+        :param zstack: (list of DataArray) the images acquired at each zlevel
+        :param zlevels: (list of float) the focus position of each image
+        :return DataArray: da for the current tile stream
+        """
         logging.debug(
             f"Zstack acquisition for tile {ix}x{iy}, stream {stream.name} finished, compressing data into a single image.")
-        # Convert zstack into a cube
-        fm_cube = assembleZCube(zstack, self._zlevels)
+        use_mip = self._focusing_method == FocusingMethod.MAX_INTENSITY_PROJECTION
+        # The cube is only needed if it's saved, or returned as-is
+        assembler = ZCubeAssembler(zlevels, nb_images=len(zstack),
+                                   cube=bool(self._log_path) or not use_mip, mip=use_mip)
+        for da in zstack:
+            assembler.append(da)
+
         # Save the cube on disk if a log path exists
         if self._log_path:
-            self._save_tiles(ix, iy, fm_cube, stream_cube_id=self._streams.index(stream))
+            self._save_tiles(ix, iy, assembler.get_cube(), stream_cube_id=self._streams.index(stream))
 
-        if self._focusing_method == FocusingMethod.MAX_INTENSITY_PROJECTION:
+        if use_mip:
             # Compress the cube into a single image along z-axis (using maximum intensity projection)
-            mip_image = img.max_intensity_projection(fm_cube, axis=0)
+            mip_image = assembler.get_mip()
             if self._future._task_state == CANCELLED:
                 raise CancelledError()
             logging.debug(f"Zstack compression for tile {ix}x{iy}, stream {stream.name} finished.")
-            return DataArray(mip_image, copy.copy(zstack[0].metadata))
+            return mip_image
         else:
             # TODO: support stitched Z-stacks
             # For now, the init will raise NotImplementedError in such case
             logging.warning("Zstack returned as-is, while it is not supported")
-            return fm_cube
+            return assembler.get_cube()
 
     def _acquireStreamTile(self, i, ix, iy, stream):
         """
@@ -719,13 +765,15 @@ class TiledAcquisitionTask(object):
     def _getTileDAs(self, i, ix, iy):
         """
         Iterate over each tile stream and construct their data arrays list
-        :return: list(DataArray) list of each stream DataArray
+        :return: list(DataArray or list(DataArray)) list of each stream DataArray.
+          For the streams acquired as a zstack, it's the list of DataArray of each zlevel.
         """
         das = []
         for stream in self._streams:
             if stream.focuser is not None and len(self._zlevels) > 1:
-                # Acquire zstack images based on the given zlevels, and compress them into a single da
-                da = self._acquireStreamCompressedZStack(i, ix, iy, stream)
+                # Acquire zstack images based on the given zlevels. They are
+                # compressed into a single da by _processTile().
+                da = self._acquireStreamZStack(i, ix, iy, stream)
             elif stream.focuser and len(self._zlevels) == 1:
                 z = self._zlevels[0]
                 logging.debug(f"Moving focus for tile {ix}x{iy} to {z}.")
@@ -741,13 +789,15 @@ class TiledAcquisitionTask(object):
     def _acquireTiles(self):
         """
          Acquire needed tiles by moving the stage to the tile position then calling acqmng.acquire
+         The acquired tiles are post-processed (zstack compression, saving, sorting)
+         in separate threads, so that the stage can move to the next tile immediately.
         :return: (list of list of DataArrays): list of acquired data for each stream on each tile
         """
-        da_list = []  # for each position, a list of DataArrays
+        tile_futures = []  # for each position, a future returning a list of DataArrays
         prev_idx = START_INDEX
         i = 0
 
-        self._save_time = {"acq": [], "stitch": [], "move": [], "save": []}
+        self._save_time = {"acq": [], "stitch": [], "move": [], "save": [], "wait": []}
         # The increase in the number of scanning indices increase with overlap between tiles. The time take
         # by stage to move to different indices also includes the time taken to move when scanning indices increase due
         # to increase in overlap. This means stitching time is included when move time between tiles is observed.
@@ -759,45 +809,96 @@ class TiledAcquisitionTask(object):
         # Sort the tile_indices in zigzag order to optimize the stage movement
         zigzag_indices = self._sort_tile_indices_zigzag(self._tile_indices)
 
-        for ix, iy in zigzag_indices:
-            if i > 0:
-                self.average_acquisition_time = (time.time() - start_time) / i
-
-            self._moveToTile((ix, iy), prev_idx, self._sfov)
-            if move_to_tile_start:
-                self._save_time["move"].append(time.time() - move_to_tile_start)
-            prev_idx = ix, iy
-
-            acquisition_start = time.time()
-            if self._focus_points is not None:
-                self._refocus()
-
-            logging.debug("Acquiring tile %dx%d", ix, iy)
-            das = self._getTileDAs(i, ix, iy)
-
-            if i == 0:
-                # Check the FoV is correct using the data, and if not update
-                self._sfov = self._updateFov(das, self._sfov)
+        executor = ThreadPoolExecutor(max_workers=TILE_PROCESSING_WORKERS,
+                                      thread_name_prefix="Tile processing")
+        try:
+            for ix, iy in zigzag_indices:
+                if i > 0:
+                    self.average_acquisition_time = (time.time() - start_time) / i
+
+                self._moveToTile((ix, iy), prev_idx, self._sfov)
+                if move_to_tile_start:
+                    self._save_time["move"].append(time.time() - move_to_tile_start)
+                prev_idx = ix, iy
+
+                acquisition_start = time.time()
+                if self._focus_points is not None:
+                    self._refocus()
+
+                logging.debug("Acquiring tile %dx%d", ix, iy)
+                das = self._getTileDAs(i, ix, iy)
+                zlevels = self._zlevels  # As used for this tile, before the next refocus
+
+                if i == 0:
+                    # Check the FoV is correct using the data, and if not update
+                    # (for zstacks, all the images have the same FoV)
+                    self._sfov = self._updateFov([d[0] if isinstance(d, list) else d for d in das],
+                                                 self._sfov)
+
+                if self._focus_stream:
+                    # Check if the acquisition was not good enough, then adjusts focus of current tile and reacquires image
+                    # Note: it has to be done before moving, as the tile might have to be reacquired.
+                    das = self._adjustFocus(das, i, ix, iy)
+
+                self._save_time["acq"].append(time.time() - acquisition_start)
+
+                # The stream .raw will change with the next acquisition, so
+                # the stream of each DA has to be found now.
+                self._addAcqTypeMetadata([da for d in das for da in (d if isinstance(d, list) else [d])],
+                                         self._streams)
+
+                # Limit the number of tiles waiting for processing (to limit the memory usage)
+                wait_start = time.time()
+                while sum(not f.done() for f in tile_futures) >= MAX_PENDING_TILES:
+                    next(f for f in tile_futures if not f.done()).result()
+                self._save_time["wait"].append(time.time() - wait_start)
+
+                tile_futures.append(executor.submit(self._processTile, ix, iy, das, zlevels))
+
+                i += 1
+                move_to_tile_start = time.time()
+
+            # Wait for all the tiles to be processed
+            da_list = [f.result() for f in tile_futures]
+        except Exception:
+            for f in tile_futures:
+                f.cancel()
+            raise
+        finally:
+            executor.shutdown(wait=True)
+            self._waitSaveTiles()
 
-            if self._focus_stream:
-                # Check if the acquisition was not good enough, then adjusts focus of current tile and reacquires image
-                das = self._adjustFocus(das, i, ix, iy)
+        dur = time.time() - start_time
+        if i > 0 and dur > 0:
+            logging.info("Acquired %d tiles in %g s (%.3g tiles/s), waited %g s for tile processing",
+                         i, dur, i / dur, sum(self._save_time["wait"]))
 
-            self._save_time["acq"].append(time.time() - acquisition_start)
+        return da_list
 
-            # Save the das on disk if a log path exists
-            save_tile_start = time.time()
-            if self._log_path:
-                self._save_tiles(ix, iy, das)
+    def _processTile(self, ix, iy, das, zlevels):
+        """
+        Post-process the data acquired for one tile: compress the zstacks,
+        save the data on disk if requested, and sort the data for stitching.
+        Run in a separate thread, while the next tiles are acquired.
+        :param das: (list of DataArray or list of DataArray) as returned by _getTileDAs()
+        :param zlevels: (list of float) focus positions at which the zstacks were acquired
+        :return: (tuple of DataArray) the data of the tile, sorted for stitching
+        """
+        if self._future._task_state == CANCELLED:
+            raise CancelledError()
 
-            # Sort tiles (largest sem on first position)
-            da_list.append(self._sortDAs(das, self._streams))
-            self._save_time["save"].append(time.time() - save_tile_start)
+        process_start = time.time()
+        das = [self._compressZStack(ix, iy, stream, d, zlevels) if isinstance(d, list) else d
+               for stream, d in zip(self._streams, das)]
 
-            i += 1
-            move_to_tile_start = time.time()
+        # Save the das on disk if a log path exists
+        if self._log_path:
+            self._save_tiles(ix, iy, das)
 
-        return da_list
+        # Sort tiles (largest sem on first position)
+        das = self._sortDAs(das, self._streams)
+        self._save_time["save"].append(time.time() - process_start)
+        return das
 
     def _get_z_on_focus_plane(self, x, y):
         if not self._focus_plane:
@@ -937,7 +1038,7 @@ class TiledAcquisitionTask(object):
                                                   self._focus_stream.focuser,
                                                   good_focus=self._good_focus,
                                                   rng_focus=self._focus_rng,
-                                                  method=MTD_EXHAUSTIVE)
+                                                  method=MTD_EXHAUSTIVE_FIT)
             _, focus_pos, _ = self._future.running_subf.result()  # blocks until autofocus is finished
 
             # Corner case where it started very badly: update the "good focus"
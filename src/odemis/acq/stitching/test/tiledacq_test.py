@@ -22,7 +22,7 @@ import math
 import os
 import time
 import unittest
-from concurrent.futures._base import FINISHED, CancelledError
+from concurrent.futures._base import FINISHED, RUNNING, CancelledError
 from typing import List, Tuple
 from unittest import mock
 
@@ -918,6 +918,39 @@ class TiledAcquisitionTaskTestCase(unittest.TestCase):
         sorted_indices = tiled_acq_task._sort_tile_indices_zigzag([])
         self.assertListEqual(sorted_indices, [])
 
+    def test_acquire_tiles_processing(self):
+        """
+        The tiles are post-processed in parallel to the acquisition, while keeping their order
+        """
+        future = model.ProgressiveFuture()
+        tiled_acq_task = TiledAcquisitionTask(streams=self.streams, stage=mock.Mock(spec=model.Actuator),
+                                              region=(0.0, 0.0, 14.0e-3, 13.0e-3), overlap=0.0145, future=future)
+        future._task_state = RUNNING
+        nb_tiles = tiled_acq_task._number_of_tiles
+
+        def get_tile_das(i, ix, iy):
+            md = {model.MD_ACQ_TYPE: model.MD_AT_EM,
+                  model.MD_PIXEL_SIZE: (0.0021 / 4, 0.0018 / 4),
+                  model.MD_POS: (ix * 0.0021, -iy * 0.0018)}
+            return [model.DataArray(numpy.full((4, 4), i), md)]
+
+        # Slow processing, to check the acquisition doesn't wait for every tile
+        orig_sort_das = tiled_acq_task._sortDAs
+        def slow_sort_das(das, ss):
+            time.sleep(0.01)
+            return orig_sort_das(das, ss)
+
+        tiled_acq_task._moveToTile = mock.Mock()
+        tiled_acq_task._getTileDAs = get_tile_das
+        tiled_acq_task._sortDAs = slow_sort_das
+        da_list = tiled_acq_task._acquireTiles()
+
+        self.assertEqual(len(da_list), nb_tiles)
+        for i, das in enumerate(da_list):
+            self.assertIsInstance(das, tuple)
+            self.assertEqual(das[0][0, 0], i)
+        self.assertEqual(len(tiled_acq_task._save_time["save"]), nb_tiles)
+
 
 if __name__ == '__main__':
     unittest.main()
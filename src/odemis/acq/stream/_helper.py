@@ -19,7 +19,6 @@ You should have received a copy of the GNU General Public License along with Ode
 
 import logging
 import math
-import numbers
 import threading
 import time
 from abc import abstractmethod
@@ -31,10 +30,14 @@ import numpy
 from odemis import model
 from odemis.acq import align
 from odemis.model import VigilantAttributeBase, MD_POL_NONE
-from odemis.util import img, almost_equal, angleres
+from odemis.util import img, almost_equal, angleres, spectrum
 from ._base import Stream, UNDEFINED_ROI, POL_POSITIONS
 from ._live import LiveStream
 
+# Approximate duration (in s) of the acquisition of a block of points at the
+# same spot, for the scanners which support it (.spotBlockSize)
+SPOT_BLOCK_PERIOD = 0.1  # s
+
 
 class RepetitionStream(LiveStream):
     """
@@ -61,6 +64,7 @@ class RepetitionStream(LiveStream):
         super(RepetitionStream, self).__init__(name, detector, dataflow, emitter,
                                                **kwargs)
         self._scanner = scanner or emitter  # fallback to emitter if no scanner
+        self._orig_spot_block_size = None  # value of .spotBlockSize before the stream was active
 
         # all the information needed to acquire an image (in addition to the
         # hardware component settings which can be directly set).
@@ -341,6 +345,55 @@ class RepetitionStream(LiveStream):
             raise AttributeError("Scanner has not VA %s" % (vaname,))
         return hwva
 
+    def _setSpotBlockSize(self):
+        """
+        If the scanner supports it, acquire the points by blocks of ~SPOT_BLOCK_PERIOD,
+        instead of one at a time, which is more efficient for short dwell times.
+        Only for the streams acquiring a single spot. Call _restoreSpotBlockSize()
+        when the acquisition is over.
+        """
+        if not model.hasVA(self._scanner, "spotBlockSize"):
+            return
+
+        dt_va = self._getScannerVA("dwellTime")
+        if self._orig_spot_block_size is None:
+            self._orig_spot_block_size = self._scanner.spotBlockSize.value
+            # The dwell time can change during the acquisition (eg, via the linked
+            # VAs), so the block size has to follow.
+            dt_va.subscribe(self._onSpotBlockDwellTime)
+        self._updateSpotBlockSize(dt_va.value)
+
+    def _updateSpotBlockSize(self, dt):
+        """
+        Set the .spotBlockSize of the scanner to match SPOT_BLOCK_PERIOD
+        dt (float): the dwell time
+        """
+        sbs_va = self._scanner.spotBlockSize
+        mn, mx = sbs_va.range
+        block_size = min(max(mn, int(SPOT_BLOCK_PERIOD / dt)), mx)
+        logging.debug("Acquiring blocks of %d points at dwell time %g s", block_size, dt)
+        sbs_va.value = block_size
+
+    def _onSpotBlockDwellTime(self, dt):
+        try:
+            self._updateSpotBlockSize(dt)
+        except Exception:
+            logging.exception("Failed to update the spot block size")
+
+    def _restoreSpotBlockSize(self):
+        """
+        Restore the .spotBlockSize of the scanner to its value before
+        _setSpotBlockSize() was called.
+        """
+        if self._orig_spot_block_size is None:
+            return
+        self._getScannerVA("dwellTime").unsubscribe(self._onSpotBlockDwellTime)
+        try:
+            self._scanner.spotBlockSize.value = self._orig_spot_block_size
+        except Exception:
+            logging.exception("Failed to restore the spot block size")
+        self._orig_spot_block_size = None
+
     def _onMagnification(self, mag):
         """
         Called when the SEM magnification is updated
@@ -1001,20 +1054,33 @@ class MonochromatorSettingsStream(RepetitionStream):
 
     # onActive: same as the standard LiveStream (ie, acquire from the dataflow)
     # Note: we assume we are in spot mode, if not the dwell time will be messed up!
-    # TODO: if the dwell time is small (eg, < 0.1s), do multiple acquisitions
-    # at the same spot (how?)
+    # If the scanner supports it (.spotBlockSize), multiple points are acquired
+    # at the same spot, and received as one block of points.
+
+    def _startAcquisition(self, future=None):
+        if self.is_active.value:  # Otherwise, the acquisition will not start
+            self._setSpotBlockSize()
+        super()._startAcquisition(future)
+
+    def _onActive(self, active):
+        super()._onActive(active)
+        if not active:
+            self._restoreSpotBlockSize()
 
-    def _append(self, count, date):
+    def _append(self, counts, dates):
         """
-        Adds a new count and updates the window
+        Adds new counts and updates the window
+        counts (ndarray of N floats): the new counts
+        dates (ndarray of N floats): the acquisition date of each count
         """
         # find first element still part of the window
-        oldest = date - self.windowPeriod.value
-        first = numpy.searchsorted(self.raw[:, 1], oldest)
+        oldest = dates[-1] - self.windowPeriod.value
+        new = numpy.column_stack((counts, dates))
+        raw = numpy.append(self.raw, new, axis=0)
+        first = numpy.searchsorted(raw[:, 1], oldest)
 
         # We must update .raw atomically as _updateImage() can run simultaneously
-        new = numpy.array([[count, date]], dtype=numpy.float64)
-        self.raw = model.DataArray(numpy.append(self.raw[first:], new, axis=0))
+        self.raw = model.DataArray(raw[first:])
 
     def _updateImage(self):
         try:
@@ -1039,19 +1105,13 @@ class MonochromatorSettingsStream(RepetitionStream):
             logging.exception("Failed to generate chronogram")
 
     def _onNewData(self, dataflow, data):
-        # we absolutely need the acquisition time
+        # Get the data values, and their acquisition time (which we absolutely need)
+        # Typically, in spot mode, it's either a single point, or a block of points.
         try:
-            date = data.metadata[model.MD_ACQ_DATE]
-        except KeyError:
-            date = time.time()
-
-        # Get one data value
-        if data.shape == (1, 1):  # obtained during spot mode?
-            d = data[0, 0]
-        else:  # obtained during a scan
-            logging.debug("Monochromator got %s points instead of 1", data.shape)
-            # TODO: cut the data into subparts based on the dwell time
-            d = data.view(numpy.ndarray).mean()
+            counts, dates = spectrum.get_point_series(data)
+        except ValueError as ex:
+            logging.warning("Discarding monochromator data: %s", ex)
+            return
 
         dtyp = data.metadata.get(model.MD_DET_TYPE, model.MD_DT_INTEGRATING)
         if dtyp == model.MD_DT_INTEGRATING:
@@ -1063,13 +1123,12 @@ class MonochromatorSettingsStream(RepetitionStream):
                 logging.warning("No dwell time metadata found in the monochromator data, "
                                 "will use %f s", dt)
 
-            d /= dt
-            assert isinstance(d, numbers.Real), "%s is not a number" % d
+            counts /= dt
 
         elif dtyp != model.MD_DT_NORMAL:
             logging.warning("Unknown detector type %s", dtyp)
 
-        self._append(d, date)
+        self._append(counts, dates)
         self._shouldUpdateImage()
 
 
@@ -1957,20 +2016,28 @@ class ScannedTCSettingsStream(RepetitionStream):
     # Taken from MonochromatorSettingsStream
     # onActive: same as the standard LiveStream (ie, acquire from the dataflow)
     # Note: we assume we are in spot mode, if not the dwell time will be messed up!
-    # TODO: if the dwell time is small (eg, < 0.1s), do multiple acquisitions
-    # at the same spot (how?)
+    # If the scanner supports it (.spotBlockSize), multiple points are acquired
+    # at the same spot, and received as one block of points.
+
+    def _startAcquisition(self, future=None):
+        if self.is_active.value:  # Otherwise, the acquisition will not start
+            self._setSpotBlockSize()
+        super()._startAcquisition(future)
 
-    def _append(self, count, date):
+    def _append(self, counts, dates):
         """
-        Adds a new count and updates the window
+        Adds new counts and updates the window
+        counts (ndarray of N floats): the new counts
+        dates (ndarray of N floats): the acquisition date of each count
         """
         # find first element still part of the window
-        oldest = date - self.windowPeriod.value
-        first = numpy.searchsorted(self.raw[:, 1], oldest)
+        oldest = dates[-1] - self.windowPeriod.value
+        new = numpy.column_stack((counts, dates))
+        raw = numpy.append(self.raw, new, axis=0)
+        first = numpy.searchsorted(raw[:, 1], oldest)
 
         # We must update .raw atomically as _updateImage() can run simultaneously
-        new = numpy.array([[count, date]], dtype=numpy.float64)
-        self.raw = model.DataArray(numpy.append(self.raw[first:], new, axis=0))
+        self.raw = model.DataArray(raw[first:])
 
     def _updateImage(self):
         try:
@@ -1995,18 +2062,13 @@ class ScannedTCSettingsStream(RepetitionStream):
             logging.exception("Failed to generate chronogram")
 
     def _onNewData(self, dataflow, data):
-        # we absolutely need the acquisition time
+        # Get the data values, and their acquisition time (which we absolutely need)
+        # Typically, in spot mode, it's either a single point, or a block of points.
         try:
-            date = data.metadata[model.MD_ACQ_DATE]
-        except KeyError:
-            date = time.time()
-
-        # Get one data value
-        if data.shape == (1, 1):  # obtained during spot mode?
-            d = data[0, 0]
-        else:  # obtained during a scan
-            logging.debug("ScannedTCSettingsStream got %s points instead of 1", data.shape)
-            d = data.view(numpy.ndarray).mean()
+            counts, dates = spectrum.get_point_series(data)
+        except ValueError as ex:
+            logging.warning("Discarding ScannedTCSettings data: %s", ex)
+            return
 
         dtyp = data.metadata.get(model.MD_DET_TYPE, model.MD_DT_INTEGRATING)
         if dtyp == model.MD_DT_INTEGRATING:
@@ -2018,13 +2080,12 @@ class ScannedTCSettingsStream(RepetitionStream):
                 logging.warning("No dwell time metadata found in the ScannedTCSettings data, "
                                 "will use %f s", dt)
 
-            d /= dt
-            assert isinstance(d, numbers.Real), "%s is not a number" % d
+            counts /= dt
 
         elif dtyp != model.MD_DT_NORMAL:
             logging.warning("Unknown detector type %s", dtyp)
 
-        self._append(d, date)
+        self._append(counts, dates)
         self._shouldUpdateImage()
 
     def _setPower(self, value):
@@ -2042,6 +2103,8 @@ class ScannedTCSettingsStream(RepetitionStream):
             self._setPower(0)
 
         RepetitionStream._onActive(self, active)
+        if not active:
+            self._restoreSpotBlockSize()
 
 
 class ScannedTemporalSettingsStream(CCDSettingsStream):
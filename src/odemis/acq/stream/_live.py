@@ -28,7 +28,7 @@ from odemis.acq.align import FindEbeamCenter
 
 from odemis.acq import fastem_conf
 from odemis.model import MD_POS_COR, VigilantAttributeBase, hasVA
-from odemis.util import img, conversion, fluo, executeAsyncTask
+from odemis.util import img, conversion, fluo, executeAsyncTask, spectrum
 import threading
 import time
 import weakref
@@ -986,18 +986,20 @@ class CameraCountStream(CameraStream):
         # useful info if the CCD is saturated
         return data.mean()
 
-    def _append(self, count, date):
+    def _append(self, counts, dates):
         """
-        Adds a new count and updates the window
+        Adds new counts and updates the window
+        counts (ndarray of N floats): the new counts
+        dates (ndarray of N floats): the acquisition date of each count
         """
-        raw = self.raw[0]
         # delete all old data
-        oldest = date - self.windowPeriod.value
+        oldest = dates[-1] - self.windowPeriod.value
+        new = numpy.column_stack((counts, dates))
+        raw = numpy.append(self.raw[0], new, axis=0)
         first = numpy.searchsorted(raw[:, 1], oldest)
 
         # We must update .raw atomically as _updateImage() can run simultaneously
-        new = numpy.array([[count, date]], dtype=numpy.float64)
-        self.raw = [model.DataArray(numpy.append(raw[first:], new, axis=0))]
+        self.raw = [model.DataArray(raw[first:])]
 
     def _updateImage(self):
         try:
@@ -1025,12 +1027,22 @@ class CameraCountStream(CameraStream):
             logging.exception("Failed to generate chronogram")
 
     def _onNewData(self, dataflow, data):
-        # we absolutely need the acquisition time
-        try:
-            date = data.metadata[model.MD_ACQ_DATE]
-        except KeyError:
-            date = time.time()
-        self._append(self._getCount(data), date)
+        if spectrum.is_point_block(data):
+            # Block of points (from a 0D detector): each point is a count
+            try:
+                counts, dates = spectrum.get_point_series(data)
+            except ValueError as ex:
+                logging.warning("Discarding block of points: %s", ex)
+                return
+        else:
+            # we absolutely need the acquisition time
+            try:
+                date = data.metadata[model.MD_ACQ_DATE]
+            except KeyError:
+                date = time.time()
+            counts = numpy.array([self._getCount(data)], dtype=numpy.float64)
+            dates = numpy.array([date], dtype=numpy.float64)
+        self._append(counts, dates)
 
         self._shouldUpdateImage()
 
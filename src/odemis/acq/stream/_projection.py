@@ -46,6 +46,28 @@ from odemis.acq.stream._static import StaticSpectrumStream
 from abc import abstractmethod
 
 
+def _get_selection_area(pos, width, shape):
+    """
+    Compute the part of the data containing all the pixels selected around a
+    position, as used by img.mean_within_circle(). This allows to only access
+    the needed part of the data (which may be computed on the fly).
+    pos (int, int): x, y position of the selected pixel
+    width (int): diameter of the circle which contains the center of the pixels
+      selected
+    shape (tuple of int): shape of the data, with Y and X as last dimensions
+    returns:
+      area (slice, slice): Y and X slices of the data containing the pixels selected
+      center (int, int): x, y position of the selected pixel in the area
+    """
+    x, y = pos
+    radius = width / 2
+    x0 = max(0, int(x - radius))
+    x1 = min(int(x + radius) + 1, shape[-1])
+    y0 = max(0, int(y - radius))
+    y1 = min(int(y + radius) + 1, shape[-2])
+    return (slice(y0, y1), slice(x0, x1)), (x - x0, y - y0)
+
+
 class DataProjection(object):
 
     def __init__(self, stream):
@@ -1261,22 +1283,17 @@ class RGBSpatialSpectrumProjection(RGBSpatialProjection):
     def projectAsRaw(self):
         try:
             data = self.stream.calibrated.value
-            raw_md = self.stream.calibrated.value.metadata
+            raw_md = data.metadata
             md = {k: raw_md[k] for k in (model.MD_PIXEL_SIZE, model.MD_POS, model.MD_THETA_LIST) if k in raw_md}
-
-            # Average time or theta values if they exist (iow, flatten axis 1).
-            if data.shape[1] > 1:
-                data = numpy.mean(data, axis=1)
-                data = data[:, 0, :, :]
-            else:
-                data = data[:, 0, 0, :, :]
+            # Average over the time or theta values (if they exist) is already in the index
+            spec_index = self.stream._getSpectrumIndex()
 
             # pick only the data inside the bandwidth
             spec_range = self.stream._get_bandwidth_in_pixel()
 
             logging.debug("Spectrum range picked: %s px", spec_range)
 
-            av_data = numpy.mean(data[spec_range[0]:spec_range[1] + 1], axis=0)
+            av_data = spec_index.mean(spec_range)
             av_data = img.ensure2DImage(av_data).astype(data.dtype)
             return model.DataArray(av_data, md)
 
@@ -1337,15 +1354,11 @@ class RGBSpatialSpectrumProjection(RGBSpatialProjection):
         """
 
         try:
-            data = self.stream.calibrated.value
             raw_md = self.stream.calibrated.value.metadata
-
-            # Average time or theta values if they exist (iow, flatten axis 1).
-            if data.shape[1] > 1:
-                data = numpy.mean(data, axis=1)
-                data = data[:, 0, :, :]
-            else:
-                data = data[:, 0, 0, :, :]
+            # Cumulative sum over the wavelengths, so that the average of any
+            # bandwidth is just a subtraction. The time or theta values (if they
+            # exist) are already averaged in it.
+            spec_index = self.stream._getSpectrumIndex()
 
             # pick only the data inside the bandwidth
             spec_range = self.stream._get_bandwidth_in_pixel()
@@ -1356,8 +1369,7 @@ class RGBSpatialSpectrumProjection(RGBSpatialProjection):
 
             if self.stream.tint.value != TINT_FIT_TO_RGB:
                 # TODO: use better intermediary type if possible?, cf semcomedi
-                av_data = numpy.mean(data[spec_range[0]:spec_range[1] + 1], axis=0)
-                av_data = img.ensure2DImage(av_data)
+                av_data = spec_index.mean(spec_range)
                 rgbim = img.DataArray2RGB(av_data, irange, self.stream.tint.value)
 
             else:
@@ -1377,16 +1389,13 @@ class RGBSpatialSpectrumProjection(RGBSpatialProjection):
                 grange[1] = max(grange)
                 rrange[1] = max(rrange)
 
-                # FIXME: unoptimized, as each channel is duplicated 3 times, and discarded
-                av_data = numpy.mean(data[rrange[0]:rrange[1] + 1], axis=0)
-                av_data = img.ensure2DImage(av_data)
+                # Each band is converted to greyscale RGB, and just one channel is kept
+                av_data = spec_index.mean(rrange)
                 rgbim = img.DataArray2RGB(av_data, irange)
-                av_data = numpy.mean(data[grange[0]:grange[1] + 1], axis=0)
-                av_data = img.ensure2DImage(av_data)
+                av_data = spec_index.mean(grange)
                 gim = img.DataArray2RGB(av_data, irange)
                 rgbim[:, :, 1] = gim[:, :, 0]
-                av_data = numpy.mean(data[brange[0]:brange[1] + 1], axis=0)
-                av_data = img.ensure2DImage(av_data)
+                av_data = spec_index.mean(brange)
                 bim = img.DataArray2RGB(av_data, irange)
                 rgbim[:, :, 2] = bim[:, :, 0]
 
@@ -1614,8 +1623,6 @@ class PixelTemporalSpectrumProjection(RGBProjection):
             return None
 
         x, y = self.stream.selected_pixel.value
-
-        spec2d = self.stream.calibrated.value[:, :, 0, :, :]  # same data but remove useless dims
         md = dict(data.metadata)
         md[model.MD_DIMS] = "TC"
 
@@ -1623,12 +1630,15 @@ class PixelTemporalSpectrumProjection(RGBProjection):
         # of the pixels to be taken into account
         width = self.stream.selectionWidth.value
         if width == 1:  # short-cut for simple case
-            data = spec2d[:, :, y, x]
+            data = data[:, :, 0, y, x]
             data = numpy.swapaxes(data, 0, 1)
             return model.DataArray(data, md)
 
+        # Only pick the pixels around the selected one, as the rest is not needed
+        (sy, sx), center = _get_selection_area((x, y), width, data.shape)
+        spec2d = data[:, :, 0, sy, sx]  # same data but remove useless dims
         radius = width / 2
-        mean = img.mean_within_circle(spec2d, (x, y), radius)
+        mean = img.mean_within_circle(spec2d, center, radius)
         mean = numpy.swapaxes(mean, 0, 1)
 
         return model.DataArray(mean.astype(spec2d.dtype), md)
@@ -1774,9 +1784,9 @@ class MeanSpectrumProjection(DataProjection):
         md = dict(data.metadata)
         md[model.MD_DIMS] = "C"
 
-        # flatten all but the C dimension, for the average
-        data = data.reshape((data.shape[0], numpy.prod(data.shape[1:])))
-        av_data = numpy.mean(data, axis=1)
+        # Average all but the C dimension, one C at a time, so that the data
+        # can also be computed on the fly (cf calibration.SpectrumCorrectedData)
+        av_data = numpy.array([numpy.mean(data[c]) for c in range(data.shape[0])])
 
         self.image.value = model.DataArray(av_data, md)
 
@@ -1833,7 +1843,6 @@ class SinglePointSpectrumProjection(DataProjection):
             t = numpy.searchsorted(self.stream._calibrated_theta_list, self.stream.selected_angle.value)
         else:
             t = 0
-        spec2d = self.stream.calibrated.value[:, t, 0, :, :]  # same data but remove useless dims
 
         md = dict(data.metadata)
         md[model.MD_DIMS] = "C"
@@ -1842,11 +1851,14 @@ class SinglePointSpectrumProjection(DataProjection):
         # of the pixels to be taken into account
         width = self.stream.selectionWidth.value
         if width == 1:  # short-cut for simple case
-            data = spec2d[:, y, x]
+            data = data[:, t, 0, y, x]
             return model.DataArray(data, md)
 
+        # Only pick the pixels around the selected one, as the rest is not needed
+        (sy, sx), center = _get_selection_area((x, y), width, data.shape)
+        spec2d = data[:, t, 0, sy, sx]  # same data but remove useless dims
         radius = width / 2
-        mean = img.mean_within_circle(spec2d, (x, y), radius)
+        mean = img.mean_within_circle(spec2d, center, radius)
 
         return model.DataArray(mean, md)
 
@@ -1895,7 +1907,8 @@ class SinglePointTemporalProjection(DataProjection):
 
     def _computeSpec(self):
 
-        if self.stream.selected_pixel.value == (None, None) or self.stream.calibrated.value.shape[1] == 1:
+        data = self.stream.calibrated.value
+        if self.stream.selected_pixel.value == (None, None) or data.shape[1] == 1:
             return None
 
         x, y = self.stream.selected_pixel.value
@@ -1903,21 +1916,23 @@ class SinglePointTemporalProjection(DataProjection):
             c = numpy.searchsorted(self.stream._wl_px_values, self.stream.selected_wavelength.value)
         else:
             c = 0
-        chrono2d = self.stream.calibrated.value[c, :, 0, :, :]  # same data but remove useless dims
 
         md = {model.MD_DIMS: "T"}
-        if model.MD_TIME_LIST in chrono2d.metadata:
-            md[model.MD_TIME_LIST] = chrono2d.metadata[model.MD_TIME_LIST]
+        if model.MD_TIME_LIST in data.metadata:
+            md[model.MD_TIME_LIST] = data.metadata[model.MD_TIME_LIST]
 
         # We treat width as the diameter of the circle which contains the center
         # of the pixels to be taken into account
         width = self.stream.selectionWidth.value
         if width == 1:  # short-cut for simple case
-            data = chrono2d[:, y, x]
-            return model.DataArray(data, md)
+            chrono = data[c, :, 0, y, x]
+            return model.DataArray(chrono, md)
 
+        # Only pick the pixels around the selected one, as the rest is not needed
+        (sy, sx), center = _get_selection_area((x, y), width, data.shape)
+        chrono2d = data[c, :, 0, sy, sx]  # same data but remove useless dims
         radius = width / 2
-        mean = img.mean_within_circle(chrono2d, (x, y), radius)
+        mean = img.mean_within_circle(chrono2d, center, radius)
 
         return model.DataArray(mean.astype(chrono2d.dtype), md)
 
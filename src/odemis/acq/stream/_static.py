@@ -780,6 +780,10 @@ class StaticSpectrumStream(StaticStream):
         self.calibrated = model.VigilantAttribute(None)
         # Store the previous parameters used to calibrate the data to skip unnecessary calls
         self._calib_parameters = (None, None)  # numpy arrays or None
+        # Cumulative sum of the calibrated data, to quickly average any bandwidth.
+        # Computed only when needed, and recomputed when .calibrated changes.
+        self._spec_index = None  # (calibrated DataArray, SpectrumCumulativeIndex) or None
+        self._spec_index_lock = threading.Lock()
         # Immediately compute it, without any correction, as it can still be
         # different from image if it's an angular spectrum dataset.
         self._updateCalibratedData(image, bckg=None, coef=self.efficiencyCompensation.value)
@@ -837,6 +841,11 @@ class StaticSpectrumStream(StaticStream):
     def _updateDRange(self, data=None):
         if data is None:
             data = self.calibrated.value
+            if isinstance(data, calibration.SpectrumCorrectedData):
+                # The drange only depends on the min/max (and dtype & metadata),
+                # so no need to compute the whole data
+                data = model.DataArray(numpy.array(data.minmax(), dtype=data.dtype),
+                                       data.metadata)
         super(StaticSpectrumStream, self)._updateDRange(data)
 
     def _updateHistogram(self, data=None):
@@ -912,13 +921,31 @@ class StaticSpectrumStream(StaticStream):
         assert low_px <= high_px
         return low_px, high_px
 
+    def _getSpectrumIndex(self):
+        """
+        Return the cumulative index of the current calibrated data, which allows
+        to compute quickly the average over any bandwidth. It's computed the
+        first time it's needed after the calibrated data changed.
+        returns (SpectrumCumulativeIndex): index of the calibrated data
+        """
+        with self._spec_index_lock:
+            calibrated = self.calibrated.value
+            if self._spec_index is None or self._spec_index[0] is not calibrated:
+                t_start = time.time()
+                self._spec_index = (calibrated, spectrum.SpectrumCumulativeIndex(calibrated))
+                logging.debug("Computed spectrum index of %s in %g s",
+                              calibrated.shape, time.time() - t_start)
+            return self._spec_index[1]
+
     # We don't have problems of rerunning this when the data is updated,
     # as the data is static.
     def _updateCalibratedData(self, data=None, bckg=None, coef=None):
         """
         Try to update the data with a new calibration. The two parameters are
         the same as apply_spectrum_corrections(). The input data comes from
-        .raw and the calibrated data is saved in .calibrated
+        .raw and the calibrated data is saved in .calibrated. If corrections
+        are needed, .calibrated is a calibration.SpectrumCorrectedData, which
+        only computes the part of the data accessed.
         :param data: (DataArray or None) The raw data. If None is given, .raw[0] is used.
         :param bckg: (DataArray or None) The background image.
         :param coef: (DataArray or None) The spectrum efficiency correction data.
@@ -940,7 +967,14 @@ class StaticSpectrumStream(StaticStream):
             self.calibrated.value = None
             return
 
-        calibrated = calibration.apply_spectrum_corrections(data, bckg, coef)
+        if (bckg is None and coef is None) or model.MD_THETA_LIST in data.metadata:
+            # Nothing to correct (so no copy), or angular spectrum (which needs
+            # to be fully recomputed anyway)
+            calibrated = calibration.apply_spectrum_corrections(data, bckg, coef)
+        else:
+            # Only compute the corrections on the parts of the data actually
+            # needed by the projections, to avoid a full copy of the data
+            calibrated = calibration.SpectrumCorrectedData(data, bckg, coef)
 
         # If angular spectrum, the length of the A dimension might have changed
         if hasattr(self, "selected_angle"):  # update the list of angles
@@ -47,7 +47,7 @@ from odemis.model import MD_POS, MD_DESCRIPTION, MD_PIXEL_SIZE, MD_ACQ_DATE, MD_
     MD_DWELL_TIME, MD_EXP_TIME, MD_DIMS, MD_THETA_LIST, MD_WL_LIST, MD_ROTATION, \
     MD_ROTATION_COR
 from odemis.model import hasVA
-from odemis.util import units, executeAsyncTask, almost_equal, img, angleres
+from odemis.util import units, executeAsyncTask, almost_equal, img, angleres, spectrum
 from odemis.util.driver import guessActuatorMoveDuration
 from . import MonochromatorSettingsStream
 from ._base import Stream, POL_POSITIONS, POL_MOVE_TIME
@@ -635,6 +635,39 @@ class MultipleDetectorStream(Stream, metaclass=ABCMeta):
         logging.debug("Stream %d data received", n)
         self._acq_data_queue[n].put(data)
 
+    def _getHwSyncData(self, n: int, timeout: float) -> model.DataArray:
+        """
+        Wait for the next data of a stream, as received by _onHwSyncData().
+        The acquisition state is regularly checked, so that a cancellation is
+        detected even if the data never arrives.
+        :param n: the detector/stream index
+        :param timeout: maximum time to wait (s)
+        :returns: the next data received
+        :raises:
+          CancelledError: if the acquisition is cancelled while waiting
+          TimeoutError: if no data is received within the timeout
+        """
+        q = self._acq_data_queue[n]
+        tend = time.time() + timeout
+        while True:
+            if self._acq_state == CANCELLED:
+                raise CancelledError()
+            tleft = tend - time.time()
+            if tleft <= 0:
+                raise TimeoutError(f"Timeout waiting for data of stream {n} after {timeout} s")
+            try:
+                return q.get(timeout=min(tleft, 0.1))
+            except queue.Empty:
+                pass
+
+    def _flushHwSyncData(self) -> None:
+        """
+        Discard all the data in the hardware synchronized acquisition queues.
+        """
+        for q in self._acq_data_queue:
+            while not q.empty():
+                q.get()
+
     def _preprocessData(self, n, data, i):
         """
         Preprocess the raw data, just after it was received from the detector.
@@ -644,7 +677,7 @@ class MultipleDetectorStream(Stream, metaclass=ABCMeta):
         data (DataArray): the data as received from the detector, from
           _onData(), and with MD_POS updated to the current position of the e-beam.
         i (int, int): pixel index of the first (top-left) pixel (Y, X)
-        return (value): value as needed by _onCompletedData/_assembleLiveData
+        return (value): value as needed by _assembleLiveData
         """
         # Update metadata based on user settings
         s = self._streams[n]
@@ -656,23 +689,6 @@ class MultipleDetectorStream(Stream, metaclass=ABCMeta):
 
         return data
 
-    def _onCompletedData(self, n, raw_das):
-        """
-        OLD-METHOD WHICH IS STILL USED FOR SEMTemporalMDStream, ScannedFluoMDStream
-        Called at the end of an entire acquisition. It should assemble the data
-        and append it to ._raw .
-        Override if you need to process the data in a different way.
-        n (0<=int): the detector/stream index
-        raw_das (list of DataArray): data as received from the detector.
-           The data is ordered, with X changing fast, then Y slow
-        """
-
-        # Default is to assume the data is 2D and assemble it.
-        da = self._assemble2DData(self.repetition.value, raw_das)
-        # explicitly add names to make sure they are different
-        da.metadata[MD_DESCRIPTION] = self._streams[n].name.value
-        self._raw.append(da)
-
     def _get_center_pxs(self, rep: Tuple[int, int],
                         tile_shape: Tuple[int, int],
                         tile_size: Tuple[float, float],
@@ -700,6 +716,16 @@ class MultipleDetectorStream(Stream, metaclass=ABCMeta):
 
         return center, pxs
 
+    def _disableSpotBlock(self) -> None:
+        """
+        Ensure the e-beam acquires a single point per pixel. A block of points at the
+        same spot (as used by the chronogram settings streams) would multiply the
+        dwell time of each pixel.
+        """
+        if model.hasVA(self._emitter, "spotBlockSize") and self._emitter.spotBlockSize.value != 1:
+            self._orig_hw_values[self._emitter.spotBlockSize] = self._emitter.spotBlockSize.value
+            self._emitter.spotBlockSize.value = 1
+
     def _assemble2DData(self, rep, data_list):
         """
         Take all the data received from a 0D DataFlow and assemble it in a
@@ -725,6 +751,10 @@ class MultipleDetectorStream(Stream, metaclass=ABCMeta):
                 logging.warning("Detector received mix of empty and non-empty data")
             return data_list[0]
 
+        # Each pixel should be a single point (see _disableSpotBlock())
+        if any(spectrum.is_point_block(d) for d in data_list):
+            raise ValueError("Detector sent blocks of points instead of single points")
+
         # start with the metadata from the first point
         md = data_list[0].metadata.copy()
         center_0 = md[MD_POS]
@@ -738,8 +768,8 @@ class MultipleDetectorStream(Stream, metaclass=ABCMeta):
                    MD_PIXEL_SIZE: pxs})
 
         # concatenate data into one big array of (number of pixels,1)
-        flat_list = [ar.flatten() for ar in data_list]
-        main_data = numpy.concatenate(flat_list)
+        # (reshape() avoids a copy, compared to flatten(), as concatenate() copies anyway)
+        main_data = numpy.concatenate([ar.reshape(-1) for ar in data_list])
         logging.debug("Assembling %s points into %s shape", main_data.shape, rep)
         # reshape to (Y, X)
         main_data.shape = rep[::-1]
@@ -1245,6 +1275,8 @@ class SEMCCDMDStream(MultipleDetectorStream):
             # CCD to be sure it is not slowing thing down.
             self._emitter.dwellTime.value = self._emitter.dwellTime.clip(exp + readout)
 
+        self._disableSpotBlock()
+
         # Order matters (a bit). At least, on the Tescan, only the "external" waits extra time to ensure
         # a stable e-beam condition, so it should be done last.
         if model.hasVA(self._emitter, "blanker") and self._emitter.blanker.value is None:
@@ -1263,24 +1295,6 @@ class SEMCCDMDStream(MultipleDetectorStream):
 
         return exp + readout, integration_count
 
-    def _onCompletedData(self, n, raw_das):
-        """
-        Called at the end of an entire acquisition. It should assemble the data
-        and append it to ._raw .
-        Override if you need to process the data in a different way.
-        :param n (0<=int): The detector/stream index.
-        :param raw_das (list of DataArray): Data as received from the detector.
-                        The data is ordered, with X changing fast, then Y slow
-        """
-
-        # Default is to assume the data is 2D and assemble it.
-        da = self._assembleTiles(self.repetition.value, raw_das)
-
-        # explicitly add names of acquisition to make sure they are different
-        da.metadata[MD_DESCRIPTION] = self._streams[n].name.value
-
-        self._raw.append(da)
-
     def _runAcquisition(self, future) -> Tuple[List[model.DataArray], Optional[Exception]]:
         """
         Acquires images from multiple detectors via software synchronisation.
@@ -2434,6 +2448,8 @@ class SEMMDStream(MultipleDetectorStream):
 
         dt = self._emitter.dwellTime.value
 
+        self._disableSpotBlock()
+
         # Order matters (a bit)
         if model.hasVA(self._emitter, "blanker") and self._emitter.blanker.value is None:
             # When the e-beam is set to automatic blanker mode, it would switch on/off for every
@@ -2843,7 +2859,10 @@ class SEMTemporalMDStream(MultipleDetectorStream):
 
         self._se_stream = streams[0]
         self._tc_stream = streams[1]
-        self._trigger = self._emitter.startScan  # to acquire a CCD image every time the SEM starts a new scan
+        # Both the SEM and the time-correlator acquire once every time this event is notified.
+        # So they stay subscribed during the whole acquisition, and only one notify() is
+        # needed per pixel.
+        self._trigger = self._det0.softwareTrigger
 
     def _estimateRawAcquisitionTime(self):
         res = numpy.prod(self._tc_stream.repetition.value)
@@ -2877,6 +2896,8 @@ class SEMTemporalMDStream(MultipleDetectorStream):
         self._tc_stream._detector.dwellTime.value = dwell_time
         self._emitter.dwellTime.value = dwell_time
 
+        self._disableSpotBlock()
+
         # Order matters (a bit). At least, on the Tescan, only the "external" waits extra time to ensure
         # a stable e-beam condition, so it should be done last.
         if model.hasVA(self._emitter, "blanker") and self._emitter.blanker.value is None:
@@ -2898,6 +2919,10 @@ class SEMTemporalMDStream(MultipleDetectorStream):
     def _runAcquisition(self, future) -> Tuple[List[model.DataArray], Optional[Exception]]:
         """
         Overrides MultipleDetectorStream._runAcquisition. See that function for doc.
+        The SEM and the time-correlator dataflows are synchronized on the same
+        trigger, and stay subscribed during the whole acquisition. For each pixel,
+        the e-beam is moved, the trigger is notified, and the data of both detectors
+        is received via the queues.
         """
         self._raw = []
         self._anchor_raw = []
@@ -2915,19 +2940,22 @@ class SEMTemporalMDStream(MultipleDetectorStream):
         tc_data = []
         spot_pos = self._getSpotPositions()
         tcdf = self._tc_stream._dataflow
+        rep = self.repetition.value
+        tot_num = int(numpy.prod(rep))
 
         try:
+            self._acq_done.clear()
             img_time, ninteg = self._adjustHardwareSettings()
+            self._flushHwSyncData()
 
-            # Prepare the time-correlator: acquire one frame every time the SEM starts scanning.
-            # The SEM may scan multiple times for each CCD frame.
+            # Get the detectors ready to acquire, once per trigger
+            self._df0.synchronizedOn(self._trigger)
             tcdf.synchronizedOn(self._trigger)
-            # Get the time-correlator ready to acquire
-            tcdf.subscribe(self._subscribers[-1])
+            self._subscribeHwSync()
 
             start_t = time.time()
-
-            for px_idx in numpy.ndindex(*self.repetition.value[::-1]):
+            prev_px_t = start_t
+            for px_idx in numpy.ndindex(*rep[::-1]):
                 x, y = tuple(spot_pos[px_idx])
                 se_px_data = []
                 tc_px_data = []
@@ -2947,66 +2975,49 @@ class SEMTemporalMDStream(MultipleDetectorStream):
                     tc_i, se_i = self._acquireImage(xclip, yclip, img_time)
                     tc_px_data.append(tc_i)
                     se_px_data.append(se_i)
-                    logging.debug("Memory used = %d bytes", udriver.readMemoryUsage())
                     # Perform drift correction
                     if self._dc_estimator:
+                        # The drift estimator uses the SEM detector without synchronization
+                        self._unsubscribeHwSync(tc=False)
+                        self._df0.synchronizedOn(None)
                         try:
-                            # Temporarily switch the detector to a different event trigger, so that it
-                            # doesn't get triggered while the drift estimator is running (because it uses the
-                            # e-beam, which sends a startScan event)
-                            tcdf.synchronizedOn(self._tc_stream._detector.softwareTrigger)
                             drift_est.acquire()
                             dc_vect = drift_est.estimate()
                             tot_dc_vect[0] += dc_vect[0]
                             tot_dc_vect[1] += dc_vect[1]
                         except Exception:
                             logging.exception("Drift correction failed, will retry next pixel")
-                        tcdf.synchronizedOn(self._trigger)
+                        self._df0.synchronizedOn(self._trigger)
+                        self._subscribeHwSync(tc=False)
 
                 n += 1
-                logging.info("Acquired %d out of %d pixels", n, numpy.prod(self.repetition.value))
-
-                # TODO: use ImageIntegrator for the image integration
-                # Sum up the partial data to get the full output for the pixel
-                dtype = tc_px_data[0].dtype
-                idt = numpy.iinfo(dtype)
-                pxsum = numpy.sum(tc_px_data, 0)
-                pxsum = numpy.minimum(pxsum, idt.max * numpy.ones(pxsum.shape))
-                tc_md = tc_px_data[0].metadata.copy()
-                try:
-                    tc_md[model.MD_DWELL_TIME] *= ninteg
-                except KeyError:
-                    logging.warning("No dwell time metadata in time-correlator data")
-                pxsum = model.DataArray(pxsum.astype(dtype), tc_md)
-                tc_data.append(pxsum)
-
-                # TODO: this is actually not really correct as the SEM data is "normalized", so the
-                # final data should be divided by ninteg. This is done correctly in ImageIntegrator.
-                pxsum = numpy.sum(se_px_data, 0)
-                pxsum = numpy.minimum(pxsum, idt.max * numpy.ones(pxsum.shape))
-                se_md = se_px_data[0].metadata.copy()
-                try:
-                    se_md[model.MD_DWELL_TIME] *= ninteg
-                except KeyError:
-                    logging.warning("No dwell time metadata in SEM data")
-                s = model.DataArray(pxsum, se_md)
-                se_data.append(s)
+                now = time.time()
+                logging.debug("Acquired %d out of %d pixels (%g s since last pixel)",
+                              n, tot_num, now - prev_px_t)
+                self._updateProgress(future, now - prev_px_t, n, tot_num)
+                prev_px_t = now
+
+                tc_data.append(self._integrateTemporalData(tc_px_data, ninteg))
+                se_data.append(self._integrateTemporalData(se_px_data, ninteg))
 
                 # Live update the setting stream with the new data
                 self._tc_stream._onNewData(self._tc_stream._dataflow, tc_data[-1])
 
             dur = time.time() - start_t
             logging.info("Acquisition completed in %g s -> %g s/frame", dur, dur / n)
-            tcdf.unsubscribe(self._subscribers[-1])
+            self._unsubscribeHwSync()
             tcdf.synchronizedOn(None)
+            self._df0.synchronizedOn(None)
 
-            self._onCompletedData(0, se_data)
-            self._onCompletedData(1, tc_data)
+            self._assembleTemporalData(se_data, tc_data)
 
             if self._dc_estimator:
                 self._anchor_raw.append(self._assembleAnchorData(drift_est.raw))
-            if self._acq_state == CANCELLED:
-                raise CancelledError()
+
+            with self._acq_lock:
+                if self._acq_state == CANCELLED:
+                    raise CancelledError()
+                self._acq_state = FINISHED
         except CancelledError:
             logging.info("Time correlator stream cancelled")
             with self._acq_lock:
@@ -3017,9 +3028,11 @@ class SEMTemporalMDStream(MultipleDetectorStream):
             # TODO: once live data is supported, return the partial data
             raise
         finally:
-            for s, sub in zip(self._streams, self._subscribers):
-                s._dataflow.unsubscribe(sub)
-            tcdf.synchronizedOn(None)  # In case of exception
+            # In case of exception
+            self._unsubscribeHwSync()
+            tcdf.synchronizedOn(None)
+            self._df0.synchronizedOn(None)
+            self._flushHwSyncData()
 
             for s in self._streams:
                 s._unlinkHwVAs()
@@ -3030,58 +3043,104 @@ class SEMTemporalMDStream(MultipleDetectorStream):
 
         return self.raw, None
 
-    def _acquireImage(self, x: float, y: float, img_time: float) -> Tuple[model.DataArray, model.DataArray]:
-        try:
-            for ce in self._acq_complete:
-                ce.clear()
-
-            self._emitter.translation.value = (x, y)
-            # checks the hardware has accepted it
-            trans = self._emitter.translation.value
-            if math.hypot(x - trans[0], y - trans[1]) > 1e-3:
-                logging.warning("Ebeam translation is %s instead of requested %s.", trans, (x, y))
-
-            self._acq_min_date = time.time()
+    def _subscribeHwSync(self, tc: bool = True) -> None:
+        """
+        Subscribe to the SEM (and time-correlator) dataflows, so that the data is
+        received in the acquisition queues. As the dataflows are synchronized,
+        they only acquire when the trigger is notified.
+        :param tc: if True, also subscribe to the time-correlator
+        """
+        streams = self._streams if tc else self._streams[:-1]
+        for s, sub in zip(streams, self._hwsync_subscribers):
+            s._dataflow.subscribe(sub)
 
-            # Start "all" the detectors but the time-correlator => start the e-beam
-            for s, sub in zip(self._streams[:-1], self._subscribers[:-1]):
-                s._dataflow.subscribe(sub)
+    def _unsubscribeHwSync(self, tc: bool = True) -> None:
+        """
+        Opposite of _subscribeHwSync()
+        :param tc: if True, also unsubscribe from the time-correlator
+        """
+        streams = self._streams if tc else self._streams[:-1]
+        for s, sub in zip(streams, self._hwsync_subscribers):
+            s._dataflow.unsubscribe(sub)
 
-            # Wait for detector to acquire image
-            for i, s in enumerate(self._streams):
-                timeout = 2.5 * img_time + 3
-                if not self._acq_complete[i].wait(timeout):
-                    raise TimeoutError(f"Timeout waiting for stream {i}")
-            if self._acq_state == CANCELLED:
-                raise CancelledError()
-            tc_data, se_data = self._acq_data[-1][-1], self._acq_data[0][-1]
-            return tc_data, se_data
-        finally:
-            for s, sub in zip(self._streams[:-1], self._subscribers[:-1]):
-                s._dataflow.unsubscribe(sub)
+    def _acquireImage(self, x: float, y: float, img_time: float) -> Tuple[model.DataArray, model.DataArray]:
+        """
+        Acquire the data of both detectors at one e-beam position.
+        The dataflows must have been subscribed with _subscribeHwSync().
+        :param x, y: e-beam translation
+        :param img_time: expected acquisition time (s)
+        :returns: time-correlator data, SEM data
+        """
+        self._emitter.translation.value = (x, y)
+        # checks the hardware has accepted it
+        trans = self._emitter.translation.value
+        if math.hypot(x - trans[0], y - trans[1]) > 1e-3:
+            logging.warning("Ebeam translation is %s instead of requested %s.", trans, (x, y))
+
+        # Start the SEM scan and the time-correlator acquisition
+        self._trigger.notify()
+
+        timeout = 2.5 * img_time + 3
+        se_data = self._getHwSyncData(0, timeout)
+        tc_data = self._getHwSyncData(len(self._streams) - 1, timeout)
+        return tc_data, se_data
+
+    def _integrateTemporalData(self, px_data: List[model.DataArray], ninteg: int) -> model.DataArray:
+        """
+        Sum up the partial data acquired at one pixel to get the full output for the pixel.
+        :param px_data: the ninteg data acquired at the pixel
+        :param ninteg: number of acquisitions per pixel
+        :returns: the data of the pixel, with the metadata of the first acquisition
+        """
+        if ninteg == 1:
+            return px_data[0]
+
+        # TODO: use ImageIntegrator for the image integration
+        # TODO: for the SEM data, this is actually not really correct as the SEM data is
+        # "normalized", so the final data should be divided by ninteg. This is done
+        # correctly in ImageIntegrator.
+        dtype = px_data[0].dtype
+        pxsum = numpy.sum(px_data, 0)
+        if numpy.issubdtype(dtype, numpy.integer):
+            pxsum = numpy.minimum(pxsum, numpy.iinfo(dtype).max).astype(dtype)
+        md = px_data[0].metadata.copy()
+        try:
+            md[model.MD_DWELL_TIME] *= ninteg
+        except KeyError:
+            logging.warning("No dwell time metadata in data")
+        return model.DataArray(pxsum, md)
 
-    def _onCompletedData(self, n, raw_das):
-        if n != 1:  # It's SEM data => no special way to treat it
-            return super(SEMTemporalMDStream, self)._onCompletedData(n, raw_das)
+    def _assembleTemporalData(self, se_data: List[model.DataArray], tc_data: List[model.DataArray]) -> None:
+        """
+        Called at the end of an entire acquisition. It assembles the data of the
+        SEM and time-correlator, and stores them in ._raw.
+        :param se_data: SEM data, one per pixel, with X changing fast, then Y slow
+        :param tc_data: time-correlator data, one per pixel, in the same order
+        """
+        # SEM data: just a 2D image
+        sem_da = self._assemble2DData(self.repetition.value, se_data)
+        # explicitly add names to make sure they are different
+        sem_da.metadata[MD_DESCRIPTION] = self._se_stream.name.value
+        self._raw.append(sem_da)
 
-        md = raw_das[0].metadata.copy()
+        md = tc_data[0].metadata.copy()
 
         # The time-correlator data is of shape 1, 65535 (XT). So the first
         # dimension can always be discarded and the second dimension is T.
         # All the data is scanned in Y(slow)/X(fast) order.
         # This will not work anymore if we include fuzzing.
         rep = self.repetition.value
-        das = numpy.array(raw_das)
+        das = numpy.array(tc_data)
         shape = das.shape  # N1T = rep[1] * rep[0], 1, detector.resolution[0]
         das.shape = (1, 1, rep[1], rep[0], shape[-1])  # Add CZ == 11 + separate YX
         das = numpy.rollaxis(das, 4, 1)  # Move T: CZYXT -> CTZYX
         md[MD_DIMS] = "CTZYX"
 
         # Compute metadata based on SEM metadata
-        sem_md = self._raw[0].metadata  # _onCompletedData() should be called in order
+        sem_md = sem_da.metadata
         md[MD_POS] = sem_md[MD_POS]
         md[MD_PIXEL_SIZE] = sem_md[MD_PIXEL_SIZE]
-        md[MD_DESCRIPTION] = self._streams[n].name.value
+        md[MD_DESCRIPTION] = self._tc_stream.name.value
 
         das = model.DataArray(das, md)
         self._raw.append(das)
@@ -3379,20 +3438,6 @@ class ScannedFluoMDStream(MultipleDetectorStream):
         # No drift correction supported => easy
         return self._estimateRawAcquisitionTime()
 
-    def _onCompletedData(self, n, raw_das):
-        """
-        Called at the end of an entire acquisition. It should assemble the data
-        and append it to ._raw .
-        Override if you need to process the data in a different way.
-        n (0<=int): the detector/stream index
-        raw_das (list of DataArray): data as received from the detector.
-           The data is ordered, with X changing fast, then Y slow
-        """
-        # explicitly add names to make sure they are different
-        da = raw_das[0]
-        da.metadata[MD_DESCRIPTION] = self._streams[n].name.value
-        # Not adding to the _raw, as it's kept on the streams directly
-
     def _adjustHardwareSettings(self):
         """
         Adapt the emitter/scanner/detector settings.
@@ -3419,39 +3464,18 @@ class ScannedFluoMDStream(MultipleDetectorStream):
                       self._streams[0].emitter.name,
                       self._streams[0].scanner.name)
 
-        # set the events, so the acq thread doesn't wait for them
-        for i in range(len(self._streams)):
-            self._acq_complete[i].set()
+        # The acq thread regularly checks the state, so it will stop waiting for the data
         self._streams[0]._dataflow.synchronizedOn(None)
 
         # Wait for the thread to be complete (and hardware state restored)
         self._acq_done.wait(5)
         return True
 
-    def _onData(self, n, df, data):
-        logging.debug("Stream %d data received", n)
-        s = self._streams[n]
-        if self._acq_min_date > data.metadata.get(model.MD_ACQ_DATE, 0):
-            # This is a sign that the e-beam might have been at the wrong (old)
-            # position while Rep data is acquiring
-            logging.warning("Dropping data (of stream %d) because it seems it started %g s too early",
-                            n, self._acq_min_date - data.metadata.get(model.MD_ACQ_DATE, 0))
-            if n == 0:
-                # As the first detector is synchronised, we need to restart it
-                # TODO: probably not necessary, as the typical reason it arrived
-                # early is that the detectors were already running, in which case
-                # they haven't "consumed" the previous trigger yet
-                self._trigger.notify()
-            return
-
-        if not self._acq_complete[n].is_set():
-            s._onNewData(s._dataflow, data)
-            self._acq_complete[n].set()
-            # TODO: unsubscribe here?
-
     def _runAcquisition(self, future) -> Tuple[List[model.DataArray], Optional[Exception]]:
         """
         Acquires images from the multiple detectors via software synchronisation.
+        All the detectors acquire simultaneously the whole area, started by a
+        single trigger. The data is received via the acquisition queues.
         Warning: can be quite memory consuming if the grid is big
         :returns
             list of DataArray: All the data acquired.
@@ -3463,6 +3487,7 @@ class ScannedFluoMDStream(MultipleDetectorStream):
         try:
             self._acq_done.clear()
             acq_time = self._adjustHardwareSettings()
+            self._flushHwSyncData()
 
             # Synchronise one detector, so that it's possible to subscribe without
             # the acquisition immediately starting. Once all the detectors are
@@ -3471,12 +3496,8 @@ class ScannedFluoMDStream(MultipleDetectorStream):
             for s in self.streams[1:]:
                 s._dataflow.synchronizedOn(None)  # Just to be sure
 
-            subscribers = []  # to keep a ref
-            for i, s in enumerate(self._streams):
-                p_subscriber = partial(self._onData, i)
-                subscribers.append(p_subscriber)
-                s._dataflow.subscribe(p_subscriber)
-                self._acq_complete[i].clear()
+            for s, sub in zip(self._streams, self._hwsync_subscribers):
+                s._dataflow.subscribe(sub)
 
             if self._acq_state == CANCELLED:
                 raise CancelledError()
@@ -3489,21 +3510,37 @@ class ScannedFluoMDStream(MultipleDetectorStream):
             # the start.
 
             # Wait until all the data is received
+            timeout = 3 + acq_time * 1.5
             for i, s in enumerate(self._streams):
                 # TODO: It should arrive at the same time, so after the first stream less timeout
-                if not self._acq_complete[i].wait(3 + acq_time * 1.5):
-                    raise IOError("Confocal acquisition hasn't received data after %g s" %
-                                  (time.time() - self._acq_min_date,))
-                if self._acq_state == CANCELLED:
-                    raise CancelledError()
-                s._dataflow.unsubscribe(subscribers[i])
+                while True:
+                    try:
+                        data = self._getHwSyncData(i, timeout)
+                    except TimeoutError:
+                        raise IOError("Confocal acquisition hasn't received data after %g s" %
+                                      (time.time() - self._acq_min_date,))
+                    if self._acq_min_date <= data.metadata.get(model.MD_ACQ_DATE, 0):
+                        break
+                    # This is a sign that the e-beam might have been at the wrong (old)
+                    # position while Rep data is acquiring
+                    logging.warning("Dropping data (of stream %d) because it seems it started %g s too early",
+                                    i, self._acq_min_date - data.metadata.get(model.MD_ACQ_DATE, 0))
+                    if i == 0:
+                        # As the first detector is synchronised, we need to restart it
+                        self._trigger.notify()
+
+                s._dataflow.unsubscribe(self._hwsync_subscribers[i])
                 s._dataflow.synchronizedOn(None)  # Just to be sure
+                s._onNewData(s._dataflow, data)
 
             # Done
             self._streams[0]._stop_light()
             logging.debug("All confocal acquisition data received")
-            for n, s in enumerate(self._streams):
-                self._onCompletedData(n, s.raw)
+            # Explicitly add names to make sure they are different.
+            # Not adding to the _raw, as it's kept on the streams directly
+            for s in self._streams:
+                for da in s.raw:
+                    da.metadata[MD_DESCRIPTION] = s.name.value
 
         except Exception as exp:
             if not isinstance(exp, CancelledError):
@@ -3512,8 +3549,8 @@ class ScannedFluoMDStream(MultipleDetectorStream):
                 logging.debug("Confocal acquisition cancelled")
 
             self._streams[0]._stop_light()
-            for i, s in enumerate(self._streams):
-                s._dataflow.unsubscribe(subscribers[i])
+            for s, sub in zip(self._streams, self._hwsync_subscribers):
+                s._dataflow.unsubscribe(sub)
                 s._dataflow.synchronizedOn(None)  # Just to be sure
 
             if not isinstance(exp, CancelledError) and self._acq_state == CANCELLED:
@@ -3521,6 +3558,7 @@ class ScannedFluoMDStream(MultipleDetectorStream):
                 raise CancelledError()
             raise
         finally:
+            self._flushHwSyncData()
             for s in self._streams:
                 s._unlinkHwVAs()
             if self._setting_stream:
@@ -405,6 +405,45 @@ class TestSpectrum(unittest.TestCase):
             if wl <= wl_calib[0]:
                 self.assertEqual(vo * dcalib[0], vc)
 
+    def test_corrected_data(self):
+        """
+        Check the lazy correction gives the same data as the direct correction
+        """
+        rng = numpy.random.default_rng(0)
+        wld = 400e-9 + numpy.arange(30) * 10e-9
+        data = model.DataArray(rng.integers(0, 2000, (30, 4, 1, 12, 15), dtype=numpy.uint16),
+                               metadata={model.MD_WL_LIST: wld.tolist()})
+        bckg = model.DataArray(rng.integers(0, 200, (30, 4, 1, 1, 1), dtype=numpy.uint16),
+                               metadata={model.MD_WL_LIST: wld.tolist()})
+        dcalib = numpy.linspace(0.5, 3, 10)
+        dcalib.shape += (1, 1, 1, 1)
+        calib = model.DataArray(dcalib, metadata={model.MD_WL_LIST: numpy.linspace(420e-9, 650e-9, 10).tolist()})
+
+        for b, c in ((bckg, None), (None, calib), (bckg, calib)):
+            exp = calibration.apply_spectrum_corrections(data, b, c)
+            corrected = calibration.SpectrumCorrectedData(data, b, c)
+            self.assertEqual(corrected.shape, exp.shape)
+            self.assertEqual(corrected.dtype, exp.dtype)
+            self.assertEqual(corrected.metadata[model.MD_WL_LIST], exp.metadata[model.MD_WL_LIST])
+
+            for key in ((slice(None), 2, 0, slice(None), slice(None)),  # One time
+                        (5,),  # One wavelength
+                        (slice(None), slice(None), 0, 3, 4),  # One pixel
+                        (3, 2, 0, 7, 6),  # One value
+                        (slice(2, 20, 3), Ellipsis, slice(None, 5)),
+                        ):
+                numpy.testing.assert_array_equal(corrected[key], exp[key])
+                # Second time, it should come from the cache
+                numpy.testing.assert_array_equal(corrected[key], exp[key])
+
+            numpy.testing.assert_array_equal(corrected.getData(), exp)
+            self.assertEqual(corrected.minmax(), (exp.min(), exp.max()))
+
+        # Angular spectrum is not supported
+        data.metadata[model.MD_THETA_LIST] = numpy.linspace(-1, 1, 4).tolist()
+        with self.assertRaises(ValueError):
+            calibration.SpectrumCorrectedData(data, bckg, None)
+
     def test_angular_spec_compensation(self):
         """Check that the angular spec data is readjusted based on chromatic aberration info"""
         # AR Spectrum (aka EK1) data
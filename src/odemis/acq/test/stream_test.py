@@ -120,6 +120,34 @@ class StreamTestCase(unittest.TestCase):
         ratio = [n / r for n, r in zip(rep, width)]
         self.assertAlmostEqual(ratio[0], ratio[1], msg="rep = %s, roi = %s" % (rep, roi))
 
+    def test_spot_block_size(self):
+        """
+        Test the .spotBlockSize of the scanner follows the dwell time while a
+        MonochromatorSettingsStream is playing.
+        """
+        ebeam = FakeEBeam("ebeam")
+        ebeam.spotBlockSize = model.IntContinuous(1, (1, 1000))
+        det = FakeDetector("det")
+        ms = stream.MonochromatorSettingsStream("test mono", det, det.data, ebeam)
+        dt = ms._getScannerVA("dwellTime")
+
+        dt.value = 10e-3
+        ms.is_active.value = True
+        time.sleep(0.1)
+        self.assertEqual(ebeam.spotBlockSize.value, int(stream.SPOT_BLOCK_PERIOD / 10e-3))
+
+        # Longer dwell time while playing => smaller blocks, to keep the same period
+        dt.value = 1
+        self.assertEqual(ebeam.spotBlockSize.value, 1)
+        dt.value = 1e-3
+        self.assertEqual(ebeam.spotBlockSize.value, int(stream.SPOT_BLOCK_PERIOD / 1e-3))
+
+        # Stopped => back to the original value, and doesn't follow the dwell time anymore
+        ms.is_active.value = False
+        self.assertEqual(ebeam.spotBlockSize.value, 1)
+        dt.value = 10e-3
+        self.assertEqual(ebeam.spotBlockSize.value, 1)
+
     def test_roi_rep_pxs_links(self):
         """
         Test the connections between .roi, .pixelSize and .repetition of a
@@ -4554,6 +4582,40 @@ class TimeCorrelatorTestCase(unittest.TestCase):
         # Check if the image changed (live update is working)
         testing.assert_array_not_equal(im1, im2)
 
+    def test_acq_cancel(self):
+        """
+        Test cancelling the acquisition while waiting for the time correlator
+        """
+        tc_stream = stream.ScannedTemporalSettingsStream(
+            "Time Correlator",
+            self.time_correlator,
+            self.time_correlator.data,
+            self.ebeam,
+            detvas={"dwellTime"},
+        )
+        sem_stream = stream.SpotSEMStream("Ebeam", self.sed, self.sed.data, self.ebeam)
+        sem_tc_stream = stream.SEMTemporalMDStream("SEM Time Correlator",
+                                                   [sem_stream, tc_stream])
+
+        tc_stream.repetition.value = (5, 3)
+        tc_stream.detDwellTime.value = 2  # s
+        f = sem_tc_stream.acquire()
+        time.sleep(3)
+
+        start = time.time()
+        self.assertTrue(f.cancel())
+        self.assertTrue(f.cancelled())
+        # Should not have to wait for the end of the whole acquisition
+        self.assertLess(time.time() - start, 3)
+
+        # Should be possible to acquire again afterwards
+        tc_stream.repetition.value = (2, 1)
+        tc_stream.detDwellTime.value = 5e-3
+        f = sem_tc_stream.acquire()
+        data, exp = f.result(30)
+        self.assertIsNone(exp)
+        self.assertEqual(len(data), 2)
+
 
 # @skip("faster")
 class SettingsStreamsTestCase(unittest.TestCase):
@@ -26,6 +26,7 @@ import logging
 import os
 
 from ._base import *
+from ._export import ExportService, export_async, get_export_service
 from odemis.dataio import tiff
 
 # The interface of a "format manager" is as follows:
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""
+Created on 19 Oct 2026
+
+Copyright © 2026 Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the
+terms of the GNU General Public License version 2 as published by the Free
+Software Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+Odemis. If not, see http://www.gnu.org/licenses/.
+
+Service to export data to files in the background, so that the acquisitions
+don't have to wait for the data to be written on disk.
+"""
+
+import logging
+import os
+import threading
+import time
+from concurrent import futures
+from typing import List, Optional
+
+from odemis import model
+
+# Default number of files written simultaneously. A few writers help to hide
+# the latency of network storage, more mostly compete for the bandwidth.
+DEFAULT_WORKERS = 2
+# Default maximum amount of data (in bytes) waiting to be written. Above it,
+# submitting new data blocks, to avoid running out of memory.
+DEFAULT_MAX_PENDING_SIZE = 2 * 1024 ** 3  # 2 GiB
+# Writing speed (B/s) assumed before any data has been written, to estimate the
+# time needed
+DEFAULT_THROUGHPUT = 100e6  # B/s
+
+
+def _get_data_size(data) -> int:
+    """
+    :param data: DataArray or list of DataArrays (or DataArrayShadows)
+    :return: the memory used by the data, in bytes. DataArrayShadows, which are
+      not (yet) in memory, are counted as 0.
+    """
+    if not isinstance(data, (list, tuple)):
+        data = [data]
+    return sum(getattr(d, "nbytes", 0) for d in data)
+
+
+class ExportService:
+    """
+    Writes data to files from a pool of threads, with a bound on the amount of
+    data waiting to be written. Each export is represented by a ProgressiveFuture,
+    which returns the filename once the data is written.
+    """
+
+    def __init__(self, max_workers: int = DEFAULT_WORKERS,
+                 max_pending_size: int = DEFAULT_MAX_PENDING_SIZE,
+                 sync: bool = False):
+        """
+        :param max_workers: number of files written simultaneously
+        :param max_pending_size: maximum amount of data (in bytes) waiting to be
+          written. When reached, export() blocks until enough data is written.
+          A single export is always accepted, even if it's larger.
+        :param sync: if True, the files are flushed to the storage (fsync) before
+          the export is reported done.
+        """
+        if max_workers < 1:
+            raise ValueError(f"max_workers must be at least 1, but got {max_workers}")
+        self._max_workers = max_workers
+        self.max_pending_size = max_pending_size
+        self.sync = sync
+
+        self._executor = model.CancellableThreadPoolExecutor(max_workers=max_workers)
+        self._pending_cond = threading.Condition()
+        self._pending_size = 0  # bytes of data submitted but not yet written
+        self._pending = set()  # futures not yet done
+        self._throughput = DEFAULT_THROUGHPUT  # B/s, average writing speed of a worker
+
+    @property
+    def pending_size(self) -> int:
+        """
+        Amount of data (in bytes) waiting to be written
+        """
+        return self._pending_size
+
+    def export(self, filename: str, data, *args, exporter=None, **kwargs) -> model.ProgressiveFuture:
+        """
+        Schedule the export of data to a file.
+        Note: the data must not be modified after calling this function, until the
+        export is completed.
+        :param filename: the path of the file to write
+        :param data: the DataArray(s) to write, as accepted by the exporter
+        :param args, kwargs: passed to the export() function of the exporter
+          (eg, the thumbnail)
+        :param exporter: (dataio module) the format to use. If None, it's
+          selected based on the filename extension.
+        :return: a future to follow the export. Its result is the filename.
+        """
+        if exporter is None:
+            from odemis.dataio import find_fittest_converter
+            exporter = find_fittest_converter(filename)
+
+        size = _get_data_size(data)
+        with self._pending_cond:
+            # Back-pressure: wait until there is enough room for the data
+            while self._pending and self._pending_size + size > self.max_pending_size:
+                logging.debug("Waiting for %d bytes of data to be saved before saving %s",
+                              self._pending_size, filename)
+                self._pending_cond.wait()
+
+            self._pending_size += size
+            # Estimate when it will be written, assuming all the pending data is written first
+            dur = self._pending_size / (self._throughput * self._max_workers)
+            f = model.ProgressiveFuture(end=time.time() + dur)
+            f._export_size = size
+            self._pending.add(f)
+
+        # Only needed if cancelled before starting, otherwise _export() releases it
+        f.add_done_callback(self._on_export_done)
+        self._executor.submitf(f, self._export, f, exporter, filename, data, *args, **kwargs)
+        return f
+
+    def _export(self, f: model.ProgressiveFuture, exporter, filename: str, data, *args, **kwargs) -> str:
+        """
+        Write the data to the file (blocking)
+        :return: the filename
+        """
+        startt = time.time()
+        f.set_progress(start=startt, end=startt + f._export_size / self._throughput)
+        logging.debug("Saving data to %s", filename)
+        try:
+            exporter.export(filename, data, *args, **kwargs)
+            if self.sync:
+                self._sync_file(filename)
+        finally:
+            # Release the data before the future is done, so that the waiters
+            # (eg, flush()) see the updated pending size
+            self._release(f)
+
+        dur = time.time() - startt
+        if f._export_size and dur > 0:
+            # Running average, to follow the changes of the storage speed
+            self._throughput = 0.7 * self._throughput + 0.3 * (f._export_size / dur)
+        logging.debug("Saved %s (%d bytes) in %g s", filename, f._export_size, dur)
+        return filename
+
+    @staticmethod
+    def _sync_file(filename: str) -> None:
+        """
+        Make sure the data of the file is on the storage
+        """
+        try:
+            fd = os.open(filename, os.O_RDONLY)
+        except OSError:
+            # Some exporters change the filename (eg, for multiple files)
+            logging.debug("Cannot open %s to flush it", filename)
+            return
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _release(self, f: model.ProgressiveFuture) -> None:
+        """
+        Remove the export from the pending ones (if not yet done)
+        """
+        with self._pending_cond:
+            if f not in self._pending:
+                return
+            self._pending.discard(f)
+            self._pending_size -= f._export_size
+            self._pending_cond.notify_all()
+
+    def _on_export_done(self, f: model.ProgressiveFuture) -> None:
+        self._release(f)
+
+        if not f.cancelled() and f.exception() is not None:
+            logging.error("Failed to save data: %s", f.exception())
+
+    def flush(self, timeout: Optional[float] = None) -> List[model.ProgressiveFuture]:
+        """
+        Wait until all the data submitted so far is written.
+        :param timeout: maximum time to wait (in s). If None, wait forever.
+        :return: the futures still pending when called, which didn't succeed
+        :raises TimeoutError: if the timeout is reached
+        """
+        with self._pending_cond:
+            fs = list(self._pending)
+        done, not_done = futures.wait(fs, timeout)
+        if not_done:
+            raise TimeoutError(f"{len(not_done)} exports still pending after {timeout} s")
+        return [f for f in fs if f.cancelled() or f.exception() is not None]
+
+    def cancel(self) -> None:
+        """
+        Cancel all the exports not yet started. Returns once the exports
+        already running are over.
+        """
+        self._executor.cancel()
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        Stop the service. No more data can be exported afterwards.
+        :param wait: if True, wait until all the pending data is written
+        """
+        self._executor.shutdown(wait=wait)
+
+
+_export_service = None
+_export_service_lock = threading.Lock()
+
+
+def get_export_service() -> ExportService:
+    """
+    :return: the export service shared by the whole process
+    """
+    global _export_service
+    with _export_service_lock:
+        if _export_service is None:
+            _export_service = ExportService()
+        return _export_service
+
+
+def export_async(filename: str, data, *args, exporter=None, **kwargs) -> model.ProgressiveFuture:
+    """
+    Export data to a file in the background, using the shared export service.
+    See ExportService.export() for the arguments.
+    :return: a future to follow the export. Its result is the filename.
+    """
+    return get_export_service().export(filename, data, *args, exporter=exporter, **kwargs)
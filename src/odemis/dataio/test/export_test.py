@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+Created on 19 Oct 2026
+
+Copyright © 2026 Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License version 2 as published by the Free Software Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with Odemis. If not, see http://www.gnu.org/licenses/.
+"""
+import logging
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+import numpy
+
+from odemis import model, dataio
+from odemis.dataio import tiff, ExportService
+
+logging.getLogger().setLevel(logging.DEBUG)
+
+
+class SlowExporter:
+    """
+    Fake exporter, which blocks until it's allowed to continue
+    """
+
+    def __init__(self):
+        self.allowed = threading.Event()
+        self.exported = []
+
+    def export(self, filename, data, thumbnail=None):
+        self.allowed.wait(10)
+        if filename.endswith("fail"):
+            raise IOError("Failed to write")
+        self.exported.append(filename)
+
+
+class TestExportService(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_export_tiff(self):
+        srv = ExportService(max_workers=2, sync=True)
+        fns = []
+        fs = []
+        for i in range(4):
+            da = model.DataArray(numpy.full((64, 32), i, dtype=numpy.uint16))
+            fn = os.path.join(self.tmpdir.name, "test%d.ome.tiff" % i)
+            fs.append(srv.export(fn, [da]))
+            fns.append(fn)
+
+        self.assertEqual(srv.flush(timeout=30), [])
+        self.assertEqual(srv.pending_size, 0)
+        for i, (f, fn) in enumerate(zip(fs, fns)):
+            self.assertEqual(f.result(), fn)
+            rdata = tiff.read_data(fn)
+            self.assertEqual(rdata[0].shape, (64, 32))
+            self.assertEqual(rdata[0][0, 0], i)
+        srv.shutdown()
+
+    def test_export_async(self):
+        da = model.DataArray(numpy.zeros((16, 16), dtype=numpy.uint8))
+        fn = os.path.join(self.tmpdir.name, "test.ome.tiff")
+        f = dataio.export_async(fn, da, exporter=tiff)
+        self.assertEqual(f.result(30), fn)
+        self.assertTrue(os.path.exists(fn))
+        self.assertIs(dataio.get_export_service(), dataio.get_export_service())
+
+    def test_back_pressure(self):
+        """
+        Check the export blocks when there is too much data pending
+        """
+        exporter = SlowExporter()
+        da = model.DataArray(numpy.zeros((100, 100), dtype=numpy.uint8))  # 10 kB
+        srv = ExportService(max_workers=1, max_pending_size=25e3)
+        f1 = srv.export("a", da, exporter=exporter)
+        f2 = srv.export("b", da, exporter=exporter)
+        self.assertEqual(srv.pending_size, 2 * da.nbytes)
+
+        # The 3rd one doesn't fit => blocks until some data is written
+        submitted = threading.Event()
+
+        def export_more():
+            srv.export("c", da, exporter=exporter)
+            submitted.set()
+
+        t = threading.Thread(target=export_more)
+        t.start()
+        self.assertFalse(submitted.wait(0.5))
+
+        exporter.allowed.set()
+        self.assertTrue(submitted.wait(10))
+        t.join()
+        self.assertEqual(srv.flush(timeout=10), [])
+        self.assertEqual(exporter.exported, ["a", "b", "c"])
+        self.assertEqual(srv.pending_size, 0)
+        self.assertTrue(f1.done() and f2.done())
+        srv.shutdown()
+
+    def test_pending_size_when_done(self):
+        """
+        Check the data is not counted as pending anymore once the export is done
+        """
+        exporter = SlowExporter()
+        exporter.allowed.set()
+        da = model.DataArray(numpy.zeros((10, 10), dtype=numpy.uint8))
+        srv = ExportService(max_workers=1)
+
+        # Slow down the done callback, to detect if the waiters rely on it
+        on_export_done = srv._on_export_done
+
+        def slow_on_export_done(f):
+            time.sleep(0.2)
+            on_export_done(f)
+
+        srv._on_export_done = slow_on_export_done
+        for i in range(3):
+            f = srv.export("f%d" % i, da, exporter=exporter)
+            f.result(10)
+            self.assertEqual(srv.pending_size, 0)
+            self.assertEqual(srv.flush(timeout=10), [])
+        srv.shutdown()
+
+    def test_failure_and_cancel(self):
+        exporter = SlowExporter()
+        da = model.DataArray(numpy.zeros((10, 10), dtype=numpy.uint8))
+        srv = ExportService(max_workers=1)
+        ffail = srv.export("fail", da, exporter=exporter)
+        fcancel = srv.export("cancelled", da, exporter=exporter)
+        time.sleep(0.1)
+        self.assertTrue(fcancel.cancel())
+        exporter.allowed.set()
+
+        failed = srv.flush(timeout=10)
+        self.assertEqual(failed, [ffail])
+        self.assertTrue(fcancel.cancelled())
+        with self.assertRaises(IOError):
+            ffail.result()
+        self.assertEqual(exporter.exported, [])
+        self.assertEqual(srv.pending_size, 0)
+        srv.shutdown()
+
+
+if __name__ == "__main__":
+    unittest.main()
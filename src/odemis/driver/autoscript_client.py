@@ -25,7 +25,7 @@ import queue
 import threading
 import time
 from concurrent.futures import CancelledError, Future
-from typing import Any, Dict, List, Optional, Tuple, Union
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
 
 import msgpack  # only used for debug information
 import msgpack_numpy
@@ -36,7 +36,9 @@ from Pyro5.errors import CommunicationError
 from scipy import ndimage
 
 from odemis import model, util
-from odemis.driver.xt_client import check_and_transfer_latest_package
+from odemis.driver.xt_client import (POLL_PERIOD_DEFAULT, adapt_polling_period,
+                                     check_and_transfer_latest_package, speed_up_polling,
+                                     update_va_value)
 from odemis.model import (
     CancellableFuture,
     CancellableThreadPoolExecutor,
@@ -128,9 +130,15 @@ class SEM(model.HwComponent):
 
         model.HwComponent.__init__(self, name, role, daemon=daemon, **kwargs)
         self._proxy_access = threading.Lock()
+        # The polling of the settings uses a separate connection, so that it
+        # never delays the other calls (eg, during an acquisition)
+        self._polling_access = threading.Lock()
+        self._batch_get_supported = True  # Set to False if the server doesn't have get_settings()
         try:
             self.server = Pyro5.api.Proxy(f"PYRO:Microscope@{address}:{port}")
             self.server._pyroTimeout = 30  # seconds
+            self._polling_server = Pyro5.api.Proxy(f"PYRO:Microscope@{address}:{port}")
+            self._polling_server._pyroTimeout = 30  # seconds
             self._swVersion = self.server.get_software_version()
             self._hwVersion = self.server.get_hardware_version()
             if "adapter: autoscript" not in self._swVersion:
@@ -247,6 +255,35 @@ class SEM(model.HwComponent):
             self.server._pyroClaimOwnership()
             self.server.stop_stage_movement()
 
+    def get_settings(self, getters: Sequence[Tuple[str, tuple]]) -> List[Any]:
+        """
+        Read multiple settings at once, typically to poll them. It uses a separate
+        connection to the server, so it doesn't delay (and is not delayed by) the
+        other calls.
+        If the server supports it, all the settings are read in a single call to
+        its get_settings() method, which calls each getter in order and returns
+        the list of the values. Otherwise, the getters are called one at a time.
+
+        :param getters: for each setting, the name of the getter method on the
+            server (eg, "get_dwell_time") and its arguments.
+        :return: the values, in the same order as the getters.
+        """
+        with self._polling_access:
+            self._polling_server._pyroClaimOwnership()
+            if self._batch_get_supported:
+                try:
+                    get_settings = self._polling_server.get_settings
+                except AttributeError:
+                    # Pyro raises AttributeError if the method is not exposed by the server
+                    logging.info("Server doesn't support reading multiple settings at once, "
+                                 "will read them one at a time")
+                    self._batch_get_supported = False
+                else:
+                    # Any error raised by the server is passed as-is
+                    return get_settings(list(getters))
+
+            return [getattr(self._polling_server, n)(*args) for n, args in getters]
+
     def get_stage_position(self) -> Dict[str, float]:
         """
         :return: the axes of the stage as keys with their corresponding position.
@@ -1251,63 +1288,72 @@ class Scanner(model.Emitter):
 
         # Refresh regularly the values, from the hardware, starting from now
         self._updateSettings()
-        self._va_poll = util.RepeatingTimer(5, self._updateSettings, "Settings polling")
+        self._va_poll = util.RepeatingTimer(POLL_PERIOD_DEFAULT, self._pollSettings, "Settings polling")
         self._va_poll.start()
 
-    def _updateSettings(self) -> None:
+    def _pollSettings(self) -> None:
+        """
+        Called regularly to update the VAs, and adjust the polling period
+        """
+        changed = self._updateSettings()
+        adapt_polling_period(self._va_poll, changed)
+
+    def _updateSettings(self) -> bool:
         """
         Read all the current settings from the SEM and reflects them on the VAs
+        :return: True if any setting changed
         """
         logging.debug("Updating SEM settings")
         try:
+            ch = (self.channel,)
+            getters = [("get_high_voltage", ch),
+                       ("get_beam_current", ch),
+                       ("get_beam_shift", ch),
+                       ("get_scan_rotation", ch),
+                       ("get_field_of_view", ch),
+                       ("beam_is_on", ch),
+                       ("beam_is_blanked", ch),
+                       ]
+            if self._has_detector:
+                getters += [("get_dwell_time", ch),
+                            ("get_resolution", ch),
+                            ]
+            values = self.parent.get_settings(getters)
+            voltage, beam_current, beam_shift, rotation, fov, beam_is_on, is_blanked = values[:7]
+
+            changed = False
             if self._has_detector:
-                dwell_time = self.parent.get_dwell_time(self.channel)
-                if dwell_time != self.dwellTime.value:
-                    self.dwellTime._value = dwell_time
-                    self.dwellTime.notify(dwell_time)
-                res = self.parent.get_resolution(self.channel)
+                dwell_time, res = values[7:]
+                changed |= update_va_value(self.dwellTime, dwell_time)
+                res = tuple(res)
                 if res != self.resolution.value:
-                    self.resolution._value = res
-                    self.resolution.notify(res)
-                self._updateResolution()
+                    scale = (self._shape[0] / res[0],) * 2
+                    self.scale._value = scale  # To not call the setter
+                    self.scale.notify(scale)
+                    changed = True
+                changed |= update_va_value(self.resolution, res)
 
-            voltage = self.parent.get_high_voltage(self.channel)
             v_range = self.accelVoltage.range
             if not v_range[0] <= voltage <= v_range[1]:
                 logging.info("Voltage {} V is outside of range {}, clipping to nearest value.".format(voltage, v_range))
                 voltage = self.accelVoltage.clip(voltage)
-            if voltage != self.accelVoltage.value:
-                self.accelVoltage._value = voltage
-                self.accelVoltage.notify(voltage)
-            beam_current = self.parent.get_beam_current(self.channel)
-            if beam_current != self.probeCurrent.value:
-                self.probeCurrent._value = beam_current
-                self.probeCurrent.notify(beam_current)
-            beam_shift = self.parent.get_beam_shift(self.channel)
-            if beam_shift != self.shift.value:
-                self.shift._value = beam_shift
-                self.shift.notify(beam_shift)
-            rotation = self.parent.get_scan_rotation(self.channel)
-            if rotation != self.rotation.value:
-                self.rotation._value = rotation
-                self.rotation.notify(rotation)
-            fov = self.parent.get_field_of_view(self.channel)
+            changed |= update_va_value(self.accelVoltage, voltage)
+            changed |= update_va_value(self.probeCurrent, beam_current)
+            changed |= update_va_value(self.shift, tuple(beam_shift))
+            changed |= update_va_value(self.rotation, rotation)
             if fov != self.horizontalFoV.value:
                 self.horizontalFoV._value = fov
                 mag = self._hfw_nomag / fov
                 self.magnification._value = mag
                 self.horizontalFoV.notify(fov)
                 self.magnification.notify(mag)
-            beam_is_on = self.parent.get_beam_is_on(self.channel)
-            if beam_is_on != self.power.value:
-                self.power._value = beam_is_on
-                self.power.notify(beam_is_on)
-            is_blanked = self.parent.beam_is_blanked(self.channel)
-            if is_blanked != self.blanker.value:
-                self.blanker._value = is_blanked
-                self.blanker.notify(is_blanked)
+                changed = True
+            changed |= update_va_value(self.power, beam_is_on)
+            changed |= update_va_value(self.blanker, is_blanked)
+            return changed
         except Exception:
             logging.exception("Unexpected failure when polling settings")
+            return False
 
     def _setScale(self, value: Tuple[int, int]) -> Tuple[int, int]:
         """
@@ -1812,7 +1858,7 @@ class Stage(model.Actuator):
         self._updatePosition()
 
         # Refresh regularly the position
-        self._pos_poll = util.RepeatingTimer(5, self._refreshPosition, "Stage position polling")
+        self._pos_poll = util.RepeatingTimer(POLL_PERIOD_DEFAULT, self._refreshPosition, "Stage position polling")
         self._pos_poll.start()
 
     def terminate(self):
@@ -1840,18 +1886,21 @@ class Stage(model.Actuator):
         logging.debug(f"The offset values in x and y are {self._raw_offset} when stage is in the raw coordinate "
                         f"system for raw stage coordinates: {pos}, linked stage coordinates: {pos_linked}")
 
-    def _updatePosition(self):
+    def _updatePosition(self) -> bool:
         """
         update the position VA
+        :return: True if the position changed
         """
         old_pos = self.position.value
-        pos = self._getPosition()
+        pos = self._getPosition(self.parent.get_settings([("get_stage_position", ())])[0])
         # Apply the offset to the raw coordinates
         pos["x"] += self._raw_offset["x"]
         pos["y"] += self._raw_offset["y"]
         self.position._set_value(self._applyInversion(pos), force_write=True)
         if old_pos != self.position.value:
             logging.debug("Updated position to %s", self.position.value)
+            return True
+        return False
 
     def _refreshPosition(self):
         """
@@ -1861,13 +1910,19 @@ class Stage(model.Actuator):
         # set request
         logging.debug("Updating SEM stage position")
         try:
-            self._updatePosition()
+            changed = self._updatePosition()
         except Exception:
             logging.exception("Unexpected failure when updating position")
+            changed = False
+        adapt_polling_period(self._pos_poll, changed)
 
-    def _getPosition(self) -> Dict[str, float]:
-        """Get position and translate the axes names to be Odemis compatible."""
-        pos = self.parent.get_stage_position()
+    def _getPosition(self, pos: Optional[Dict[str, float]] = None) -> Dict[str, float]:
+        """
+        Get position and translate the axes names to be Odemis compatible.
+        :param pos: the position as reported by the server. If None, it is read.
+        """
+        if pos is None:
+            pos = self.parent.get_stage_position()
         pos["rx"] = pos.pop("t")
         pos["rz"] = pos.pop("r")
         # Make sure the full rotations are within the range (because the SEM
@@ -1898,7 +1953,8 @@ class Stage(model.Actuator):
                     pos["t"] = pos.pop("rx")
                 if "rz" in pos.keys():
                     pos["r"] = pos.pop("rz")
-                # movements are blocking
+                # movements are blocking, but the position is still polled (on a separate connection)
+                speed_up_polling(self._pos_poll)
                 if rel:
                     self.parent.move_stage_relative(pos)
                 else:
@@ -2041,15 +2097,18 @@ class Focus(model.Actuator):
                              "An fib scanner is a required child component for the Focus class")
 
         # Refresh regularly the position
-        self._pos_poll = util.RepeatingTimer(5, self._refreshPosition, "Focus position polling")
+        self._pos_poll = util.RepeatingTimer(POLL_PERIOD_DEFAULT, self._refreshPosition, "Focus position polling")
         self._pos_poll.start()
 
-    def _updatePosition(self):
+    def _updatePosition(self) -> bool:
         """
         update the position VA
+        :return: True if the position changed
         """
-        z = self.parent.get_working_distance(self.channel)
+        z = self.parent.get_settings([("get_working_distance", (self.channel,))])[0]
+        changed = self.position.value != {"z": z}
         self.position._set_value({"z": z}, force_write=True)
+        return changed
 
     def _refreshPosition(self):
         """
@@ -2059,9 +2118,11 @@ class Focus(model.Actuator):
         # set request
         logging.debug("Updating SEM focus position")
         try:
-            self._updatePosition()
+            changed = self._updatePosition()
         except Exception:
             logging.exception("Unexpected failure when updating position")
+            changed = False
+        adapt_polling_period(self._pos_poll, changed)
 
     def _doMoveRel(self, foc):
         """
@@ -2071,6 +2132,7 @@ class Focus(model.Actuator):
         try:
             foc += self.parent.get_working_distance(self.channel)
             self.parent.set_working_distance(foc, channel=self.channel)
+            speed_up_polling(self._pos_poll)  # Follow the next changes closely
         finally:
             # Update the position, even if the move didn't entirely succeed
             self._updatePosition()
@@ -2082,6 +2144,7 @@ class Focus(model.Actuator):
         """
         try:
             self.parent.set_working_distance(foc, channel=self.channel)
+            speed_up_polling(self._pos_poll)  # Follow the next changes closely
         finally:
             # Update the position, even if the move didn't entirely succeed
             self._updatePosition()
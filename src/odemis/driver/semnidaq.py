@@ -76,7 +76,9 @@ import threading
 import time
 import warnings
 import weakref
+from collections import OrderedDict
 from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
 from typing import Any, Dict, List, Optional, Tuple, Set, Union, Callable
 
@@ -119,6 +121,20 @@ CHUNK_DURATION = 0.1  # s
 # issue (but the beginning of the scan will be discarded).
 MIN_FRAME_DURATION_CONT_ACQ = 1e-3  # s
 
+# Maximum number of points acquired at once in spot mode (see Scanner.spotBlockSize)
+MAX_SPOT_BLOCK_SIZE = 1000000
+
+# Maximum number of scan waveforms kept in memory, so that going back to previous scan settings
+# (eg, when switching between the "live" settings and the acquisition settings, or when
+# zooming in and out) doesn't require to generate them again. The cache is also limited
+# in memory usage. The latest waveform is always kept, whatever its size.
+WAVEFORM_CACHE_SIZE = 8
+WAVEFORM_CACHE_MAX_BYTES = 512 * 1024 ** 2  # B
+
+# Maximum number of threads used to downsample the AI data. Each channel is downsampled in a
+# separate thread, so more threads than channels are not used.
+MAX_DOWNSAMPLE_WORKERS = min(8, os.cpu_count() or 1)
+
 
 
 class AnalogSEM(model.HwComponent):
@@ -553,7 +569,8 @@ class AcquisitionSettings:
                  margin: int,
                  positions_n: int,
                  has_do: bool,
-                 continuous: bool = True):
+                 continuous: bool = True,
+                 spot_block: int = 1):
         """
         :param analog_detectors: list of analog detectors to acquire the data
         :param counting_detectors: list of counting detectors to acquire the data
@@ -566,6 +583,8 @@ class AcquisitionSettings:
         :param has_do: True if a digital output task will run
         :param continuous: If False, only acquire a single frame. Otherwise, acquires until a
         UPDATE_SETTINGS (or a STOP) message is received on the message queue.
+        :param spot_block: if > 1, the frame is this number of points, all at the same position,
+        and the data is sent as a block of points (shape (N,), with MD_DIMS = "T").
         """
 
         self.analog_detectors = analog_detectors
@@ -577,6 +596,7 @@ class AcquisitionSettings:
         self.margin = margin  # px
         self.positions_n = positions_n
         self.continuous = continuous
+        self.spot_block = spot_block
 
         # Derive some useful info
         self.frame_duration = positions_n * dwell_time  # s
@@ -646,6 +666,10 @@ class Acquirer:
 
         self._ai_dtype = None
 
+        # Downsample the AI data in separate threads, while the next data is being read
+        self._downsample_executor = ThreadPoolExecutor(max_workers=MAX_DOWNSAMPLE_WORKERS,
+                                                       thread_name_prefix="Downsampler")
+
         self._thread = threading.Thread(target=self._main)
         self._thread.start()
 
@@ -669,6 +693,7 @@ class Acquirer:
         self._thread = None
         del self._mq
 
+        self._downsample_executor.shutdown(wait=True)
         self._do_task_end.close()
 
     @property
@@ -1183,10 +1208,20 @@ class Acquirer:
         # Get the waveforms
         (scan_array, ttl_array,
          dt, ao_osr, ai_osr, res, margin) = self._scanner._get_scan_waveforms(len(analog_dets))
+
+        # In spot mode, acquire a block of points in a row, as if it was a line of pixels
+        spot_block = self._scanner.spotBlockSize.value if res == (1, 1) else 1
+        if spot_block > 1:
+            scan_array = numpy.tile(scan_array, (1, spot_block))
+            if ttl_array is not None:
+                ttl_array = numpy.tile(ttl_array, spot_block)
+            res = (spot_block, 1)
+
         acq_settings = AcquisitionSettings(analog_dets, counting_dets,
                                            dt, ao_osr, ai_osr, res, margin,
                                            scan_array.shape[1] // ao_osr,
-                                           has_do=(ttl_array is not None), continuous=continuous)
+                                           has_do=(ttl_array is not None), continuous=continuous,
+                                           spot_block=spot_block)
         logging.debug(f"Will scan {acq_settings.positions_n} positions @ {acq_settings.dwell_time * 1e6:.3g} µs "
                       f"{'continuously' if continuous else 'once'} "
                       f"with {len(analog_dets)} AI and {len(counting_dets)} CI, for a total of "
@@ -1417,9 +1452,11 @@ class Acquirer:
 
         # Acquire data until a STOP message is received (or only once if it's a single frame)
         should_stop = not acq_settings.continuous
-        # Place to store the raw AI data, with over-sampling
-        ai_buffer_full = numpy.empty((n_analog_det, acq_settings.ai_chunk_size), dtype=self._ai_dtype)
-        acc_dtype = get_best_dtype_for_acc(ai_buffer_full.dtype, acq_settings.ai_osr)
+        # Place to store the raw AI data, with over-sampling. There are two buffers, so that
+        # one buffer can be downsampled while the next data is read into the other one.
+        ai_buffers_full = [numpy.empty((n_analog_det, acq_settings.ai_chunk_size), dtype=self._ai_dtype)
+                           for _ in range(2)]
+        acc_dtype = get_best_dtype_for_acc(self._ai_dtype, acq_settings.ai_osr)
 
         ai_reader = AnalogUnscaledReader(ai_task.in_stream)
 
@@ -1448,8 +1485,8 @@ class Acquirer:
             ai_data = numpy.empty((n_analog_det, acq_settings.res[1], acq_settings.res[0]),
                                   dtype=self._ai_dtype)
             acquired_n = 0
-            prev_samples_n = [0] * n_analog_det
-            prev_samples_sum = [0] * n_analog_det
+            chunk_n = 0
+            ai_downsampler = AIDownsampler(acq_settings, ai_data, acc_dtype, self._downsample_executor)
 
             if ci_tasks:
                 ci_data = numpy.empty((n_counting_det, acq_settings.res[1], acq_settings.res[0]),
@@ -1459,12 +1496,11 @@ class Acquirer:
                 ci_prev_samples_sum = [0] * n_counting_det
 
             while acquired_n < acq_settings.ai_samples_n:
-                new_samples_n, prev_samples_n, prev_samples_sum = self._read_ai_buffer(
-                    acq_settings,
-                    ai_reader, ai_data, ai_buffer_full, acquired_n,
-                    acc_dtype, prev_samples_n, prev_samples_sum)
-
+                new_samples_n = self._read_ai_buffer(acq_settings, ai_reader,
+                                                     ai_buffers_full[chunk_n % 2],
+                                                     acquired_n, ai_downsampler)
                 acquired_n += new_samples_n
+                chunk_n += 1
 
                 # Is it time to acquire CI?
                 if ci_tasks:
@@ -1485,11 +1521,23 @@ class Acquirer:
 
                 # End of buffer read
 
+            # Make sure all the data is downsampled
+            ai_downsampler.wait()
             logging.debug(f"Acquired one frame of {ai_data.shape} px, with {acquired_n} samples")
 
             # TODO: just put the data on a queue, and let the listener take care of this?
             # This would avoid blocking (of course, it's not a big issue, as the hardware is running in background)
 
+            if acq_settings.spot_block > 1:
+                # Send as a block of points (instead of a line)
+                ai_data.shape = (n_analog_det, -1)
+                for md in analog_mds:
+                    md[model.MD_DIMS] = "T"
+                if ci_tasks:
+                    ci_data.shape = (n_counting_det, -1)
+                    for md in counting_mds:
+                        md[model.MD_DIMS] = "T"
+
             for i, d in enumerate(acq_settings.analog_detectors):
                 im = model.DataArray(ai_data[i], analog_mds[i])
                 d.data.notify(im)
@@ -1503,32 +1551,23 @@ class Acquirer:
 
     # TODO: make a whole class for this?
     def _read_ai_buffer(self, acq_settings: AcquisitionSettings,
-                        ai_reader: AnalogUnscaledReader, ai_data: numpy.ndarray,
+                        ai_reader: AnalogUnscaledReader,
                         ai_buffer_full: numpy.ndarray,
-                        acquired_n: int, acc_dtype: numpy.dtype,
-                        prev_samples_n: List[int], prev_samples_sum: List[int],
-                        ) -> Tuple[int, List[int], List[int]]:
+                        acquired_n: int,
+                        ai_downsampler: "AIDownsampler",
+                        ) -> int:
         """
-        Reads data from the Analog Input (AI) buffer and processes it to fill the corresponding part
-        of the final frame data.
+        Reads data from the Analog Input (AI) buffer and passes it to the downsampler, to fill
+        the corresponding part of the final frame data (in the background).
 
         :param acq_settings: AcquisitionSettings object containing the settings for the current acquisition.
         :param ai_reader: object to read the data from the AI task.
-        :param ai_data: image array to store the data, shape (channels, height, width)
         :param ai_buffer_full: temporary array to store the raw AI data from the device, shape (channels, N)
+        It must not be used by the downsampler anymore (ie, at least one other buffer must have been
+        passed to the downsampler since it was last used).
         :param acquired_n: number of samples already acquired.
-        :param acc_dtype: numpy.dtype object representing the data type used for accumulation during downsampling.
-        :param prev_samples_n: number of samples lastly processed but not yet completing
-        a whole pixel, for each channel. It should be the samples_n returned by the last call.
-        :param prev_samples_sum: sum of samples lastly processed but not yet completing
-        a whole pixel, for each channel. It should be the samples_sum returned by the last call.
-        :param acc_dtype: the numpy data type to use for the accumulator.
-        :returns:
-            * acquired_n: updated number of samples acquired
-            * samples_n: the number of the (last) samples which could not be fully
-            fitted in a pixel yet.
-            * samples_sum: the sum of the (last) samples which could not be fully
-            fitted in a pixel yet.
+        :param ai_downsampler: to process the data into the final frame
+        :returns: number of new samples acquired
         """
         n_detectors, ai_chunk_size = ai_buffer_full.shape
         # Compute the number of data left to acquire to fill the array
@@ -1569,18 +1608,9 @@ class Acquirer:
 
         logging.debug("Got another %s AI samples, over %s still to acquire", new_samples_n, samples_left_n)
 
-        # Downsample each channel independently
-        for c in range(ai_data.shape[0]):
-            prev_samples_n[c], prev_samples_sum[c] = self._downsample_data(ai_data[c],
-                                                                           acq_settings.res,
-                                                                           acq_settings.margin,
-                                                                           acquired_n, acq_settings.ai_osr,
-                                                                           ai_buffer[c, :new_samples_n],
-                                                                           prev_samples_n[c],
-                                                                           prev_samples_sum[c],
-                                                                           acc_dtype,
-                                                                           average=True)
-        return new_samples_n, prev_samples_n, prev_samples_sum
+        # Downsample each channel independently, in the background
+        ai_downsampler.submit(ai_buffer, acquired_n, new_samples_n)
+        return new_samples_n
 
     def _read_ci_buffer(self, acq_settings: AcquisitionSettings,
                         ci_readers: List[CounterReader],
@@ -2008,6 +2038,64 @@ class Acquirer:
             numpy.add.reduce(buffer_osr, axis=2, out=subdata)
 
 
+class AIDownsampler:
+    """
+    Downsamples the AI data of a frame, chunk by chunk, in separate threads. Each channel is
+    downsampled in its own thread, and the data is directly stored in the final image. As a
+    chunk is downsampled in the background, the caller can already read the next chunk (in
+    another buffer). As the downsampling of a chunk depends on the previous chunk (for the
+    pixel split between two chunks), a chunk is only processed once the previous one is done.
+    """
+
+    def __init__(self, acq_settings: AcquisitionSettings, ai_data: numpy.ndarray,
+                 acc_dtype: numpy.dtype, executor: ThreadPoolExecutor):
+        """
+        :param acq_settings: settings for the acquisition.
+        :param ai_data: image array to store the data, shape (channels, height, width)
+        :param acc_dtype: the numpy data type to use for the accumulator.
+        :param executor: the threads to run the downsampling
+        """
+        self._acq_settings = acq_settings
+        self._ai_data = ai_data
+        self._acc_dtype = acc_dtype
+        self._executor = executor
+
+        n_channels = ai_data.shape[0]
+        # Samples not yet completing a whole pixel, for each channel
+        self._prev_samples_n = [0] * n_channels
+        self._prev_samples_sum = [0] * n_channels
+        self._futures = []  # Downsampling of the latest chunk, one per channel
+
+    def submit(self, buffer: numpy.ndarray, acquired_n: int, new_samples_n: int) -> None:
+        """
+        Schedule the downsampling of a chunk of data. It waits for the previous chunk
+        to be downsampled, so after returning, the buffer of the previous chunk is free.
+        :param buffer: the raw AI data, shape (channels, N). It must not be modified until
+        the next call to submit() or wait().
+        :param acquired_n: number of samples acquired and processed before this chunk.
+        :param new_samples_n: number of samples to use from the buffer (<= N).
+        """
+        self.wait()
+        acq = self._acq_settings
+        self._futures = [
+            self._executor.submit(Acquirer._downsample_data, self._ai_data[c],
+                                  acq.res, acq.margin, acquired_n, acq.ai_osr,
+                                  buffer[c, :new_samples_n],
+                                  self._prev_samples_n[c], self._prev_samples_sum[c],
+                                  self._acc_dtype, True)
+            for c in range(self._ai_data.shape[0])
+        ]
+
+    def wait(self) -> None:
+        """
+        Wait until all the submitted data is downsampled.
+        :raise: any exception which happened during the downsampling
+        """
+        futures, self._futures = self._futures, []
+        for c, f in enumerate(futures):
+            self._prev_samples_n[c], self._prev_samples_sum[c] = f.result()
+
+
 class ActiveTTLManager:
     """
     Manage the "slow" TTL signals (digital output) to indicate the active state of a detector or
@@ -2528,9 +2616,16 @@ class Scanner(model.Emitter):
         self.dwellTime = model.FloatContinuous(min_dt, range_dwell,
                                                unit="s", setter=self._setDwellTime)
 
-        # Cached data for the waveforms
-        self._prev_settings = [None, None, None, None, None]  # resolution, scale, translation, margin, ao_osr
-        self._scan_array = None  # last scan array computed
+        # In spot mode (resolution 1x1), number of points acquired in a row, and
+        # sent as one DataArray of shape (N,), with MD_DIMS = "T" (if N > 1).
+        # The points are acquired back-to-back, so with a short dwell time, it
+        # allows to acquire continuously, instead of one point at a time.
+        self.spotBlockSize = model.IntContinuous(1, (1, MAX_SPOT_BLOCK_SIZE))
+        self.spotBlockSize.subscribe(self._on_setting_changed)
+
+        # Cached data for the waveforms, the most recently used last
+        # (resolution, scale, translation, margin, ao_osr) -> (scan array, ttl signal)
+        self._waveforms = OrderedDict()
         self._ao_osr = 1
         self._ai_osr = 1
         self._nrchans = 0
@@ -2866,29 +2961,57 @@ class Scanner(model.Emitter):
         # being exposed twice more than the others.
         margin = int(math.ceil(st / dwell_time - 0.01))
 
-        new_settings = [resolution, scale, translation, margin, ao_osr]
-        if self._prev_settings != new_settings:
-            self._update_raw_scan_array(resolution, scale, translation, margin, ao_osr)
-            self._prev_settings = new_settings
+        scan_array, ttl_signal = self._get_raw_waveforms(resolution, scale, translation, margin, ao_osr)
 
-        return (self._scan_array,
-                self._ttl_signal,
+        return (scan_array,
+                ttl_signal,
                 dwell_time,
                 ao_osr,
                 ai_osr,
                 resolution,
                 margin)
 
-    def _update_raw_scan_array(self, shape, scale, translation, margin, dup):
+    def _get_raw_waveforms(self, shape, scale, translation, margin, dup
+                           ) -> Tuple[numpy.ndarray, Optional[numpy.ndarray]]:
         """
-        Update the raw array of values to send to scan the 2D area.
+        Get the raw arrays of values to send to scan the 2D area, from the cache if they
+        have already been computed for the same settings.
+        The arrays returned must not be modified, as they might be returned again later.
+        See _compute_raw_waveforms() for the arguments and the returned values.
+        """
+        key = (tuple(shape), tuple(scale), tuple(translation), margin, dup)
+        try:
+            waveforms = self._waveforms[key]
+            self._waveforms.move_to_end(key)
+            return waveforms
+        except KeyError:
+            pass
+
+        waveforms = self._compute_raw_waveforms(shape, scale, translation, margin, dup)
+        self._waveforms[key] = waveforms
+
+        # Discard the least recently used waveforms, if there are too many
+        cache_size = sum(a.nbytes for wfs in self._waveforms.values() for a in wfs if a is not None)
+        while len(self._waveforms) > 1 and (len(self._waveforms) > WAVEFORM_CACHE_SIZE
+                                            or cache_size > WAVEFORM_CACHE_MAX_BYTES):
+            _, old_wfs = self._waveforms.popitem(last=False)
+            cache_size -= sum(a.nbytes for a in old_wfs if a is not None)
+
+        return waveforms
+
+    def _compute_raw_waveforms(self, shape, scale, translation, margin, dup
+                               ) -> Tuple[numpy.ndarray, Optional[numpy.ndarray]]:
+        """
+        Compute the raw arrays of values to send to scan the 2D area.
         :param shape: (list of 2 int): X/Y of the scanning area (slow, fast axis)
         :param scale: (tuple of 2 float): scaling of the pixels
         :param translation: (tuple of 2 float): shift from the center
         :param margin: (0<=int): number of additional pixels to add at the beginning of
             each scanned line
         :param dup: (1<=int): how many times each pixel should be duplicated
-        returns nothing, but update ._scan_array.
+        :returns:
+            scan_array: array of shape (2, N), dtype int16, the analog waveform
+            ttl_signal: array of shape (N*2), the digital signal, or None if no TTL
         """
         full_res = self._shape[:2]
         # adapt limits according to the scale and translation so that if scale
@@ -2941,13 +3064,13 @@ class Scanner(model.Emitter):
                       roi_limits[0], roi_limits[1], shape, margin)
 
         scan_array = self._generate_scan_array(shape, roi_limits_raw, margin, dup)
-        self._scan_array = scan_array.reshape(2, -1)  # flatten the YX+dup dimensions
+        scan_array = scan_array.reshape(2, -1)  # flatten the YX+dup dimensions
 
-        # ttl_signal = self._generate_signal_array(shape, margin, dup)
         ttl_signal = self._generate_signal_array_bits(shape, margin, dup)
         if ttl_signal is not None:
             ttl_signal = ttl_signal.ravel()  # flatten the YX+dup dimensions
-        self._ttl_signal = ttl_signal
+
+        return scan_array, ttl_signal
 
     @staticmethod
     def volt_to_raw(ao_channel: "AOChannel", volt: float) -> int:
@@ -2988,20 +3111,18 @@ class Scanner(model.Emitter):
         # prepare an array of the right type
         full_shape = (2, res[1], res[0] + margin, dup)
         scan = numpy.empty(full_shape, dtype=numpy.int16, order='C')  # TODO: is this alway this dtype? Use a get_ao_dtype()?
-        scan_dup = numpy.moveaxis(scan, 3, 0)  # Move dup to the back, to tell numpy everything needs to be copied
 
-        # fill the Y dimension, by copying the X over every Y value
-        # swap because we the broadcast rule is going to duplicate on the first dimension(s)
-        scany = scan_dup[:, 1, :, :].swapaxes(1, 2)
+        # All the lines are the same on the X dimension => compute one line, with the margin filled
+        # with the first pixel, and copy it over every Y value
         # Note: it's important that limits contain Python int's, and not numpy.uint's,
         # because with uint's, linspace() goes crazy when limits go high->low.
-        scany[:, :, :] = numpy.linspace(limits[1][0], limits[1][1], res[1])
-        # fill the X dimension
-        scan_dup[:, 0, :, margin:] = numpy.linspace(limits[0][0], limits[0][1], res[0])
+        line = numpy.empty((res[0] + margin, dup), dtype=numpy.int16)
+        line[margin:] = numpy.linspace(limits[0][0], limits[0][1], res[0])[:, numpy.newaxis]
+        line[:margin] = limits[0][0]
+        scan[0] = line
 
-        # fill the margin with the first pixel (X dimension is already filled)
-        if margin:
-            scan_dup[:, 0, :, :margin] = limits[0][0]
+        # Y is constant over a line
+        scan[1] = numpy.linspace(limits[1][0], limits[1][1], res[1])[:, numpy.newaxis, numpy.newaxis]
 
         return scan
 
@@ -3036,38 +3157,35 @@ class Scanner(model.Emitter):
         # than the dwell time, with half of the dwell time the pixel signal high
         # and half of the pixel signal the dwell time low. That's the slowest rate
         # that allows to distinguish each pixel.
-        full_shape = (res[1], 2 * (res[0] + margin), dup)
-        ttl_signal = numpy.empty(full_shape, dtype=dtype, order='C')
+        # All the lines are identical, except at the beginning and end of the frame. So first
+        # compute one line, with all the bits, and then copy it over every line.
         inactive_bitmap = sum(1 << port for port, inv in self._ttl_inverted.items() if inv)
-        ttl_signal[...] = inactive_bitmap
+        pixel_bits = dtype(sum(1 << c for c in self._pixel_ttl))
+        line_bits = dtype(sum(1 << c for c in self._line_ttl))
+        frame_bits = dtype(sum(1 << c for c in self._frame_ttl))
 
+        line = numpy.full((2 * (res[0] + margin), dup), inactive_bitmap, dtype=dtype)
         # Pixel: everything after the margin, is filled with alternating high/low
-        for c in self._pixel_ttl:
-            pixel_bit = dtype(1 << c)
-            ttl_signal[:, margin * 2::2, 0] ^= pixel_bit  # xor, to flip the bit
-
+        line[margin * 2::2, 0] ^= pixel_bits  # xor, to flip the bits
         # Line: everything after the margin is the line
-        # Special array view, with dup to as first dim, to tell numpy everything needs to be copied
-        ttl_signal_dup = numpy.moveaxis(ttl_signal, 2, 0)
-        for c in self._line_ttl:
-            line_bit = dtype(1 << c)
-            ttl_signal_dup[:, :, margin * 2:] ^= line_bit
-            # Special case when there is no margin: make it low as the end of the line, to get a transition
-            # TODO: if there is really some hardware that rely on the precise timing for line and frame
-            # signals, even on such special cases (eg, spot mode), that might not be good enough. We
-            # would need to increase the TTL rate to AI rate, so that the last value corresponds to a very
-            # short time.
-            if not margin:
-                ttl_signal_dup[-1, :, -1] ^= line_bit
-
+        line[margin * 2:] ^= line_bits
+        # Special case when there is no margin: make it low as the end of the line, to get a transition
+        # TODO: if there is really some hardware that rely on the precise timing for line and frame
+        # signals, even on such special cases (eg, spot mode), that might not be good enough. We
+        # would need to increase the TTL rate to AI rate, so that the last value corresponds to a very
+        # short time.
+        if not margin:
+            line[-1, -1] ^= line_bits
         # Frame: almost everywhere high, except for the margin of the first line
-        for c in self._frame_ttl:
-            frame_bit = dtype(1 << c)
-            frame_signal = ttl_signal_dup.reshape(dup, res[1] * 2 * (res[0] + margin))
-            frame_signal[:, margin * 2:] ^= frame_bit
-            # Special case when there is no margin: make it low as the end of the frame, to get a transition
-            if not margin:
-                frame_signal[-1, -1] ^= frame_bit
+        line ^= frame_bits
+
+        full_shape = (res[1], 2 * (res[0] + margin), dup)
+        ttl_signal = numpy.empty(full_shape, dtype=dtype, order='C')
+        ttl_signal[:] = line
+        ttl_signal[0, :margin * 2] ^= frame_bits
+        # Special case when there is no margin: make it low as the end of the frame, to get a transition
+        if not margin:
+            ttl_signal[-1, -1, -1] ^= frame_bits
 
         return ttl_signal
 
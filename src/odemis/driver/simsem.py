@@ -37,6 +37,9 @@ import threading
 import time
 import weakref
 
+# Maximum number of points acquired at once in spot mode
+MAX_SPOT_BLOCK_SIZE = 1000000
+
 
 class SimSEM(model.HwComponent):
     '''
@@ -208,6 +211,10 @@ class Scanner(model.Emitter):
 
         self.dwellTime = model.FloatContinuous(1e-06, (1e-06, 1000), unit="s")
 
+        # In spot mode (resolution 1x1), number of points acquired in a row, and
+        # sent as one DataArray of shape (N,), with MD_DIMS = "T" (if N > 1).
+        self.spotBlockSize = model.IntContinuous(1, (1, MAX_SPOT_BLOCK_SIZE))
+
         # VAs to control the ebeam, purely fake
         self.probeCurrent = model.FloatEnumerated(1.3e-9,
                           {0.1e-9, 1.3e-9, 2.6e-9, 3.4e-9, 11.564e-9, 23e-9},
@@ -458,6 +465,7 @@ class Detector(model.Detector):
             scale = scanner.scale.value
             res = scanner.resolution.value
             shi = scanner.shift.value
+            block = scanner.spotBlockSize.value if res == (1, 1) else 1
 
             phy_pos = metadata.get(model.MD_POS, (0, 0))
             trans = scanner.pixelToPhy(pxs_pos)
@@ -523,6 +531,12 @@ class Detector(model.Detector):
             metadata[model.MD_DWELL_TIME] = scanner.dwellTime.value
             metadata[model.MD_EBEAM_CURRENT] = scanner.probeCurrent.value
             metadata[model.MD_EBEAM_VOLTAGE] = scanner.accelVoltage.value
+
+            if block > 1:
+                # The same point, acquired multiple times in a row
+                sim_img = numpy.repeat(sim_img.reshape(1), block)
+                metadata[model.MD_DIMS] = "T"
+                metadata[model.MD_ACQ_DATE] -= block * scanner.dwellTime.value
             return model.DataArray(sim_img, metadata)
 
     def _acquire_thread(self, callback):
@@ -535,9 +549,12 @@ class Detector(model.Detector):
         try:
             first_frame = True
             while not self._acquisition_must_stop.is_set():
-                dwelltime = self.parent._scanner.dwellTime.value
-                resolution = self.parent._scanner.resolution.value
+                scanner = self.parent._scanner
+                dwelltime = scanner.dwellTime.value
+                resolution = scanner.resolution.value
                 duration = numpy.prod(resolution) * dwelltime
+                if resolution == (1, 1):
+                    duration *= scanner.spotBlockSize.value
                 if self._acquisition_must_stop.wait(duration):
                     break
                 # TODO: it's not a very proper simulation for multiple detectors,
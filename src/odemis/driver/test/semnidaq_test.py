@@ -28,7 +28,9 @@ logging.basicConfig(format="%(asctime)s  %(levelname)-7s %(module)s:%(lineno)d %
 
 import threading
 import time
+import types
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 from typing import Tuple
 
 import matplotlib
@@ -149,6 +151,35 @@ class EventReceiver:
         self.count += 1
 
 
+class FakeAnalogUnscaledReader:
+    """
+    Simulates the reading of the AI data, as nidaqmx.AnalogUnscaledReader, from a
+    pre-computed array of samples. It can return less samples than requested,
+    as the hardware does when the data is not yet available.
+    """
+    def __init__(self, samples: numpy.ndarray, read_sizes: Tuple[int, ...]):
+        """
+        :param samples: all the samples to be read, shape (channels, N)
+        :param read_sizes: maximum number of samples returned by each read, used cyclically
+        """
+        self._samples = samples
+        self._read_sizes = read_sizes
+        self._read_n = 0  # number of reads
+        self._pos = 0  # number of samples already read
+
+    def read_int16(self, data: numpy.ndarray, number_of_samples_per_channel: int) -> int:
+        assert data.shape == (self._samples.shape[0], number_of_samples_per_channel)
+        assert data.flags.c_contiguous
+        n = min(number_of_samples_per_channel,
+                self._read_sizes[self._read_n % len(self._read_sizes)],
+                self._samples.shape[1] - self._pos)
+        self._read_n += 1
+        data[...] = -1  # garbage, which should not be used
+        data[:, :n] = self._samples[:, self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+
 class TestAnalogSEM(unittest.TestCase):
 
     @classmethod
@@ -184,6 +215,7 @@ class TestAnalogSEM(unittest.TestCase):
         self.scanner.dwellTime.value = self.scanner.dwellTime.range[0]  # s
         self.scanner.scale.value = (8, 8)  # => res is 8x8 smaller than max res
         self.scanner.resolution.value = self.scanner.resolution.range[1]  # max res, limited to the scale (so, max / 8)
+        self.scanner.spotBlockSize.value = 1
 
         # for receive_image()
         self.expected_shape = tuple(self.scanner.resolution.value[::-1])
@@ -327,6 +359,38 @@ class TestAnalogSEM(unittest.TestCase):
         nb_transitions = numpy.sum(numpy.diff((ttl_array & self.frame_bit).astype(bool)))
         self.assertEqual(nb_transitions, 1)
 
+    def test_waveform_cache(self):
+        """
+        Check the waveforms are reused when going back to previous settings
+        """
+        scanner = self.scanner
+        scanner.scale.value = (8, 8)
+        scanner.resolution.value = scanner.resolution.range[1]
+        scan_array_full, ttl_array_full, *_ = scanner._get_scan_waveforms(1)
+
+        # Zoom in, and check the waveforms are different
+        scanner.scale.value = (1, 1)
+        scanner.resolution.value = (256, 256)
+        scan_array_zoom, ttl_array_zoom, *_ = scanner._get_scan_waveforms(1)
+        self.assertNotEqual(scan_array_zoom.shape, scan_array_full.shape)
+
+        # Zoom out => same waveforms as the first time
+        scanner.scale.value = (8, 8)
+        scanner.resolution.value = scanner.resolution.range[1]
+        scan_array, ttl_array, *_ = scanner._get_scan_waveforms(1)
+        self.assertIs(scan_array, scan_array_full)
+        self.assertIs(ttl_array, ttl_array_full)
+
+        # Too many different settings => the oldest ones are discarded
+        for i in range(semnidaq.WAVEFORM_CACHE_SIZE):
+            scanner.resolution.value = (128, 64 + i)
+            scanner._get_scan_waveforms(1)
+        self.assertLessEqual(len(scanner._waveforms), semnidaq.WAVEFORM_CACHE_SIZE)
+        scanner.resolution.value = scanner.resolution.range[1]
+        scan_array, *_ = scanner._get_scan_waveforms(1)
+        self.assertIsNot(scan_array, scan_array_full)
+        numpy.testing.assert_array_equal(scan_array, scan_array_full)
+
     def test_waveform_spot(self):
         """
         Check the waveform generated when scanning a single spot
@@ -377,6 +441,36 @@ class TestAnalogSEM(unittest.TestCase):
         nb_transitions = numpy.sum(numpy.diff((ttl_array & self.frame_bit).astype(bool)))
         self.assertEqual(nb_transitions, 1)
 
+    def test_spot_block(self):
+        """
+        Check the acquisition of a block of points at the same spot
+        """
+        self.scanner.dwellTime.value = 1e-3  # s
+        dt = self.scanner.dwellTime.value
+        self.scanner.scale.value = 1, 1
+        self.scanner.resolution.value = 1, 1
+        block = 10
+        self.scanner.spotBlockSize.value = block
+
+        start_t = time.time()
+        da = self.sed.data.get()
+        duration = time.time() - start_t
+        self.assertEqual(da.shape, (block,))
+        self.assertEqual(da.metadata[model.MD_DIMS], "T")
+        self.assertAlmostEqual(da.metadata[model.MD_DWELL_TIME], dt)
+        self.assertGreaterEqual(duration, dt * block)
+
+        # Also works with counting detectors
+        da = self.counter.data.get()
+        self.assertEqual(da.shape, (block,))
+        self.assertEqual(da.metadata[model.MD_DIMS], "T")
+
+        # Not a spot => the block size is ignored
+        self.scanner.resolution.value = 8, 8
+        da = self.sed.data.get()
+        self.assertEqual(da.shape, (8, 8))
+        self.assertNotIn(model.MD_DIMS, da.metadata)
+
     def test_find_best_dwell_time(self):
 
         # For small dwell times, it should essentially be rounded to 100ns
@@ -648,6 +742,88 @@ class TestAnalogSEM(unittest.TestCase):
         self.assertEqual(data[0, 0], buffer[margin])
         self.assertEqual(data[-1, -1], buffer[-1])
 
+    def test_downsample_parallel(self):
+        """
+        Check the downsampling in separate threads gives the same result as in a single thread
+        """
+        res = (100, 50)  # X, Y
+        margin = 7
+        osr = 13
+        n_channels = 3
+        acq_settings = types.SimpleNamespace(res=res, margin=margin, ai_osr=osr)
+        samples_n = res[1] * (res[0] + margin) * osr
+        rng = numpy.random.default_rng(0)
+        buffer = rng.integers(-2000, 2000, (n_channels, samples_n), dtype=numpy.int16)
+        acc_dtype = util.get_best_dtype_for_acc(buffer.dtype, osr)
+
+        exp_data = numpy.zeros((n_channels,) + res[::-1], dtype=numpy.int16)
+        for c in range(n_channels):
+            Acquirer._downsample_data(exp_data[c], res, margin, 0, osr, buffer[c], 0, 0, acc_dtype)
+
+        executor = ThreadPoolExecutor(max_workers=n_channels)
+        try:
+            for grain in (samples_n, 1001, 13 * 9):
+                data = numpy.zeros_like(exp_data)
+                downsampler = semnidaq.AIDownsampler(acq_settings, data, acc_dtype, executor)
+                # Use two buffers alternatively, as the Acquirer does
+                chunks = [numpy.empty((n_channels, grain), dtype=buffer.dtype) for _ in range(2)]
+                for i, acquired_n in enumerate(range(0, samples_n, grain)):
+                    n = min(grain, samples_n - acquired_n)
+                    chunk = chunks[i % 2]
+                    chunk[:, :n] = buffer[:, acquired_n:acquired_n + n]
+                    downsampler.submit(chunk, acquired_n, n)
+                downsampler.wait()
+                numpy.testing.assert_array_equal(data, exp_data)
+        finally:
+            executor.shutdown()
+
+    def test_read_ai_buffer(self):
+        """
+        Check reading a whole frame, chunk by chunk, with the data sometimes only partially
+        available, gives the same result as downsampling everything at once
+        """
+        res = (64, 40)  # X, Y
+        margin = 5
+        osr = 7
+        n_channels = 2
+        samples_n = res[1] * (res[0] + margin) * osr
+        acq_settings = types.SimpleNamespace(res=res, margin=margin, ai_osr=osr,
+                                             ai_samples_n=samples_n, ai_sample_rate=1e6)
+        rng = numpy.random.default_rng(1)
+        samples = rng.integers(-2000, 2000, (n_channels, samples_n), dtype=numpy.int16)
+        acc_dtype = util.get_best_dtype_for_acc(samples.dtype, osr)
+
+        exp_data = numpy.zeros((n_channels,) + res[::-1], dtype=numpy.int16)
+        for c in range(n_channels):
+            Acquirer._downsample_data(exp_data[c], res, margin, 0, osr, samples[c], 0, 0, acc_dtype)
+
+        # Only the attributes used by _read_ai_buffer()
+        acquirer = types.SimpleNamespace(_sem=types.SimpleNamespace(_gc_while_waiting=lambda t: None))
+        chunk_size = 1000
+        executor = ThreadPoolExecutor(max_workers=n_channels)
+        try:
+            # Full chunks, short reads (not a multiple of the pixel), and single samples
+            for read_sizes in ((chunk_size,), (chunk_size, 333, 1, chunk_size, 50)):
+                reader = FakeAnalogUnscaledReader(samples, read_sizes)
+                data = numpy.zeros_like(exp_data)
+                downsampler = semnidaq.AIDownsampler(acq_settings, data, acc_dtype, executor)
+                buffers = [numpy.empty((n_channels, chunk_size), dtype=samples.dtype) for _ in range(2)]
+                acquired_n = 0
+                chunk_n = 0
+                while acquired_n < samples_n:
+                    new_samples_n = Acquirer._read_ai_buffer(acquirer, acq_settings, reader,
+                                                             buffers[chunk_n % 2],
+                                                             acquired_n, downsampler)
+                    self.assertGreater(new_samples_n, 0)
+                    acquired_n += new_samples_n
+                    chunk_n += 1
+                downsampler.wait()
+
+                self.assertEqual(acquired_n, samples_n)
+                numpy.testing.assert_array_equal(data, exp_data)
+        finally:
+            executor.shutdown()
+
     def test_acquisition(self):
         # Fast acquisition, using synchronous acquisition
         self.scanner.dwellTime.value = 1.e-6  # s
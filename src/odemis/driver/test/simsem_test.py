@@ -240,6 +240,30 @@ class TestSEM(unittest.TestCase):
                                  "Scale = %g, res = %s gives shape %s" % (s, (r, r), im.shape)
                                  )
 
+    def test_spot_block(self):
+        """
+        In spot mode, with a block size > 1, the points should come as one block
+        """
+        self.scanner.resolution.value = (1, 1)
+        self.scanner.dwellTime.value = 10e-6  # s
+        self.scanner.spotBlockSize.value = 100
+        try:
+            start = time.time()
+            im = self.sed.data.get()
+            duration = time.time() - start
+        finally:
+            self.scanner.spotBlockSize.value = 1
+
+        self.assertEqual(im.shape, (100,))
+        self.assertEqual(im.metadata[model.MD_DIMS], "T")
+        self.assertGreaterEqual(duration, 100 * 10e-6)
+        self.assertLessEqual(im.metadata[model.MD_ACQ_DATE], start + 0.5)
+
+        # Back to a single point
+        im = self.sed.data.get()
+        self.assertEqual(im.shape, (1, 1))
+        self.assertNotIn(model.MD_DIMS, im.metadata)
+
     def test_roi(self):
         """
         check that .translation and .scale work
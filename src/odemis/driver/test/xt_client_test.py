@@ -25,12 +25,15 @@ import math
 import os
 import shutil
 import time
+import types
 import unittest
+import zlib
 
 import numpy
-from odemis import model
+from odemis import model, util
 
 from odemis.driver import xt_client
+from odemis.driver.test import xt_fake_server
 from odemis.model import ProgressiveFuture, NotSettableError
 from odemis.util import testing
 
@@ -396,6 +399,17 @@ class TestMicroscope(unittest.TestCase):
         max_res = self.scanner.shape
         return (max_res[0] / res[0],) * 2
 
+    def test_image_buffer(self):
+        """
+        Transferring the image as a buffer should give the same image as the standard transfer.
+        """
+        self.scanner.dwellTime.value = self.scanner.dwellTime.range[0]
+        self.detector.data.get()  # Make sure there is a latest image
+        image = self.microscope.get_latest_image(self.scanner.channel)
+        for compression in xt_client.IMAGE_COMPRESSIONS:
+            buf = self.microscope.get_latest_image_buffer(self.scanner.channel, compression)
+            numpy.testing.assert_array_equal(xt_client.decode_image_buffer(buf), image)
+
     def test_stop_acquisition(self):
         """Test stopping the acquisition of an image using the Detector."""
         init_dwell_time = self.scanner.dwellTime.value
@@ -458,6 +472,47 @@ class TestMicroscope(unittest.TestCase):
             press = self.chamber.pressure.value
             self.assertNotEqual(prev_press, press)
 
+    def test_get_settings(self):
+        """
+        Reading multiple settings at once should give the same values as reading them one at a time,
+        both with and without the server support.
+        """
+        getters = [("get_dwell_time", ()),
+                   ("get_ht_voltage", ()),
+                   ("get_rotation", ()),
+                   ("get_brightness", (self.scanner.channel,)),
+                   ]
+        expected = [self.microscope.get_dwell_time(),
+                    self.microscope.get_ht_voltage(),
+                    self.microscope.get_rotation(),
+                    self.microscope.get_brightness(self.scanner.channel),
+                    ]
+
+        batch_supported = self.microscope._batch_get_supported
+        try:
+            for supported in (True, False):
+                self.microscope._batch_get_supported = supported
+                values = self.microscope.get_settings(getters)
+                self.assertEqual(len(values), len(getters))
+                for v, e in zip(values, expected):
+                    self.assertAlmostEqual(v, e)
+        finally:
+            self.microscope._batch_get_supported = batch_supported
+
+    def test_polling_period(self):
+        """
+        The settings polling should speed up when a setting changes, and slow down when nothing changes.
+        """
+        init_rotation = self.scanner.rotation.value
+        try:
+            # Change the setting directly on the server, so that only the polling can detect it
+            self.microscope.set_rotation(init_rotation + 0.1)
+            time.sleep(xt_client.POLL_PERIOD_MAX + 1)
+            self.assertAlmostEqual(self.scanner.rotation.value, init_rotation + 0.1, places=3)
+            self.assertLess(self.scanner._va_poll.period, xt_client.POLL_PERIOD_MAX)
+        finally:
+            self.scanner.rotation.value = init_rotation
+
     def test_apply_auto_contrast_brightness(self):
         """
         Test for the auto contrast brightness functionality.
@@ -608,6 +663,208 @@ class TestMicroscope(unittest.TestCase):
         self.detector.contrast.value = init_contrast
 
 
+class TestPollingPeriod(unittest.TestCase):
+    """
+    Test the adjustment of the polling period (doesn't need a server).
+    """
+
+    def test_adapt(self):
+        timer = util.RepeatingTimer(xt_client.POLL_PERIOD_DEFAULT, lambda: None, "Test polling")
+        xt_client.adapt_polling_period(timer, changed=True)
+        self.assertEqual(timer.period, xt_client.POLL_PERIOD_MIN)
+
+        # Slows down progressively, up to the maximum
+        prev_period = timer.period
+        for i in range(20):
+            xt_client.adapt_polling_period(timer, changed=False)
+            self.assertGreaterEqual(timer.period, prev_period)
+            prev_period = timer.period
+        self.assertEqual(timer.period, xt_client.POLL_PERIOD_MAX)
+
+        xt_client.adapt_polling_period(timer, changed=True)
+        self.assertEqual(timer.period, xt_client.POLL_PERIOD_MIN)
+
+    def test_speed_up(self):
+        polls = []
+
+        def poll():
+            polls.append(time.time())
+
+        # The timer only keeps a weak reference to the callback
+        timer = util.RepeatingTimer(xt_client.POLL_PERIOD_MAX, poll, "Test polling")
+        timer.start()
+        try:
+            # A move should trigger a poll immediately, instead of at the end of the period
+            xt_client.speed_up_polling(timer)
+            self.assertEqual(timer.period, xt_client.POLL_PERIOD_MIN)
+            time.sleep(0.2)
+            self.assertEqual(len(polls), 1)
+        finally:
+            timer.cancel()
+
+
+class TestFakeServer(unittest.TestCase):
+    """
+    Test the calls to the server which reduce the number of calls, with a fake server
+    (doesn't need the xtadapter).
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = xt_fake_server.FakeXTServer()
+        cls.uri, cls.daemon = xt_fake_server.start_server(cls.server)
+        cls.legacy_server = xt_fake_server.LegacyXTServer()
+        cls.legacy_uri, cls.legacy_daemon = xt_fake_server.start_server(cls.legacy_server)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.daemon.shutdown()
+        cls.legacy_daemon.shutdown()
+
+    def test_get_settings(self):
+        getters = [("get_dwell_time", ()),
+                   ("get_ht_voltage", ()),
+                   ("get_rotation", ()),
+                   ("get_brightness", ("electron1",)),
+                   ]
+        self.server.set_rotation(0.25)
+        self.legacy_server.set_rotation(0.25)
+        expected = [self.server.get_dwell_time(),
+                    self.server.get_ht_voltage(),
+                    self.server.get_rotation(),
+                    self.server.get_brightness("electron1"),
+                    ]
+
+        # All read in a single call
+        client = xt_fake_server.create_client(self.uri)
+        self.server.calls.clear()
+        values = xt_client.SEM.get_settings(client, getters)
+        self.assertEqual(values, expected)
+        self.assertEqual(self.server.calls[0], "get_settings")
+        self.assertEqual(self.server.calls[1:], [n for n, a in getters])
+        self.assertTrue(client._batch_get_supported)
+
+        # Only the exposed methods can be called
+        with self.assertRaises(Exception):
+            xt_client.SEM.get_settings(client, [("_record", ("get_dwell_time",))])
+        self.assertTrue(client._batch_get_supported)  # Still supported after a server error
+
+        # Server without get_settings() => one call per setting
+        client = xt_fake_server.create_client(self.legacy_uri)
+        for i in range(2):
+            self.legacy_server.calls.clear()
+            values = xt_client.SEM.get_settings(client, getters)
+            self.assertEqual(values, expected)
+            self.assertEqual(self.legacy_server.calls, [n for n, a in getters])
+            self.assertFalse(client._batch_get_supported)
+
+    def test_update_settings(self):
+        """
+        The scanner settings are polled in one call, and the dwell time is only
+        read when the scan mode is not external.
+        """
+        client = xt_fake_server.create_client(self.uri)
+        client.get_settings = lambda getters: xt_client.SEM.get_settings(client, getters)
+        client.get_dwell_time = lambda: xt_client.SEM.get_settings(client, [("get_dwell_time", ())])[0]
+        # Just the attributes used by Scanner._updateSettings()
+        scanner = types.SimpleNamespace(
+            parent=client,
+            _has_detector=True,
+            _hfw_nomag=0.1,
+            _updateResolution=lambda: None,
+            external=model.BooleanVA(False),
+            dwellTime=model.FloatContinuous(1e-6, (1e-9, 1)),
+            accelVoltage=model.FloatContinuous(5000, (200, 30000)),
+            blanker=model.VAEnumerated(None, choices={True, False, None}),
+            spotSize=model.FloatContinuous(1, (0, 100)),
+            shift=model.TupleContinuous((0, 0), ((-1, -1), (1, 1))),
+            rotation=model.FloatContinuous(0, (-10, 10)),
+            horizontalFoV=model.FloatContinuous(1e-4, (1e-7, 1)),
+            magnification=model.FloatContinuous(1000, (1, 1e9)),
+        )
+        self.server.set_scan_mode("full_frame")
+        self.server.set_rotation(0)
+
+        self.server.calls.clear()
+        xt_client.Scanner._updateSettings(scanner)
+        self.assertEqual(self.server.calls.count("get_settings"), 1)
+        self.assertIn("get_dwell_time", self.server.calls)
+
+        # External => the dwell time is refused, but the other settings are updated
+        self.server.set_scan_mode("external")
+        self.server.set_rotation(0.5)
+        xt_client.Scanner._updateSettings(scanner)
+        self.assertTrue(scanner.external.value)
+        self.assertEqual(scanner.rotation.value, 0.5)
+
+        # Still external => dwell time not read anymore
+        self.server.calls.clear()
+        xt_client.Scanner._updateSettings(scanner)
+        self.assertEqual(self.server.calls.count("get_settings"), 1)
+        self.assertNotIn("get_dwell_time", self.server.calls)
+
+        # Back to full frame => the dwell time is read immediately
+        self.server.set_scan_mode("full_frame")
+        self.server._settings["dwell_time"] = 2e-6
+        xt_client.Scanner._updateSettings(scanner)
+        self.assertFalse(scanner.external.value)
+        self.assertEqual(scanner.dwellTime.value, 2e-6)
+
+    def test_image_buffer(self):
+        image = numpy.random.randint(0, 2 ** 16, (256, 512), dtype=numpy.uint16)
+        self.server.image = image
+        self.legacy_server.image = image
+
+        # Transferred as a buffer
+        client = xt_fake_server.create_client(self.uri)
+        for compression in xt_client.IMAGE_COMPRESSIONS:
+            self.server.calls.clear()
+            buf = xt_client.SEM.get_latest_image_buffer(client, "electron1", compression)
+            self.assertEqual(self.server.calls, ["get_latest_image_buffer"])
+            self.assertTrue(client._image_buffer_supported)
+            numpy.testing.assert_array_equal(xt_client.decode_image_buffer(buf), image)
+
+        # Server without get_latest_image_buffer() => standard transfer, but the
+        # image is only decoded by decode_image_buffer()
+        client = xt_fake_server.create_client(self.legacy_uri)
+        for compression in xt_client.IMAGE_COMPRESSIONS:
+            self.legacy_server.calls.clear()
+            buf = xt_client.SEM.get_latest_image_buffer(client, "electron1", compression)
+            self.assertEqual(self.legacy_server.calls, ["get_latest_image"])
+            self.assertFalse(client._image_buffer_supported)
+            self.assertNotIsInstance(buf, numpy.ndarray)
+            numpy.testing.assert_array_equal(xt_client.decode_image_buffer(buf), image)
+
+        # The proxy is back to normal
+        numpy.testing.assert_array_equal(xt_client.SEM.get_latest_image(client, "electron1"), image)
+
+        # Errors are raised immediately, in both cases
+        for uri in (self.uri, self.legacy_uri):
+            client = xt_fake_server.create_client(uri)
+            with self.assertRaises(ValueError):
+                xt_client.SEM.get_latest_image_buffer(client, "electron2")
+
+
+class TestImageBuffer(unittest.TestCase):
+    """
+    Test the decoding of the images transferred as buffer (doesn't need a server).
+    """
+
+    def test_decode(self):
+        image = numpy.random.randint(0, 2 ** 16, (256, 512), dtype=numpy.uint16)
+        for compression in xt_client.IMAGE_COMPRESSIONS:
+            data = image.tobytes()
+            if compression == "zlib":
+                data = zlib.compress(data, 1)
+            buf = {"data": data, "dtype": image.dtype.str, "shape": image.shape, "compression": compression}
+            decoded = xt_client.decode_image_buffer(buf)
+            numpy.testing.assert_array_equal(decoded, image)
+
+        buf = {"data": b"", "dtype": "u1", "shape": (0,), "compression": "lzma"}
+        with self.assertRaises(ValueError):
+            xt_client.decode_image_buffer(buf)
+
+
 class TestHelperMicroscope(TestMicroscope):
     """
     Test the SEM connection when it's used as an extra settings control for the analog scan control
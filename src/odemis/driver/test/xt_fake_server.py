@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+Created on 19 Oct 2026
+
+Copyright © 2026 Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms of the GNU
+General Public License as published by the Free Software Foundation, either version 2 of the License, or (at your
+option) any later version.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even
+the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for
+more details.
+
+You should have received a copy of the GNU General Public License along with Odemis. If not, see
+http://www.gnu.org/licenses/.
+"""
+# A minimal stand-in for the xtadapter server (which runs on the microscope PC),
+# to test and benchmark the xt_client and autoscript_client calls to the server,
+# without hardware nor the xtadapter simulator. It only provides a few settings,
+# and an image.
+
+import threading
+import types
+import zlib
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy
+import Pyro5.api
+
+# Also configures Pyro5 to use msgpack (with numpy support), as the real server
+from odemis.driver import xt_client
+
+
+class LegacyXTServer:
+    """
+    Server providing only the standard methods: one call per setting.
+    """
+
+    def __init__(self):
+        self.calls = []  # str: name of each method called, in order
+        self._settings = {"scan_mode": "full_frame",
+                          "dwell_time": 1e-6,
+                          "ht_voltage": 5000.0,
+                          "beam_is_blanked": False,
+                          "ebeam_spotsize": 3.0,
+                          "beam_shift": (0.0, 0.0),
+                          "rotation": 0.0,
+                          "scanning_size": (1e-4, 6.7e-5),
+                          "brightness": 0.5,
+                          }
+        # The image returned, whatever the channel
+        self.image = numpy.zeros((512, 512), dtype=numpy.uint16)
+        self.channels = {"electron1"}
+
+    def _record(self, name: str) -> None:
+        self.calls.append(name)
+
+    @Pyro5.api.expose
+    def get_software_version(self) -> str:
+        return "fake xtadapter"
+
+    @Pyro5.api.expose
+    def get_hardware_version(self) -> str:
+        return "fake microscope"
+
+    @Pyro5.api.expose
+    def get_scan_mode(self) -> str:
+        self._record("get_scan_mode")
+        return self._settings["scan_mode"]
+
+    @Pyro5.api.expose
+    def set_scan_mode(self, mode: str) -> None:
+        self._record("set_scan_mode")
+        self._settings["scan_mode"] = mode
+
+    @Pyro5.api.expose
+    def get_dwell_time(self) -> float:
+        self._record("get_dwell_time")
+        if self._settings["scan_mode"] == "external":
+            raise ValueError("Dwell time not available in external scan mode")
+        return self._settings["dwell_time"]
+
+    @Pyro5.api.expose
+    def get_ht_voltage(self) -> float:
+        self._record("get_ht_voltage")
+        return self._settings["ht_voltage"]
+
+    @Pyro5.api.expose
+    def beam_is_blanked(self) -> bool:
+        self._record("beam_is_blanked")
+        return self._settings["beam_is_blanked"]
+
+    @Pyro5.api.expose
+    def get_ebeam_spotsize(self) -> float:
+        self._record("get_ebeam_spotsize")
+        return self._settings["ebeam_spotsize"]
+
+    @Pyro5.api.expose
+    def get_beam_shift(self) -> Tuple[float, float]:
+        self._record("get_beam_shift")
+        return self._settings["beam_shift"]
+
+    @Pyro5.api.expose
+    def get_scanning_size(self) -> Tuple[float, float]:
+        self._record("get_scanning_size")
+        return self._settings["scanning_size"]
+
+    @Pyro5.api.expose
+    def get_rotation(self) -> float:
+        self._record("get_rotation")
+        return self._settings["rotation"]
+
+    @Pyro5.api.expose
+    def set_rotation(self, rotation: float) -> None:
+        self._record("set_rotation")
+        self._settings["rotation"] = rotation
+
+    @Pyro5.api.expose
+    def get_brightness(self, channel_name: str) -> float:
+        self._record("get_brightness")
+        return self._settings["brightness"]
+
+    def _check_channel(self, channel_name: str) -> None:
+        if channel_name not in self.channels:
+            raise ValueError("Unknown channel %s" % (channel_name,))
+
+    @Pyro5.api.expose
+    def get_latest_image(self, channel_name: str) -> numpy.ndarray:
+        self._record("get_latest_image")
+        self._check_channel(channel_name)
+        return self.image
+
+
+class FakeXTServer(LegacyXTServer):
+    """
+    Server also providing the methods to reduce the number of calls.
+    """
+
+    @Pyro5.api.expose
+    def get_settings(self, getters: Sequence[Tuple[str, Sequence[Any]]]) -> List[Any]:
+        """
+        Read multiple settings in a single call, as expected by SEM.get_settings().
+        :param getters: for each setting, the name of the getter method and its arguments.
+        :return: the value returned by each getter, in the same order.
+        """
+        self._record("get_settings")
+        values = []
+        for name, args in getters:
+            getter = getattr(self, name, None)
+            # Only allow the methods which could be called directly
+            if not getattr(getter, "_pyroExposed", False):
+                raise AttributeError("No getter %s" % (name,))
+            values.append(getter(*args))
+        return values
+
+    @Pyro5.api.expose
+    def get_latest_image_buffer(self, channel_name: str, compression: Optional[str] = None
+                                ) -> Dict[str, Any]:
+        """
+        Return the image as a buffer, as expected by SEM.get_latest_image_buffer().
+        :param compression: None for a raw buffer, or "zlib".
+        :return: the (possibly compressed) "data" bytes, with the "dtype", "shape"
+          and "compression" of the image.
+        """
+        self._record("get_latest_image_buffer")
+        self._check_channel(channel_name)
+        data = self.image.tobytes()
+        if compression == "zlib":
+            data = zlib.compress(data, 1)
+        elif compression is not None:
+            raise ValueError("Unsupported image compression %s" % (compression,))
+        return {"data": data,
+                "dtype": self.image.dtype.str,
+                "shape": self.image.shape,
+                "compression": compression,
+                }
+
+
+def start_server(server: LegacyXTServer) -> Tuple[str, Pyro5.api.Daemon]:
+    """
+    Serve the fake server on localhost, in a separate thread.
+    :param server: the server object.
+    :return: the URI of the server, and the Pyro daemon (call .shutdown() to stop it).
+    """
+    daemon = Pyro5.api.Daemon(host="localhost")
+    uri = daemon.register(server, "Microscope")
+    thread = threading.Thread(target=daemon.requestLoop, name="Fake XT server", daemon=True)
+    thread.start()
+    return str(uri), daemon
+
+
+def create_client(uri: str) -> types.SimpleNamespace:
+    """
+    Create an object with the attributes of a xt_client.SEM (or autoscript_client.SEM)
+    which are needed to call its methods communicating with the server (eg,
+    xt_client.SEM.get_settings(client, getters)). A real SEM cannot be created, as
+    the server doesn't provide all the settings needed by its children.
+    :param uri: the URI of the server.
+    """
+    server = Pyro5.api.Proxy(uri)
+    polling_server = Pyro5.api.Proxy(uri)
+    return types.SimpleNamespace(server=server,
+                                 _proxy_access=threading.Lock(),
+                                 _polling_server=polling_server,
+                                 _polling_access=threading.Lock(),
+                                 _batch_get_supported=True,
+                                 _image_buffer_supported=True,
+                                 )
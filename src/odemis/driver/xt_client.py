@@ -27,11 +27,14 @@ import re
 import threading
 import time
 import zipfile
+import zlib
 from concurrent import futures
 from concurrent.futures import CancelledError
-from typing import Any, Dict, Optional, Set, Tuple, Union
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple, Union
 
 import Pyro5.api
+import Pyro5.protocol
+import Pyro5.serializers
 import msgpack_numpy
 import notify2
 import numpy
@@ -79,6 +82,89 @@ RESOLUTIONS = (
 # Xtadapter debian package installation directory which contains xtadapter's zip files
 XT_INSTALL_DIR = "/usr/share/xtadapter"
 
+# Period of the polling of the settings. It starts at POLL_PERIOD_DEFAULT, is
+# reduced to POLL_PERIOD_MIN as soon as a setting changes (eg, during a move),
+# and is progressively increased up to POLL_PERIOD_MAX when nothing changes.
+POLL_PERIOD_DEFAULT = 5  # s
+POLL_PERIOD_MIN = 1  # s
+POLL_PERIOD_MAX = 10  # s
+POLL_PERIOD_BACKOFF = 1.5  # ratio to increase the period when nothing changed
+
+# Compression methods supported for transferring the image as a raw buffer
+IMAGE_COMPRESSIONS = {None, "zlib"}
+
+
+def adapt_polling_period(timer: util.RepeatingTimer, changed: bool) -> None:
+    """
+    Adjust the period of a polling timer, so that it polls often when the settings
+    change, and less often when they stay the same.
+    :param timer: the timer calling the polling function.
+    :param changed: True if any setting changed during the latest poll.
+    """
+    if changed:
+        timer.period = POLL_PERIOD_MIN
+    else:
+        timer.period = min(timer.period * POLL_PERIOD_BACKOFF, POLL_PERIOD_MAX)
+
+
+def speed_up_polling(timer: util.RepeatingTimer) -> None:
+    """
+    Poll immediately, and then at the fastest rate, typically because a move has just
+    started. Without waking up the timer, the new period would only be used after the
+    end of the current period (which can be up to POLL_PERIOD_MAX).
+    :param timer: the timer calling the polling function.
+    """
+    timer.period = POLL_PERIOD_MIN
+    timer.wakeup()
+
+
+def decode_raw_response(msg: Pyro5.protocol.ReceivingMessage) -> Any:
+    """
+    Deserialize the response of a Pyro call done with _pyroRawWireResponse set.
+    :param msg: the raw response.
+    :return: the value returned by the server.
+    :raises: the exception raised by the server, if the call failed.
+    """
+    serializer = Pyro5.serializers.serializers_by_id[msg.serializer_id]
+    data = serializer.loads(msg.data)
+    if msg.flags & Pyro5.protocol.FLAGS_EXCEPTION:
+        raise data
+    return data
+
+
+def decode_image_buffer(buf: Union[Dict[str, Any], Pyro5.protocol.ReceivingMessage]) -> numpy.ndarray:
+    """
+    Convert an image transferred as a raw buffer into a numpy array.
+    :param buf: as returned by SEM.get_latest_image_buffer(): the (possibly
+      compressed) "data" bytes, with the "dtype", "shape" and "compression" of the image,
+      or the raw (not yet deserialized) response of the server.
+    :return: the image.
+    """
+    if isinstance(buf, Pyro5.protocol.ReceivingMessage):
+        return decode_raw_response(buf)
+
+    data = buf["data"]
+    if buf["compression"] == "zlib":
+        data = zlib.decompress(data)
+    elif buf["compression"] is not None:
+        raise ValueError("Unsupported image compression %s" % (buf["compression"],))
+    return numpy.frombuffer(data, dtype=buf["dtype"]).reshape(buf["shape"])
+
+
+def update_va_value(va: model.VigilantAttribute, value: Any) -> bool:
+    """
+    Update the value of a VA with the value read from the hardware, without
+    calling the setter (to avoid sending it back to the hardware).
+    :param va: the VA to update.
+    :param value: the current value, as read from the hardware.
+    :return: True if the value changed.
+    """
+    if value == va.value:
+        return False
+    va._value = value
+    va.notify(value)
+    return True
+
 
 class Package(object):
     """
@@ -275,9 +361,16 @@ class SEM(model.HwComponent):
 
         model.HwComponent.__init__(self, name, role, daemon=daemon, **kwargs)
         self._proxy_access = threading.Lock()
+        # The polling of the settings uses a separate connection, so that it
+        # never delays the other calls (eg, during an acquisition)
+        self._polling_access = threading.Lock()
+        self._batch_get_supported = True  # Set to False if the server doesn't have get_settings()
+        self._image_buffer_supported = True  # Set to False if the server doesn't have get_latest_image_buffer()
         try:
             self.server = Pyro5.api.Proxy(address)
             self.server._pyroTimeout = 30  # seconds
+            self._polling_server = Pyro5.api.Proxy(address)
+            self._polling_server._pyroTimeout = 30  # seconds
             self._swVersion = self.server.get_software_version()
             self._hwVersion = self.server.get_hardware_version()
             if "adapter; autoscript" in self._swVersion:
@@ -355,6 +448,35 @@ class SEM(model.HwComponent):
                 self._detector = Detector(parent=self, daemon=daemon, **ckwargs)
             self.children.value.add(self._detector)
 
+    def get_settings(self, getters: Sequence[Tuple[str, tuple]]) -> List[Any]:
+        """
+        Read multiple settings at once, typically to poll them. It uses a separate
+        connection to the server, so it doesn't delay (and is not delayed by) the
+        other calls.
+        If the server supports it, all the settings are read in a single call to
+        its get_settings() method, which calls each getter in order and returns
+        the list of the values. Otherwise, the getters are called one at a time.
+
+        :param getters: for each setting, the name of the getter method on the
+            server (eg, "get_dwell_time") and its arguments.
+        :return: the values, in the same order as the getters.
+        """
+        with self._polling_access:
+            self._polling_server._pyroClaimOwnership()
+            if self._batch_get_supported:
+                try:
+                    get_settings = self._polling_server.get_settings
+                except AttributeError:
+                    # Pyro raises AttributeError if the method is not exposed by the server
+                    logging.info("Server doesn't support reading multiple settings at once, "
+                                 "will read them one at a time")
+                    self._batch_get_supported = False
+                else:
+                    # Any error raised by the server is passed as-is
+                    return get_settings(list(getters))
+
+            return [getattr(self._polling_server, n)(*args) for n, args in getters]
+
     def transfer_latest_package(self, data: bytes) -> None:
         """
         Transfer a (new) xtadapter package.
@@ -445,6 +567,49 @@ class SEM(model.HwComponent):
             image = self.server.get_latest_image(channel_name)
             return image
 
+    def get_latest_image_buffer(self, channel_name: str, compression: Optional[str] = None
+                                ) -> Union[Dict[str, Any], Pyro5.protocol.ReceivingMessage]:
+        """
+        Acquire an image observed via the currently set channel, without decoding
+        it, so that it can be decoded later, in another thread, with decode_image_buffer().
+        The server returns a dict with the raw (and optionally compressed) "data"
+        bytes, and the "dtype", "shape" and "compression" of the image.
+        If the server doesn't support it, it falls back to get_latest_image(), but
+        returns the response of the server before it's deserialized.
+
+        Note: the channel needs to be stopped before an image can be acquired.
+
+        :param compression: None for a raw buffer, or "zlib".
+        :return: the image as a buffer, or as a raw Pyro response if the server
+          doesn't support raw buffers.
+        """
+        if compression not in IMAGE_COMPRESSIONS:
+            raise ValueError("Unsupported image compression %s" % (compression,))
+
+        with self._proxy_access:
+            self.server._pyroClaimOwnership()
+            if self._image_buffer_supported:
+                try:
+                    # Pyro raises AttributeError if the method is not exposed by the server
+                    get_buffer = self.server.get_latest_image_buffer
+                except AttributeError:
+                    logging.info("Server doesn't support transferring the image as a buffer, "
+                                 "will use the standard image transfer")
+                    self._image_buffer_supported = False
+                else:
+                    return get_buffer(channel_name, compression)
+
+            self.server._pyroRawWireResponse = True
+            try:
+                msg = self.server.get_latest_image(channel_name)
+            finally:
+                self.server._pyroRawWireResponse = False
+
+        # Report errors immediately, as with the standard call
+        if msg.flags & Pyro5.protocol.FLAGS_EXCEPTION:
+            decode_raw_response(msg)
+        return msg
+
     def set_scan_mode(self, mode: str) -> None:
         """
         Set the scan mode.
@@ -1474,63 +1639,81 @@ class Scanner(model.Emitter):
 
         # Refresh regularly the values, from the hardware, starting from now
         self._updateSettings()
-        self._va_poll = util.RepeatingTimer(5, self._updateSettings, "Settings polling")
+        self._va_poll = util.RepeatingTimer(POLL_PERIOD_DEFAULT, self._pollSettings, "Settings polling")
         self._va_poll.start()
 
-    def _updateSettings(self) -> None:
+    def _pollSettings(self) -> None:
+        """
+        Called regularly to update the VAs, and adjust the polling period
+        """
+        changed = self._updateSettings()
+        adapt_polling_period(self._va_poll, changed)
+
+    def _updateSettings(self) -> bool:
         """
         Read all the current settings from the SEM and reflects them on the VAs
+        :return: True if any setting changed
         """
         logging.debug("Updating SEM settings")
         try:
-            external = self._isExternal()
-            if external != self.external.value:
-                self.external._value = external
-                self.external.notify(external)
-            # Read dwellTime and resolution settings from the SEM and reflects them on the VAs only
+            # Read all the settings at once. The dwell time is only needed when the
+            # scan mode is not external. As the scan mode is read at the same time,
+            # rely on the scan mode found at the previous poll.
+            getters = [("get_scan_mode", ()),
+                       ("get_ht_voltage", ()),
+                       ("beam_is_blanked", ()),
+                       ("get_ebeam_spotsize", ()),
+                       ("get_beam_shift", ()),
+                       ("get_rotation", ()),
+                       ("get_scanning_size", ()),
+                       ]
+            read_dwell_time = self._has_detector and not self.external.value
+            if read_dwell_time:
+                try:
+                    values = self.parent.get_settings(getters + [("get_dwell_time", ())])
+                except Exception:
+                    # The scan mode might have just changed to external => read the other settings
+                    logging.debug("Failed to read the settings with the dwell time, will read them without",
+                                  exc_info=True)
+                    read_dwell_time = False
+            if not read_dwell_time:
+                values = self.parent.get_settings(getters)
+            scan_mode, voltage, blanked, spot_size, beam_shift, rotation, scanning_size = values[:7]
+
+            changed = update_va_value(self.external, scan_mode.lower() == "external")
+            # Reflects dwellTime and resolution settings on the VAs only
             # when external is False i.e. the scan mode is 'full_frame'.
             # If external is True i.e. the scan mode is 'external' the dwellTime and resolution are
             # disabled and hence no need to reflect settings on the VAs.
             if self._has_detector and not self.external.value:
-                dwell_time = self.parent.get_dwell_time()
-                if dwell_time != self.dwellTime.value:
-                    self.dwellTime._value = dwell_time
-                    self.dwellTime.notify(dwell_time)
+                # If the scan mode just changed, the dwell time hasn't been read yet
+                dwell_time = values[7] if read_dwell_time else self.parent.get_dwell_time()
+                if update_va_value(self.dwellTime, dwell_time):
                     self._updateResolution()
-            voltage = self.parent.get_ht_voltage()
+                    changed = True
             v_range = self.accelVoltage.range
             if not v_range[0] <= voltage <= v_range[1]:
                 logging.info("Voltage {} V is outside of range {}, clipping to nearest value.".format(voltage, v_range))
                 voltage = self.accelVoltage.clip(voltage)
-            if voltage != self.accelVoltage.value:
-                self.accelVoltage._value = voltage
-                self.accelVoltage.notify(voltage)
-            blanked = self.parent.beam_is_blanked()  # blanker status on the HW
+            changed |= update_va_value(self.accelVoltage, voltage)
             # if blanker is in auto mode (None), don't care about HW status (self-regulated)
-            if self.blanker.value is not None and blanked != self.blanker.value:
-                self.blanker._value = blanked
-                self.blanker.notify(blanked)
-            spot_size = self.parent.get_ebeam_spotsize()
-            if spot_size != self.spotSize.value:
-                self.spotSize._value = spot_size
-                self.spotSize.notify(spot_size)
-            beam_shift = self.parent.get_beam_shift()
-            if beam_shift != self.shift.value:
-                self.shift._value = beam_shift
-                self.shift.notify(beam_shift)
-            rotation = self.parent.get_rotation()
-            if rotation != self.rotation.value:
-                self.rotation._value = rotation
-                self.rotation.notify(rotation)
-            fov = self.parent.get_scanning_size()[0]
+            if self.blanker.value is not None:
+                changed |= update_va_value(self.blanker, blanked)
+            changed |= update_va_value(self.spotSize, spot_size)
+            changed |= update_va_value(self.shift, tuple(beam_shift))
+            changed |= update_va_value(self.rotation, rotation)
+            fov = scanning_size[0]
             if fov != self.horizontalFoV.value:
                 self.horizontalFoV._value = fov
                 mag = self._hfw_nomag / fov
                 self.magnification._value = mag
                 self.horizontalFoV.notify(fov)
                 self.magnification.notify(mag)
+                changed = True
+            return changed
         except Exception:
             logging.exception("Unexpected failure when polling settings")
+            return False
 
     def _setScale(self, value: Tuple[float, float]) -> Tuple[float, float]:
         """
@@ -1746,7 +1929,12 @@ class Detector(model.Detector):
     is captured.
     """
 
-    def __init__(self, name: str, role: str, parent: model.HwComponent, **kwargs) -> None:
+    def __init__(self, name: str, role: str, parent: model.HwComponent,
+                 transfer_compression: Optional[str] = None, **kwargs) -> None:
+        """
+        :param transfer_compression: compression used to transfer the images from
+          the server: None (raw) or "zlib". Compression is only worthy on slow networks.
+        """
         # The acquisition is based on a FSM that roughly looks like this:
         # Event\State |    Stopped    |   Acquiring    | Receiving data |
         #    START    | Ready for acq |        .       |       .        |
@@ -1754,6 +1942,11 @@ class Detector(model.Detector):
         #    STOP     |       .       |     Stopped    |    Stopped     |
         #    TERM     |     Final     |      Final     |     Final      |
 
+        if transfer_compression not in IMAGE_COMPRESSIONS:
+            raise ValueError("transfer_compression must be one of %s, but got %s" %
+                             (IMAGE_COMPRESSIONS, transfer_compression))
+        self._transfer_compression = transfer_compression
+
         model.Detector.__init__(self, name, role, parent=parent, **kwargs)
         self._shape = (256,)  # Depth of the image
         self.data = SEMDataFlow(self)
@@ -1786,10 +1979,14 @@ class Detector(model.Detector):
 
         self._genmsg = queue.Queue()  # GEN_*
         self._generator = None
+        # To decode and notify the image, while the next one is already being scanned.
+        # Only one worker, so that the images are notified in order.
+        self._notifier = futures.ThreadPoolExecutor(max_workers=1)
+        self._notify_future = model.InstantaneousFuture()  # latest image to be notified
 
         # Refresh regularly the values, from the hardware, starting from now
         self._updateSettings()
-        self._va_poll = util.RepeatingTimer(5, self._updateSettings, "Settings polling detector")
+        self._va_poll = util.RepeatingTimer(POLL_PERIOD_DEFAULT, self._pollSettings, "Settings polling detector")
         self._va_poll.start()
 
     def terminate(self) -> None:
@@ -1798,6 +1995,7 @@ class Detector(model.Detector):
             self._genmsg.put(GEN_TERM)
             self._generator.join(5)
             self._generator = None
+        self._notifier.shutdown(wait=True)
 
     def start_generate(self) -> None:
         self._genmsg.put(GEN_START)
@@ -1857,12 +2055,12 @@ class Detector(model.Detector):
                         self.stop_acquisition()
                         break
 
-                    # Retrieve the image
-                    image = self.parent.get_latest_image(self._scanner.channel)
+                    # Retrieve the image, and let it be decoded and notified while
+                    # the next image is being scanned.
+                    image = self.parent.get_latest_image_buffer(self._scanner.channel,
+                                                                self._transfer_compression)
                     md.update(self._metadata)
-                    da = DataArray(image, md)
-                    logging.debug("Notify dataflow with new image.")
-                    self.data.notify(da)
+                    self._notifyImage(image, md)
             logging.debug("Acquisition stopped")
         except TerminationRequested:
             logging.debug("Acquisition thread requested to terminate")
@@ -1871,6 +2069,27 @@ class Detector(model.Detector):
         finally:
             self._generator = None
 
+    def _notifyImage(self, image: Union[Dict[str, Any], Pyro5.protocol.ReceivingMessage],
+                     md: Dict[str, Any]) -> None:
+        """
+        Schedule the decoding of the image and its notification on the dataflow.
+        To bound the memory usage, it waits first for the previous image to be notified.
+
+        :param image: as returned by SEM.get_latest_image_buffer()
+        :param md: metadata of the image
+        """
+        self._notify_future.result()
+        self._notify_future = self._notifier.submit(self._decodeAndNotify, image, md)
+
+    def _decodeAndNotify(self, image: Union[Dict[str, Any], Pyro5.protocol.ReceivingMessage],
+                         md: Dict[str, Any]) -> None:
+        try:
+            da = DataArray(decode_image_buffer(image), md)
+            logging.debug("Notify dataflow with new image.")
+            self.data.notify(da)
+        except Exception:
+            logging.exception("Failed to decode image")
+
     def stop_acquisition(self) -> None:
         """
         Stop acquiring images.
@@ -1980,18 +2199,29 @@ class Detector(model.Detector):
 
         return scanner_name
 
-    def _updateSettings(self) -> None:
+    def _pollSettings(self) -> None:
+        """
+        Called regularly to update the VAs, and adjust the polling period
+        """
+        try:
+            changed = self._updateSettings()
+        except Exception:
+            logging.exception("Unexpected failure when polling detector settings")
+            changed = False
+        adapt_polling_period(self._va_poll, changed)
+
+    def _updateSettings(self) -> bool:
         """
         Reads all the current settings from the Detector and reflects them on the VAs
+        :return: True if any setting changed
         """
-        brightness = self.parent.get_brightness(self._scanner.channel)
-        if brightness != self.brightness.value:
-            self.brightness._value = brightness
-            self.brightness.notify(brightness)
-        contrast = self.parent.get_contrast(self._scanner.channel)
-        if contrast != self.contrast.value:
-            self.contrast._value = contrast
-            self.contrast.notify(contrast)
+        channel = self._scanner.channel
+        brightness, contrast = self.parent.get_settings([("get_brightness", (channel,)),
+                                                         ("get_contrast", (channel,)),
+                                                         ])
+        changed = update_va_value(self.brightness, brightness)
+        changed |= update_va_value(self.contrast, contrast)
+        return changed
 
     def _setBrightness(self, brightness: float) -> float:
         self.parent.set_brightness(brightness, self._scanner.channel)
@@ -2081,7 +2311,7 @@ class Chamber(model.Actuator):
         self.pressure = model.FloatContinuous(info["range"][0], info["range"], readonly=True, unit=info["unit"])
         self._refreshPressure()
 
-        self._polling_thread = util.RepeatingTimer(5, self._refreshPressure, "Pressure polling")
+        self._polling_thread = util.RepeatingTimer(POLL_PERIOD_DEFAULT, self._pollPressure, "Pressure polling")
         self._polling_thread.start()
 
         self._executor = CancellableThreadPoolExecutor(max_workers=1)
@@ -2115,14 +2345,32 @@ class Chamber(model.Actuator):
             self.parent.vent()
         self._refreshPressure()
 
-    def _refreshPressure(self) -> None:
+    def _pollPressure(self) -> None:
+        """
+        Called regularly to update the pressure, and adjust the polling period
+        """
+        try:
+            changed = self._refreshPressure()
+        except Exception:
+            logging.exception("Unexpected failure when polling pressure")
+            changed = False
+        adapt_polling_period(self._polling_thread, changed)
+
+    def _refreshPressure(self) -> bool:
+        """
+        Read the vacuum state and pressure, and update the VAs
+        :return: True if the vacuum state or the pressure changed
+        """
+        state, pressure = self.parent.get_settings([("get_vacuum_state", ()),
+                                                    ("get_pressure", ()),
+                                                    ])
+        prev_pressure = self.pressure.value
         # Position (vacuum state)
-        state = self.parent.get_vacuum_state()
         val = {"vacuum": PRESSURE_PUMPED if state == "vacuum" else PRESSURE_VENTED}
+        changed = val != self.position.value
         self.position._set_value(val, force_write=True)
 
         # Pressure
-        pressure = self.parent.get_pressure()
         if pressure != -1:  # -1 is returned when the chamber is vented
             self.pressure._set_value(pressure, force_write=True)
             logging.debug("Updated chamber pressure, %s Pa, vacuum state %s.", pressure, val["vacuum"])
@@ -2130,6 +2378,9 @@ class Chamber(model.Actuator):
             pressure = 100e3  # ambient pressure, Pa
             self.pressure._set_value(pressure, force_write=True)
             logging.warning("Couldn't read pressure value, assuming ambient pressure %s.", pressure)
+        # The pressure reading is noisy, so only consider it changed when it's significantly different
+        changed |= not util.almost_equal(pressure, prev_pressure, rtol=0.05)
+        return changed
 
     def terminate(self) -> None:
         self._polling_thread.cancel()
@@ -2228,7 +2479,7 @@ class Stage(model.Actuator):
         self._switch_coordinate_system(raw_coordinates)
 
         # Refresh regularly the position
-        self._pos_poll = util.RepeatingTimer(5, self._refreshPosition, "Stage position polling")
+        self._pos_poll = util.RepeatingTimer(POLL_PERIOD_DEFAULT, self._refreshPosition, "Stage position polling")
         self._pos_poll.start()
 
     def _switch_coordinate_system(self, raw_coordinates: bool) -> None:
@@ -2260,12 +2511,13 @@ class Stage(model.Actuator):
                 # Do not raise an error if non-raw coordinates are requested, because non-raw is the default in old
                 # versions of the xtadapter
 
-    def _updatePosition(self) -> None:
+    def _updatePosition(self) -> bool:
         """
         update the position VA
+        :return: True if the position changed
         """
         old_pos = self.position.value
-        pos = self._getPosition()
+        pos = self._getPosition(self.parent.get_settings([("get_stage_position", ())])[0])
         if self._raw_coordinates:
             # correct for the offset such that the stage coordinates displayed in
             # TFS software is the same as Odemis
@@ -2274,6 +2526,8 @@ class Stage(model.Actuator):
         self.position._set_value(self._applyInversion(pos), force_write=True)
         if old_pos != self.position.value:
             logging.debug("Updated position to %s", self.position.value)
+            return True
+        return False
 
     def _refreshPosition(self) -> None:
         """
@@ -2283,13 +2537,19 @@ class Stage(model.Actuator):
         # set request
         logging.debug("Updating SEM stage position")
         try:
-            self._updatePosition()
+            changed = self._updatePosition()
         except Exception:
             logging.exception("Unexpected failure when updating position")
+            changed = False
+        adapt_polling_period(self._pos_poll, changed)
 
-    def _getPosition(self) -> Dict[str, float]:
-        """Get position and translate the axes names to be Odemis compatible."""
-        pos = self.parent.get_stage_position()
+    def _getPosition(self, pos: Optional[Dict[str, float]] = None) -> Dict[str, float]:
+        """
+        Get position and translate the axes names to be Odemis compatible.
+        :param pos: the position as reported by the server. If None, it is read.
+        """
+        if pos is None:
+            pos = self.parent.get_stage_position()
         pos["rx"] = pos.pop("t")
         pos["rz"] = pos.pop("r")
         # Make sure the full rotations are within the range (because the SEM
@@ -2328,6 +2588,7 @@ class Stage(model.Actuator):
                 orig_pos = self.parent.get_stage_position()
 
                 self.parent.move_stage(pos, rel=rel)
+                speed_up_polling(self._pos_poll)  # Follow the move closely
                 time.sleep(0.1)  # It takes a little while before the stage is being reported as moving
 
                 # Get the target position in absolute coordinates
@@ -2558,7 +2819,7 @@ class Focus(model.Actuator):
                              "An ebeam or multi-beam scanner is a required child component for the Focus class")
 
         # Refresh regularly the position
-        self._pos_poll = util.RepeatingTimer(5, self._refreshPosition, "Focus position polling")
+        self._pos_poll = util.RepeatingTimer(POLL_PERIOD_DEFAULT, self._refreshPosition, "Focus position polling")
         self._pos_poll.start()
 
     @isasync
@@ -2620,12 +2881,15 @@ class Focus(model.Actuator):
                 logging.warning("Failed to cancel autofocus: %s", error_msg)
                 return False
 
-    def _updatePosition(self) -> None:
+    def _updatePosition(self) -> bool:
         """
         update the position VA
+        :return: True if the position changed
         """
-        z = self.parent.get_free_working_distance()
+        z = self.parent.get_settings([("get_free_working_distance", ())])[0]
+        changed = self.position.value != {"z": z}
         self.position._set_value({"z": z}, force_write=True)
+        return changed
 
     def _refreshPosition(self) -> None:
         """
@@ -2635,9 +2899,11 @@ class Focus(model.Actuator):
         # set request
         logging.debug("Updating SEM focus position")
         try:
-            self._updatePosition()
+            changed = self._updatePosition()
         except Exception:
             logging.exception("Unexpected failure when updating position")
+            changed = False
+        adapt_polling_period(self._pos_poll, changed)
 
     def _doMoveRel(self, foc: float) -> None:
         """
@@ -2648,6 +2914,7 @@ class Focus(model.Actuator):
         try:
             foc += self.parent.get_free_working_distance()
             self.parent.set_free_working_distance(foc)
+            speed_up_polling(self._pos_poll)  # Follow the next changes closely
         finally:
             # Update the position, even if the move didn't entirely succeed
             self._updatePosition()
@@ -2660,6 +2927,7 @@ class Focus(model.Actuator):
         """
         try:
             self.parent.set_free_working_distance(foc)
+            speed_up_polling(self._pos_poll)  # Follow the next changes closely
         finally:
             # Update the position, even if the move didn't entirely succeed
             self._updatePosition()
@@ -2824,57 +3092,44 @@ class MultiBeamScanner(Scanner):
             f = self._executor.submitf(f, self.parent.start_autostig)
         return f
 
-    def _updateSettings(self) -> None:
+    def _updateSettings(self) -> bool:
         """
         Read all the current settings from the SEM and reflects them on the VAs
+        :return: True if any setting changed
         """
         # TODO When the new approach of adding update function to a list is implemented in xt_client.py instead of
         #  overwriting the method updateSettings the method _updateMBSettings can be added to the list of
         #  functions to be updated. That means the overwritten part in this class is no longer needed.
 
         # Polling XT client settings
-        super(MultiBeamScanner, self)._updateSettings()
+        changed = super(MultiBeamScanner, self)._updateSettings()
         # Polling XTtoolkit settings
         try:
             self._updateHFWRange()
-            delta_pitch = self.parent.get_delta_pitch() * 1e-6
-            if delta_pitch != self.deltaPitch.value:
-                self.deltaPitch._value = delta_pitch
-                self.deltaPitch.notify(delta_pitch)
-            beam_stigmator = self.parent.get_stigmator()
-            if beam_stigmator != self.beamStigmator.value:
-                self.beamStigmator._value = beam_stigmator
-                self.beamStigmator.notify(beam_stigmator)
-            pattern_stigmator = self.parent.get_pattern_stigmator()
-            if pattern_stigmator != self.patternStigmator.value:
-                self.patternStigmator._value = pattern_stigmator
-                self.patternStigmator.notify(pattern_stigmator)
-            beam_shift_transformation_matrix = self.parent.get_dc_coils()
-            if beam_shift_transformation_matrix != self.beamShiftTransformationMatrix.value:
-                self.beamShiftTransformationMatrix._value = beam_shift_transformation_matrix
-                self.beamShiftTransformationMatrix.notify(beam_shift_transformation_matrix)
-            mpp_rotation = math.radians(self.parent.get_mpp_orientation())
-            if mpp_rotation != self.multiprobeRotation.value:
-                self.multiprobeRotation._value = mpp_rotation
-                self.multiprobeRotation.notify(mpp_rotation)
-            beamlet_index = tuple(int(i) for i in self.parent.get_beamlet_index())
-            if beamlet_index != self.beamletIndex.value:
-                self.beamletIndex._value = beamlet_index
-                self.beamletIndex.notify(beamlet_index)
-            immersion = self.parent.get_compound_lens_focusing_mode() > 0
-            if immersion != self.immersion.value:
-                self.immersion._value = immersion
-                self.immersion.notify(immersion)
-            multibeam_mode = (self.parent.get_use_case() == 'MultiBeamTile')
-            if multibeam_mode != self.multiBeamMode.value:
-                self.multiBeamMode._value = multibeam_mode
-                self.multiBeamMode.notify(multibeam_mode)
-            power = self.parent.get_beam_is_on()
-            if power != self.power.value:
-                self.power._value = power
-                self.power.notify(power)
+            (delta_pitch, beam_stigmator, pattern_stigmator, beam_shift_transformation_matrix, mpp_orientation,
+             beamlet_index, focusing_mode, use_case, power
+             ) = self.parent.get_settings([("get_delta_pitch", ()),
+                                           ("get_stigmator", ()),
+                                           ("get_pattern_stigmator", ()),
+                                           ("get_dc_coils", ()),
+                                           ("get_mpp_orientation", ()),
+                                           ("get_beamlet_index", ()),
+                                           ("get_compound_lens_focusing_mode", ()),
+                                           ("get_use_case", ()),
+                                           ("get_beam_is_on", ()),
+                                           ])
+            changed |= update_va_value(self.deltaPitch, delta_pitch * 1e-6)
+            changed |= update_va_value(self.beamStigmator, tuple(beam_stigmator))
+            changed |= update_va_value(self.patternStigmator, tuple(pattern_stigmator))
+            changed |= update_va_value(self.beamShiftTransformationMatrix, beam_shift_transformation_matrix)
+            changed |= update_va_value(self.multiprobeRotation, math.radians(mpp_orientation))
+            changed |= update_va_value(self.beamletIndex, tuple(int(i) for i in beamlet_index))
+            changed |= update_va_value(self.immersion, focusing_mode > 0)
+            changed |= update_va_value(self.multiBeamMode, use_case == 'MultiBeamTile')
+            changed |= update_va_value(self.power, power)
         except Exception:
             logging.exception("Unexpected failure when polling XTtoolkit settings")
+        return changed
 
     def _setDeltaPitch(self, delta_pitch: float) -> float:
         self.parent.set_delta_pitch(delta_pitch * 1e6)  # Convert from meters to micrometers.
@@ -118,18 +118,27 @@ Graphical data is drawn using the following sequence of method calls:
 
             * draw()
 
-                * _draw_background()
+                * _update_images_layer() (only the parts which changed since the previous draw)
 
-                * _draw_merged_images
+                    * _draw_background()
 
-                   * for all but last image:
-                        * _draw_image()
+                    * _draw_merged_images
 
-                    * for last image:
-                        * _draw_image()
+                       * for all but last image:
+                            * _draw_image()
+
+                        * for last image:
+                            * _draw_image()
+
+                * world overlays
 
             * Refresh/Update canvas
 
+The background and the images are drawn in a separate layer, which is reused
+as long as the images and the view don't change. So updating only an overlay
+doesn't require to redraw the images. When the view is just moved by a whole
+number of pixels, the layer is scrolled and only the exposed areas are redrawn.
+
 """
 
 import logging
@@ -152,11 +161,12 @@ from odemis.gui.util import (
 )
 from odemis.gui.util.conversion import wxcol_to_frgb
 from odemis.gui.util.img import (
+    ImageSurfaceCache,
     add_alpha_byte,
     apply_flip,
     apply_rotation,
     apply_shear,
-    get_sub_img,
+    get_sub_img_rect,
 )
 from odemis.util import intersect
 
@@ -802,11 +812,48 @@ class BitmapCanvas(BufferedCanvas):
         self.scale = 1.0  # px/m
         self.margins = (0, 0)
 
+        # Cairo surfaces of the images, to not recreate them at every redraw
+        self._surface_cache = ImageSurfaceCache()
+        # Layer with the background and the images (without the world overlays).
+        # It's only redrawn when the images or the view change.
+        self._images_layer = None  # cairo.ImageSurface
+        self._images_layer_spare = None  # cairo.ImageSurface, to scroll the layer
+        self._images_layer_state = None  # canvas settings used to draw the layer
+        self._images_layer_images = None  # the images list drawn in the layer
+        self._images_layer_center = None  # p_buffer_center when the layer was drawn
+        self._images_dirty_rects = []  # rectangles (ltwh, in buffer px) to redraw
+
     def clear(self):
         """ Remove the images and clear the canvas """
         self.images = [None]
+        self.invalidate_images()
         BufferedCanvas.clear(self)
 
+    def invalidate_images(self, rect=None):
+        """ Indicate that the images have to be redrawn at the next draw()
+
+        This is automatically done when the images are changed via set_images(),
+        or when the view changes. It is only needed when the image data is
+        modified in-place.
+
+        :param rect: (None or 4 floats) left, top, width, height (in buffer px)
+            of the area to redraw. If None, the whole buffer is redrawn.
+        """
+        # The surfaces of the cropped images are copies of the data, so they are
+        # outdated too.
+        self._surface_cache.clear()
+        self._invalidate_images_layer(rect)
+
+    def _invalidate_images_layer(self, rect=None):
+        """ Indicate that the images layer has to be redrawn at the next draw()
+
+        :param rect: see invalidate_images()
+        """
+        if rect is None:
+            self._images_layer_state = None
+        else:
+            self._images_dirty_rects.append(tuple(rect))
+
     def set_images(self, im_args):
         """ Set (or update)  image
 
@@ -880,6 +927,16 @@ class BitmapCanvas(BufferedCanvas):
 
         self.images = images
 
+        # Only keep the surfaces of the images still displayed
+        displayed = []
+        for im in images:
+            if isinstance(im, tuple):
+                displayed.extend(t for tile_col in im for t in tile_col)
+            elif im is not None:
+                displayed.append(im)
+        self._surface_cache.retain(displayed)
+        self._invalidate_images_layer()
+
     def draw(self, interpolate_data=False):
         """ Draw the images and overlays into the buffer
 
@@ -899,10 +956,12 @@ class BitmapCanvas(BufferedCanvas):
 
         ctx = wxcairo.ContextFromDC(self._dc_buffer)
 
-        self._draw_background(ctx)
-        ctx.identity_matrix()  # Reset the transformation matrix
-
-        self._draw_merged_images(ctx, interpolate_data)
+        # Copy the (cached) background + images, and draw the overlays on top
+        self._update_images_layer(interpolate_data)
+        ctx.set_source_surface(self._images_layer, 0, 0)
+        ctx.set_operator(cairo.OPERATOR_SOURCE)
+        ctx.paint()
+        ctx.set_operator(cairo.OPERATOR_OVER)
         ctx.identity_matrix()  # Reset the transformation matrix
 
         # Remember that the device context being passed belongs to the *buffer* and the view
@@ -916,6 +975,86 @@ class BitmapCanvas(BufferedCanvas):
                 logging.exception("Failed to draw world overlay %s", o)
             ctx.restore()
 
+    def _update_images_layer(self, interpolate_data=False):
+        """ Redraw the parts of the images layer which are not up-to-date
+
+        :param interpolate_data: (boolean) Apply interpolation if True
+
+        """
+        size = self._bmp_buffer_size
+        state = (size, self.scale, self.merge_ratio, interpolate_data,
+                 self.background_brush, self.BackgroundColour.Get())
+
+        if (self._images_layer is None or self._images_layer_state != state or
+                self._images_layer_images is not self.images):
+            if (self._images_layer is None or
+                    (self._images_layer.get_width(), self._images_layer.get_height()) != size):
+                self._images_layer = cairo.ImageSurface(cairo.FORMAT_RGB24, *size)
+                self._images_layer_spare = None
+            dirty_rects = [(0, 0) + size]
+        else:
+            dirty_rects = self._images_dirty_rects
+            if self._images_layer_center != self.p_buffer_center:
+                dirty_rects = self._scroll_images_layer(dirty_rects)
+
+        if dirty_rects:
+            ctx = cairo.Context(self._images_layer)
+            for r in dirty_rects:
+                ctx.rectangle(*r)
+            ctx.clip()
+
+            self._draw_background(ctx)
+            ctx.identity_matrix()  # Reset the transformation matrix
+
+            self._draw_merged_images(ctx, interpolate_data)
+
+        self._images_layer_state = state
+        self._images_layer_images = self.images
+        self._images_layer_center = self.p_buffer_center
+        self._images_dirty_rects = []
+
+    def _scroll_images_layer(self, dirty_rects):
+        """ Move the content of the images layer to follow the change of buffer center
+
+        It's only possible if the move corresponds to a whole number of pixels.
+
+        :param dirty_rects: (list of 4 floats) areas (ltwh) to redraw, before the move
+
+        :return: (list of 4 floats) areas to redraw, after the move
+
+        """
+        w, h = self._bmp_buffer_size
+        prev_center = self._images_layer_center
+        # Move of the content, in buffer px (Y is inverted)
+        shift = (-(self.p_buffer_center[0] - prev_center[0]) * self.scale,
+                 (self.p_buffer_center[1] - prev_center[1]) * self.scale)
+        dx, dy = int(round(shift[0])), int(round(shift[1]))
+        if (abs(shift[0] - dx) > 1e-3 or abs(shift[1] - dy) > 1e-3 or
+                abs(dx) >= w or abs(dy) >= h):
+            return [(0, 0, w, h)]
+
+        if self._images_layer_spare is None:
+            self._images_layer_spare = cairo.ImageSurface(cairo.FORMAT_RGB24, w, h)
+        ctx = cairo.Context(self._images_layer_spare)
+        ctx.set_source_surface(self._images_layer, dx, dy)
+        ctx.set_operator(cairo.OPERATOR_SOURCE)
+        ctx.paint()
+        del ctx
+        self._images_layer, self._images_layer_spare = self._images_layer_spare, self._images_layer
+
+        dirty_rects = [(r[0] + dx, r[1] + dy, r[2], r[3]) for r in dirty_rects]
+        # The areas which were outside of the buffer
+        if dx > 0:
+            dirty_rects.append((0, 0, dx, h))
+        elif dx < 0:
+            dirty_rects.append((w + dx, 0, -dx, h))
+        if dy > 0:
+            dirty_rects.append((0, 0, w, dy))
+        elif dy < 0:
+            dirty_rects.append((0, h + dy, w, -dy))
+
+        return dirty_rects
+
     def _draw_merged_images(self, ctx, interpolate_data=False):
         """ Draw the images on the DC buffer, centred around their _dc_center, with their own
         scale and an opacity of "mergeratio" for im1.
@@ -1123,12 +1262,7 @@ class BitmapCanvas(BufferedCanvas):
             ctx.save()
             for tile in tile_col:
                 height, width, _ = tile.shape
-
-                # Note: Stride calculation is done automatically when no stride parameter is provided.
-                stride = cairo.ImageSurface.format_stride_for_width(im_format, width)
-                # In Cairo a surface is a target that it can render to. Here we're going to use it as the
-                #  source for a pattern
-                imgsurface = cairo.ImageSurface.create_for_data(tile, im_format, width, height, stride)
+                imgsurface = self._surface_cache.get(tile, im_format)
 
                 # In Cairo a pattern is the 'paint' that it uses to draw
                 surfpat = cairo.SurfacePattern(imgsurface)
@@ -1216,13 +1350,14 @@ class BitmapCanvas(BufferedCanvas):
         if abs(total_scale_x - 1) < 1e-8 or abs(total_scale_y - 1) < 1e-8:
             total_scale = (1.0, 1.0)
 
+        crop = None
         if total_scale_x > 1.0 or total_scale_y > 1.0:
             # logging.debug("Up scaling required")
 
             # If very little data is trimmed, it's better to scale the entire image than to create
             # a slightly smaller copy first.
             if b_im_rect[2] > intersection[2] * 1.1 or b_im_rect[3] > intersection[3] * 1.1:
-                im_data, tl = get_sub_img(intersection, b_im_rect, im_data, total_scale)
+                crop, tl = get_sub_img_rect(intersection, b_im_rect, im_data.shape, total_scale)
                 b_im_rect = (tl[0], tl[1], b_im_rect[2], b_im_rect[3], )
 
         # Render the image data to the context
@@ -1232,14 +1367,9 @@ class BitmapCanvas(BufferedCanvas):
         else:
             im_format = cairo.FORMAT_RGB24
 
-        height, width, _ = im_data.shape
-        # logging.debug("Image data shape is %s", im_data.shape)
-
-        # Note: Stride calculation is done automatically when no stride parameter is provided.
-        stride = cairo.ImageSurface.format_stride_for_width(im_format, width)
-        # In Cairo a surface is a target that it can render to. Here we're going to use it as the
-        #  source for a pattern
-        imgsurface = cairo.ImageSurface.create_for_data(im_data, im_format, width, height, stride)
+        # The surface (of the cropped image) is reused as long as the image and
+        # the crop don't change (ie, the view is not moved)
+        imgsurface = self._surface_cache.get(im_data, im_format, crop)
 
         # In Cairo a pattern is the 'paint' that it uses to draw
         surfpat = cairo.SurfacePattern(imgsurface)
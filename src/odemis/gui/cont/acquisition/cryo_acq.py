@@ -536,17 +536,21 @@ class CryoAcquiController(object):
             # get the exporter
             exporter = dataio.get_converter(self._config.last_format)
 
-            # export fib/sem data as separate images
+            # export fib/sem data as separate images (written in parallel)
             if self.acqui_mode is guimod.AcquiMode.FIBSEM:
+                export_fs = []
                 for d in data:
                     filename = self._create_cryo_filename(base_filename,
                                                           d.metadata[model.MD_ACQ_TYPE])
-                    exporter.export(filename, d, thumb_nail)
+                    export_fs.append(dataio.export_async(filename, d, thumb_nail, exporter=exporter))
             else:
                 # export fm channels as single image
                 filename = self._create_cryo_filename(base_filename)
-                exporter.export(filename, data, thumb_nail)
-                logging.info("Acquisition saved as file '%s'.", filename)
+                export_fs = [dataio.export_async(filename, data, thumb_nail, exporter=exporter)]
+
+            # The files must be written before picking the next (unique) filename
+            for f in export_fs:
+                logging.info("Acquisition saved as file '%s'.", f.result())
 
             # TODO: make saving fibsem data optional
             # TODO: investigate using Cntrl + S to save?
@@ -29,7 +29,8 @@ from odemis.gui.conf import get_acqui_conf
 from odemis.gui.util import call_in_wx_main, formats_to_wildcards
 from odemis.gui.util.img import ar_to_export_data, spectrum_to_export_data, \
     images_to_export_data, line_to_export_data, temporal_spectrum_to_export_data, \
-    chronogram_to_export_data, angular_spectrum_to_export_data, theta_to_export_data
+    chronogram_to_export_data, angular_spectrum_to_export_data, theta_to_export_data, \
+    MAX_RES_FACTOR
 from odemis.util.dataio import splitext
 import os
 import time
@@ -323,11 +324,15 @@ class ExportController(object):
             view_pos = fview.view_pos.value
             draw_merge_ratio = fview.stream_tree.kwargs.get("merge", 0.5)
             interpolate_data = fview.interpolate_content.value
+            # Print-ready images are rendered at the resolution of the data
+            # (within the memory limit), while raw export keeps the default limit.
+            max_res_factor = MAX_RES_FACTOR if raw else None
             exported_data = images_to_export_data(streams,
                                                   view_hfw, view_pos,
                                                   draw_merge_ratio, raw, vp.canvas,
                                                   interpolate_data=interpolate_data,
-                                                  logo=self._main_frame.legend_logo)
+                                                  logo=self._main_frame.legend_logo,
+                                                  max_res_factor=max_res_factor)
 
         return exported_data
 
@@ -31,6 +31,7 @@ from odemis.gui.cont.menu import MenuController
 from odemis.gui.cont.temperature import TemperatureController
 from odemis.gui.util import call_in_wx_main
 from odemis.gui.xmlh import odemis_get_resources
+from odemis.util import driver
 import sys
 import threading
 import traceback
@@ -128,6 +129,8 @@ class OdemisGUIApp(wx.App):
                     sys.exit(1)
                 microscope = None
             else:
+                # Connect to all the components in the background, while the GUI is being built
+                driver.speedUpPyroConnect(microscope)
                 if microscope.role == "delphi":
                     gui.logo = img.getBitmap("logo_delphi.png")
                     gui.legend_logo = "legend_logo_delphi.png"
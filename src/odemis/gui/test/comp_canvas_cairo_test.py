@@ -369,6 +369,108 @@ class TestCanvas(test.GuiTestCase):
         old_canvas.set_images(images)
         # old_canvas.shift_view((125, 125))
 
+    def test_images_layer_cache(self):
+        """ The images layer is only redrawn when the view or the images change """
+        self.app.test_frame.SetSize((500, 500))
+        self.app.test_frame.Center()
+        self.app.test_frame.Layout()
+
+        tab = self.create_simple_tab_model()
+        view = tab.focussedView.value
+        cnvs = miccanvas.DblMicroscopeCanvas(self.panel)
+        cnvs.setView(view, tab)
+        self.add_control(cnvs, flags=wx.EXPAND, proportion=1)
+        test.gui_loop(0.1)
+
+        # Count how many times the images are actually drawn
+        draw_calls = []
+        orig_draw_merged_images = cnvs._draw_merged_images
+
+        def count_draw_merged_images(ctx, interpolate_data=False):
+            draw_calls.append(interpolate_data)
+            orig_draw_merged_images(ctx, interpolate_data)
+
+        cnvs._draw_merged_images = count_draw_merged_images
+
+        darray = generate_img_data(100, 100, 4, color=(255, 0, 0))
+        cnvs.set_images([(darray, (0.0, 0.0), (0.0000003, 0.0000003), True, None, None, None, None, "red")])
+        cnvs.draw()
+        self.assertEqual(len(draw_calls), 1)
+        layer = cnvs._images_layer
+
+        # Nothing changed => the layer is reused as-is
+        cnvs.draw()
+        cnvs.draw()
+        self.assertEqual(len(draw_calls), 1)
+        self.assertIs(cnvs._images_layer, layer)
+        self.assertEqual(cnvs._images_dirty_rects, [])
+
+        # Data modified in-place => redrawn only once invalidated
+        darray[...] = 128
+        cnvs.invalidate_images()
+        cnvs.draw()
+        self.assertEqual(len(draw_calls), 2)
+        cnvs.draw()
+        self.assertEqual(len(draw_calls), 2)
+
+        # New images => redrawn
+        darray_blue = generate_img_data(100, 100, 4, color=(0, 0, 255))
+        cnvs.set_images([(darray_blue, (0.0, 0.0), (0.0000003, 0.0000003), True, None, None, None, None, "blue")])
+        cnvs.draw()
+        self.assertEqual(len(draw_calls), 3)
+
+        # New scale => redrawn
+        cnvs.scale *= 2
+        cnvs.draw()
+        self.assertEqual(len(draw_calls), 4)
+        cnvs.draw()
+        self.assertEqual(len(draw_calls), 4)
+
+        # Moved by whole pixels => the layer is scrolled, and only the uncovered part is drawn
+        center = cnvs.p_buffer_center
+        cnvs.p_buffer_center = (center[0] + 10 / cnvs.scale, center[1])
+        cnvs.draw()
+        self.assertEqual(len(draw_calls), 5)
+        self.assertIsNot(cnvs._images_layer, layer)
+        self.assertEqual(cnvs._images_layer_center, cnvs.p_buffer_center)
+        cnvs.draw()
+        self.assertEqual(len(draw_calls), 5)
+
+    def test_images_layer_cache_cropped(self):
+        """ An image modified in-place is redrawn, even if it's cropped """
+        self.app.test_frame.SetSize((500, 500))
+        self.app.test_frame.Center()
+        self.app.test_frame.Layout()
+
+        tab = self.create_simple_tab_model()
+        view = tab.focussedView.value
+        cnvs = miccanvas.DblMicroscopeCanvas(self.panel)
+        cnvs.setView(view, tab)
+        self.add_control(cnvs, flags=wx.EXPAND, proportion=1)
+        test.gui_loop(0.1)
+
+        def get_center_pixel():
+            layer = cnvs._images_layer
+            w, h = layer.get_width(), layer.get_height()
+            data = numpy.frombuffer(layer.get_data(), dtype=numpy.uint8)
+            data = data.reshape(h, layer.get_stride() // 4, 4)
+            return tuple(data[h // 2, w // 2, :3])  # Alpha is undefined for RGB24
+
+        darray = generate_img_data(200, 200, 4, color=(255, 0, 0))
+        cnvs.set_images([(darray, (0.0, 0.0), (1e-6, 1e-6), True, None, None, None, None, "red")])
+        # 1 image px = 10 buffer px => only the center of the image is displayed
+        cnvs.scale = 1e7
+        cnvs.draw()
+        self.assertTrue(any(key[2] is not None for key in cnvs._surface_cache._surfaces),
+                        "Image not cropped")
+        self.assertNotEqual(get_center_pixel(), (0, 0, 0))
+
+        # Data modified in-place => the crop is updated
+        darray[..., :3] = 0
+        cnvs.invalidate_images()
+        cnvs.draw()
+        self.assertEqual(get_center_pixel(), (0, 0, 0))
+
     def test_blending(self):
         self.app.test_frame.SetSize((500, 500))
         self.app.test_frame.Center()
@@ -23,6 +23,8 @@ Odemis. If not, see http://www.gnu.org/licenses/.
 # Some helper functions to convert/manipulate images
 
 import cairo
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import logging
 import math
 import numbers
@@ -48,6 +50,10 @@ import odemis.gui.img as guiimg
 BAR_PLOT_COLOUR = (0.5, 0.5, 0.5)
 CROP_RES_LIMIT = 1024
 MAX_RES_FACTOR = 5  # upper limit resolution factor to exported image
+# Hard limit of the number of pixels of an exported image, when the resolution factor is not
+# limited, as the whole image is held in memory (1 GiB in BGRA)
+MAX_EXPORT_PIXELS = 2 ** 28  # px
+EXPORT_TILE_SIZE = 1024  # px, size of the tiles rendered in parallel when exporting a view
 MIN_AR_SIZE = 800  # px, minimum size the AR image is exported
 TICKS_PER_AXIS = 10  # rough number of ticks to show on axes
 SPEC_PLOT_SIZE = 1024
@@ -77,6 +83,7 @@ ARC_LEFT_MARGIN = 0.01
 ARC_TOP_MARGIN = 0.0104
 TINT_SIZE = 0.0155
 COLORBAR_WIDTH_RATIO = 0.6  # the fraction of the two cells to make the colorbar
+SURFACE_CACHE_SIZE = 32  # default maximum number of Cairo surfaces kept by an ImageSurfaceCache
 
 
 # TODO: rename to *_bgra_*
@@ -626,7 +633,8 @@ def calc_img_buffer_rect(im_data, im_scale, p_im_center, buffer_center, buffer_s
 
 def draw_image(ctx, im_data, p_im_center, buffer_center, buffer_scale,
                buffer_size, opacity=1.0, im_scale=(1.0, 1.0), rotation=None,
-               shear=None, flip=None, blend_mode=BLEND_DEFAULT, interpolate_data=False):
+               shear=None, flip=None, blend_mode=BLEND_DEFAULT, interpolate_data=False,
+               surface_cache=None):
     """ Draw the given image to the Cairo context
 
     ctx (cairo.Context): Cario context to draw on
@@ -642,6 +650,8 @@ def draw_image(ctx, im_data, p_im_center, buffer_center, buffer_scale,
     flip (wx.HORIZONTAL | wx.VERTICAL): If and how to flip the image
     blend_mode (int): Graphical blending type used for transparency
     interpolate_data (boolean): apply interpolation if True
+    surface_cache (ImageSurfaceCache or None): if provided, the Cairo surface
+      of the image is taken from (and stored in) this cache.
 
     """
 
@@ -684,6 +694,12 @@ def draw_image(ctx, im_data, p_im_center, buffer_center, buffer_scale,
     height_ratio = float(im_scale[1]) / float(buffer_scale[1])
     total_scale = total_scale_x, total_scale_y = (width_ratio, height_ratio)
 
+    if im_data.metadata.get('dc_keepalpha', True):
+        im_format = cairo.FORMAT_ARGB32
+    else:
+        im_format = cairo.FORMAT_RGB24
+
+    crop = None
     if total_scale_x > 1.0 or total_scale_y > 1.0:
         logging.debug("Up scaling required")
 
@@ -697,21 +713,14 @@ def draw_image(ctx, im_data, p_im_center, buffer_center, buffer_scale,
                             intersection[1] - 0.1 * intersection[3],
                             1.2 * intersection[2],
                             1.2 * intersection[3])
-            im_data, tl = get_sub_img(intersection, b_im_rect, im_data, total_scale)
+            crop, tl = get_sub_img_rect(intersection, b_im_rect, im_data.shape, total_scale)
             b_im_rect = (tl[0], tl[1], b_im_rect[2], b_im_rect[3],)
             x, y, _, _ = b_im_rect
 
-    if im_data.metadata.get('dc_keepalpha', True):
-        im_format = cairo.FORMAT_ARGB32
+    if surface_cache is None:
+        imgsurface = create_image_surface(im_data, im_format, crop)
     else:
-        im_format = cairo.FORMAT_RGB24
-
-    height, width, _ = im_data.shape
-
-    # Note: Stride calculation is done automatically when no stride parameter is provided.
-    stride = cairo.ImageSurface.format_stride_for_width(im_format, width)
-
-    imgsurface = cairo.ImageSurface.create_for_data(im_data, im_format, width, height, stride)
+        imgsurface = surface_cache.get(im_data, im_format, crop)
 
     # In Cairo a pattern is the 'paint' that it uses to draw
     surfpat = cairo.SurfacePattern(imgsurface)
@@ -2326,29 +2335,26 @@ def convert_streams_to_images(streams, raw=False):
     return images, im_min_type
 
 
-def get_sub_img(b_intersect, b_im_rect, im_data, total_scale):
-    """ Return the minimal image data that will cover the intersection
+def get_sub_img_rect(b_intersect, b_im_rect, im_shape, total_scale):
+    """ Compute the minimal area of the image data that will cover the intersection
 
     :param b_intersect: (ltbr px = 4 float) Intersection of the full image and the buffer
-
     :param b_im_rect: (ltbr px = 4 float) The area the full image would occupy in the
         buffer
-    :param im_data: (DataArray) The original image data
+    :param im_shape: (tuple of ints) The shape of the original image data (YX...)
     :param total_scale: (float, float) The scale used to convert the image data to
         buffer pixels. (= image scale * buffer scale)
 
-    :return: (DataArray, (float, float)): cropped image and left-top coordinate
-
-    Since trimming the image will possibly change the top left buffer
-    coordinates it should be drawn at, an adjusted (x, y) tuple will be
-    returned as well.
+    :return: ((int, int, int, int), (float, float)): left, top, right, bottom
+        (inclusive) of the area in image pixels, and left-top buffer coordinate of
+        the area.
     """
     # TODO: Test if scaling a sub image really has performance benefits
     # while rendering with Cairo (i.e. Maybe Cairo is smart enough to render
     # big images without calculating the pixels that are not visible.)
     # Although, it seems not, at least with Cairo 1.0.
 
-    im_h, im_w = im_data.shape[:2]
+    im_h, im_w = im_shape[:2]
 
     # where is this intersection in the original image?
     unsc_rect = (
@@ -2379,6 +2385,28 @@ def get_sub_img(b_intersect, b_im_rect, im_data, total_scale):
     b_new = ((l * total_scale[0]) + b_im_rect[0],
              (t * total_scale[1]) + b_im_rect[1])
 
+    return (l, t, r, b), b_new
+
+
+def get_sub_img(b_intersect, b_im_rect, im_data, total_scale):
+    """ Return the minimal image data that will cover the intersection
+
+    :param b_intersect: (ltbr px = 4 float) Intersection of the full image and the buffer
+
+    :param b_im_rect: (ltbr px = 4 float) The area the full image would occupy in the
+        buffer
+    :param im_data: (DataArray) The original image data
+    :param total_scale: (float, float) The scale used to convert the image data to
+        buffer pixels. (= image scale * buffer scale)
+
+    :return: (DataArray, (float, float)): cropped image and left-top coordinate
+
+    Since trimming the image will possibly change the top left buffer
+    coordinates it should be drawn at, an adjusted (x, y) tuple will be
+    returned as well.
+    """
+    (l, t, r, b), b_new = get_sub_img_rect(b_intersect, b_im_rect, im_data.shape, total_scale)
+
     # We need to copy the data, since cairo.ImageSurface.create_for_data expects a single
     # segment buffer object (i.e. the data must be contiguous)
     im_data = im_data[t:b + 1, l:r + 1].copy()
@@ -2386,6 +2414,94 @@ def get_sub_img(b_intersect, b_im_rect, im_data, total_scale):
     return im_data, b_new
 
 
+def create_image_surface(im_data, im_format, crop=None):
+    """ Wrap the image data into a Cairo surface
+
+    :param im_data: (DataArray of shape YX4, uint8) The image data
+    :param im_format: (cairo.FORMAT_*) The format of the data
+    :param crop: (None or (int, int, int, int)): left, top, right, bottom (inclusive)
+        of the area of the image to use, as returned by get_sub_img_rect().
+        If None, the whole image is used.
+
+    :return: (cairo.ImageSurface): the surface. It keeps a reference to the data.
+    """
+    if crop is not None:
+        l, t, r, b = crop
+        im_data = im_data[t:b + 1, l:r + 1]
+    # Cairo needs a single segment buffer object (i.e. the data must be contiguous)
+    if not im_data.flags.c_contiguous:
+        im_data = numpy.ascontiguousarray(im_data)
+
+    height, width, _ = im_data.shape
+    # Note: Stride calculation is done automatically when no stride parameter is provided.
+    stride = cairo.ImageSurface.format_stride_for_width(im_format, width)
+    # In Cairo a surface is a target that it can render to. Here we're going to use it as the
+    #  source for a pattern
+    return cairo.ImageSurface.create_for_data(im_data, im_format, width, height, stride)
+
+
+class ImageSurfaceCache(object):
+    """ Keeps the Cairo surfaces created for the images, so that redrawing the
+    same image (eg, when just an overlay changed, or when the view is panned)
+    doesn't require to copy and wrap the image data again.
+
+    The surfaces are associated to the image object (not its content), so if
+    an image passed to the cache is modified afterwards, the cache must be cleared.
+    """
+
+    def __init__(self, max_size=SURFACE_CACHE_SIZE):
+        """
+        :param max_size: (int > 0) maximum number of surfaces kept. When more
+            surfaces are needed, the least recently used ones are discarded.
+        """
+        self.max_size = max_size
+        # (id, format, crop) -> (image, surface)
+        # The image is kept to ensure the id is not reused by another object
+        self._surfaces = OrderedDict()
+
+    def __len__(self):
+        return len(self._surfaces)
+
+    def get(self, im_data, im_format, crop=None):
+        """ Return the surface of an image, creating it if necessary
+
+        :param im_data: (DataArray of shape YX4, uint8) The image data
+        :param im_format: (cairo.FORMAT_*) The format of the data
+        :param crop: (None or (int, int, int, int)): area of the image to use.
+            See create_image_surface().
+
+        :return: (cairo.ImageSurface): the surface of the (cropped) image
+        """
+        key = (id(im_data), im_format, crop)
+        try:
+            im_cached, surface = self._surfaces[key]
+            if im_cached is im_data:
+                self._surfaces.move_to_end(key)
+                return surface
+        except KeyError:
+            pass
+
+        surface = create_image_surface(im_data, im_format, crop)
+        self._surfaces[key] = (im_data, surface)
+        while len(self._surfaces) > self.max_size:
+            self._surfaces.popitem(last=False)
+        return surface
+
+    def retain(self, images):
+        """ Discard all the surfaces which are not of the given images
+
+        :param images: (iterable of DataArray) The images to keep in the cache
+        """
+        ids = {id(im) for im in images}
+        for key in list(self._surfaces.keys()):
+            if key[0] not in ids:
+                del self._surfaces[key]
+
+    def clear(self):
+        """ Discard all the surfaces """
+        self._surfaces.clear()
+
+
 class FakeCanvas(object):
     """Fake canvas for drawing purposes. It is currently used to export images with printed rulers
     in print-ready export. We ask the overlay to draw on this fake canvas"""
@@ -2417,9 +2533,148 @@ class FakeCanvas(object):
         overlay.draw(self.ctx, canvas=self, font_size=font_size)
 
 
+def _get_merge_ratio(images, i, draw_merge_ratio, raw):
+    """
+    Compute the opacity to use to draw an image, when merged with the other images
+    images (list of DataArray): all the images, in the drawing order
+    i (int): index of the image to draw
+    draw_merge_ratio (0<=float<=1): merge ratio of the view
+    raw (bool): if True, each image is drawn separately
+    return (0<=float<=1): the opacity
+    """
+    n = len(images)
+    im = images[i]
+    if n == 1 or raw:
+        # For single image, don't use merge ratio
+        # For raw, each image is a "single image"
+        return 1.0
+
+    # If 'merge_ratio' present in the image metadata, it takes precedence over the general draw_merge_ratio
+    # for an image. Note: This is a hack for rare cases where a specific image needs a custom merge ratio.
+    if 'merge_ratio' in im.metadata:
+        return im.metadata['merge_ratio']
+
+    bm_last = images[-1].metadata["blend_mode"]
+    # If there are all "screen" (= last one is screen):
+    # merge ratio   im0   im1
+    #     0         1      0
+    #    0.25       1      0.5
+    #    0.5        1      1
+    #    0.75       0.5    1
+    #     1         0      1
+    if bm_last == BLEND_SCREEN:
+        if ((draw_merge_ratio < 0.5 and i < n - 1) or
+            (draw_merge_ratio >= 0.5 and i == n - 1)):
+            return 1
+        else:
+            return (0.5 - abs(draw_merge_ratio - 0.5)) * 2
+    else:  # bm_last == BLEND_DEFAULT
+        # Average all the first images
+        if i < n - 1:
+            if im.metadata['blend_mode'] == BLEND_SCREEN:
+                return 1.0
+            else:
+                return 1 - i / n
+        else:  # last image
+            return draw_merge_ratio
+
+
+def _draw_tile(layers, buffer_center, buffer_scale, buffer_size, tile_rect, interpolate_data, margin=0):
+    """
+    Draw part of the buffer
+    layers (list of (DataArray, float, int)): images to draw, with their opacity
+      and blend mode, in the drawing order
+    buffer_center (float, float): center position X, Y of the whole buffer in m
+    buffer_scale (float, float): size of a pixel of the buffer in m
+    buffer_size (int, int): size of the whole buffer in px
+    tile_rect (int, int, int, int): left, top, width, height of the tile in the buffer
+    interpolate_data (bool): apply interpolation on the images
+    margin (int): extra pixels drawn around the tile, and then discarded. That
+      ensures the interpolation at the border of the tile is the same as if the
+      whole buffer was drawn at once.
+    return (numpy.array of shape YX4, uint8): the tile, in BGRA
+    """
+    tx, ty, tw, th = tile_rect
+    tx, ty, tw, th = tx - margin, ty - margin, tw + 2 * margin, th + 2 * margin
+    # Center of the tile, in physical coordinates
+    tile_center = (buffer_center[0] + (tx + tw / 2 - buffer_size[0] / 2) * buffer_scale[0],
+                   buffer_center[1] - (ty + th / 2 - buffer_size[1] / 2) * buffer_scale[1])
+
+    tile = numpy.zeros((th, tw, 4), dtype=numpy.uint8)
+    surface = cairo.ImageSurface.create_for_data(tile, cairo.FORMAT_ARGB32, tw, th)
+    ctx = cairo.Context(surface)
+    for im, opacity, blend_mode in layers:
+        draw_image(
+            ctx,
+            im,
+            im.metadata['dc_center'],
+            tile_center,
+            buffer_scale,
+            (tw, th),
+            opacity,
+            im_scale=im.metadata['dc_scale'],
+            rotation=im.metadata['dc_rotation'],
+            shear=im.metadata['dc_shear'],
+            flip=im.metadata['dc_flip'],
+            blend_mode=blend_mode,
+            interpolate_data=interpolate_data
+        )
+    surface.finish()
+    return tile[margin:th - margin, margin:tw - margin]
+
+
+def render_tiled(layers, buffer_center, buffer_scale, buffer_size, interpolate_data=False,
+                 tile_size=EXPORT_TILE_SIZE, max_workers=None):
+    """
+    Draw images into a buffer, by rendering it in tiles, in parallel. That allows
+    to use all the CPU cores to draw large buffers, and keeps the temporary
+    memory usage low.
+    layers (list of (DataArray, float, int)): images to draw, with their opacity
+      and blend mode, in the drawing order. The images must have the "dc_*"
+      metadata, as set by set_images().
+    buffer_center (float, float): center position X, Y of the buffer in m
+    buffer_scale (float, float): size of a pixel of the buffer in m
+    buffer_size (int, int): size of the buffer in px
+    interpolate_data (bool): apply interpolation on the images
+    tile_size (int): maximum width and height of a tile in px
+    max_workers (int or None): number of threads to use. If None, it's based on
+      the number of CPUs.
+    return (numpy.array of shape YX4, uint8): the buffer, in BGRA
+    """
+    buffer = numpy.zeros((buffer_size[1], buffer_size[0], 4), dtype=numpy.uint8)
+    tile_rects = [(x, y, min(tile_size, buffer_size[0] - x), min(tile_size, buffer_size[1] - y))
+                  for y in range(0, buffer_size[1], tile_size)
+                  for x in range(0, buffer_size[0], tile_size)]
+
+    margin = 0
+    if interpolate_data and layers and len(tile_rects) > 1:
+        # The interpolation filters use a few neighbouring pixels of the image
+        max_scale = max(max(im.metadata['dc_scale'][0] / buffer_scale[0],
+                            im.metadata['dc_scale'][1] / buffer_scale[1])
+                        for im, _, _ in layers)
+        margin = int(math.ceil(3 * max(max_scale, 1)))
+
+    def draw_tile(tile_rect):
+        tx, ty, tw, th = tile_rect
+        # Each tile is copied as soon as it's ready, so that only a few tiles are in memory
+        buffer[ty:ty + th, tx:tx + tw] = _draw_tile(layers, buffer_center, buffer_scale, buffer_size,
+                                                    tile_rect, interpolate_data, margin)
+
+    if len(tile_rects) == 1:
+        draw_tile(tile_rects[0])
+    else:
+        # Cairo releases the GIL while drawing, so threads are sufficient
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # list() to raise any exception which happened in a thread
+            list(executor.map(draw_tile, tile_rects))
+
+    return buffer
+
+
 def images_to_export_data(streams, view_hfw, view_pos,
                           draw_merge_ratio, raw=False,
-                          orig_canvas=None, interpolate_data=False, logo=None):
+                          orig_canvas=None, interpolate_data=False, logo=None,
+                          max_res_factor=MAX_RES_FACTOR):
     """
     streams (Streams or DataProjection): the data to be exported
     view_hfw (tuple of float): X (width), Y (height) in m
@@ -2429,10 +2684,16 @@ def images_to_export_data(streams, view_hfw, view_pos,
     orig_canvas: if the passed canvas has a ruler overlay, a fake canvas is used
       for the ruler overlay to draw on it.
     logo (RGBA DataArray): Image to display in the legend
+    max_res_factor (float or None): the maximum resolution of the exported image,
+      as a factor of CROP_RES_LIMIT. If None, the image is exported at the
+      resolution of the data with the smallest pixel size, up to MAX_EXPORT_PIXELS.
     return (list of DataArray)
     raise LookupError: if no data visible in the selected FoV
     """
-    max_res = (MAX_RES_FACTOR * CROP_RES_LIMIT) ** 2
+    if max_res_factor is None:
+        max_res = MAX_EXPORT_PIXELS
+    else:
+        max_res = (max_res_factor * CROP_RES_LIMIT) ** 2
     # min_mpp = the minimum meters per pixels resulting in the maximum pixels size on based on the requested
     # field-of-view, and the maximum number of pixels we are willing to export (independent of the image ratio)
     min_mpp = math.sqrt((view_hfw[0]*view_hfw[1]) / max_res)# Area = [meters per pixel]^2 * number_of_pixels
@@ -2481,7 +2742,12 @@ def images_to_export_data(streams, view_hfw, view_pos,
     # the smallest pixel size, otherwise adjust it
     min_res = CROP_RES_LIMIT, CROP_RES_LIMIT * view_hfw[1] / view_hfw[0]
     new_res = view_hfw[0] // min_pxs[0], view_hfw[1] // min_pxs[1]
-    max_res = MAX_RES_FACTOR * min_res[0], MAX_RES_FACTOR * min_res[1]
+    if max_res_factor is None:
+        # Same ratio as the view, with at most MAX_EXPORT_PIXELS
+        max_res = (math.sqrt(MAX_EXPORT_PIXELS * view_hfw[0] / view_hfw[1]),
+                   math.sqrt(MAX_EXPORT_PIXELS * view_hfw[1] / view_hfw[0]))
+    else:
+        max_res = max_res_factor * min_res[0], max_res_factor * min_res[1]
     buffer_size = tuple(numpy.clip(new_res, min_res, max_res))
     if buffer_size != new_res:
         min_pxs = view_hfw[0] / buffer_size[0], view_hfw[1] / buffer_size[1]
@@ -2533,96 +2799,49 @@ def images_to_export_data(streams, view_hfw, view_pos,
 
     # The list of images to export
     data_to_export = []
-    fake_canvas = None
-    n = len(images)
-    bm_last = images[-1].metadata["blend_mode"]
+    layers = []
     for i, im in enumerate(images):
         if raw and not (im.ndim == 3 and im.shape[-1] == 4):
             # Non BGRA data type => we'll pass it completely as-is
             data_to_export.append(im)
             continue
 
-        if raw or i == 0:  # when print-ready, share the surface to draw
-            # Make surface based on the maximum resolution
-            data_to_draw = numpy.zeros((buffer_size[1], buffer_size[0], 4), dtype=numpy.uint8)
-            surface = cairo.ImageSurface.create_for_data(
-                data_to_draw, cairo.FORMAT_ARGB32, buffer_size[0], buffer_size[1])
-            ctx = cairo.Context(surface)
-            # The ruler overlay needs a canvas to draw itself, so use a fake canvas
-            fake_canvas = FakeCanvas(ctx, buffer_size, buffer_center, (1 / buffer_scale[0], 1 / buffer_scale[1]))
-
         blend_mode = im.metadata['blend_mode']
-        if n == 1 or raw:
-            # For single image, don't use merge ratio
-            # For raw, each image is a "single image"
-            merge_ratio = 1.0
-        else:
-            # If 'merge_ratio' present in the image metadata, it takes precedence over the general draw_merge_ratio
-            # for an image. Note: This is a hack for rare cases where a specific image needs a custom merge ratio.
-            if 'merge_ratio' in im.metadata:
-                merge_ratio = im.metadata['merge_ratio']
-            # If there are all "screen" (= last one is screen):
-            # merge ratio   im0   im1
-            #     0         1      0
-            #    0.25       1      0.5
-            #    0.5        1      1
-            #    0.75       0.5    1
-            #     1         0      1
-            elif bm_last == BLEND_SCREEN:
-                if ((draw_merge_ratio < 0.5 and i < n - 1) or
-                    (draw_merge_ratio >= 0.5 and i == n - 1)):
-                    merge_ratio = 1
-                else:
-                    merge_ratio = (0.5 - abs(draw_merge_ratio - 0.5)) * 2
-            else:  # bm_last == BLEND_DEFAULT
-                # Average all the first images
-                if i < n - 1:
-                    if blend_mode == BLEND_SCREEN:
-                        merge_ratio = 1.0
-                    else:
-                        merge_ratio = 1 - i / n
-                else:  # last image
-                    merge_ratio = draw_merge_ratio
-
         # Reset the first image to be drawn to the default blend operator to be
         # drawn full opacity (only useful if the background is not full black)
         if i == 0:
             blend_mode = BLEND_DEFAULT
+        merge_ratio = _get_merge_ratio(images, i, draw_merge_ratio, raw)
 
-        draw_image(
-            ctx,
-            im,
-            im.metadata['dc_center'],
-            buffer_center,
-            buffer_scale,
-            buffer_size,
-            merge_ratio,
-            im_scale=im.metadata['dc_scale'],
-            rotation=im.metadata['dc_rotation'],
-            shear=im.metadata['dc_shear'],
-            flip=im.metadata['dc_flip'],
-            blend_mode=blend_mode,
-            interpolate_data=interpolate_data
-        )
+        if not raw:  # when print-ready, all the images are drawn on the same buffer
+            layers.append((im, merge_ratio, blend_mode))
+            continue
 
         # Create legend for each raw image
-        if raw:
-            legend_rgb = draw_legend_multi_streams(images, buffer_size, buffer_scale,
-                                                   view_hfw[0], im.metadata['date'],
-                                                   im.metadata['stream'], img_file=logo)
+        data_to_draw = render_tiled([(im, merge_ratio, blend_mode)], buffer_center, buffer_scale,
+                                    buffer_size, interpolate_data)
+        legend_rgb = draw_legend_multi_streams(images, buffer_size, buffer_scale,
+                                               view_hfw[0], im.metadata['date'],
+                                               im.metadata['stream'], img_file=logo)
 
-            new_data_to_draw = _unpack_raw_data(data_to_draw, im_min_type)
-            legend_as_raw = _adapt_rgb_to_raw(legend_rgb, new_data_to_draw)
-            data_with_legend = numpy.append(new_data_to_draw, legend_as_raw, axis=0)
+        new_data_to_draw = _unpack_raw_data(data_to_draw, im_min_type)
+        legend_as_raw = _adapt_rgb_to_raw(legend_rgb, new_data_to_draw)
+        data_with_legend = numpy.append(new_data_to_draw, legend_as_raw, axis=0)
 
-            md = {model.MD_DESCRIPTION: im.metadata['name']}
-            data_to_export.append(model.DataArray(data_with_legend, md))
+        md = {model.MD_DESCRIPTION: im.metadata['name']}
+        data_to_export.append(model.DataArray(data_with_legend, md))
 
-    # Create legend for print-ready
+    # Draw all the images together, and create legend for print-ready
     if not raw:  # png, tiff
+        data_to_draw = render_tiled(layers, buffer_center, buffer_scale, buffer_size, interpolate_data)
         # In print-ready export, a fake canvas is used by the ruler overlay
         if orig_canvas and orig_canvas.gadget_overlay:
+            surface = cairo.ImageSurface.create_for_data(
+                data_to_draw, cairo.FORMAT_ARGB32, buffer_size[0], buffer_size[1])
+            ctx = cairo.Context(surface)
+            fake_canvas = FakeCanvas(ctx, buffer_size, buffer_center, (1 / buffer_scale[0], 1 / buffer_scale[1]))
             fake_canvas.draw_overlay(orig_canvas.gadget_overlay)
+            surface.finish()
         dates = [im.metadata['date'] if im.metadata['date'] else 0 for im in images]
         date = max(dates)
         legend_rgb = draw_legend_multi_streams(images, buffer_size, buffer_scale,
@@ -20,12 +20,14 @@ You should have received a copy of the GNU General Public License along with
 Odemis. If not, see http://www.gnu.org/licenses/.
 '''
 import logging
+import math
 import os
 import re
 import time
 import unittest
 import warnings
 from builtins import range
+from unittest.mock import patch
 
 import cairo
 import numpy
@@ -42,10 +44,12 @@ from odemis.acq.stream import (POL_POSITIONS, POL_POSITIONS_RESULTS,
 from odemis.dataio import tiff
 from odemis.gui.comp.overlay.gadget import RulerGadget, LabelGadget
 from odemis.gui.model import TOOL_LABEL, TOOL_RULER
+from odemis.gui import BLEND_DEFAULT, BLEND_SCREEN
 from odemis.gui.util import img
-from odemis.gui.util.img import (calculate_ticks, format_rgba_darray,
-                                 insert_tile_to_image, merge_screen,
-                                 wxImage2NDImage)
+from odemis.gui.util.img import (ImageSurfaceCache, calculate_ticks,
+                                 format_rgba_darray, get_sub_img,
+                                 get_sub_img_rect, insert_tile_to_image,
+                                 merge_screen, wxImage2NDImage)
 
 logging.getLogger().setLevel(logging.DEBUG)
 
@@ -1448,6 +1452,29 @@ class TestSpatialExportPyramidal(unittest.TestCase):
             new_image_ratio = data_gray.shape[0] / data_gray.shape[1]
             self.assertLess(abs(new_image_ratio - ratio) / ratio, 0.3)
 
+    def test_no_max_resolution(self):
+        '''
+        Without maximum resolution, the print-ready image is exported at the full resolution of the data
+        '''
+        self._prepare_streams((10000, 10000), (10000, 10000))
+
+        view_hfw = (2*8.191282393266523e-04, 2*6.205915392651362e-04)
+        view_pos = [-0.001203511795256, -0.000295338300158]
+        draw_merge_ratio = 0.3
+        exp_data_rgb = img.images_to_export_data(self.streams, view_hfw, view_pos, draw_merge_ratio, False,
+                                                 max_res_factor=None)
+        self.assertEqual(len(exp_data_rgb), 1)
+        self.assertEqual(len(exp_data_rgb[0].shape), 3)  # RGB
+        # Much bigger than the standard maximum
+        self.assertGreater(exp_data_rgb[0][:, :, 0].size, 2 * self.expected_max_nmr_pixels)
+
+        # Still limited to MAX_EXPORT_PIXELS
+        with patch.object(img, "MAX_EXPORT_PIXELS", 2000 * 1000):
+            exp_data_rgb = img.images_to_export_data(self.streams, view_hfw, view_pos, draw_merge_ratio, False,
+                                                     max_res_factor=None)
+        max_width = math.sqrt(2000 * 1000 * view_hfw[0] / view_hfw[1])
+        self.assertLessEqual(exp_data_rgb[0].shape[1], max_width + 1)
+
     def test_narrow_rectangular(self):
         '''
         Test printing an stream which has an high resolution an is an extremely narrow rectangular image
@@ -1578,5 +1605,81 @@ class TestOverviewFunctions(unittest.TestCase):
         self.assertTrue(numpy.all(merged == 255))
 
 
+class TestImageSurfaceCache(unittest.TestCase):
+    """ Tests the ImageSurfaceCache and the sub-image helpers """
+
+    def test_sub_img(self):
+        im = model.DataArray(numpy.arange(100 * 80 * 4, dtype=numpy.uint8).reshape(100, 80, 4))
+        # Image scaled x2, partly outside of the buffer
+        b_im_rect = (-20, -40, 160, 200)
+        b_intersect = (0, 0, 50, 60)
+        (l, t, r, b), tl = get_sub_img_rect(b_intersect, b_im_rect, im.shape, (2, 2))
+        self.assertEqual((l, t, r, b), (10, 20, 35, 50))
+        self.assertEqual(tl, (0, 0))
+
+        sub_im, sub_tl = get_sub_img(b_intersect, b_im_rect, im, (2, 2))
+        self.assertEqual(sub_tl, tl)
+        numpy.testing.assert_array_equal(sub_im, im[t:b + 1, l:r + 1])
+
+    def test_cache(self):
+        cache = ImageSurfaceCache(max_size=2)
+        im1 = model.DataArray(numpy.zeros((20, 30, 4), dtype=numpy.uint8))
+        im2 = model.DataArray(numpy.ones((20, 30, 4), dtype=numpy.uint8))
+
+        surf1 = cache.get(im1, cairo.FORMAT_ARGB32)
+        self.assertEqual((surf1.get_width(), surf1.get_height()), (30, 20))
+        self.assertIs(cache.get(im1, cairo.FORMAT_ARGB32), surf1)
+        self.assertEqual(len(cache), 1)
+
+        # Cropped version is a different surface
+        surf1c = cache.get(im1, cairo.FORMAT_ARGB32, (5, 2, 14, 11))
+        self.assertEqual((surf1c.get_width(), surf1c.get_height()), (10, 10))
+        self.assertIsNot(surf1c, surf1)
+        self.assertEqual(len(cache), 2)
+
+        # Least recently used (= the full im1) is discarded
+        cache.get(im2, cairo.FORMAT_ARGB32)
+        self.assertEqual(len(cache), 2)
+        self.assertIsNot(cache.get(im1, cairo.FORMAT_ARGB32), surf1)
+
+        cache.retain([im2])
+        self.assertEqual(len(cache), 1)
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+
+class TestRenderTiled(unittest.TestCase):
+    """ Tests the drawing of images by tiles """
+
+    def test_same_as_single_tile(self):
+        rng = numpy.random.default_rng(0)
+        im1 = model.DataArray(rng.integers(0, 255, (300, 400, 4), dtype=numpy.uint8))
+        im2 = model.DataArray(rng.integers(0, 255, (50, 60, 4), dtype=numpy.uint8))
+        ims = img.set_images([
+            (im1, (0, 0), (1e-6, 1e-6), False, 0, 0, 0, BLEND_DEFAULT, "big", None, None, {}),
+            # Smaller image, upscaled and not centered
+            (im2, (30e-6, -20e-6), (3e-6, 3e-6), True, 0, 0, 0, BLEND_SCREEN, "small", None, None, {}),
+        ])
+        layers = [(ims[0], 1.0, BLEND_DEFAULT), (ims[1], 0.5, BLEND_SCREEN)]
+        buffer_size = (333, 257)  # Not a multiple of the tile size
+        buffer_center = (5e-6, 3e-6)
+        buffer_scale = (0.8e-6, 0.8e-6)
+
+        full = img.render_tiled(layers, buffer_center, buffer_scale, buffer_size, tile_size=1024)
+        self.assertEqual(full.shape, (buffer_size[1], buffer_size[0], 4))
+        self.assertTrue(full.any())
+
+        tiled = img.render_tiled(layers, buffer_center, buffer_scale, buffer_size, tile_size=64, max_workers=4)
+        numpy.testing.assert_array_equal(tiled, full)
+
+        # Also with interpolation
+        full = img.render_tiled(layers, buffer_center, buffer_scale, buffer_size, interpolate_data=True)
+        tiled = img.render_tiled(layers, buffer_center, buffer_scale, buffer_size, interpolate_data=True,
+                                 tile_size=100)
+        # Only the pixels at the tile borders can be slightly different
+        diff = numpy.abs(tiled.astype(numpy.int16) - full)
+        self.assertLessEqual(diff.max(), 2)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -252,6 +252,14 @@ class ComponentProxy(ComponentBase, Pyro4.Proxy):
             raise AttributeError("Cannot override existing VigilantAttribute %s" % (name,))
         super(ComponentProxy, self).__setattr__(name, value)
 
+    def _pyroInvoke(self, *args, **kwargs):
+        try:
+            return Pyro4.Proxy._pyroInvoke(self, *args, **kwargs)
+        finally:
+            # The method might have changed some VAs, so the cached values
+            # cannot be trusted until the change notifications are received.
+            _vattributes.invalidate_va_cache()
+
     def __str__(self):
         try:
             return "Proxy of Component '%s'" % (self.name,)
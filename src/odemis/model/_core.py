@@ -61,6 +61,10 @@ BACKEND_NAME = "backend"  # the official name for the backend container
 BACKEND_FILE = os.path.join(BASE_DIRECTORY, BACKEND_NAME + ".ipc")  # the official ipc file for backend (just to detect status)
 
 _microscope = None
+# The component proxies already received, to reuse them (and their connections)
+# when the components are requested again: (microscope, dict str -> Component)
+_components_cache = (None, {})
+_components_lock = threading.Lock()
 
 
 def getMicroscope():
@@ -116,9 +120,33 @@ def getComponent(name=None, role=None):
 def getComponents():
     """
     return (set of Component): all the HwComponents (alive) managed by the backend
+    Note: the components which were already returned by a previous call are
+    returned as the same objects. So their connections, and their VAs, DataFlows
+    and Events proxies don't have to be set up again. It still needs one call
+    to the backend, to know which components are alive.
     """
+    global _components_cache
     microscope = getMicroscope()
-    return microscope.alive.value | {microscope}
+    comps = microscope.alive.value | {microscope}
+
+    with _components_lock:
+        cache_microscope, cache = _components_cache
+        if cache_microscope is not microscope:  # The microscope has been reset
+            cache = {}
+            _components_cache = (microscope, cache)
+
+        cache[microscope.name] = microscope
+        ret = set()
+        for c in comps:
+            prev_c = cache.get(c.name)
+            # If the component has been restarted, it's a different object
+            if prev_c is not None and getattr(prev_c, "_pyroUri", None) == getattr(c, "_pyroUri", None):
+                c = prev_c
+            else:
+                cache[c.name] = c
+            ret.add(c)
+
+    return ret
     # return _getChildren(microscope)
 
 
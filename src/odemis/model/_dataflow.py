@@ -25,8 +25,11 @@ Odemis. If not, see http://www.gnu.org/licenses/.
 # losslessly and with metadata attached (see _metadata for the conventional ones).
 
 import Pyro4
+import copy
 import logging
 import numpy
+import pickle
+import struct
 from odemis.model import _metadata, _vattributes
 from odemis.util import inspect_getmembers
 from odemis.util.weak import WeakMethod, WeakRefLostError
@@ -38,6 +41,10 @@ import zmq
 
 from . import _core
 
+# Maximum time (in s) between two transmissions of the complete metadata, so
+# that a subscriber which missed it (or which just joined) can recover quickly.
+MD_BASE_REFRESH_PERIOD = 2  # s
+
 
 class DataArray(numpy.ndarray):
     """
@@ -95,6 +102,342 @@ class DataArray(numpy.ndarray):
     #     return numpy.ndarray.__array_wrap__(self, out_arr, context)
 
 
+_MISSING = object()  # Marker of a missing value in a dict
+
+
+def _md_value_equal(a, b):
+    """
+    Compares two metadata values, which can be any (picklable) object, including
+    numpy arrays.
+    return (bool): True if they are known to be equal
+    """
+    if a is b:
+        return True
+    try:
+        return bool(a == b)
+    except ValueError:  # The truth value of an array is ambiguous
+        try:
+            return numpy.array_equal(a, b)
+        except Exception:
+            return False
+
+
+class _MetadataEncoder(object):
+    """
+    Compresses a sequence of metadata dicts, by sending only the values which
+    differ from a "base" metadata, sent once. Typically, most of the metadata
+    (pixel size, calibration...) is static during an acquisition, and only a few
+    values (acquisition date, position...) change for each frame.
+    The base is sent again when the metadata has changed too much from it, when
+    reset() is called (eg, because there is a new subscriber), and regularly.
+    The base is a (deep) copy of the metadata, so that the values modified
+    in-place after being sent (eg, a list) are detected as changed.
+    """
+
+    def __init__(self):
+        self._base = None  # dict or None, snapshot of the metadata sent as base
+        self._base_id = 0  # int, increased each time the base changes
+        self._base_time = 0  # time of the last transmission of the base
+
+    def reset(self):
+        """
+        Force the base to be sent with the next metadata
+        """
+        self._base = None
+
+    def encode(self, md):
+        """
+        md (dict str -> value): the metadata to transmit
+        return (dict): the encoded metadata, with the following keys:
+          "mdid" (int): identifier of the base
+          "mdbase" (dict): the complete base (only present when it is changed)
+          "md" (dict): the values which differ from the base
+          "mddel" (tuple of str): the keys of the base which are not in md
+        """
+        now = time.time()
+        base = self._base
+        if base is not None and now < self._base_time + MD_BASE_REFRESH_PERIOD:
+            delta = {}
+            nnew = 0  # number of keys not in the base
+            for k, v in md.items():
+                bv = base.get(k, _MISSING)
+                if bv is _MISSING:
+                    nnew += 1
+                    delta[k] = v
+                elif v is not bv and not _md_value_equal(v, bv):
+                    delta[k] = v
+            if len(md) - nnew == len(base):
+                removed = ()
+            else:
+                removed = tuple(k for k in base if k not in md)
+            # If it's mostly different, it's more efficient to change the base
+            if len(delta) + len(removed) <= len(base) // 2:
+                return {"mdid": self._base_id, "md": delta, "mddel": removed}
+
+        self._base = copy.deepcopy(md)
+        self._base_id += 1
+        self._base_time = now
+        return {"mdid": self._base_id, "mdbase": self._base, "md": {}, "mddel": ()}
+
+
+class _MetadataDecoder(object):
+    """
+    Reconstructs the metadata encoded by the _MetadataEncoder.
+    All the metadata dicts decoded from the same base share the same (static)
+    values, instead of each having its own copy.
+    """
+
+    def __init__(self):
+        self._base = None
+        self._base_id = None
+
+    def decode(self, header):
+        """
+        header (dict): the encoded metadata, as returned by _MetadataEncoder.encode()
+        return (dict or None): the metadata, or None if it cannot be reconstructed
+          because the base was not received.
+        """
+        if "mdbase" in header:
+            self._base = header["mdbase"]
+            self._base_id = header["mdid"]
+        elif header["mdid"] != self._base_id:
+            return None
+
+        md = self._base.copy()
+        md.update(header["md"])
+        for k in header["mddel"]:
+            del md[k]
+        return md
+
+
+# Binary header sent over 0MQ before the data of each DataArray. All values are
+# little-endian:
+#  * version (B), flags (B), metadata base id (I)
+#  * number of dimensions (B), shape (Q * ndim)
+#  * dtype: length (B) + numpy dtype string, or, if _HDR_DTYPE_PICKLED,
+#    length (I) + pickled dtype (for structured dtypes)
+#  * if _HDR_MD_BASE: length (I) + pickled metadata base
+#  * metadata delta: number of items (H), then each item as key + value
+#  * metadata keys removed: number of keys (H), then each key
+# A key is encoded as length (H) + UTF-8 string. A value is encoded as a type
+# code (B), followed by the value (see _pack_md_value()).
+_HDR_VERSION = 1
+_HDR_MD_BASE = 0x01
+_HDR_DTYPE_PICKLED = 0x02
+_HDR_START = struct.Struct("<BBI")
+_HDR_COUNT = struct.Struct("<H")
+_HDR_LENGTH = struct.Struct("<I")
+_HDR_BYTE = struct.Struct("<B")
+
+# Type codes of the metadata values
+_MDV_FLOAT = 0  # float, as d
+_MDV_INT = 1  # int, as q
+_MDV_FLOATS = 2  # tuple of floats, as length (B) + d * length
+_MDV_PICKLE = 3  # anything else, as length (I) + pickle
+_MDV_FLOAT_STRUCT = struct.Struct("<Bd")
+_MDV_INT_STRUCT = struct.Struct("<Bq")
+_INT64_MIN, _INT64_MAX = -2 ** 63, 2 ** 63 - 1
+
+
+def _pack_str(s):
+    b = s.encode("utf-8")
+    return _HDR_COUNT.pack(len(b)) + b
+
+
+def _pack_md_value(v):
+    """
+    Encode a metadata value. The most common types of the values which change
+    for every DataArray (date, position...) are packed, and the rest is pickled.
+    return (bytes): the type code + the value
+    """
+    t = type(v)
+    if t is float:
+        return _MDV_FLOAT_STRUCT.pack(_MDV_FLOAT, v)
+    elif t is int and _INT64_MIN <= v <= _INT64_MAX:
+        return _MDV_INT_STRUCT.pack(_MDV_INT, v)
+    elif t is tuple and len(v) < 256 and all(type(x) is float for x in v):
+        return struct.pack("<BB%dd" % len(v), _MDV_FLOATS, len(v), *v)
+    else:
+        b = pickle.dumps(v, pickle.HIGHEST_PROTOCOL)
+        return _HDR_BYTE.pack(_MDV_PICKLE) + _HDR_LENGTH.pack(len(b)) + b
+
+
+def _unpack_md_value(buf, offset):
+    """
+    return (object, int): the value, and the offset after it
+    """
+    code = buf[offset]
+    if code == _MDV_FLOAT:
+        _, v = _MDV_FLOAT_STRUCT.unpack_from(buf, offset)
+        return v, offset + _MDV_FLOAT_STRUCT.size
+    elif code == _MDV_INT:
+        _, v = _MDV_INT_STRUCT.unpack_from(buf, offset)
+        return v, offset + _MDV_INT_STRUCT.size
+    elif code == _MDV_FLOATS:
+        l = buf[offset + 1]
+        v = struct.unpack_from("<%dd" % l, buf, offset + 2)
+        return v, offset + 2 + 8 * l
+    elif code == _MDV_PICKLE:
+        l, = _HDR_LENGTH.unpack_from(buf, offset + 1)
+        offset += 1 + _HDR_LENGTH.size
+        return pickle.loads(buf[offset:offset + l]), offset + l
+    else:
+        raise ValueError("Unknown metadata value type %d" % (code,))
+
+
+class _HeaderEncoder(object):
+    """
+    Serializes the format (dtype, shape) and metadata of DataArrays into the
+    binary header sent over 0MQ. The metadata is compressed with a
+    _MetadataEncoder.
+    """
+
+    def __init__(self):
+        self.md_encoder = _MetadataEncoder()
+        self._format = None  # (dtype, shape, bytes): last format encoded
+
+    def reset(self):
+        """
+        Force the metadata base to be sent with the next header
+        """
+        self.md_encoder.reset()
+
+    def _encode_format(self, dtype, shape):
+        """
+        return (int, bytes): the flags, and the encoded format
+        """
+        if dtype.fields is None:
+            b = dtype.str.encode("ascii")
+            flags = 0
+            dtype_b = _HDR_BYTE.pack(len(b)) + b
+        else:
+            b = pickle.dumps(dtype, pickle.HIGHEST_PROTOCOL)
+            flags = _HDR_DTYPE_PICKLED
+            dtype_b = _HDR_LENGTH.pack(len(b)) + b
+        return flags, struct.pack("<B%dQ" % len(shape), len(shape), *shape) + dtype_b
+
+    def encode(self, data):
+        """
+        data (DataArray): the array to send
+        return (bytes): the header
+        """
+        # The format is typically the same for all the DataArrays => cache it
+        fmt = self._format
+        if fmt is None or fmt[0] != data.dtype or fmt[1] != data.shape:
+            fmt = (data.dtype, data.shape) + self._encode_format(data.dtype, data.shape)
+            self._format = fmt
+        flags, fmt_b = fmt[2], fmt[3]
+
+        md = self.md_encoder.encode(getattr(data, "metadata", {}))
+        parts = []
+        if "mdbase" in md:
+            flags |= _HDR_MD_BASE
+            b = pickle.dumps(md["mdbase"], pickle.HIGHEST_PROTOCOL)
+            parts.append(_HDR_LENGTH.pack(len(b)))
+            parts.append(b)
+
+        delta = md["md"]
+        parts.append(_HDR_COUNT.pack(len(delta)))
+        for k, v in delta.items():
+            parts.append(_pack_str(k))
+            parts.append(_pack_md_value(v))
+        removed = md["mddel"]
+        parts.append(_HDR_COUNT.pack(len(removed)))
+        for k in removed:
+            parts.append(_pack_str(k))
+
+        return b"".join([_HDR_START.pack(_HDR_VERSION, flags, md["mdid"]), fmt_b] + parts)
+
+
+class _HeaderDecoder(object):
+    """
+    Decodes the header created by the _HeaderEncoder
+    """
+
+    def __init__(self):
+        self.md_decoder = _MetadataDecoder()
+        self._format = None  # (bytes, dtype, shape): last format decoded
+        self._keys = {}  # bytes -> str: cache of the metadata keys decoded
+
+    def _decode_format(self, buf, offset, flags):
+        """
+        return (numpy.dtype, tuple of ints, int): the dtype and shape of the array,
+          and the offset after the format
+        """
+        fmt = self._format
+        if fmt is not None and buf.startswith(fmt[0], offset):
+            return fmt[1], fmt[2], offset + len(fmt[0])
+
+        start = offset
+        ndim = buf[offset]
+        shape = struct.unpack_from("<%dQ" % ndim, buf, offset + 1)
+        offset += 1 + 8 * ndim
+        if flags & _HDR_DTYPE_PICKLED:
+            l, = _HDR_LENGTH.unpack_from(buf, offset)
+            offset += _HDR_LENGTH.size
+            dtype = pickle.loads(buf[offset:offset + l])
+        else:
+            l = buf[offset]
+            offset += 1
+            dtype = numpy.dtype(buf[offset:offset + l].decode("ascii"))
+        offset += l
+
+        self._format = (buf[start:offset], dtype, shape)
+        return dtype, shape, offset
+
+    def _decode_key(self, buf, offset):
+        """
+        return (str, int): the key, and the offset after it
+        """
+        l, = _HDR_COUNT.unpack_from(buf, offset)
+        offset += _HDR_COUNT.size
+        b = buf[offset:offset + l]
+        try:
+            k = self._keys[b]
+        except KeyError:
+            k = b.decode("utf-8")
+            self._keys[b] = k
+        return k, offset + l
+
+    def decode(self, header):
+        """
+        header (bytes): the header received
+        return (numpy.dtype, tuple of ints, dict or None): the dtype and shape of
+          the array, and its metadata (None if it cannot be reconstructed, see
+          _MetadataDecoder.decode())
+        """
+        buf = bytes(header)
+        version, flags, mdid = _HDR_START.unpack_from(buf, 0)
+        if version != _HDR_VERSION:
+            raise ValueError("Unsupported DataFlow header version %d" % (version,))
+        dtype, shape, offset = self._decode_format(buf, _HDR_START.size, flags)
+
+        md = {"mdid": mdid}
+        if flags & _HDR_MD_BASE:
+            l, = _HDR_LENGTH.unpack_from(buf, offset)
+            offset += _HDR_LENGTH.size
+            md["mdbase"] = pickle.loads(buf[offset:offset + l])
+            offset += l
+
+        n, = _HDR_COUNT.unpack_from(buf, offset)
+        offset += _HDR_COUNT.size
+        delta = {}
+        for i in range(n):
+            k, offset = self._decode_key(buf, offset)
+            delta[k], offset = _unpack_md_value(buf, offset)
+        md["md"] = delta
+
+        n, = _HDR_COUNT.unpack_from(buf, offset)
+        offset += _HDR_COUNT.size
+        removed = []
+        for i in range(n):
+            k, offset = self._decode_key(buf, offset)
+            removed.append(k)
+        md["mddel"] = removed
+
+        return dtype, shape, self.md_decoder.decode(md)
+
+
 class DataFlowBase(object):
     """
     This is an abstract class that must be extended by each detector which
@@ -214,6 +557,7 @@ class DataFlow(DataFlowBase):
         self._max_discard = max_discard
         self._max_discard_orig = max_discard  # Used when switching between synchronized and not
         self._max_discard_last_update = None  # Value when last updated (when there are no remote listeners)
+        self._header_encoder = _HeaderEncoder()  # To send the format & metadata to the remote listeners
 
     def _getproxystate(self):
         """
@@ -238,6 +582,14 @@ class DataFlow(DataFlowBase):
     def _set_max_discard(self, value):
         self.max_discard = value
 
+    # for the remote proxy (only!)
+    def _request_md_base(self):
+        """
+        Called by a remote listener which missed the metadata base, to get it
+        sent again with the next DataArray.
+        """
+        self._header_encoder.reset()
+
     def _update_pipe_hwm(self):
         """
         updates the high water mark option of OMQ pipe according to max_discard
@@ -375,6 +727,8 @@ class DataFlow(DataFlowBase):
             # add string to listeners if listener is string
             if isinstance(listener, str):
                 self._remote_listeners.add(listener)
+                # The new subscriber needs the complete metadata
+                self._header_encoder.reset()
             else:
                 assert callable(listener)
                 self._listeners.add(WeakMethod(listener))
@@ -415,36 +769,60 @@ class DataFlow(DataFlowBase):
                 # It's the right moment to unbind/rebind the pipe
                 self._update_pipe_hwm()
 
-    def notify(self, data):
-        # publish the data remotely
-        if self.pipe and len(self._remote_listeners) > 0:
-            # TODO: is there any way to know how many recipients of the pipe?
-            # If possible, we would detect it's 0, because some listener closed
-            # without unsubscribing, and we would kick it out.
-            # => use zmq_socket_monitor() to detect connection/disconnection and
-            # update the count of subscribers, or detect when a remote_listener
-            # is gone (if there is a way to associate it)
-
-            # TODO thread-safe for self.pipe ?
-            dformat = {"dtype": str(data.dtype), "shape": data.shape, "metadata": data.metadata}
-            self.pipe.send_pyobj(dformat, zmq.SNDMORE)
+    def _send_remote(self, das):
+        """
+        Publish the DataArrays over 0MQ, as one (multipart) message.
+        Each DataArray is sent as two parts: the header and the data.
+        das (list of DataArrays): the data to send
+        """
+        # TODO: is there any way to know how many recipients of the pipe?
+        # If possible, we would detect it's 0, because some listener closed
+        # without unsubscribing, and we would kick it out.
+        # => use zmq_socket_monitor() to detect connection/disconnection and
+        # update the count of subscribers, or detect when a remote_listener
+        # is gone (if there is a way to associate it)
+
+        # TODO thread-safe for self.pipe ?
+        for i, data in enumerate(das):
+            flags = zmq.SNDMORE if i < len(das) - 1 else 0
+            self.pipe.send(self._header_encoder.encode(data), zmq.SNDMORE)
             try:
                 if not data.flags["C_CONTIGUOUS"]:
                     # if not in C order, it will be received incorrectly
                     # TODO: if it's just rotated, send the info to reconstruct it
                     # and avoid the memory copy
                     raise TypeError("Need C ordered array")
-                self.pipe.send(memoryview(data), copy=False)
+                self.pipe.send(memoryview(data), flags, copy=False)
             except TypeError:
                 # not all buffers can be sent zero-copy (e.g., has strides)
                 # try harder by copying (which removes the strides)
                 logging.debug("Failed to send data with zero-copy")
                 data = numpy.require(data, requirements=["C_CONTIGUOUS"])
-                self.pipe.send(memoryview(data), copy=False)
+                self.pipe.send(memoryview(data), flags, copy=False)
+
+    def notify(self, data):
+        # publish the data remotely
+        if self.pipe and len(self._remote_listeners) > 0:
+            self._send_remote([data])
 
         # publish locally
         DataFlowBase.notify(self, data)
 
+    def notify_batch(self, das):
+        """
+        Share multiple DataArrays with all the listeners. It is equivalent to
+        calling notify() on each of them, but the remote listeners receive them
+        all at once, which is more efficient for many small arrays.
+        das (list of DataArrays): the data to be sent to listeners, in order
+        """
+        if not das:
+            return
+        if self.pipe and len(self._remote_listeners) > 0:
+            self._send_remote(das)
+
+        for data in das:
+            DataFlowBase.notify(self, data)
+
     def __del__(self):
         if self._count_listeners() > 0:
             self.stop_generate()
@@ -598,6 +976,8 @@ class SubscribeProxyThread(threading.Thread):
             # Read from the remote DataFlow when the subscription is started.
             max_discard = 0
             discarded = 0  # Number of messages discarded in a row
+            missing_md = 0  # Number of arrays dropped in a row because the metadata base is missing
+            header_decoder = _HeaderDecoder()
             while True:
                 socks = dict(poller.poll())
 
@@ -621,31 +1001,57 @@ class SubscribeProxyThread(threading.Thread):
 
                 # receive data
                 if self._data in socks:
-                    # TODO: be more resilient if wrong data is received (can block forever)
-                    array_format = self._data.recv_pyobj()
-                    array_buf = self._data.recv(copy=False)
-                    # logging.debug("Received new DataArray over ZMQ for %s", self.uri)
-                    # more fresh data already?
-                    if (discarded < max_discard
-                        and self._data.getsockopt(zmq.EVENTS) & zmq.POLLIN
-                       ):
-                        discarded += 1
-                        # logging.debug("Discarding object received as a newer one is available")
-                        continue
-                    # Don't log here, because if we are discarding message it's because we are running
-                    # out of time, and logging is slow.
-                    # TODO: only log the accumulated number every second, to avoid log flooding
-                    if discarded:
-                        logging.warning("Dataflow %s dropped %d arrays", self.uri, discarded)
-                    discarded = 0
-                    # TODO: any need to use zmq.utils.rebuffer.array_from_buffer()?
-                    if len(array_buf):
-                        array = numpy.frombuffer(array_buf, dtype=array_format["dtype"])
-                    else:  # frombuffer doesn't support zero length array
-                        array = numpy.empty((0,), dtype=array_format["dtype"])
-                    array.shape = array_format["shape"]
-                    darray = DataArray(array, metadata=array_format["metadata"])
-                    self.weak_df.notify(darray)
+                    # A message contains one or more DataArrays, each as a
+                    # header and data part.
+                    more = True
+                    while more:
+                        # TODO: be more resilient if wrong data is received (can block forever)
+                        header = self._data.recv()
+                        array_buf = self._data.recv(copy=False)
+                        more = self._data.getsockopt(zmq.RCVMORE)
+                        # Always decode, even if discarded, to not miss a change of metadata
+                        dtype, shape, md = header_decoder.decode(header)
+                        # logging.debug("Received new DataArray over ZMQ for %s", self.uri)
+                        # more fresh data already?
+                        if (discarded < max_discard
+                            and (more or self._data.getsockopt(zmq.EVENTS) & zmq.POLLIN)
+                           ):
+                            discarded += 1
+                            # logging.debug("Discarding object received as a newer one is available")
+                            continue
+                        # Don't log here, because if we are discarding message it's because we are running
+                        # out of time, and logging is slow.
+                        # TODO: only log the accumulated number every second, to avoid log flooding
+                        if discarded:
+                            logging.warning("Dataflow %s dropped %d arrays", self.uri, discarded)
+                        discarded = 0
+                        if md is None:
+                            # Can only happen if the beginning of the subscription was missed
+                            # => ask for the base (once), and drop the arrays until it's received
+                            if not missing_md:
+                                logging.warning("Dataflow %s received array without its metadata, "
+                                                "requesting it", self.uri)
+                                try:
+                                    self.weak_df._request_md_base()
+                                except ReferenceError:
+                                    raise
+                                except Exception:
+                                    logging.exception("Failed to request the metadata of dataflow %s",
+                                                      self.uri)
+                            missing_md += 1
+                            continue
+                        elif missing_md:
+                            logging.warning("Dataflow %s dropped %d arrays received without their metadata",
+                                            self.uri, missing_md)
+                            missing_md = 0
+                        # TODO: any need to use zmq.utils.rebuffer.array_from_buffer()?
+                        if len(array_buf):
+                            array = numpy.frombuffer(array_buf, dtype=dtype)
+                        else:  # frombuffer doesn't support zero length array
+                            array = numpy.empty((0,), dtype=dtype)
+                        array.shape = shape
+                        darray = DataArray(array, metadata=md)
+                        self.weak_df.notify(darray)
 
         except ReferenceError:  # The DataFlow(Proxy) is gone
             # => stop this thread too
@@ -28,7 +28,9 @@ import numbers
 import numpy
 from odemis.util.weak import WeakMethod, WeakRefLostError
 import os
+import pickle
 import threading
+import time
 import types
 import sys
 import zmq
@@ -42,6 +44,42 @@ class NotSettableError(AttributeError):
     pass
 
 
+# While they are subscribed to the remote VA (ie, they have listeners), the
+# proxies of the VAs keep a local copy of the value, kept up-to-date by the
+# change notifications, so that repeatedly reading the value doesn't require a
+# call to the remote VA each time. The cache is only used once the initial value,
+# sent by the remote VA after subscribing, has been received, as it guarantees
+# the subscription is active.
+# Maximum time (s) a cached value is used, before reading it again remotely, in
+# case a notification was lost.
+VA_CACHE_MAX_AGE = 2
+
+# Incremented whenever something is (potentially) changed remotely by this
+# process (VA value set, method called on a component...). A cached value is
+# only valid if it was stored during the current generation, as the
+# notification of the change might not have been received yet.
+_cache_generation = 0
+_cache_stats = {"hits": 0, "misses": 0}
+
+
+def invalidate_va_cache():
+    """
+    Mark all the values cached by the VA proxies as outdated. Must be called
+    whenever an action might have changed the value of a remote VA.
+    """
+    global _cache_generation
+    _cache_generation += 1
+
+
+def get_va_cache_statistics():
+    """
+    return (dict str -> int): number of reads of the VA proxy values which
+      were answered from the cache ("hits") and which needed a remote call
+      ("misses"), since the beginning.
+    """
+    return dict(_cache_stats)
+
+
 class VigilantAttributeBase(object):
     """
     An abstract class for VigilantAttributes and its proxy
@@ -137,6 +175,7 @@ class VigilantAttribute(VigilantAttributeBase):
 
         # different from ._listeners for notify() to do different things
         self._remote_listeners = set() # any unique string works
+        self._pipe_lock = threading.Lock()  # to send multi-part messages
 
         self._global_name = None # to be filled when registered
         self._ctx = None
@@ -161,8 +200,11 @@ class VigilantAttribute(VigilantAttributeBase):
         Equivalent to __getstate__() of the proxy version
         """
         proxy_state = Pyro4.core.pyroObjectSerializer(self)[2]
+        # If there is a getter, the value can change without notification,
+        # so the proxy should not cache it.
+        cacheable = self._getter is None
         return (proxy_state, _core.dump_roattributes(self), self.unit,
-                self.readonly, self.max_discard)
+                self.readonly, self.max_discard, cacheable)
 
     def _check(self, value):
         """
@@ -303,10 +345,17 @@ class VigilantAttribute(VigilantAttributeBase):
         """
         listener (string) => uri of listener of zmq
         listener (callable) => method to call (locally)
+        init (boolean): if True, sends the current value to the listener
         """
         # add string to listeners if listener is string
         if isinstance(listener, str):
             self._remote_listeners.add(listener)
+            if init:
+                # Sent with the name of the listener as first part, so that the
+                # other listeners ignore it
+                with self._pipe_lock:
+                    self.pipe.send(listener.encode("utf-8"), zmq.SNDMORE)
+                    self.pipe.send_pyobj(self.value)
         else:
             VigilantAttributeBase.subscribe(self, listener, init)
 
@@ -333,7 +382,8 @@ class VigilantAttribute(VigilantAttributeBase):
 
         # publish the data remotely
         if self._remote_listeners:
-            self.pipe.send_pyobj(v)
+            with self._pipe_lock:
+                self.pipe.send_pyobj(v)
 
         # publish locally
         VigilantAttributeBase.notify(self, v)
@@ -356,10 +406,22 @@ class VigilantAttributeProxy(VigilantAttributeBase, Pyro4.Proxy):
         VigilantAttributeBase.__init__(self) # TODO setting value=None might not always be valid
         self.max_discard = 100
         self.readonly = False # will be updated in __setstate__
+        self.cacheable = False  # will be updated in __setstate__
 
         self._ctx = None
         self._commands = None
         self._thread = None
+        self._init_cache()
+
+    def _init_cache(self):
+        self._cache_lock = threading.Lock()
+        self._cache_value = None
+        self._cache_generation = None  # generation when the value was stored, None if no value
+        self._cache_time = 0  # time when the value was stored
+        self._cache_updates = 0  # incremented at every notification received
+        # True once the initial value has been received after subscribing, so that
+        # all the changes are notified.
+        self._cache_active = False
 
     def __getattr__(self, name):
         # Behaviour of .range and .choices remote attributes:
@@ -379,14 +441,80 @@ class VigilantAttributeProxy(VigilantAttributeBase, Pyro4.Proxy):
 
     @property
     def value(self):
-        return self.__getattr__("_get_value")()
+        return self._read_value()
 
     @value.setter
     def value(self, v):
+        return self._write_value(v)
+    # no delete remotely
+
+    def _read_value(self):
+        """
+        return (value): the current value, from the cache if it's up-to-date,
+          otherwise read remotely.
+        """
+        if not self.cacheable:
+            return self.__getattr__("_get_value")()
+
+        with self._cache_lock:
+            if (self._cache_generation == _cache_generation and
+                time.time() < self._cache_time + VA_CACHE_MAX_AGE
+               ):
+                _cache_stats["hits"] += 1
+                return _copy_mutable(self._cache_value)
+            generation = _cache_generation
+            updates = self._cache_updates
+
+        value = self.__getattr__("_get_value")()
+
+        with self._cache_lock:
+            _cache_stats["misses"] += 1
+            # Only store the value if we are sure no change notification
+            # could have been missed since it was read.
+            if (self._cache_active and
+                generation == _cache_generation and
+                updates == self._cache_updates
+               ):
+                self._store_cache(value, generation)
+
+        return _copy_mutable(value)
+
+    def _store_cache(self, value, generation):
+        """
+        Must be called with the _cache_lock taken
+        """
+        self._cache_value = value
+        self._cache_generation = generation
+        self._cache_time = time.time()
+
+    def _write_value(self, v):
         if self.readonly:
             raise NotSettableError("Value is read-only")
-        return self.__getattr__("_set_value")(v)
-    # no delete remotely
+        try:
+            return self.__getattr__("_set_value")(v)
+        finally:
+            # The setter may have changed the value (and the one of other VAs)
+            invalidate_va_cache()
+
+    def _on_remote_value(self, v):
+        """
+        Called when a change notification is received
+        """
+        with self._cache_lock:
+            self._cache_updates += 1
+            if self._cache_active:
+                self._store_cache(v, _cache_generation)
+        self.notify(v)
+
+    def _on_remote_init(self, v):
+        """
+        Called when the initial value is received, after subscribing
+        """
+        with self._cache_lock:
+            self._cache_updates += 1
+            if self._listeners:  # Still subscribed
+                self._cache_active = True
+                self._store_cache(v, _cache_generation)
 
     # for enumerated VA
     @property
@@ -407,7 +535,7 @@ class VigilantAttributeProxy(VigilantAttributeBase, Pyro4.Proxy):
         proxy_state = Pyro4.Proxy.__getstate__(self)
         # we don't need value, it's always remotely accessed
         return (proxy_state, _core.dump_roattributes(self), self.unit,
-                self.readonly, self.max_discard)
+                self.readonly, self.max_discard, self.cacheable)
 
     def __setstate__(self, state):
         """
@@ -416,8 +544,10 @@ class VigilantAttributeProxy(VigilantAttributeBase, Pyro4.Proxy):
                             a new one is already available. 0 to keep (notify)
                             all the messages (dangerous if callback is slower
                             than the generator).
+        cacheable (bool): if True, the value can be cached locally, as any
+          change is notified.
         """
-        proxy_state, roattributes, unit, self.readonly, self.max_discard = state
+        proxy_state, roattributes, unit, self.readonly, self.max_discard, self.cacheable = state
         Pyro4.Proxy.__setstate__(self, proxy_state)
         VigilantAttributeBase.__init__(self, unit=unit)
         _core.load_roattributes(self, roattributes)
@@ -428,13 +558,15 @@ class VigilantAttributeProxy(VigilantAttributeBase, Pyro4.Proxy):
         self._ctx = None
         self._commands = None
         self._thread = None
+        self._init_cache()
 
     def _create_thread(self):
         logging.debug("Creating thread for VA %s", self._global_name)
         self._ctx = zmq.Context(1) # apparently 0MQ reuse contexts
         self._commands = self._ctx.socket(zmq.PAIR)
         self._commands.bind("inproc://" + self._global_name)
-        self._thread = SubscribeProxyThread(self.notify, self._global_name, self.max_discard, self._ctx)
+        self._thread = SubscribeProxyThread(self._on_remote_value, self._global_name, self.max_discard, self._ctx,
+                                            self._proxy_name, self._on_remote_init)
         self._thread.start()
 
     def subscribe(self, listener, init=False):
@@ -457,7 +589,9 @@ class VigilantAttributeProxy(VigilantAttributeBase, Pyro4.Proxy):
 
         # send subscription to the actual VA
         # a bit tricky because the underlying method gets created on the fly
-        Pyro4.Proxy.__getattr__(self, "subscribe")(self._proxy_name)
+        # If the value can be cached, ask for the initial value, to know when the
+        # subscription is active.
+        Pyro4.Proxy.__getattr__(self, "subscribe")(self._proxy_name, init=self.cacheable)
 
     def unsubscribe(self, listener):
         VigilantAttributeBase.unsubscribe(self, listener)
@@ -468,6 +602,11 @@ class VigilantAttributeProxy(VigilantAttributeBase, Pyro4.Proxy):
         """
         stop the remote subscription
         """
+        with self._cache_lock:
+            self._cache_active = False
+            self._cache_generation = None
+            self._cache_value = None
+
         Pyro4.Proxy.__getattr__(self, "unsubscribe")(self._proxy_name)
         if self._commands:
             self._commands.send(b"UNSUB")
@@ -494,13 +633,26 @@ class VigilantAttributeProxy(VigilantAttributeBase, Pyro4.Proxy):
             pass  # don't be too rough if that fails, it's not big deal anymore
 
 
+def _copy_mutable(value):
+    """
+    Return a copy of the value if it could be modified in place, so that the
+    caller cannot modify the cached value.
+    """
+    if isinstance(value, (list, dict, set, numpy.ndarray)):
+        return value.copy()
+    return value
+
+
 class SubscribeProxyThread(threading.Thread):
-    def __init__(self, notifier, uri, max_discard, zmq_ctx):
+    def __init__(self, notifier, uri, max_discard, zmq_ctx, listener=None, init_notifier=None):
         """
         notifier (callable): method to call when a new value arrives
         uri (string): unique string to identify the connection
         max_discard (int)
         zmq_ctx (0MQ context): available 0MQ context to use
+        listener (string or None): name used to subscribe to the VA
+        init_notifier (callable or None): method to call when the initial value
+          sent to the listener arrives
         """
         threading.Thread.__init__(self, name="zmq for VA " + uri)
         self.daemon = True
@@ -510,6 +662,8 @@ class SubscribeProxyThread(threading.Thread):
         # don't keep strong reference to notifier so that it can be garbage
         # collected normally and it will let us know then that we can stop
         self.w_notifier = WeakMethod(notifier)
+        self.listener = listener.encode("utf-8") if listener else None
+        self.w_init_notifier = WeakMethod(init_notifier) if init_notifier else None
 
         # create a zmq synchronised channel to receive commands
         self._commands = zmq_ctx.socket(zmq.PAIR)
@@ -544,20 +698,27 @@ class SubscribeProxyThread(threading.Thread):
 
             # receive data
             if socks.get(self.data) == zmq.POLLIN:
-                value = self.data.recv_pyobj()
-                # more fresh data already?
-                if (
-                        self.data.getsockopt(zmq.EVENTS) & zmq.POLLIN and
-                        discarded < self.max_discard
-                ):
-                    discarded += 1
-                    continue
-                if discarded:
-                    logging.debug("VA discarded %d values", discarded)
-                discarded = 0
+                msg = self.data.recv_multipart()
+                if len(msg) > 1:
+                    # Initial value, for a single listener
+                    if msg[0] != self.listener or self.w_init_notifier is None:
+                        continue
+                    notifier = self.w_init_notifier
+                else:
+                    # more fresh data already?
+                    if (
+                            self.data.getsockopt(zmq.EVENTS) & zmq.POLLIN and
+                            discarded < self.max_discard
+                    ):
+                        discarded += 1
+                        continue
+                    if discarded:
+                        logging.debug("VA discarded %d values", discarded)
+                    discarded = 0
+                    notifier = self.w_notifier
 
                 try:
-                    self.w_notifier(value)
+                    notifier(pickle.loads(msg[-1]))
                 except WeakRefLostError:
                     self._commands.close()
                     self.data.close()
@@ -780,7 +941,7 @@ class ListVAProxy(VigilantAttributeProxy):
     @property
     def value(self):
         # Transform a normal list into a notifying one
-        raw_list = self.__getattr__("_get_value")()
+        raw_list = self._read_value()
         # When value change, same as setting the value
         val = _NotifyingList(raw_list, notifier=self.__value_setter)
         return val
@@ -791,9 +952,7 @@ class ListVAProxy(VigilantAttributeProxy):
 
     # needs to be an explicit method to be able to reference it from the list
     def __value_setter(self, v):
-        if self.readonly:
-            raise NotSettableError("Value is read-only")
-        self.__getattr__("_set_value")(v)
+        self._write_value(v)
 
 
 class BooleanVA(VigilantAttribute):
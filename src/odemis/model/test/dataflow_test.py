@@ -25,10 +25,13 @@ import logging
 
 from Pyro4.core import oneway
 from odemis import model
+from odemis.model import _dataflow
+import numpy
 import pickle
 import threading
 import time
 import unittest
+import zmq
 
 
 class SimpleDataFlow(model.DataFlow):
@@ -361,5 +364,228 @@ class TestDataFlow(unittest.TestCase):
         self.assertEqual(self.left, 10)
 
 
+class TestMetadataEncoding(unittest.TestCase):
+
+    def setUp(self):
+        self.encoder = _dataflow._MetadataEncoder()
+        self.decoder = _dataflow._MetadataDecoder()
+        self.md = {model.MD_PIXEL_SIZE: (1e-6, 1e-6),
+                   model.MD_EXP_TIME: 0.1,
+                   model.MD_HW_NAME: "fake",
+                   model.MD_DESCRIPTION: "test",
+                   model.MD_POS: (0, 0),
+                   model.MD_ACQ_DATE: time.time(),
+                   model.MD_DWELL_TIME: 1e-6,
+                   model.MD_WL_LIST: numpy.linspace(400e-9, 700e-9, 100),
+                   }
+
+    def _transmit(self, md):
+        """
+        Encode, pickle, and decode the metadata, as when sending it over 0MQ
+        return (dict, int): the decoded metadata, and the size of the encoded metadata
+        """
+        msg = pickle.dumps(self.encoder.encode(md))
+        return self.decoder.decode(pickle.loads(msg)), len(msg)
+
+    def _assert_md_equal(self, md, dmd):
+        self.assertEqual(set(md.keys()), set(dmd.keys()))
+        for k, v in md.items():
+            numpy.testing.assert_equal(dmd[k], v)
+
+    def test_delta(self):
+        dmd, full_size = self._transmit(self.md)
+        self._assert_md_equal(self.md, dmd)
+
+        # Only the acquisition date and position change => much smaller message
+        for i in range(10):
+            md = self.md.copy()
+            md[model.MD_ACQ_DATE] += i
+            md[model.MD_POS] = (i * 1e-6, 0)
+            md[model.MD_WL_LIST] = self.md[model.MD_WL_LIST].copy()
+            dmd, size = self._transmit(md)
+            self._assert_md_equal(md, dmd)
+            self.assertLess(size, full_size / 4)
+
+        # Removed and added keys
+        md = self.md.copy()
+        del md[model.MD_HW_NAME]
+        md[model.MD_BINNING] = (2, 2)
+        dmd, size = self._transmit(md)
+        self._assert_md_equal(md, dmd)
+
+        # The decoded metadata are independent
+        dmd[model.MD_EXP_TIME] = 2
+        dmd2, _ = self._transmit(md)
+        self.assertEqual(dmd2[model.MD_EXP_TIME], 0.1)
+
+    def test_rebase(self):
+        self._transmit(self.md)
+
+        # Completely different metadata => base changed
+        md = {model.MD_EXP_TIME: 1, model.MD_ACQ_DATE: time.time()}
+        encoded = self.encoder.encode(md)
+        self.assertIn("mdbase", encoded)
+        self._assert_md_equal(md, self.decoder.decode(encoded))
+
+        # After a reset, the base is sent again
+        self.encoder.reset()
+        self.assertIn("mdbase", self.encoder.encode(md))
+
+    def test_missed_base(self):
+        self.encoder.encode(self.md)  # Not received
+        md = self.md.copy()
+        md[model.MD_ACQ_DATE] += 1
+        self.assertIsNone(self.decoder.decode(self.encoder.encode(md)))
+
+        # Base is sent again after some time => back to normal
+        self.encoder._base_time -= _dataflow.MD_BASE_REFRESH_PERIOD
+        self._assert_md_equal(md, self.decoder.decode(self.encoder.encode(md)))
+
+    def test_in_place_change(self):
+        md = self.md.copy()
+        md[model.MD_EXTRA_SETTINGS] = {"stage": {"x": [1, "m"]}}
+        md[model.MD_AR_MIRROR_TOP] = [1, 2]
+        self._transmit(md)
+
+        # Values modified in-place must be detected as changed
+        md[model.MD_EXTRA_SETTINGS]["stage"]["x"][0] = 2
+        md[model.MD_AR_MIRROR_TOP].append(3)
+        md[model.MD_WL_LIST][0] = 0
+        encoded = self.encoder.encode(md)
+        self.assertNotIn("mdbase", encoded)
+        self.assertEqual(set(encoded["md"].keys()),
+                         {model.MD_EXTRA_SETTINGS, model.MD_AR_MIRROR_TOP, model.MD_WL_LIST})
+        self._assert_md_equal(md, self.decoder.decode(encoded))
+
+
+class TestHeaderEncoding(unittest.TestCase):
+
+    def test_roundtrip(self):
+        encoder = _dataflow._HeaderEncoder()
+        decoder = _dataflow._HeaderDecoder()
+        md = {model.MD_ACQ_DATE: time.time(),
+              model.MD_POS: (1e-3, -2e-3),
+              model.MD_BINNING: (2, 2),
+              model.MD_INTEGRATION_COUNT: 3,
+              model.MD_DESCRIPTION: "Spectrum ☃",
+              model.MD_WL_LIST: numpy.linspace(400e-9, 700e-9, 10),
+              model.MD_BPP: 2 ** 70,  # too large to be packed as int64
+              model.MD_HW_NAME: True,
+              }
+        arrays = [numpy.zeros((5, 3), dtype=numpy.uint16),
+                  numpy.array(1.5),  # 0D
+                  numpy.zeros((2,), dtype=[("x", "<f4"), ("y", "<i2")]),  # structured
+                  numpy.zeros((1, 1, 1, 2, 3), dtype=">f8"),
+                  ]
+        for i, a in enumerate(arrays * 2):
+            da = model.DataArray(a, md.copy())
+            da.metadata[model.MD_ACQ_DATE] += i
+            da.metadata[model.MD_POS] = (float(i), 0.0)
+            if i == 5:
+                del da.metadata[model.MD_DESCRIPTION]
+            dtype, shape, dmd = decoder.decode(encoder.encode(da))
+            self.assertEqual(dtype, a.dtype)
+            self.assertEqual(shape, a.shape)
+            self.assertEqual(set(dmd.keys()), set(da.metadata.keys()))
+            for k, v in da.metadata.items():
+                numpy.testing.assert_equal(dmd[k], v)
+                self.assertIs(type(dmd[k]), type(v))
+
+    def test_wrong_version(self):
+        header = _dataflow._HeaderEncoder().encode(model.DataArray([1, 2]))
+        header = bytes([_dataflow._HDR_VERSION + 1]) + header[1:]
+        with self.assertRaises(ValueError):
+            _dataflow._HeaderDecoder().decode(header)
+
+
+class TestRemoteNotify(unittest.TestCase):
+    """
+    Test the messages sent by a DataFlow to the remote listeners
+    """
+
+    def setUp(self):
+        self.df = model.DataFlow()
+        self.df._ctx = zmq.Context(1)
+        self.df.pipe = self.df._ctx.socket(zmq.PUB)
+        self.df.pipe.linger = 0
+        self.df.pipe.bind("inproc://dataflow_test")
+        self.sub = self.df._ctx.socket(zmq.SUB)
+        self.sub.linger = 0
+        self.sub.connect("inproc://dataflow_test")
+        self.sub.setsockopt(zmq.SUBSCRIBE, b"")
+        self.df.subscribe("remote")
+        time.sleep(0.1)  # let the subscription propagate
+        self.decoder = _dataflow._HeaderDecoder()
+
+    def tearDown(self):
+        self.df._remote_listeners.clear()
+        self.sub.close()
+        self.df._unregister()
+
+    def _receive_message(self):
+        """
+        return (list of (DataArray)): all the arrays in one message
+        """
+        self.assertTrue(self.sub.poll(5000))
+        das = []
+        while True:
+            dtype, shape, md = self.decoder.decode(self.sub.recv())
+            das.append(model.DataArray(numpy.frombuffer(self.sub.recv(), dtype=dtype).reshape(shape), md))
+            if not self.sub.getsockopt(zmq.RCVMORE):
+                return das
+
+    def test_notify(self):
+        data = numpy.arange(12, dtype=numpy.uint16).reshape(3, 4)
+        self.df.notify(model.DataArray(data, {model.MD_EXP_TIME: 0.1}))
+        das = self._receive_message()
+        self.assertEqual(len(das), 1)
+        numpy.testing.assert_array_equal(das[0], data)
+        self.assertEqual(das[0].metadata, {model.MD_EXP_TIME: 0.1})
+
+        # Non-contiguous arrays are sent too
+        self.df.notify(model.DataArray(data.T, {model.MD_EXP_TIME: 0.2}))
+        das = self._receive_message()
+        numpy.testing.assert_array_equal(das[0], data.T)
+        self.assertEqual(das[0].metadata, {model.MD_EXP_TIME: 0.2})
+
+    def test_notify_batch(self):
+        local = []
+        def on_data(df, data):
+            local.append(data)
+        self.df.subscribe(on_data)
+
+        das = [model.DataArray(numpy.array([i], dtype=numpy.uint32), {model.MD_ACQ_DATE: float(i)})
+               for i in range(100)]
+        self.df.notify_batch(das)
+        rdas = self._receive_message()
+        self.assertEqual(len(rdas), len(das))
+        for i, d in enumerate(rdas):
+            self.assertEqual(d[0], i)
+            self.assertEqual(d.metadata, {model.MD_ACQ_DATE: float(i)})
+        self.assertEqual(len(local), len(das))
+        self.assertTrue(all(l is d for l, d in zip(local, das)))
+        self.df.unsubscribe(on_data)
+
+    def test_request_md_base(self):
+        md = {model.MD_EXP_TIME: 0.1, model.MD_ACQ_DATE: 1.0}
+        self.df.notify(model.DataArray(numpy.zeros(3), md.copy()))
+        self._receive_message()
+
+        # A listener which missed the base (eg, reconnected) cannot decode the metadata...
+        self.decoder = _dataflow._HeaderDecoder()
+        md[model.MD_ACQ_DATE] = 2.0
+        self.df.notify(model.DataArray(numpy.zeros(3), md.copy()))
+        self.assertTrue(self.sub.poll(5000))
+        self.assertIsNone(self.decoder.decode(self.sub.recv())[2])
+        self.sub.recv()
+
+        # ... until it requests it
+        self.df._request_md_base()
+        md[model.MD_ACQ_DATE] = 3.0
+        self.df.notify(model.DataArray(numpy.zeros(3), md.copy()))
+        das = self._receive_message()
+        self.assertEqual(das[0].metadata, md)
+
+
 if __name__ == "__main__":
     unittest.main()
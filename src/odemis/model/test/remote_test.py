@@ -833,6 +833,84 @@ class RemoteTest(unittest.TestCase):
         self.last_value = value
         self.assertIsInstance(value, list)
 
+    def test_va_cache(self):
+        prop = self.comp.prop
+        self.assertTrue(prop.cacheable)
+        prop.value = 10
+
+        # Not subscribed => always read remotely
+        stats_before = model.get_va_cache_statistics()
+        for i in range(3):
+            self.assertEqual(prop.value, 10)
+        stats_after = model.get_va_cache_statistics()
+        self.assertEqual(stats_after["hits"], stats_before["hits"])
+
+        # Subscribed => cached, once the initial value is received
+        self.called = 0
+        prop.subscribe(self.receive_va_update)
+        time.sleep(0.1)
+        self.assertEqual(self.called, 0)  # The initial value is not notified
+        stats_before = model.get_va_cache_statistics()
+        for i in range(10):
+            self.assertEqual(prop.value, 10)
+        stats_after = model.get_va_cache_statistics()
+        self.assertEqual(stats_after["hits"] - stats_before["hits"], 10)
+        self.assertEqual(stats_after["misses"], stats_before["misses"])
+
+        # Change remotely => the cache is updated by the notification
+        self.comp.change_prop(45)
+        time.sleep(0.1)
+        self.assertEqual(self.called, 1)
+        self.assertEqual(prop.value, 45)
+
+        # Change locally => immediately visible
+        prop.value = 3
+        self.assertEqual(prop.value, 3)
+
+        # After a while, the value is read again remotely
+        time.sleep(model.VA_CACHE_MAX_AGE + 0.1)
+        stats_before = model.get_va_cache_statistics()
+        self.assertEqual(prop.value, 3)
+        stats_after = model.get_va_cache_statistics()
+        self.assertEqual(stats_after["misses"] - stats_before["misses"], 1)
+
+        # Unsubscribed => not cached anymore
+        prop.unsubscribe(self.receive_va_update)
+        stats_before = model.get_va_cache_statistics()
+        self.assertEqual(prop.value, 3)
+        stats_after = model.get_va_cache_statistics()
+        self.assertEqual(stats_after["hits"], stats_before["hits"])
+
+    def test_va_cache_list(self):
+        l = self.comp.listval
+        self.called = 0
+        l.subscribe(self.receive_listva_update)
+        time.sleep(0.1)
+        self.assertEqual(len(l.value), 2)
+
+        # Modifying the returned list doesn't modify the cached value, but the
+        # remote one
+        l.value.append(3)
+        self.assertEqual(len(l.value), 3)
+        self.assertEqual(self.comp.get_listval_len(), 3)
+        l.unsubscribe(self.receive_listva_update)
+
+    def test_va_cache_getter(self):
+        """
+        VAs with a getter are never cached
+        """
+        counter = self.comp.counter
+        self.assertFalse(counter.cacheable)
+        prev_val = counter.value
+        self.called = 0
+        counter.subscribe(self.receive_va_update)
+        for i in range(5):
+            time.sleep(0.1)
+            val = counter.value
+            self.assertGreater(val, prev_val)
+            prev_val = val
+        counter.unsubscribe(self.receive_va_update)
+
 # a basic server (component container)
 def ServerLoop(socket_name):
     try:
@@ -905,6 +983,15 @@ class MyComponent(model.Component):
         self.enum = model.StringEnumerated("a", {"a", "c", "bfds"})
         self.cut = model.IntVA(0, setter=self._setCut)
         self.listval = model.ListVA([2, 65])
+        self._counter = 0
+        self.counter = model.IntVA(0, getter=self._getCounter, readonly=True)
+
+    def _getCounter(self):
+        self._counter += 1
+        return self._counter
+
+    def get_listval_len(self):
+        return len(self.listval.value)
 
     def _setCut(self, value):
         self.data.cut = value
@@ -710,12 +710,17 @@ class RepeatingTimer(threading.Thread):
         self.period = period
         self.daemon = True
         self._must_stop = threading.Event()
+        self._wakeup = threading.Event()  # set to stop waiting (to stop, or to call immediately)
 
     def run(self):
         # use the timeout as a timer
         try:
             wait_time = self.period
-            while not self._must_stop.wait(wait_time):
+            while True:
+                self._wakeup.wait(wait_time)
+                self._wakeup.clear()
+                if self._must_stop.is_set():
+                    return
                 tstart = time.time()
                 try:
                     self.callback()
@@ -730,6 +735,14 @@ class RepeatingTimer(threading.Thread):
 
     def cancel(self):
         self._must_stop.set()
+        self._wakeup.set()
+
+    def wakeup(self):
+        """
+        Call the callback as soon as possible, instead of waiting for the end of
+        the current period. The next calls are then scheduled from this call.
+        """
+        self._wakeup.set()
 
 
 class BackgroundWorker:
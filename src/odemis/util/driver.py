@@ -27,9 +27,10 @@ import sys
 import threading
 import time
 from collections.abc import Iterable
-from concurrent.futures import CancelledError
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
 from typing import Dict, List
 
+import Pyro4
 from Pyro4.errors import CommunicationError
 
 from odemis import model, util
@@ -393,42 +394,84 @@ class EventOnce(model.Event):
 
 
 # Special trick functions for speeding up Pyro start-up
-def _speedUpPyroVAConnect(comp):
+PYRO_CONNECT_WORKERS = 8  # maximum number of connections set up simultaneously
+
+
+def _bindProxies(comp):
     """
-    Ensures that all the VAs of the component will be quick to access
+    Set up the connection to the component, and all its VAs, DataFlows and Events
     comp (Component)
+    return (set of Component): the children of the component
     """
-    # Force the creation of the connection
-    # If the connection already exists it's very fast, otherwise, we wait
-    # for the connection to be created in a separate thread
-
-    for name, va in model.getVAs(comp).items():
-        t = threading.Thread(name="Connection to VA %s.%s" % (comp.name, name),
-                             target=va._pyroBind)
-        t.daemon = True
-        t.start()
-
-
-def speedUpPyroConnect(comp):
+    # Each connection is pretty fast (~10ms), but the component and its VAs
+    # are all different connections.
+    if isinstance(comp, Pyro4.Proxy):
+        comp._pyroBind()
+    for attrs in (model.getVAs(comp), model.getDataFlows(comp), model.getEvents(comp)):
+        for a in attrs.values():
+            if isinstance(a, Pyro4.Proxy):
+                a._pyroBind()
+    return comp.children.value
+
+
+def speedUpPyroConnect(comp, max_workers=PYRO_CONNECT_WORKERS):
     """
-    Ensures that all the children of the component will be quick to access.
+    Ensures that the component and all its children (recursively) will be quick
+    to access. The connections to the components and their VAs are set up in the
+    background, by a limited number of threads.
     It does nothing but speed up later access.
-    comp (Component)
+    comp (Component): typically, the microscope
+    max_workers (int > 0): maximum number of connections set up simultaneously
+    return (Future): finished when all the connections are set up. Its result is
+      the set of all the components found.
     """
-
-    # each connection is pretty fast (~10ms) but when listing all the VAs of
+    # Each connection is pretty fast (~10ms) but when listing all the VAs of
     # all the components, it can easily add up to 1s if done sequentially.
+    f = Future()
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="Pyro connection")
+    comps = set()
+    names = set()  # names of the components in comps
+    pending = set()
+    lock = threading.Lock()
+
+    def bind_comp(c):
+        try:
+            children = _bindProxies(c)
+        except Exception:
+            logging.warning("Failed to connect to component %s", c, exc_info=True)
+            children = set()
+
+        with lock:
+            for child in children:
+                if child.name not in names:
+                    schedule(child)
+            pending.discard(c)
+            if not pending:
+                executor.shutdown(wait=False)
+                f.set_result(comps)
+
+    def schedule(c):
+        # Must be called with the lock held
+        comps.add(c)
+        names.add(c.name)
+        pending.add(c)
+        executor.submit(bind_comp, c)
+
+    f.set_running_or_notify_cancel()
+    # If it's the microscope, all the components are known at once
+    if comp is model._core._microscope:
+        initial_comps = model.getComponents()  # Reuses the proxies already connected
+    elif model.hasVA(comp, "alive"):
+        initial_comps = comp.alive.value | {comp}
+    else:
+        initial_comps = {comp}
 
-    def bind_obj(obj):
-        #        logging.debug("binding comp %s", obj.name)
-        obj._pyroBind()
-        speedUpPyroConnect(obj)
-
-    _speedUpPyroVAConnect(comp)
+    with lock:
+        for c in initial_comps:
+            if c.name not in names:
+                schedule(c)
 
-    for child in comp.children.value:
-        t = threading.Thread(name="Connection to %s" % child.name, target=bind_obj, args=(child,))
-        t.start()
+    return f
 
 
 BACKEND_RUNNING = "RUNNING"
@@ -159,3 +159,57 @@ def AssessFocus(levels, min_ratio=15):
         logging.debug("Significant focus level deviation was found")
         return True
     return False
+
+
+def FitFocusCurve(positions, levels, model="gaussian"):
+    """
+    Fits a peak model on the focus levels measured at different focus positions.
+    It allows to locate the best focus position in-between the measured positions.
+    positions (list of floats): focus positions (m) at which the levels were measured
+    levels (list of floats): focus levels measured at each position
+    model ("gaussian" or "lorentzian"): the shape of the peak
+    returns (float, float, float, float): position (m) of the peak, width (m) of
+      the peak, amplitude and offset (ie, baseline level) of the fitted curve.
+    raises ValueError: if the curve cannot be fitted
+    """
+    # Note: imported here to avoid loading the peak module just for measuring the focus
+    from odemis.util.peak import GaussianFit, LorentzianFit
+    fit_functions = {"gaussian": GaussianFit, "lorentzian": LorentzianFit}
+    try:
+        func = fit_functions[model]
+    except KeyError:
+        raise ValueError("Unknown model %s" % (model,))
+
+    if len(positions) != len(levels):
+        raise ValueError("Got %d positions but %d levels" % (len(positions), len(levels)))
+    if len(positions) < 4:  # 4 parameters to fit
+        raise ValueError("Not enough points (%d) to fit the focus curve" % (len(positions),))
+
+    x = numpy.asarray(positions, dtype=float)
+    y = numpy.asarray(levels, dtype=float)
+    imax = numpy.argmax(y)
+    offset = y.min()
+    amplitude = y[imax] - offset
+    if amplitude <= 0:
+        raise ValueError("Focus levels are all the same")
+
+    # Fitting on values around 1 is more robust, so normalise the scales
+    x_shift, x_scale = x[imax], numpy.ptp(x)
+    xn = (x - x_shift) / x_scale
+    yn = (y - offset) / amplitude
+
+    # Initial width guess: half the size of the region above half maximum
+    above = xn[yn >= 0.5]
+    width = max(numpy.ptp(above) / 2, numpy.min(numpy.abs(numpy.diff(xn))))
+    p_initial = [0, width, 1, 0]  # pos, width, amplitude, offset
+    try:
+        popt, pcov = curve_fit(func, xn, yn, p0=p_initial)
+    except (RuntimeError, TypeError) as ex:
+        raise ValueError("Failed to fit the focus curve: %s" % (ex,))
+
+    pos, width, amp, off = popt
+    if not numpy.all(numpy.isfinite(popt)) or amp <= 0:
+        raise ValueError("Fitting of the focus curve didn't find a peak")
+
+    return (pos * x_scale + x_shift, abs(width) * x_scale,
+            amp * amplitude, off * amplitude + offset)
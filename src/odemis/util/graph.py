@@ -557,3 +557,63 @@ def is_connected(graph: Graph) -> bool:
     collections.deque(zip(walker, counter), maxlen=0)
     connected = len(graph) == next(counter)
     return connected
+
+
+def shortest_open_path(costs: numpy.ndarray, start: int = 0) -> List[int]:
+    """
+    Approximate the shortest path which starts at a given vertex and visits
+    every other vertex exactly once, without returning to the start (open
+    travelling salesman problem).
+
+    The path is first constructed using the nearest neighbor heuristic, and
+    then improved by 2-opt moves (reversal of a section of the path) until no
+    move shortens the path anymore.
+
+    Parameters
+    ----------
+    costs : ndarray
+        Square matrix of shape (n, n) containing the (symmetric) cost of going
+        from vertex i to vertex j.
+    start : int
+        The index of the starting vertex. Default is 0.
+
+    Returns
+    -------
+    path : list of int
+        The indices of all the vertices, in the order to visit them, starting
+        with `start`.
+
+    """
+    costs = numpy.asarray(costs, dtype=float)
+    n = len(costs)
+    if costs.shape != (n, n):
+        raise ValueError(f"Expected a square matrix, but got shape {costs.shape}.")
+    if not 0 <= start < n:
+        raise ValueError(f"Start vertex {start} out of range for {n} vertices.")
+
+    # Nearest neighbor
+    path = [start]
+    remaining = set(range(n)) - {start}
+    while remaining:
+        vertex = path[-1]
+        neighbor = min(remaining, key=lambda v: (costs[vertex, v], v))
+        path.append(neighbor)
+        remaining.remove(neighbor)
+
+    # 2-opt: reverse the section path[i:j+1] whenever it makes the path shorter.
+    # The start is fixed, and as the path is open, the last vertex has no successor.
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, n - 1):
+            for j in range(i + 1, n):
+                before = costs[path[i - 1], path[i]]
+                after = costs[path[i - 1], path[j]]
+                if j < n - 1:
+                    before += costs[path[j], path[j + 1]]
+                    after += costs[path[i], path[j + 1]]
+                if after < before - 1e-12:
+                    path[i:j + 1] = path[i:j + 1][::-1]
+                    improved = True
+
+    return path
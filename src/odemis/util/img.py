@@ -1195,30 +1195,124 @@ def assembleZCube(images, zlevels):
         """
         # images is a list of 3 dim data arrays.
         # Will fail on purpose if the images contain more than 2 dimensions
-        ret = numpy.array([im.reshape(im.shape[-2:]) for im in images])
+        assembler = ZCubeAssembler(zlevels, nb_images=len(images))
+        for im in images:
+            assembler.append(im)
+
+        return assembler.get_cube()
+
+
+class ZCubeAssembler(object):
+    """
+    Construct a xyz cube from a z stack of images, one image at a time, as they
+    are acquired. The cube is allocated once, when the first image is received,
+    and the maximum intensity projection can be computed along, so that the
+    images don't need to be kept until the end of the z stack.
+    """
+    def __init__(self, zlevels, nb_images=None, cube=True, mip=False):
+        """
+        :param zlevels: (list of float) list of focus positions, in the order of
+          the images which will be appended.
+        :param nb_images: (int or None) number of images which will be appended.
+          If None, it's the number of zlevels.
+        :param cube: (bool) if True, the cube is built (see get_cube()).
+        :param mip: (bool) if True, the maximum intensity projection is computed
+          (see get_mip()).
+        """
+        self._zlevels = zlevels
+        self._nb_images = len(zlevels) if nb_images is None else nb_images
+        self._keep_cube = cube
+        self._compute_mip = mip
+        # For a negative pixel size, the images are stored in reverse order,
+        # so that the cube has a positive pixel size.
+        self._reverse = len(zlevels) > 1 and zlevels[-1] < zlevels[0]
+
+        self._cube = None  # numpy array of shape ZYX
+        self._mip = None  # numpy array of shape YX
+        self._md = None  # metadata of the first image
+        self._count = 0  # number of images appended so far
+
+    def append(self, img):
+        """
+        Add the next image of the z stack.
+        :param img: (DataArray of shape YX) the image at the next zlevel. It
+          can have extra dimensions of length 1 (eg, CTZYX), but no more than
+          2 dimensions of length > 1.
+        raise ValueError: if the image has more than 2 dimensions
+        raise IndexError: if more images than expected are appended
+        """
+        # Will fail on purpose if the images contain more than 2 dimensions
+        im = img.reshape(img.shape[-2:])
+        if self._count >= self._nb_images:
+            raise IndexError("Already received %d images" % (self._count,))
+
+        if self._md is None:
+            self._md = img.metadata
+            if self._keep_cube:
+                self._cube = numpy.empty((self._nb_images,) + im.shape, dtype=im.dtype)
+            if self._compute_mip:
+                self._mip = numpy.array(im)
+        elif self._compute_mip:
+            numpy.maximum(self._mip, im, out=self._mip)
+
+        if self._keep_cube:
+            if self._reverse:
+                self._cube[self._nb_images - 1 - self._count] = im
+            else:
+                self._cube[self._count] = im
+        self._count += 1
+
+    def get_cube(self):
+        """
+        :return: (DataArray of shape ZYX) the data array of the xyz cube, with
+          the metadata of the first image, extended to 3D. If less images than
+          expected were appended, the cube only contains these images.
+        raise ValueError: if no image was appended
+        """
+        if not self._keep_cube:
+            raise ValueError("Cube not computed")
+        if self._count == 0:
+            raise ValueError("No image received")
+
+        if self._count < self._nb_images:
+            logging.warning("Only received %d images out of %d, cube will be incomplete",
+                            self._count, self._nb_images)
+        if self._reverse:
+            cube = self._cube[self._nb_images - self._count:]
+        else:
+            cube = self._cube[:self._count]
 
         # Add back metadata
-        metadata3d = copy.copy(images[0].metadata)
+        metadata3d = copy.copy(self._md)
         # Extend pixel size to 3D
+        zlevels = self._zlevels
         ps_x, ps_y = metadata3d[model.MD_PIXEL_SIZE]
-        ps_z = (zlevels[-1] - zlevels[0]) / (len(zlevels) - 1) if len(zlevels) > 1 else 1e-6
+        ps_z = abs(zlevels[-1] - zlevels[0]) / (len(zlevels) - 1) if len(zlevels) > 1 else 1e-6
 
         # Compute cube centre
         c_x, c_y = metadata3d[model.MD_POS]
         c_z = (zlevels[0] + zlevels[-1]) / 2  # Assuming zlevels are ordered
         metadata3d[model.MD_POS] = (c_x, c_y, c_z)
 
-        # For a negative pixel size, convert to a positive and flip the z axis
-        if ps_z < 0:
-            ret = numpy.flipud(ret)
-            ps_z = -ps_z
-
         metadata3d[model.MD_PIXEL_SIZE] = (ps_x, ps_y, ps_z)
         metadata3d[model.MD_DIMS] = "ZYX"
 
-        ret = DataArray(ret, metadata3d)
+        return DataArray(cube, metadata3d)
 
-        return ret
+    def get_mip(self):
+        """
+        :return: (DataArray of shape YX) the maximum intensity projection along
+          Z of the images appended so far, with the metadata of the first image.
+        raise ValueError: if no image was appended
+        """
+        if not self._compute_mip:
+            raise ValueError("Maximum intensity projection not computed")
+        if self._count == 0:
+            raise ValueError("No image received")
+
+        md = copy.copy(self._md)
+        md[model.MD_DIMS] = "YX"
+        return DataArray(self._mip.copy(), md)
 
 
 def apply_flood_fill(input_array, start):
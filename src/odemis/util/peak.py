@@ -15,10 +15,15 @@ Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRAN
 You should have received a copy of the GNU General Public License along with Odemis. If not, see http://www.gnu.org/licenses/.
 '''
 from concurrent.futures._base import CancelledError, CANCELLED, FINISHED, RUNNING
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import logging
+import multiprocessing
+from multiprocessing import shared_memory
 import numpy
 from odemis import model
+from odemis.util import executeAsyncTask, spectrum as uspectrum
 from scipy.optimize import curve_fit, OptimizeWarning
+import os
 import threading
 import time
 import warnings
@@ -30,6 +35,12 @@ E_CHARGE = 1.602e-19  # J --> eV
 WL_TO_ENERGY = H_PLANK * C_LIGHT / E_CHARGE
 WIDTH_RATIO = 0.01
 
+# Below this number of spectra, a map is fitted in the current process, as
+# starting worker processes would take longer than the fitting itself.
+MIN_SPECTRA_PARALLEL_FIT = 256
+# Number of rows of a map fitted by a worker process in one go
+MAP_ROWS_PER_TASK = 4
+
 # TODO: this code is full of reliance on numpy being quite lax with wrong
 # computation, and easily triggers numpy warnings. To force numpy to be
 # stricter:
@@ -201,6 +212,162 @@ def Detect(y_vector, x_vector=None, lookahead=5, delta=0):
     return maxtab, mintab
 
 
+def _FitSpectrum(spectrum, wavelength, type='gaussian_space', is_cancelled=lambda: False):
+    """
+    Smooths the spectrum signal, detects the peaks and applies the type of peak
+    fitting required.
+    spectrum (1d array of floats): The data representing the spectrum.
+    wavelength (1d array of floats): The wavelength values corresponding to the
+    spectrum given.
+    type (str): Type of fitting to be applied
+    is_cancelled (callable returning bool): to check whether the fitting should stop
+    returns:
+         params (1d array of floats): the optimized parameters, as passed to the
+           fit function (ie, in the energy domain for the energy types)
+         bounds (2 lists of floats): the lower and upper bounds of the parameters
+    raises:
+            KeyError if given type not available
+            ValueError if fitting cannot be applied
+            CancelledError if is_cancelled() returned True
+    """
+    # values based on experimental datasets
+    if len(wavelength) >= 2000:
+        divider = 20
+    elif len(wavelength) >= 1000:
+        divider = 25
+    else:
+        divider = 30
+    init_window_size = max(3, len(wavelength) // divider)
+    window_size = init_window_size
+    logging.debug("Starting peak detection on data (len = %d) with window = %d",
+                  len(wavelength), window_size)
+    try:
+        wl_rng = wavelength[-1] - wavelength[0]
+        width = wl_rng * WIDTH_RATIO  # initial peak width estimation
+        FitFunction = PEAK_FUNCTIONS[type]
+    except KeyError:
+        raise KeyError("Given type %s not in available fitting types: %s" % (type, list(PEAK_FUNCTIONS.keys())))
+    for step in range(5):
+        if is_cancelled():
+            raise CancelledError()
+        smoothed = Smooth(spectrum, window_len=window_size)
+        # Increase window size until peak detection finds enough peaks to fit
+        # the spectrum curve
+        peaks = Detect(smoothed, wavelength, lookahead=window_size, delta=5)[0]
+        if not peaks:
+            window_size = int(round(window_size * 1.2))
+            logging.debug("Retrying to fit peak with window = %d", window_size)
+            continue
+
+        fit_list = []
+        for (pos, amplitude) in peaks:
+            if type in {'gaussian_energy', 'lorentzian_energy'}:
+                fit_list.extend(peak_to_energy(pos, width, amplitude))
+            else:
+                fit_list.extend([pos, width, amplitude])
+
+        # Initialize the offset with the minimum possible value
+        offset = 0
+        fit_list.append(offset)
+        param_bounds = _FitBounds(spectrum, wavelength, len(peaks), type)
+
+        if is_cancelled():
+            raise CancelledError()
+
+        try:
+            params = _CurveFit(spectrum, wavelength, fit_list, param_bounds, type)
+            break
+        except Exception as ex:
+            window_size = int(round(window_size * 1.2))
+            logging.debug("Retrying to fit peak with window = %d due to error %s", window_size, ex)
+            continue
+    else:
+        raise ValueError("Could not apply peak fitting of type %s." % type)
+
+    return params, param_bounds
+
+
+def _FitBounds(spectrum, wavelength, npeaks, type='gaussian_space'):
+    """
+    Computes the bounds of the fitting parameters.
+    npeaks (int): number of peaks fitted
+    returns (2 lists of floats): the lower and upper bounds of the parameters
+    """
+    lower_bounds = []
+    upper_bounds = []
+    if type in {'gaussian_energy', 'lorentzian_energy'}:
+        energy = apply_jacobian_x(wavelength)
+        # lower & upper bounds for center position, width, amplitude in energy domain
+        en_rng = energy[0] - energy[-1]
+        peak_lower = [energy[-1] - en_rng / 2, en_rng / 1e4, 0]
+        peak_upper = [energy[0] + en_rng / 2, en_rng * 10, numpy.inf]
+    else:
+        # lower & upper bounds for center position, width, amplitude in space domain
+        wl_rng = wavelength[-1] - wavelength[0]
+        peak_lower = [wavelength[0] - wl_rng / 2, wl_rng / 1e3, 0]
+        peak_upper = [wavelength[-1] + wl_rng / 2, wl_rng * 10, numpy.inf]
+    for i in range(npeaks):
+        lower_bounds.extend(peak_lower)
+        upper_bounds.extend(peak_upper)
+
+    # Set the lower & upper bounds for the offset
+    offset_lower, offset_upper = _OffsetBounds(spectrum)
+    lower_bounds.append(offset_lower)
+    upper_bounds.append(offset_upper)
+    return lower_bounds, upper_bounds
+
+
+def _OffsetBounds(spectrum):
+    """
+    Computes the bounds of the offset: between 0 and the minimum of the spectrum.
+    If the spectrum goes down to 0 or below (eg, due to noise), the offset is
+    allowed to go down to the minimum, as the bounds must not be equal.
+    returns (float, float): the lower and upper bounds of the offset (lower < upper)
+    """
+    smin = float(numpy.min(spectrum))
+    lower = min(smin, 0)
+    upper = max(smin, 0)
+    if upper <= lower:  # minimum exactly 0
+        upper = lower + max(float(numpy.ptp(spectrum)), 1) * 1e-3
+    return lower, upper
+
+
+def _CurveFit(spectrum, wavelength, p0, bounds, type='gaussian_space'):
+    """
+    Fits the peak function to the spectrum
+    p0 (list of floats): initial parameters
+    bounds (2 lists of floats): the lower and upper bounds of the parameters
+    returns (1d array of floats): the optimized parameters
+    raises: any exception raised by curve_fit() if the fitting failed
+    """
+    FitFunction = PEAK_FUNCTIONS[type]
+    if type in {'gaussian_energy', 'lorentzian_energy'}:
+        x = apply_jacobian_x(wavelength)
+        y = apply_jacobian_y(wavelength, spectrum)
+    else:
+        x, y = wavelength, spectrum
+    with warnings.catch_warnings():
+        # Hide scipy/optimize/minpack.py:690: OptimizeWarning: Covariance of the parameters could not be estimated
+        warnings.filterwarnings("ignore", "", OptimizeWarning)
+        params, _ = curve_fit(FitFunction, x, y, p0=p0, bounds=bounds)
+    return params
+
+
+def _ParamsToPeaks(params, type='gaussian_space'):
+    """
+    Reformat the fitting parameters to a list of peaks in the space domain.
+    params (1d array of floats): as returned by _FitSpectrum()
+    returns (list of 3-tuple): Each peak parameters as (pos, width, amplitude)
+    """
+    peaks_params = []
+    for pos, width, amplitude in _Grouped(params[:-1], 3):
+        if type in {'gaussian_energy', 'lorentzian_energy'}:
+            peaks_params.append(peak_to_wavelength(pos, width, amplitude))
+        else:
+            peaks_params.append((pos, width, amplitude))
+    return peaks_params
+
+
 class PeakFitter(object):
     def __init__(self):
         # will take care of executing peak fitting asynchronously
@@ -253,94 +420,9 @@ class PeakFitter(object):
                 ValueError if fitting cannot be applied
         """
         try:
-            # values based on experimental datasets
-            if len(wavelength) >= 2000:
-                divider = 20
-            elif len(wavelength) >= 1000:
-                divider = 25
-            else:
-                divider = 30
-            init_window_size = max(3, len(wavelength) // divider)
-            window_size = init_window_size
-            logging.debug("Starting peak detection on data (len = %d) with window = %d",
-                          len(wavelength), window_size)
-            try:
-                wl_rng = wavelength[-1] - wavelength[0]
-                width = wl_rng * WIDTH_RATIO  # initial peak width estimation
-                FitFunction = PEAK_FUNCTIONS[type]
-            except KeyError:
-                raise KeyError("Given type %s not in available fitting types: %s" % (type, list(PEAK_FUNCTIONS.keys())))
-            for step in range(5):
-                if future._fit_state == CANCELLED:
-                    raise CancelledError()
-                smoothed = Smooth(spectrum, window_len=window_size)
-                # Increase window size until peak detection finds enough peaks to fit
-                # the spectrum curve
-                peaks = Detect(smoothed, wavelength, lookahead=window_size, delta=5)[0]
-                if not peaks:
-                    window_size = int(round(window_size * 1.2))
-                    logging.debug("Retrying to fit peak with window = %d", window_size)
-                    continue
-
-                fit_list = []
-                lower_bounds = []
-                upper_bounds = []
-                for (pos, amplitude) in peaks:
-                    if type in {'gaussian_energy', 'lorentzian_energy'}:
-                        energy = apply_jacobian_x(wavelength)
-                        spectra_energy = apply_jacobian_y(wavelength, spectrum)
-                        fit_list.extend(peak_to_energy(pos, width, amplitude))
-                        # lower & upper bounds for center position, width, amplitude in energy domain
-                        en_rng = energy[0] - energy[-1]
-                        lower_bounds.extend([energy[-1] - en_rng / 2, en_rng / 1e4, 0])
-                        upper_bounds.extend([energy[0] + en_rng / 2, en_rng * 10, numpy.inf])
-                    else:
-                        # lower & upper bounds for center position, width, amplitude in space domain
-                        fit_list.extend([pos, width, amplitude])
-                        lower_bounds.extend([wavelength[0] - wl_rng / 2, wl_rng / 1e3, 0])
-                        upper_bounds.extend([wavelength[-1] + wl_rng / 2, wl_rng * 10, numpy.inf])
-
-                # Initialize the offset with the minimum possible value
-                offset = 0
-                fit_list.append(offset)
-                # Set the lower & upper bounds for the offset
-                lower_bounds.extend([0])
-                upper_bounds.extend([min(spectrum)])
-                param_bounds = (lower_bounds, upper_bounds)
-
-                if future._fit_state == CANCELLED:
-                    raise CancelledError()
-
-                try:
-                    with warnings.catch_warnings():
-                        # Hide scipy/optimize/minpack.py:690: OptimizeWarning: Covariance of the parameters could not be estimated
-                        warnings.filterwarnings("ignore", "", OptimizeWarning)
-                        # TODO, from scipy 0.17, curve_fit() supports the 'bounds' parameter.
-                        # It could be used to ensure the peaks params are positives.
-                        # (Once we don't support Ubuntu 12.04)
-                        if type in {'gaussian_energy', 'lorentzian_energy'}:
-                            params, _ = curve_fit(FitFunction, energy, spectra_energy, p0=fit_list, bounds=param_bounds)
-                        else:
-                            params, _ = curve_fit(FitFunction, wavelength, spectrum, p0=fit_list, bounds=param_bounds)
-                    break
-                except Exception as ex:
-                    window_size = int(round(window_size * 1.2))
-                    logging.debug("Retrying to fit peak with window = %d due to error %s", window_size, ex)
-                    continue
-            else:
-                raise ValueError("Could not apply peak fitting of type %s." % type)
-            # reformat parameters to (list of 3 tuples, offset)
-            peaks_params = []
-            for pos, width, amplitude in _Grouped(params[:-1], 3):
-                # Note: to avoid negative peaks, the fit functions only take the
-                # absolute of the amplitude/width. So now amplitude and width
-                # have 50% chances to be negative => Force positive now.
-                if type in {'gaussian_energy', 'lorentzian_energy'}:
-                    peaks_params.append(peak_to_wavelength(pos, width, amplitude))
-                else:
-                    peaks_params.append((pos, width, amplitude))
-
-            return peaks_params, params[-1], type
+            params, _ = _FitSpectrum(spectrum, wavelength, type,
+                                     is_cancelled=lambda: future._fit_state == CANCELLED)
+            return _ParamsToPeaks(params, type), params[-1], type
         except CancelledError:
             logging.debug("Fitting of type %s was cancelled.", type)
         finally:
@@ -499,3 +581,238 @@ def _Grouped(iterable, n):
     Iterate over the iterable, n elements at a time
     """
     return zip(*[iter(iterable)] * n)
+
+
+def _FitSpectra(spectra, width, wavelength, p0, bounds, type):
+    """
+    Fits the peaks on each spectrum of a block of rows of a map. Each fit starts
+    from the result of the neighbouring pixel: on the left, or above for the
+    first pixel of a row. If the neighbour could not be fitted, it starts from p0.
+    spectra (2d array of floats of shape N, C): the spectra of complete rows (N = rows * width)
+    width (int): number of pixels in a row
+    wavelength (1d array of floats): the wavelength of each spectrum value
+    p0 (list of floats): the initial parameters
+    bounds (2 lists of floats): the lower and upper bounds of the parameters
+    type (str): type of fitting
+    returns (2d array of floats of shape N, P): the fitted parameters, NaN if the
+      fitting failed
+    """
+    p0 = numpy.asarray(p0, dtype=float)
+    results = numpy.full((len(spectra), len(p0)), numpy.nan)
+    for i, spec in enumerate(spectra):
+        if i % width:
+            start = results[i - 1]  # left
+        elif i >= width:
+            start = results[i - width]  # above
+        else:
+            start = p0
+        if numpy.isnan(start).any():
+            start = p0
+        # The offset is bounded by the minimum of the spectrum
+        lbounds, ubounds = list(bounds[0]), list(bounds[1])
+        lbounds[-1], ubounds[-1] = _OffsetBounds(spec)
+        pstart = numpy.clip(start, lbounds, ubounds)
+        try:
+            results[i] = _CurveFit(spec, wavelength, pstart, (lbounds, ubounds), type)
+        except Exception as ex:
+            logging.debug("Failed to fit spectrum %d: %s", i, ex)
+    return results
+
+
+def _FitSharedSpectra(shm_name, shape, dtype, rows, width, wavelength, p0, bounds, type):
+    """
+    Runs _FitSpectra() in a worker process, on spectra stored in shared memory.
+    shm_name (str): name of the shared memory containing all the spectra
+    shape (tuple of ints): shape of the array of spectra (N, C)
+    dtype (numpy.dtype): type of the array of spectra
+    rows (slice): the rows to fit (as indices of the spectra, so multiple of width)
+    returns (2d array of floats): see _FitSpectra()
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        spectra = numpy.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        # Copy, so that the shared memory is not referenced anymore when closing it
+        block = spectra[rows].copy()
+        del spectra
+    finally:
+        shm.close()
+    return _FitSpectra(block, width, wavelength, p0, bounds, type)
+
+
+def FitMap(data, wavelength=None, type='gaussian_space', npeaks=None, max_workers=None):
+    """
+    Fits peaks on every spectrum of a spectrum cube, in parallel processes.
+    The peaks are detected on the average spectrum, and every spectrum is fitted
+    with these peaks, starting from the result of the neighbouring spectrum.
+    data (DataArray of shape CYX, C11YX, CTYX or CT1YX): the spectrum cube
+    wavelength (1d array of floats): the wavelength values corresponding to C. If None,
+      it's computed from the metadata of data.
+    type (str): Type of fitting to be applied ('gaussian_space', 'lorentzian_space',
+      'gaussian_energy' or 'lorentzian_energy')
+    npeaks (int or None): maximum number of peaks fitted. If None, all the
+      peaks detected on the average spectrum are fitted.
+    max_workers (int or None): number of processes. If None, the number of CPUs.
+    returns (model.ProgressiveFuture): the fitting progress. Its result is a list of
+      DataArrays, one per parameter map: for each peak, the position, width and
+      amplitude (in the space domain), and then the offset. Each map has the shape
+      of data without C (and without dimensions of length 1 before YX). A
+      spectrum which could not be fitted has NaN as parameters.
+    """
+    if wavelength is None:
+        wavelength, _ = uspectrum.get_spectrum_range(data)
+    wavelength = numpy.asarray(wavelength, dtype=float)
+    if type not in PEAK_FUNCTIONS:
+        raise KeyError("Given type %s not in available fitting types: %s" % (type, list(PEAK_FUNCTIONS.keys())))
+
+    nspectra = int(numpy.prod(data.shape[1:]))
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    if nspectra < MIN_SPECTRA_PARALLEL_FIT:
+        max_workers = 1
+
+    est_start = time.time() + 0.1
+    f = model.ProgressiveFuture(start=est_start,
+                                end=est_start + _EstimateMapFitTime(nspectra, len(wavelength), max_workers))
+    f._fit_state = RUNNING
+    f._fit_lock = threading.Lock()
+    f._fit_subfutures = []
+    f.task_canceller = _CancelFitMap
+    executeAsyncTask(f, _DoFitMap, args=(f, data, wavelength, type, npeaks, max_workers))
+    return f
+
+
+def _EstimateMapFitTime(nspectra, length, workers):
+    """
+    Estimates the duration of fitting a map
+    """
+    # Warm-started fits are much faster than the fit of a single spectrum
+    return nspectra * length * 1e-4 / workers + 1  # s
+
+
+def _CancelFitMap(future):
+    """
+    Canceller of _DoFitMap task.
+    """
+    with future._fit_lock:
+        if future._fit_state == FINISHED:
+            return False
+        future._fit_state = CANCELLED
+        for sf in future._fit_subfutures:
+            sf.cancel()
+    logging.debug("Map fitting cancelled.")
+    return True
+
+
+def _DoFitMap(future, data, wavelength, type, npeaks, max_workers):
+    """
+    Fits peaks on every spectrum of a spectrum cube. See FitMap() for the parameters.
+    returns (list of DataArrays): the parameter maps
+    """
+    try:
+        s = data.shape
+        # one spectrum per row, with the pixels in raster order
+        spectra = numpy.ascontiguousarray(numpy.reshape(data, (s[0], -1)).T, dtype=float)
+        width = s[-1]
+
+        # Find the peaks on the average spectrum, to use as initial parameters
+        mean_spec = spectra.mean(axis=0)
+        params, _ = _FitSpectrum(mean_spec, wavelength, type,
+                                 is_cancelled=lambda: future._fit_state == CANCELLED)
+        peaks = list(_Grouped(params[:-1], 3))
+        if npeaks is not None and len(peaks) > npeaks:
+            # Keep the highest peaks, in the order of the spectrum
+            highest = sorted(numpy.argsort([a for _, _, a in peaks])[::-1][:npeaks])
+            peaks = [peaks[i] for i in highest]
+        p0 = [v for p in peaks for v in p] + [params[-1]]
+        bounds = _FitBounds(mean_spec, wavelength, len(peaks), type)
+        logging.debug("Fitting %d spectra with %d peaks, with %d processes",
+                      len(spectra), len(peaks), max_workers)
+
+        start = time.time()
+        if max_workers <= 1:
+            results = _FitSpectra(spectra, width, wavelength, p0, bounds, type)
+        else:
+            results = _FitSpectraParallel(future, spectra, width, wavelength, p0, bounds, type, max_workers)
+        logging.debug("Fitted %d spectra in %g s", len(spectra), time.time() - start)
+
+        # Convert back to the space domain
+        if type in {'gaussian_energy', 'lorentzian_energy'}:
+            for i in range(len(peaks)):
+                results[:, 3 * i:3 * i + 3] = numpy.column_stack(peak_to_wavelength(*results[:, 3 * i:3 * i + 3].T))
+
+        return _ResultsToMaps(data, results, len(peaks))
+    finally:
+        with future._fit_lock:
+            if future._fit_state == CANCELLED:
+                raise CancelledError()
+            future._fit_state = FINISHED
+
+
+def _FitSpectraParallel(future, spectra, width, wavelength, p0, bounds, type, max_workers):
+    """
+    Runs _FitSpectra() over blocks of rows, in a pool of processes, which access
+    the spectra via shared memory.
+    returns (2d array of floats): see _FitSpectra()
+    """
+    shm = shared_memory.SharedMemory(create=True, size=spectra.nbytes)
+    try:
+        shared = numpy.ndarray(spectra.shape, dtype=spectra.dtype, buffer=shm.buf)
+        shared[:] = spectra
+        del shared
+
+        results = numpy.empty((len(spectra), len(p0)))
+        block = MAP_ROWS_PER_TASK * width
+        # "spawn" instead of "fork", as the process is multi-threaded
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=ctx) as executor:
+            with future._fit_lock:
+                if future._fit_state == CANCELLED:
+                    raise CancelledError()
+                subfs = {}
+                for i in range(0, len(spectra), block):
+                    rows = slice(i, min(i + block, len(spectra)))
+                    sf = executor.submit(_FitSharedSpectra, shm.name, spectra.shape, spectra.dtype,
+                                         rows, width, wavelength, p0, bounds, type)
+                    subfs[sf] = rows
+                future._fit_subfutures = list(subfs.keys())
+
+            start = time.time()
+            for n, sf in enumerate(as_completed(subfs), 1):
+                if future._fit_state == CANCELLED:
+                    raise CancelledError()
+                results[subfs[sf]] = sf.result()
+                # Update the estimated end time, based on the progress so far
+                future.set_progress(end=time.time() + (time.time() - start) * (len(subfs) - n) / n)
+        return results
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def _ResultsToMaps(data, results, npeaks):
+    """
+    Converts the fitting results to parameter maps
+    data (DataArray): the spectrum cube
+    results (2d array of floats of shape N, P): the fitted parameters of each spectrum
+    npeaks (int): number of peaks
+    returns (list of DataArrays): one map per parameter
+    """
+    shape = data.shape[1:]
+    # Drop the dimensions of length 1 before YX (ie, Z, and T if not temporal)
+    while len(shape) > 2 and shape[-3] == 1:
+        shape = shape[:-3] + shape[-2:]
+    md = getattr(data, "metadata", {}).copy()
+    for k in (model.MD_WL_LIST, model.MD_DIMS, model.MD_OUT_WL, model.MD_TIME_LIST, model.MD_THETA_LIST):
+        md.pop(k, None)
+    desc = md.get(model.MD_DESCRIPTION, "Spectrum")
+
+    names = []
+    for i in range(npeaks):
+        names.extend(["peak %d position" % (i + 1), "peak %d width" % (i + 1), "peak %d amplitude" % (i + 1)])
+    names.append("offset")
+    maps = []
+    for i, name in enumerate(names):
+        mmd = md.copy()
+        mmd[model.MD_DESCRIPTION] = "%s %s" % (desc, name)
+        maps.append(model.DataArray(results[:, i].reshape(shape), mmd))
+    return maps
@@ -28,6 +28,7 @@ Odemis. If not, see http://www.gnu.org/licenses/.
 
 import logging
 import math
+import time
 
 import numpy
 
@@ -185,6 +186,49 @@ def get_time_range(data):
         return list(range(min_t, max_t + 1)), "px"
 
 
+def is_point_block(data):
+    """
+    Check whether the data is a block of consecutive points of a 0D detector.
+    Such block is acquired in spot mode, when the scanner .spotBlockSize > 1.
+    It has a shape (N,), with MD_DIMS = "T". The points are acquired back-to-back,
+    one every MD_DWELL_TIME, starting at MD_ACQ_DATE.
+
+    :param data: (model.DataArray): data received from a detector
+    :return: (bool): True if it's a block of points
+    """
+    return data.ndim == 1 and data.metadata.get(model.MD_DIMS) == "T"
+
+
+def get_point_series(data):
+    """
+    Convert the data of a 0D detector into a series of values, each with its
+    acquisition date.
+
+    :param data: (model.DataArray): either a single point (of any shape, typically 1x1),
+      or a block of consecutive points (see is_point_block()). If the data has
+      more than one point, but is not a block, the average is used.
+    :return: (ndarray of N floats, ndarray of N floats): the values, and the
+      date (in s) of the beginning of the acquisition of each value
+    """
+    date = data.metadata.get(model.MD_ACQ_DATE)
+    if date is None:
+        date = time.time()
+
+    if is_point_block(data):
+        try:
+            dt = data.metadata[model.MD_DWELL_TIME]
+        except KeyError:
+            raise ValueError("Block of points without MD_DWELL_TIME")
+        values = data.view(numpy.ndarray).astype(numpy.float64)
+        dates = date + numpy.arange(len(data)) * dt
+        return values, dates
+
+    if data.size != 1:
+        logging.debug("Got %s points instead of 1", data.shape)
+    values = numpy.array([data.view(numpy.ndarray).mean()], dtype=numpy.float64)
+    return values, numpy.array([date], dtype=numpy.float64)
+
+
 def get_angle_range(data):
     """ Returns the list of theta values.
 
@@ -292,6 +336,74 @@ def get_angle_per_pixel(da):
     return thetal
 
 
+class SpectrumCumulativeIndex(object):
+    """
+    Pre-computed cumulative sum of a spectrum cube along the C dimension, so that
+    the average over any wavelength range can be computed by just subtracting
+    two planes, instead of summing all the planes of the range.
+    If the data has a T or A dimension, it is averaged once, when building the
+    index. So the average can only be computed over the whole T/A dimension: a
+    window in T/A is not supported. Indexing it too would need a cumulative sum
+    along both C and T/A, of (C + 1) * (T + 1) * Y * X elements, which is too
+    large for temporal or angular spectrum cubes. Callers needing a T/A window
+    have to average the data themselves.
+    For integer data, the sums are exact, unless they could overflow 64-bit
+    integers (only with 64-bit data). The index takes (C + 1) * Y * X
+    integers of 32 or 64 bits (depending on the dtype of the data), or floats
+    of 64 bits.
+    """
+
+    def __init__(self, data):
+        """
+        data (numpy.ndarray or similar of shape CTZYX, with Z = 1): the spectrum cube
+        """
+        if data.ndim != 5 or data.shape[2] != 1:
+            raise ValueError("Data should be of shape CT1YX, but got %s" % (data.shape,))
+
+        self.shape = data.shape
+        self.dtype = data.dtype
+        self._nt = data.shape[1]  # Number of elements summed for each C
+
+        nc = data.shape[0]
+        if numpy.issubdtype(data.dtype, numpy.integer):
+            # Use 32 bits if the total sum can never overflow, as it halves the memory usage
+            idt = numpy.iinfo(data.dtype)
+            max_sum = max(abs(int(idt.min)), int(idt.max)) * nc * self._nt
+            for sum_dtype in (numpy.int32, numpy.int64, numpy.uint64):
+                sdt = numpy.iinfo(sum_dtype)
+                # Unsigned sums only for unsigned data, as they only increase
+                if max_sum <= sdt.max and (idt.min >= 0 or sdt.min < 0):
+                    break
+            else:
+                # The sum could overflow even 64-bit integers => use floats (not exact anymore)
+                sum_dtype = numpy.float64
+        else:
+            sum_dtype = numpy.float64
+
+        # First plane is all 0's, so that the sum of [l, h] is always cs[h + 1] - cs[l]
+        self._cumsum = numpy.zeros((nc + 1,) + data.shape[-2:], dtype=sum_dtype)
+        # Sum one C at a time, so that the data can also be computed on the fly
+        # (eg, calibration.SpectrumCorrectedData)
+        for c in range(nc):
+            numpy.sum(data[c, :, 0], axis=0, dtype=sum_dtype, out=self._cumsum[c + 1])
+            # Note: it's much faster than numpy.cumsum() along the first axis
+            self._cumsum[c + 1] += self._cumsum[c]
+
+    def mean(self, c_range):
+        """
+        Compute the average over a range of the C dimension (and always the whole
+          T/A dimension, as it's not indexed)
+        c_range (int, int): low and high index in C (both included)
+        return (numpy.ndarray of shape YX, of float): the average for each pixel
+        """
+        low, high = c_range
+        if not 0 <= low <= high < self.shape[0]:
+            raise IndexError("Range %s is not within the C dimension of length %d" %
+                             (c_range, self.shape[0]))
+        s = self._cumsum[high + 1] - self._cumsum[low]
+        return s / ((high - low + 1) * self._nt)
+
+
 def coefficients_to_dataarray(coef):
     """
     Convert a spectrum efficiency coefficient array to a DataArray as expected
@@ -310,3 +422,101 @@ def coefficients_to_dataarray(coef):
     da.metadata[model.MD_WL_LIST] = wl_list
 
     return da
+
+
+# Maximum amount of memory (in bytes) used at once for the differential of the
+# spectra, when detecting spikes. The data is processed in chunks of rows.
+SPIKE_CHUNK_SIZE = 64 * 1024 ** 2
+
+
+def _iter_spectra_chunks(specdat):
+    """
+    Iterates over the spectral data, by chunks of rows
+    specdat (numpy.array of shape CYX)
+    yields (slice, numpy.array of shape C, N): the rows and their spectra, with the
+      pixels flattened
+    """
+    c, h, w = specdat.shape
+    nrows = max(1, SPIKE_CHUNK_SIZE // (max(c - 1, 1) * w * 4))  # float32 differential
+    for y in range(0, h, nrows):
+        rows = slice(y, min(y + nrows, h))
+        yield rows, specdat[:, rows, :].reshape(c, -1)
+
+
+def remove_spikes(data, threshold=8, margin=1, spacing=3):
+    """
+    Detects and removes the spikes in spectral data, typically caused by cosmic
+    rays hitting the CCD during acquisition.
+    The spike detection is performed by comparing the signal differential
+    with the average differential in the whole data. If the differential for a
+    given wavelength exceeds threshold times the average, it will be marked
+    as a spike. Subsequently, the identified wavelengths are corrected by linear
+    interpolation between the neighbouring wavelengths of the spectrum.
+    Each spectrum is corrected independently, as they are acquired independently.
+    A spectrum with only one wavelength with a large differential is not corrected.
+    data (DataArray or numpy.array of shape CYX or C11YX): the spectral data
+    threshold (float >= 1): sensitivity of the detection (the lower, the more sensitive)
+    margin (int >= 0): number of wavelengths on each side of a spike also corrected
+    spacing (int >= 1): minimum distance between two separate spikes in a spectrum
+    returns:
+       corrected (DataArray of the same shape and metadata as data): the corrected data
+       npixels (int): number of spectra (aka e-beam positions) corrected
+       nspikes (int): number of spikes corrected
+    raises ValueError: if the data doesn't contain only spectra
+    """
+    s = data.shape
+    if data.ndim < 3 or numpy.prod(s[1:-2]) != 1:
+        raise ValueError("Spike removal only supports spectral data CYX, but got shape %s" % (s,))
+    corrected = model.DataArray(data.copy(), metadata=getattr(data, "metadata", {}))
+    specdat = corrected.reshape(s[0], s[-2], s[-1])  # view, to correct in place
+    if s[0] < 2:
+        return corrected, 0, 0
+
+    # this diff calculation requires higher numerical precision than 16 bits because it is squared.
+    ndiff = (s[0] - 1) * s[-2] * s[-1]
+    ms_step = 0
+    for _, chunk in _iter_spectra_chunks(specdat):
+        ms_step += (numpy.diff(numpy.float32(chunk), axis=0) ** 2).sum(dtype=numpy.float64)
+    ms_step /= ndiff
+    diff_threshold = ms_step * threshold ** 2
+
+    npixels = 0
+    nspikes = 0
+    for rows, chunk in _iter_spectra_chunks(specdat):
+        spikes = numpy.diff(numpy.float32(chunk), axis=0) ** 2 > diff_threshold
+        # Only spectra with more than one spike index are corrected
+        to_correct = numpy.count_nonzero(spikes, axis=0) > 1
+        if not to_correct.any():
+            continue
+        pxs = numpy.flatnonzero(to_correct)
+        # Indices sorted by pixel, then by wavelength
+        pxi, idx = numpy.nonzero(spikes[:, pxs].T)
+        px = pxs[pxi]
+
+        # Split the indices into spikes, when they are too far apart (or in a different spectrum)
+        starts = numpy.ones(len(idx), dtype=bool)
+        starts[1:] = (pxi[1:] != pxi[:-1]) | (numpy.diff(idx) > spacing)
+        ends = numpy.roll(starts, -1)
+        spike_px = px[starts]
+        low = numpy.maximum(idx[starts] - margin, 0)
+        high = numpy.minimum(idx[ends] + margin, s[0] - 1)
+        npixels += len(pxs)
+        nspikes += len(spike_px)
+
+        # Linearly interpolate all the spikes at once, between the low and high edges,
+        # exactly as numpy.linspace() would do
+        lengths = high - low + 1
+        seg = numpy.repeat(numpy.arange(len(spike_px)), lengths)
+        pos = numpy.arange(lengths.sum()) - numpy.repeat(numpy.cumsum(lengths) - lengths, lengths)
+        start = chunk[low, spike_px].astype(numpy.float64)
+        stop = chunk[high, spike_px].astype(numpy.float64)
+        step = (stop - start) / (lengths - 1)
+        values = pos * step[seg] + start[seg]
+        last = pos == lengths[seg] - 1
+        values[last] = stop[seg[last]]
+        chunk[low[seg] + pos, spike_px[seg]] = values
+
+        specdat[:, rows, :] = chunk.reshape(s[0], -1, s[-1])
+
+    logging.debug("Corrected %d spikes in %d spectra", nspikes, npixels)
+    return corrected, npixels, nspikes
@@ -16,7 +16,9 @@ You should have received a copy of the GNU General Public License along with Ode
 """
 import logging
 import math
-from typing import Optional, Tuple
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Sequence, Tuple, Union
 
 import cv2
 import numpy
@@ -30,6 +32,14 @@ from scipy.cluster.vq import kmeans
 from scipy.spatial import cKDTree as KDTree
 from scipy.spatial.distance import cdist
 
+# Methods to refine the position of the spots with sub-pixel accuracy
+REFINE_RADIAL_SYMMETRY = "radial_symmetry"
+REFINE_GAUSSIAN = "gaussian"
+
+# Number of sub-images processed together by the batch functions. Larger
+# batches are split, and processed in parallel threads.
+SPOT_BATCH_SIZE = 256
+
 
 def _SubtractBackground(data, background=None):
     # We actually want to make really sure that only real signal is > 0.
@@ -238,6 +248,232 @@ def radial_symmetry_center(
     return jc, ic
 
 
+def _radial_symmetry_centers_stack(
+    images: numpy.ndarray, smoothing: bool
+) -> numpy.ndarray:
+    """
+    Vectorised version of radial_symmetry_center() for a stack of images of
+    the same shape.
+
+    Parameters
+    ----------
+    images : ndarray
+        Stack of images of shape `(N, n, m)`.
+    smoothing : boolean
+        Apply a smoothing kernel to the intensity gradient.
+
+    Returns
+    -------
+    pos : ndarray
+        Array of shape `(N, 2)` containing the radial symmetry center `(j, i)`
+        of each image.
+
+    """
+    images = numpy.asarray(images, dtype=numpy.float64)
+    _, n, m = images.shape
+
+    # Lattice midpoints (jk, ik), broadcastable to the gradient arrays.
+    jk = numpy.arange(n - 1, dtype=float)[:, numpy.newaxis] + 0.5
+    ik = numpy.arange(m - 1, dtype=float)[numpy.newaxis, :] + 0.5
+
+    # Intensity gradient, same as the convolutions of radial_symmetry_center().
+    dIdj = images[:, 1:, 1:] + images[:, 1:, :-1] - images[:, :-1, 1:] - images[:, :-1, :-1]
+    dIdi = images[:, 1:, 1:] - images[:, 1:, :-1] + images[:, :-1, 1:] - images[:, :-1, :-1]
+    if smoothing:
+        # "reflect" is the same as the "symm" boundary of convolve2d
+        dIdj = ndimage.uniform_filter(dIdj, size=(1, 3, 3), mode="reflect")
+        dIdi = ndimage.uniform_filter(dIdi, size=(1, 3, 3), mode="reflect")
+    dI2 = numpy.square(dIdj) + numpy.square(dIdi)
+
+    # Entries where the intensity gradient magnitude is zero get a zero weight,
+    # which is equivalent to discarding them.
+    valid = dI2 > 0
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        dI = numpy.sqrt(dI2)
+        a = numpy.where(valid, -dIdi / dI, 0)
+        b = numpy.where(valid, dIdj / dI, 0)
+        c = a * jk + b * ik
+
+        sdI2 = numpy.sum(dI2, axis=(1, 2))
+        j0 = numpy.sum(dI2 * jk, axis=(1, 2)) / sdI2
+        i0 = numpy.sum(dI2 * ik, axis=(1, 2)) / sdI2
+        dist = numpy.hypot(jk - j0[:, numpy.newaxis, numpy.newaxis],
+                           ik - i0[:, numpy.newaxis, numpy.newaxis])
+        w2 = numpy.where(valid, dI2 / dist, 0)
+
+        # Solve the weighted least-squares problem via its (2x2) normal equations.
+        saa = numpy.sum(w2 * a * a, axis=(1, 2))
+        sab = numpy.sum(w2 * a * b, axis=(1, 2))
+        sbb = numpy.sum(w2 * b * b, axis=(1, 2))
+        sac = numpy.sum(w2 * a * c, axis=(1, 2))
+        sbc = numpy.sum(w2 * b * c, axis=(1, 2))
+        det = saa * sbb - sab * sab
+        jc = (sbb * sac - sab * sbc) / det
+        ic = (saa * sbc - sab * sac) / det
+
+    # In case the system is (close to) singular, use the standard least-squares
+    # solver, with the same rcond as radial_symmetry_center().
+    rcond = numpy.finfo(numpy.float64).eps * max(n, m)
+    bad = ~(numpy.isfinite(jc) & numpy.isfinite(ic)) | (det <= (rcond * (saa + sbb)) ** 2)
+    for idx in numpy.flatnonzero(bad):
+        jc[idx], ic[idx] = radial_symmetry_center(images[idx], smoothing)
+
+    return numpy.stack((jc, ic), axis=-1)
+
+
+def _map_batches(fn, images: numpy.ndarray, max_workers: Optional[int]) -> numpy.ndarray:
+    """
+    Apply a function computing one position per image on a stack of images,
+    by batches of SPOT_BATCH_SIZE, in parallel threads if there are several
+    batches.
+
+    Returns
+    -------
+    pos : ndarray
+        Array of shape `(N, 2)`, the concatenated results of `fn`.
+
+    """
+    nimg = len(images)
+    if nimg <= SPOT_BATCH_SIZE or max_workers == 1:
+        return fn(images)
+
+    batches = [images[i:i + SPOT_BATCH_SIZE] for i in range(0, nimg, SPOT_BATCH_SIZE)]
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(batches))) as executor:
+        return numpy.concatenate(list(executor.map(fn, batches)))
+
+
+def radial_symmetry_centers(
+    images: Union[numpy.ndarray, Sequence[numpy.ndarray]],
+    smoothing: bool = True,
+    max_workers: Optional[int] = None,
+) -> numpy.ndarray:
+    """
+    Returns the radial symmetry center of multiple images with sub-pixel
+    resolution. Same as calling radial_symmetry_center() on each image, but
+    computed on all the images at once.
+
+    Parameters
+    ----------
+    images : ndarray or sequence of ndarrays
+        A stack of images of shape `(N, n, m)`, or a sequence of N images. The
+        images can have different shapes, in which case the images of the
+        same shape are processed together.
+    smoothing : boolean
+        Apply a smoothing kernel to the intensity gradient.
+    max_workers : int, optional
+        Maximum number of threads used when there are many images. By default,
+        the number of CPUs.
+
+    Returns
+    -------
+    pos : ndarray
+        Array of shape `(N, 2)` containing the position of the radial
+        symmetry center `(j, i)` of each image, as pixel index of the image.
+
+    """
+    def centers(stack):
+        return _map_batches(lambda b: _radial_symmetry_centers_stack(b, smoothing), stack, max_workers)
+
+    if isinstance(images, numpy.ndarray) and images.ndim == 3:
+        return centers(images)
+
+    pos = numpy.empty((len(images), 2), dtype=float)
+    shapes = {}  # shape -> list of indices of the images
+    for idx, im in enumerate(images):
+        shapes.setdefault(numpy.shape(im), []).append(idx)
+    for indices in shapes.values():
+        pos[indices] = centers(numpy.stack([numpy.asarray(images[idx]) for idx in indices]))
+    return pos
+
+
+def _gaussian_centers_stack(images: numpy.ndarray) -> numpy.ndarray:
+    """
+    Vectorised estimation of the center of a Gaussian spot in each image of a
+    stack, by fitting a Gaussian on the maximum and its direct neighbours,
+    independently along each axis.
+    """
+    images = numpy.asarray(images, dtype=numpy.float64)
+    nimg, n, m = images.shape
+    # Remove the background, and make sure the logarithm is defined
+    images = images - images.min(axis=(1, 2), keepdims=True) + numpy.finfo(numpy.float64).tiny
+    logimg = numpy.log(images)
+
+    jm, im = numpy.unravel_index(numpy.argmax(images.reshape(nimg, -1), axis=1), (n, m))
+    # The neighbours have to be within the image
+    jm = numpy.clip(jm, 1, max(n - 2, 1)) if n >= 3 else jm
+    im = numpy.clip(im, 1, max(m - 2, 1)) if m >= 3 else im
+    k = numpy.arange(nimg)
+
+    def offset(before, center, after):
+        # Peak of the parabola passing by the 3 points (in log space)
+        denom = before - 2 * center + after
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            off = 0.5 * (before - after) / denom
+        # Not a maximum => no refinement
+        return numpy.where((denom < 0) & (numpy.abs(off) <= 1), off, 0)
+
+    jc = jm.astype(float)
+    ic = im.astype(float)
+    if n >= 3:
+        jc += offset(logimg[k, jm - 1, im], logimg[k, jm, im], logimg[k, jm + 1, im])
+    if m >= 3:
+        ic += offset(logimg[k, jm, im - 1], logimg[k, jm, im], logimg[k, jm, im + 1])
+    return numpy.stack((jc, ic), axis=-1)
+
+
+def gaussian_centers(
+    images: numpy.ndarray, max_workers: Optional[int] = None
+) -> numpy.ndarray:
+    """
+    Returns the center of the (Gaussian shaped) spot in each image of a stack,
+    with sub-pixel resolution. The position is found by fitting a Gaussian
+    through the brightest pixel and its direct neighbours, along each axis.
+    It's faster, but less robust to noise than radial_symmetry_centers().
+
+    Parameters
+    ----------
+    images : ndarray
+        A stack of images of shape `(N, n, m)`.
+    max_workers : int, optional
+        Maximum number of threads used when there are many images. By default,
+        the number of CPUs.
+
+    Returns
+    -------
+    pos : ndarray
+        Array of shape `(N, 2)` containing the position of the spot center
+        `(j, i)` of each image, as pixel index of the image.
+
+    """
+    return _map_batches(_gaussian_centers_stack, images, max_workers)
+
+
+def find_center_coordinates_batch(
+    images: Sequence[numpy.ndarray],
+    smoothing: bool = True,
+    max_workers: Optional[int] = None,
+) -> List[Tuple[float, float]]:
+    """
+    Same as calling FindCenterCoordinates() on each image, but computed on all
+    the images at once.
+
+    Returns
+    -------
+    pos : list of tuples
+        For each image, the position `(dx, -dy)` in pixels relative to the
+        center of the image.
+
+    """
+    ji = radial_symmetry_centers(images, smoothing, max_workers)
+    pos = []
+    for p, im in zip(ji, images):
+        xc, yc = to_physical_space(p, numpy.shape(im))
+        pos.append((xc, -yc))
+    return pos
+
+
 def _CreateSEDisk(r=3):
     """
     Create a flat disk-shaped structuring element with the specified radius r. The structuring element can be used
@@ -306,10 +542,10 @@ def MaximaFind(image, qty, len_object=18):
         logging.debug("Only %d maxima found, while expected %d", len(pos), qty)
     # Improve center estimate using radial symmetry method.
     w = len_object // 2
-    refined_center = numpy.zeros_like(pos)
+    spots = []
     pos = numpy.rint(pos).astype(numpy.int16)
     y_max, x_max = image.shape
-    for idx, xy in enumerate(pos):
+    for xy in pos:
         x_start, y_start = xy - w + 1
         x_end, y_end = xy + w
         # If the spot is near the edge of the image, crop so it is still in the center of the sub-image. Subtract the
@@ -327,8 +563,8 @@ def MaximaFind(image, qty, len_object=18):
         elif y_end > y_max:
             y_start += y_end - y_max
             y_end = y_max
-        spot = filtered[y_start:y_end, x_start:x_end]
-        refined_center[idx] = numpy.array(FindCenterCoordinates(spot))
+        spots.append(filtered[y_start:y_end, x_start:x_end])
+    refined_center = numpy.array(find_center_coordinates_batch(spots)).reshape(-1, 2)
     refined_position = pos + refined_center
     return refined_position
 
@@ -363,6 +599,87 @@ def _get_subimage(
     return image[(j - size):(j + size + 1), (i - size):(i + size + 1)]
 
 
+def _get_subimages(
+    image: numpy.ndarray, coordinates: numpy.ndarray, size: int
+) -> numpy.ndarray:
+    """
+    Returns the square shaped regions of interest of the input array `image`
+    centered at each of the `coordinates`, as a single stack.
+
+    Parameters
+    ----------
+    image : ndarray
+        The input image
+    coordinates : ndarray
+        Array of shape `(N, 2)` of 2-dimensional indices `(j, i)` of the
+        array `image`.
+    size : int
+        Controls the shape of the subimages.
+
+    Returns
+    -------
+    out : ndarray
+        A copy of the regions of interest, of shape
+        `(N, 2 * size + 1, 2 * size + 1)`.
+
+    """
+    coordinates = numpy.asarray(coordinates, dtype=int).reshape(-1, 2)
+    length = 2 * size + 1
+    if len(coordinates) == 0:
+        return numpy.empty((0, length, length), dtype=image.dtype)
+    n, m = image.shape
+    j, i = coordinates[:, 0], coordinates[:, 1]
+    if numpy.any((j < size) | (i < size) | (j >= n - size) | (i >= m - size)):
+        raise IndexError("Position too close to the edge of the image.")
+    windows = numpy.lib.stride_tricks.sliding_window_view(image, (length, length))
+    return windows[j - size, i - size]
+
+
+def refine_spot_positions(
+    image: numpy.ndarray,
+    coordinates: numpy.ndarray,
+    size: int,
+    method: str = REFINE_RADIAL_SYMMETRY,
+    max_workers: Optional[int] = None,
+) -> numpy.ndarray:
+    """
+    Improve the estimate of the position of spots with sub-pixel resolution.
+    All the spots are processed at once.
+
+    Parameters
+    ----------
+    image : ndarray
+        The input image.
+    coordinates : ndarray
+        Array of shape `(N, 2)` containing the pixel index `(j, i)` of each
+        spot.
+    size : int
+        Half the length of the region around each spot used for the refinement.
+    method : str
+        REFINE_RADIAL_SYMMETRY to use the radial symmetry center (see
+        radial_symmetry_center()), or REFINE_GAUSSIAN for a Gaussian fit (see
+        gaussian_centers()).
+    max_workers : int, optional
+        Maximum number of threads used when there are many spots. By
+        default, the number of CPUs.
+
+    Returns
+    -------
+    refined_position : ndarray
+        A 2-dimensional array of shape `(N, 2)` containing the refined
+        coordinates `(j, i)` of the spots.
+
+    """
+    subimgs = _get_subimages(image, coordinates, size)
+    if method == REFINE_RADIAL_SYMMETRY:
+        centers = radial_symmetry_centers(subimgs, smoothing=False, max_workers=max_workers)
+    elif method == REFINE_GAUSSIAN:
+        centers = gaussian_centers(subimgs, max_workers=max_workers)
+    else:
+        raise ValueError("Unknown refinement method %s" % (method,))
+    return numpy.asarray(coordinates, dtype=float).reshape(-1, 2) + (centers - size)
+
+
 def find_spot_positions(
     image: numpy.ndarray,
     sigma: float,
@@ -370,6 +687,7 @@ def find_spot_positions(
     threshold_rel: Optional[float] = None,
     num_spots: Optional[int] = None,
     min_distance: Optional[int] = None,
+    method: str = REFINE_RADIAL_SYMMETRY,
 ) -> numpy.ndarray:
     """
     Find the center coordinates of spots with the highest intensity in an
@@ -394,6 +712,9 @@ def find_spot_positions(
     min_distance : int, optional
         The minimal allowed distance in pixels separating peaks. To find the
         maximum number of peaks, use `min_distance=1`.
+    method : str, optional
+        Method used to refine the position of the spots with sub-pixel
+        resolution. See refine_spot_positions().
 
     Returns
     -------
@@ -417,15 +738,8 @@ def find_spot_positions(
         len_object=len_object,
     )
 
-    # Improve coordinate estimate using radial symmetry center.
-    refined_coordinates = numpy.empty_like(coordinates, dtype=float)
-    for idx, ji in enumerate(coordinates):
-        subimg = _get_subimage(filtered, ji, size)
-        rsc = radial_symmetry_center(subimg, smoothing=False)
-        delta = numpy.subtract(rsc, size)
-        refined_coordinates[idx] = ji + delta
-
-    return refined_coordinates
+    # Improve coordinate estimate, using radial symmetry center by default.
+    return refine_spot_positions(filtered, coordinates, size, method)
 
 
 def EstimateLatticeConstant(pos):
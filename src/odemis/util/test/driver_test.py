@@ -73,13 +73,23 @@ class TestDriver(unittest.TestCase):
             logging.error(str(exp))
             raise
 
-        model._components._microscope = None  # force reset of the microscope for next connection
+        model._core._microscope = None  # force reset of the microscope for next connection
 
-        speedUpPyroConnect(model.getMicroscope())
-
-        time.sleep(2)
-        if need_stop:
-            testing.stop_backend()
+        try:
+            microscope = model.getMicroscope()
+            f = speedUpPyroConnect(microscope)
+            comps = f.result(30)
+            self.assertIn(microscope.name, {c.name for c in comps})
+            self.assertGreater(len(comps), 1)
+
+            # The proxies already received are reused
+            comps = model.getComponents()
+            self.assertEqual({c.name for c in comps}, {c.name for c in model.getComponents()})
+            for c in comps:
+                self.assertIs(model.getComponent(name=c.name), c)
+        finally:
+            if need_stop:
+                testing.stop_backend()
 
     def test_memoryUsage(self):
         m = readMemoryUsage()
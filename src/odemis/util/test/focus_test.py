@@ -19,7 +19,7 @@ You should have received a copy of the GNU General Public License along with Ode
 import unittest
 import numpy
 
-from odemis.util.focus import MeasureSpotsFocus, MeasureOpticalFocus
+from odemis.util.focus import MeasureSpotsFocus, MeasureOpticalFocus, FitFocusCurve
 
 
 class TestMeasureOpticalFocus(unittest.TestCase):
@@ -64,5 +64,32 @@ class TestMeasureSpotsFocus(unittest.TestCase):
         self.assertGreater(focus_level, 1)  # Usually much higher than 1e12!
 
 
+class TestFitFocusCurve(unittest.TestCase):
+
+    def test_gaussian(self):
+        # Peak in-between two measured positions
+        pos = numpy.linspace(-50e-6, 50e-6, 21)
+        levels = 100 + 1000 * numpy.exp(-(pos - 3.2e-6) ** 2 / (2 * 10e-6 ** 2))
+        levels += numpy.random.default_rng(0).normal(0, 5, levels.shape)
+        center, width, amp, offset = FitFocusCurve(pos, levels)
+        self.assertAlmostEqual(center, 3.2e-6, delta=0.5e-6)
+        self.assertAlmostEqual(width, 10e-6, delta=1e-6)
+        self.assertAlmostEqual(amp, 1000, delta=50)
+        self.assertAlmostEqual(offset, 100, delta=20)
+
+    def test_lorentzian(self):
+        pos = numpy.linspace(0, 1e-3, 15)
+        levels = 5 + 20 * 80e-6 ** 2 / ((pos - 420e-6) ** 2 + 80e-6 ** 2)
+        center, width, amp, offset = FitFocusCurve(pos, levels, model="lorentzian")
+        self.assertAlmostEqual(center, 420e-6, delta=1e-6)
+
+    def test_flat(self):
+        pos = numpy.linspace(0, 1e-3, 15)
+        with self.assertRaises(ValueError):
+            FitFocusCurve(pos, numpy.ones(15))
+        with self.assertRaises(ValueError):
+            FitFocusCurve(pos[:3], [1, 2, 1])
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -45,6 +45,7 @@ from odemis.util.graph import (
     maximum_spanning_tree,
     minimum_spanning_tree,
     remove_triangles,
+    shortest_open_path,
 )
 
 
@@ -665,5 +666,58 @@ class IsConnectedTest(unittest.TestCase):
         self.assertRaises(ValueError, is_connected, graph)
 
 
+class ShortestOpenPathTest(unittest.TestCase):
+    """Unit tests for `shortest_open_path()`."""
+
+    @staticmethod
+    def _distances(points: numpy.ndarray) -> numpy.ndarray:
+        return numpy.linalg.norm(points[:, None] - points[None, :], axis=-1)
+
+    @staticmethod
+    def _length(costs: numpy.ndarray, path) -> float:
+        return sum(costs[u, v] for u, v in pairwise(path))
+
+    def test_line(self):
+        """Points on a line should be visited in order from the start."""
+        points = numpy.array([[0, 0], [3, 0], [1, 0], [4, 0], [2, 0]], dtype=float)
+        costs = self._distances(points)
+        self.assertListEqual(shortest_open_path(costs), [0, 2, 4, 1, 3])
+        self.assertListEqual(shortest_open_path(costs, start=3), [3, 1, 4, 2, 0])
+
+    def test_visits_all(self):
+        """The path should start at the start vertex and visit every vertex once."""
+        rng = numpy.random.default_rng(0)
+        points = rng.random((30, 2))
+        costs = self._distances(points)
+        path = shortest_open_path(costs, start=5)
+        self.assertEqual(path[0], 5)
+        self.assertCountEqual(path, range(30))
+        # Much shorter than the default order
+        self.assertLess(self._length(costs, path), self._length(costs, range(30)))
+
+    def test_near_optimal(self):
+        """On small problems, the path should be close to the optimal one."""
+        rng = numpy.random.default_rng(1)
+        for _ in range(10):
+            points = rng.random((7, 2))
+            costs = self._distances(points)
+            path = shortest_open_path(costs)
+            optimal = min(
+                self._length(costs, (0,) + p)
+                for p in itertools.permutations(range(1, 7))
+            )
+            self.assertLessEqual(self._length(costs, path), optimal * 1.2)
+
+    def test_trivial(self):
+        """One or two vertices only have one possible path."""
+        self.assertListEqual(shortest_open_path(numpy.zeros((1, 1))), [0])
+        self.assertListEqual(shortest_open_path(numpy.ones((2, 2)), start=1), [1, 0])
+
+    def test_raises(self):
+        """Should raise a ValueError on invalid input."""
+        self.assertRaises(ValueError, shortest_open_path, numpy.zeros((2, 3)))
+        self.assertRaises(ValueError, shortest_open_path, numpy.zeros((2, 2)), 2)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -2068,6 +2068,53 @@ class TestAssembleZCube(unittest.TestCase):
         self.assertGreater(output_rev_z.metadata[model.MD_PIXEL_SIZE][2], 0)
         numpy.testing.assert_array_equal(output_da_after, output_rev_z)
 
+    def test_zcube_assembler(self):
+        """
+        Check the incremental assembly gives the same cube and MIP as assembling at the end
+        """
+        img_list = [model.DataArray(numpy.random.randint(0, 220, self.size, dtype=numpy.uint16), self.md)
+                    for z in self.z_list]
+        expected_cube = img.assembleZCube(img_list, self.z_list)
+        expected_mip = img.max_intensity_projection(expected_cube, axis=0)
+
+        for zlevels in (self.z_list, self.z_list[::-1]):
+            assembler = img.ZCubeAssembler(zlevels, mip=True)
+            for im in img_list:
+                assembler.append(im)
+
+            cube = assembler.get_cube()
+            self.assertEqual(cube.dtype, numpy.uint16)
+            self.assertEqual(cube.shape, (len(zlevels),) + self.size)
+            self.assertEqual(cube.metadata[model.MD_PIXEL_SIZE], expected_cube.metadata[model.MD_PIXEL_SIZE])
+            self.assertEqual(cube.metadata[model.MD_POS], expected_cube.metadata[model.MD_POS])
+            if zlevels is self.z_list:
+                numpy.testing.assert_array_equal(cube, expected_cube)
+            else:
+                numpy.testing.assert_array_equal(cube, expected_cube[::-1])
+
+            mip = assembler.get_mip()
+            self.assertEqual(mip.metadata[model.MD_DIMS], "YX")
+            numpy.testing.assert_array_equal(mip, expected_mip)
+
+            with self.assertRaises(IndexError):
+                assembler.append(img_list[0])
+
+        # MIP only: no cube available
+        assembler = img.ZCubeAssembler(self.z_list, cube=False, mip=True)
+        with self.assertRaises(ValueError):
+            assembler.get_mip()  # no image yet
+        for im in img_list:
+            assembler.append(im)
+        numpy.testing.assert_array_equal(assembler.get_mip(), expected_mip)
+        with self.assertRaises(ValueError):
+            assembler.get_cube()
+
+        # Incomplete zstack
+        assembler = img.ZCubeAssembler(self.z_list)
+        for im in img_list[:3]:
+            assembler.append(im)
+        numpy.testing.assert_array_equal(assembler.get_cube(), expected_cube[:3])
+
 
 class TestFloodFill(unittest.TestCase):
 
@@ -16,6 +16,7 @@ You should have received a copy of the GNU General Public License along with Ode
 '''
 import logging
 import numpy
+from odemis import model
 from odemis.dataio import hdf5
 from odemis.util import peak
 import os
@@ -131,5 +132,78 @@ class TestPeak(unittest.TestCase):
         self.assertRaises(KeyError, peak.Curve, wl, params, offset, type='wrongType')
 
 
+class TestFitMap(unittest.TestCase):
+    """
+    Test peak fitting on all the pixels of a spectrum cube
+    """
+
+    def setUp(self):
+        # A single gaussian peak, whose position shifts along X
+        self.wl = numpy.linspace(500e-9, 700e-9, 100)
+        shape = (len(self.wl), 1, 1, 12, 25)
+        data = numpy.empty(shape)
+        self.pos = numpy.empty(shape[-2:])
+        rng = numpy.random.default_rng(0)
+        for y in range(shape[-2]):
+            for x in range(shape[-1]):
+                pos = 560e-9 + x * 2e-9
+                self.pos[y, x] = pos
+                spec = peak.Curve(self.wl, [(pos, 15e-9, 1000)], 100, type='gaussian_space')
+                data[:, 0, 0, y, x] = spec + rng.normal(0, 5, len(self.wl))
+        md = {model.MD_WL_LIST: list(self.wl),
+              model.MD_PIXEL_SIZE: (1e-6, 1e-6),
+              model.MD_POS: (1e-3, 2e-3),
+              model.MD_DESCRIPTION: "Spectrum"}
+        self.data = model.DataArray(data, md)
+
+    def _check_maps(self, maps):
+        self.assertEqual(len(maps), 4)  # 1 peak + offset
+        pos, width, amplitude, offset = maps
+        for m in maps:
+            self.assertEqual(m.shape, self.data.shape[-2:])
+            self.assertEqual(m.metadata[model.MD_POS], (1e-3, 2e-3))
+            self.assertNotIn(model.MD_WL_LIST, m.metadata)
+        self.assertEqual(pos.metadata[model.MD_DESCRIPTION], "Spectrum peak 1 position")
+        numpy.testing.assert_allclose(pos, self.pos, atol=1e-9)
+        numpy.testing.assert_allclose(amplitude, 1000, rtol=0.05)
+        # The offset is bounded by the minimum of the (noisy) spectrum
+        self.assertTrue(numpy.all((75 < offset) & (offset <= 100)))
+
+    def test_in_process(self):
+        f = peak.FitMap(self.data, type='gaussian_space', max_workers=1)
+        self._check_maps(f.result())
+
+    def test_parallel(self):
+        f = peak.FitMap(self.data, type='gaussian_space', max_workers=2)
+        self._check_maps(f.result())
+
+    def test_no_baseline(self):
+        """
+        Noisy spectra without baseline go below 0, which shouldn't prevent the fitting
+        """
+        rng = numpy.random.default_rng(1)
+        data = numpy.empty((len(self.wl), 1, 1, 8, 8))
+        for y in range(data.shape[-2]):
+            for x in range(data.shape[-1]):
+                spec = peak.Curve(self.wl, [(600e-9, 15e-9, 1000)], 0, type='gaussian_space')
+                data[:, 0, 0, y, x] = spec + rng.normal(0, 20, len(self.wl))
+        # Some spectra have exactly 0 as minimum (eg, clipped by the detector)
+        data[:, 0, 0, 0, :] = numpy.maximum(data[:, 0, 0, 0, :], 0)
+        self.assertTrue((data.min(axis=0) < 0).any())
+        data = model.DataArray(data, {model.MD_WL_LIST: list(self.wl)})
+
+        f = peak.FitMap(data, type='gaussian_space', npeaks=1, max_workers=1)
+        pos, width, amplitude, offset = f.result()
+        self.assertFalse(numpy.isnan(pos).any())
+        numpy.testing.assert_allclose(pos, 600e-9, atol=2e-9)
+        numpy.testing.assert_allclose(amplitude, 1000, rtol=0.1)
+        numpy.testing.assert_allclose(offset, 0, atol=20)
+
+    def test_cancel(self):
+        f = peak.FitMap(self.data, max_workers=2)
+        f.cancel()
+        self.assertTrue(f.cancelled())
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -127,6 +127,89 @@ class TestGetAngle(unittest.TestCase):
         self.assertEqual(wl, wl_orig)
 
 
+class TestSpectrumCumulativeIndex(unittest.TestCase):
+
+    def test_simple(self):
+        """
+        Check the average matches the direct computation
+        """
+        rng = numpy.random.default_rng(0)
+        data = rng.integers(0, 4095, (50, 1, 1, 30, 40), dtype=numpy.uint16)
+        index = spectrum.SpectrumCumulativeIndex(data)
+
+        for c_range in ((0, 0), (0, 49), (10, 20), (49, 49)):
+            av = index.mean(c_range)
+            self.assertEqual(av.shape, (30, 40))
+            exp = numpy.mean(data[c_range[0]:c_range[1] + 1, 0, 0], axis=0)
+            numpy.testing.assert_allclose(av, exp)
+
+        with self.assertRaises(IndexError):
+            index.mean((10, 50))
+        with self.assertRaises(IndexError):
+            index.mean((20, 10))
+
+    def test_temporal(self):
+        """
+        Check the T dimension is averaged, and float data is supported
+        """
+        rng = numpy.random.default_rng(0)
+        data = rng.random((20, 8, 1, 10, 12), dtype=numpy.float32)
+        index = spectrum.SpectrumCumulativeIndex(data)
+
+        av = index.mean((3, 12))
+        exp = numpy.mean(data[3:13, :, 0], axis=(0, 1))
+        numpy.testing.assert_allclose(av, exp, rtol=1e-5)
+
+    def test_overflow(self):
+        """
+        Check the sums don't overflow with large values
+        """
+        data = numpy.full((1000, 4, 1, 5, 6), 2 ** 32 - 1, dtype=numpy.uint32)
+        index = spectrum.SpectrumCumulativeIndex(data)
+        numpy.testing.assert_array_equal(index.mean((0, 999)), data[0, 0, 0])
+
+        # 64-bit data, which doesn't fit in 64-bit sums
+        for dtype in (numpy.uint64, numpy.int64):
+            data = numpy.full((10, 2, 1, 3, 4), numpy.iinfo(dtype).max, dtype=dtype)
+            index = spectrum.SpectrumCumulativeIndex(data)
+            numpy.testing.assert_allclose(index.mean((0, 9)), float(numpy.iinfo(dtype).max))
+            numpy.testing.assert_allclose(index.mean((3, 3)), float(numpy.iinfo(dtype).max))
+
+
+class TestPointSeries(unittest.TestCase):
+
+    def test_single_point(self):
+        da = model.DataArray(numpy.array([[12]], dtype=numpy.uint16),
+                             {model.MD_ACQ_DATE: 1000.0, model.MD_DWELL_TIME: 1e-3})
+        self.assertFalse(spectrum.is_point_block(da))
+        values, dates = spectrum.get_point_series(da)
+        numpy.testing.assert_array_equal(values, [12])
+        numpy.testing.assert_array_equal(dates, [1000.0])
+
+    def test_block(self):
+        da = model.DataArray(numpy.arange(5, dtype=numpy.uint32),
+                             {model.MD_ACQ_DATE: 1000.0, model.MD_DWELL_TIME: 0.5,
+                              model.MD_DIMS: "T"})
+        self.assertTrue(spectrum.is_point_block(da))
+        values, dates = spectrum.get_point_series(da)
+        self.assertEqual(values.dtype, numpy.float64)
+        numpy.testing.assert_array_equal(values, [0, 1, 2, 3, 4])
+        numpy.testing.assert_array_almost_equal(dates, [1000, 1000.5, 1001, 1001.5, 1002])
+
+        del da.metadata[model.MD_DWELL_TIME]
+        with self.assertRaises(ValueError):
+            spectrum.get_point_series(da)
+
+    def test_multiple_points(self):
+        """
+        Data with multiple points, but not a block, is averaged
+        """
+        da = model.DataArray(numpy.array([[1, 2], [3, 4]], dtype=numpy.uint16))
+        values, dates = spectrum.get_point_series(da)
+        numpy.testing.assert_array_equal(values, [2.5])
+        self.assertEqual(len(dates), 1)
+
+
 class TestCoefToDA(unittest.TestCase):
 
     def test_simple(self):
@@ -140,5 +223,63 @@ class TestCoefToDA(unittest.TestCase):
         numpy.testing.assert_equal(da[:, 0, 0, 0, 0], dcalib)
         numpy.testing.assert_equal(da.metadata[model.MD_WL_LIST], wl_calib * 1e-9)
 
+class TestRemoveSpikes(unittest.TestCase):
+
+    def setUp(self):
+        # Smooth spectra, with a bit of noise
+        rng = numpy.random.default_rng(0)
+        self.shape = (200, 1, 1, 8, 10)
+        wl = numpy.linspace(-1, 1, self.shape[0])
+        spec = 1000 + 500 * numpy.exp(-wl ** 2 / 0.1)
+        data = spec[:, None, None, None, None] + rng.normal(0, 5, self.shape)
+        self.data = model.DataArray(data.astype(numpy.uint16), {model.MD_DESCRIPTION: "test"})
+
+    def test_no_spike(self):
+        cor, npixels, nspikes = spectrum.remove_spikes(self.data, 8)
+        self.assertEqual((npixels, nspikes), (0, 0))
+        numpy.testing.assert_array_equal(cor, self.data)
+        self.assertEqual(cor.metadata, self.data.metadata)
+
+    def test_spikes(self):
+        data = self.data.copy()
+        orig = self.data.copy()
+        data[50, 0, 0, 2, 3] += 10000  # single wavelength spike
+        data[100:102, 0, 0, 2, 3] += 8000  # a second spike in the same spectrum
+        data[1, 0, 0, 5, 5] += 10000  # on the border
+        data[150:153, 0, 0, 7, 9] += 12000  # 3 wavelengths spike
+        data_in = data.copy()
+
+        cor, npixels, nspikes = spectrum.remove_spikes(data, 8)
+        self.assertEqual(cor.shape, self.shape)
+        self.assertEqual(cor.dtype, self.data.dtype)
+        numpy.testing.assert_array_equal(data, data_in)  # input not modified
+        self.assertEqual(npixels, 3)
+        self.assertEqual(nspikes, 4)
+
+        # The spikes are gone (the values are within the noise of the original data)
+        numpy.testing.assert_allclose(cor.astype(float), orig.astype(float), atol=50)
+        # The spectra without spikes are untouched
+        numpy.testing.assert_array_equal(cor[:, :, :, 0, :], orig[:, :, :, 0, :])
+
+        # The correction is a linear interpolation between the neighbours (+ margin)
+        spec = data[:, 0, 0, 7, 9]
+        expected = numpy.linspace(spec[148], spec[153], 6).astype(numpy.uint16)
+        numpy.testing.assert_array_equal(cor[148:154, 0, 0, 7, 9], expected)
+
+        # Same result with small chunks, and with CYX data
+        orig_chunk_size = spectrum.SPIKE_CHUNK_SIZE
+        spectrum.SPIKE_CHUNK_SIZE = 1000
+        try:
+            cor_chunk, npixels_chunk, nspikes_chunk = spectrum.remove_spikes(data[:, 0, 0], 8)
+        finally:
+            spectrum.SPIKE_CHUNK_SIZE = orig_chunk_size
+        self.assertEqual((npixels_chunk, nspikes_chunk), (npixels, nspikes))
+        numpy.testing.assert_array_equal(cor_chunk, cor[:, 0, 0])
+
+    def test_wrong_shape(self):
+        with self.assertRaises(ValueError):
+            spectrum.remove_spikes(numpy.zeros((10, 2, 1, 5, 5)))
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -14,6 +14,7 @@ Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRAN
 
 You should have received a copy of the GNU General Public License along with Odemis. If not, see http://www.gnu.org/licenses/.
 """
+import itertools
 import math
 import numpy
 from odemis import model
@@ -295,6 +296,73 @@ class TestRadialSymmetryCenter(unittest.TestCase):
                         self.assertAlmostEqual(i, ic)
 
 
+class TestRadialSymmetryCenters(unittest.TestCase):
+    """
+    Unit test class to test the batch functions to find the center of spots
+    in odemis.util.spot.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        """Create a synthetic dataset of 1000 noisy spot images."""
+        n = 1000
+        shape = (9, 9)
+        numpy.random.seed(0)
+        cls.coords0 = 0.5 * numpy.asarray(shape) - numpy.random.random_sample((n, 2))
+        cls.imgdata = numpy.empty((n,) + shape)
+        for i in range(n):
+            cls.imgdata[i] = synthetic.psf_gaussian(shape, cls.coords0[i], 1.2)
+        cls.imgdata += 0.01 * numpy.random.random_sample(cls.imgdata.shape)
+
+    def test_same_as_single(self):
+        """
+        radial_symmetry_centers should return the same as radial_symmetry_center
+        on each image, with and without threads.
+        """
+        for smoothing in (True, False):
+            expected = numpy.array([spot.radial_symmetry_center(im, smoothing) for im in self.imgdata])
+            for max_workers in (1, None):
+                coords = spot.radial_symmetry_centers(self.imgdata, smoothing, max_workers=max_workers)
+                numpy.testing.assert_allclose(coords, expected, atol=1e-9)
+
+    def test_different_shapes(self):
+        imgs = [self.imgdata[0], self.imgdata[1][1:, :], self.imgdata[2], self.imgdata[3][:, 2:]]
+        coords = spot.radial_symmetry_centers(imgs)
+        expected = numpy.array([spot.radial_symmetry_center(im) for im in imgs])
+        numpy.testing.assert_allclose(coords, expected, atol=1e-9)
+
+        xy = spot.find_center_coordinates_batch(imgs)
+        expected = [spot.FindCenterCoordinates(im) for im in imgs]
+        numpy.testing.assert_allclose(xy, expected, atol=1e-9)
+
+    def test_sanity(self):
+        """
+        A single pixel with value one should be found at its pixel index
+        """
+        imgs = numpy.zeros((9, 7, 8))
+        expected = []
+        for k, (j, i) in enumerate(itertools.product(range(2, 5), range(2, 5))):
+            imgs[k, j, i] = 1
+            expected.append((j, i))
+        numpy.testing.assert_allclose(spot.radial_symmetry_centers(imgs), expected, atol=1e-9)
+        numpy.testing.assert_allclose(spot.gaussian_centers(imgs), expected, atol=1e-9)
+
+    def test_gaussian_accuracy(self):
+        coords = spot.gaussian_centers(self.imgdata)
+        stdev = numpy.std((coords - self.coords0).ravel())
+        self.assertLess(stdev, 0.1)
+
+    def test_refine_spot_positions(self):
+        image = synthetic.psf_gaussian((64, 64), [(20.3, 30.6), (40.7, 12.2)], 1.5)
+        coords = numpy.array([(20, 31), (41, 12)])
+        for method in (spot.REFINE_RADIAL_SYMMETRY, spot.REFINE_GAUSSIAN):
+            ji = spot.refine_spot_positions(image, coords, 4, method)
+            numpy.testing.assert_allclose(ji, [(20.3, 30.6), (40.7, 12.2)], atol=0.05)
+
+        with self.assertRaises(IndexError):
+            spot.refine_spot_positions(image, [(2, 31)], 4)
+
+
 class TestFindSpotPositions(unittest.TestCase):
     def test_multiple(self):
         """
@@ -180,6 +180,48 @@ class TestBackgroundWorker(unittest.TestCase):
         self.assertIn("done", self.results)
 
 
+class TestRepeatingTimer(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = []  # time of each call
+
+    def tick(self):
+        self.calls.append(time.time())
+
+    def test_period(self):
+        timer = util.RepeatingTimer(0.1, self.tick, "Test timer")
+        timer.start()
+        time.sleep(0.55)
+        timer.cancel()
+        timer.join(1)
+        self.assertFalse(timer.is_alive())
+        self.assertTrue(4 <= len(self.calls) <= 6, self.calls)
+
+    def test_wakeup(self):
+        timer = util.RepeatingTimer(10, self.tick, "Test timer")
+        timer.start()
+        time.sleep(0.1)
+        self.assertEqual(self.calls, [])
+
+        # Called immediately, instead of after 10 s
+        start = time.time()
+        timer.period = 0.2
+        timer.wakeup()
+        time.sleep(0.1)
+        self.assertEqual(len(self.calls), 1)
+        self.assertLess(self.calls[0] - start, 0.1)
+
+        # Then, the new period is used
+        time.sleep(0.2)
+        self.assertEqual(len(self.calls), 2)
+
+        # Cancelling is immediate too
+        timer.cancel()
+        timer.join(1)
+        self.assertFalse(timer.is_alive())
+        self.assertEqual(len(self.calls), 2)
+
+
 class TestExectuteTask(unittest.TestCase):
 
     def test_execute(self):